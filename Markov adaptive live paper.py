@@ -31,6 +31,10 @@ FEATURES:
 
 Kör:
     python "Markov adaptive live paper.py"
+
+Replay (deterministisk, utan graf, så snabbt CPU:n hinner):
+    python "Markov adaptive live paper.py" --replay data/ticks.csv [--replay-mode poll|tick]
+        [--log-dir logs/replay] [--config config_test.json]
 """
 
 from __future__ import annotations
@@ -51,11 +55,37 @@ except ImportError as e:
         "och starta sedan om skriptet."
     ) from e
 
+# Klocka: riktig tid live, virtuell tid vid --replay (se replay.py)
+from replay import ReplayFinished, ReplaySession, SystemClock, parse_replay_args
+# Som variant i paper_fanout.py: priser, klocka, config och loggkatalog kommer från flödet
+from paper_fanout import attached_variant
+
+FANOUT = attached_variant()
+CLI_ARGS = parse_replay_args([] if FANOUT else None)
+REPLAY: Optional[ReplaySession] = ReplaySession(CLI_ARGS.replay, CLI_ARGS.replay_mode) if CLI_ARGS.replay else None
+CLOCK = FANOUT.clock if FANOUT else (REPLAY.clock if REPLAY else SystemClock())
+HEADLESS = REPLAY is not None or FANOUT is not None  # ingen graf vid replay/fan-out
+OFFLINE = REPLAY is not None or (FANOUT is not None and FANOUT.replay)  # priser ur tickfil
+
 # (Valfritt men fint): realtids-graf
+if HEADLESS:
+    import matplotlib
+    matplotlib.use("Agg")
 import matplotlib.pyplot as plt
 import matplotlib.gridspec as gridspec
 from collections import deque
 
+# Tick-inspelning (valfritt, se tick_recorder.py)
+from tick_recorder import TickRecorder
+from warm_start import load_seed_prices
+from checkpoint import Checkpointer, checkpoint_age_sec
+from latency_stats import LatencyStats
+from live_profiler import LiveProfiler
+from decimal_math import FeeModel, mul_down, HALF, HUNDRED, ONE, Q2, Q4, Q8, ZERO
+from markov_model import MarkovState, outcome_state  # Markov-räknare (delas med live-skripten)
+from quantile_sketch import SIDECAR_SUFFIX, TradeSketches
+from performance_tracker import PerformanceTracker, TradeResult
+
 # Adaptive L-module (DIN IDÉ!)
 try:
     from adaptive_L import AdaptiveLCalculator
@@ -309,7 +339,7 @@ class StrategyModeManager:
         Returns:
             (current_mode, mode_changed)
         """
-        now = time.time()
+        now = CLOCK.time()
         
         # Vänta med byte om vi nyligen bytte mode
         if now < self.switch_cooldown_until:
@@ -333,7 +363,7 @@ class StrategyModeManager:
         # Logga mode-byten
         if mode_changed:
             change_info = {
-                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "timestamp": CLOCK.now_utc().isoformat(),
                 "from_mode": old_mode,
                 "to_mode": self.current_mode,
                 "trend_strength": trend_strength
@@ -362,13 +392,13 @@ class StrategyModeManager:
 
 # ----------------------- Konfig ----------------------------------------------
 ROOT = os.path.dirname(__file__)
-CONFIG_PATH = os.path.join(ROOT, "config.json")
+CONFIG_PATH = FANOUT.config_path if FANOUT else (CLI_ARGS.config or os.path.join(ROOT, "config.json"))
 with open(CONFIG_PATH, "r", encoding="utf-8-sig") as f:
     cfg = json.load(f)
 
 SYMBOL         = cfg.get("base_symbol", "BTCUSDT")
 ORDER_TEST     = bool(cfg.get("order_test", True))        # True = PAPER MODE
-ORDER_QTY      = Decimal(str(cfg.get("order_qty", 0.001))).quantize(Decimal("0.00000001"), rounding=ROUND_DOWN)
+ORDER_QTY      = Decimal(str(cfg.get("order_qty", 0.001))).quantize(Q8, rounding=ROUND_DOWN)
 
 # Strategiparametrar
 TP_PCT         = Decimal(str(cfg.get("tp_pct", 0.0010)))       # 0.10%
@@ -427,6 +457,17 @@ else:
     ADAPTIVE_L_UPDATE_INTERVAL = 0
 DIR_BIAS_COOLDOWN = float(cfg.get("direction_bias_cooldown", 0.0))
 
+# Markov-grind: P(vinst | de k senaste utfallen) innan entry (markov_model.py)
+MARKOV_ORDER = int(cfg.get("markov_order", 2))
+MARKOV_GATE_ENABLED = bool(cfg.get("markov_gate_enabled", False))
+MARKOV_GATE_MIN_WIN_PROB = float(cfg.get("markov_gate_min_win_prob", 0.5))
+MARKOV_GATE_MIN_SAMPLES = int(cfg.get("markov_gate_min_samples", 20))
+# Utfallshistoriken ändras bara vid exit – blockerar grinden båda sidor skulle den
+# aldrig öppnas igen. Efter så här lång sammanhängande blockering släpps en
+# prov-entry igenom så att modellen får ett nytt utfall (0 = aldrig).
+MARKOV_GATE_MAX_BLOCK_SEC = float(cfg.get("markov_gate_max_block_sec", 900))
+MARKOV_FIT_FROM_LOGS = bool(cfg.get("markov_fit_from_logs", True)) and not OFFLINE
+
 # Dynamisk positionsstorlek
 DYNAMIC_SIZING = cfg.get("dynamic_position_sizing", False)
 SIZE_LEVELS = cfg.get("position_size_levels", [1.0, 0.5, 0.25])
@@ -445,6 +486,17 @@ SCALE_OUT_LEVELS = [Decimal(str(x)) for x in cfg.get("scale_out_levels", [0.0003
 SCALE_OUT_MULT = Decimal(str(cfg.get("scale_out_multiplier", 0.3)))
 MIN_SCALE_MULT = Decimal(str(cfg.get("min_scale_multiplier", 0.2)))
 
+# Förberäknade konstanter för hot path (samma Decimal-värden som tidigare)
+TAKER_FEE = FeeModel(TAKER_FEE_PCT)
+TP_LONG_MULT = ONE + TP_PCT
+TP_SHORT_MULT = ONE - TP_PCT
+SCALE_IN_DEBUG_LEVEL = (SCALE_IN_LEVELS[0] if SCALE_IN_LEVELS else ZERO) * Decimal("0.8")
+SCALE_OUT_DEBUG_LEVEL = (SCALE_OUT_LEVELS[0] if SCALE_OUT_LEVELS else ZERO) * HALF
+# Lägsta tröskel som kan ge utskrift eller trigga en nivå → under den gör check_scale_* ingenting
+SCALE_IN_GATE = min([SCALE_IN_DEBUG_LEVEL] + SCALE_IN_LEVELS)
+SCALE_OUT_GATE = min([SCALE_OUT_DEBUG_LEVEL] + SCALE_OUT_LEVELS)
+SCALE_OUT_CLOSE_FRACTION = Decimal("0.05")
+
 # ========== MAX LOSS PROTECTION (KRITISKT!) ==========
 # Ingen position får förlora mer än initial investment!
 MAX_LOSS_PCT = Decimal(str(cfg.get("max_loss_pct", "1.5")))  # Max 1.5% förlust
@@ -463,7 +515,8 @@ INITIAL_BTC = START_BTC
 INITIAL_TOTAL_USDT = START_USDT  # Kommer uppdateras med BTC värde
 
 # Logg-filer
-LOG_DIR        = os.path.join(ROOT, "logs")
+REPLAY_LOG_DIR = os.path.join(ROOT, "logs", "replay")
+LOG_DIR        = FANOUT.log_dir if FANOUT else (CLI_ARGS.log_dir or (REPLAY_LOG_DIR if REPLAY else os.path.join(ROOT, "logs")))
 ORDERS_CSV     = os.path.join(LOG_DIR, "orders_paper.csv")
 SUMMARY_CSV    = os.path.join(LOG_DIR, "session_summary.csv")
 TRADE_METRICS_CSV = os.path.join(LOG_DIR, "trade_metrics.csv")
@@ -488,11 +541,86 @@ TRADE_METRICS_HEADER = [
     "pause_timeout_sec",
 ]
 os.makedirs(LOG_DIR, exist_ok=True)
+def _inside_dir(path: str, directory: str) -> bool:
+    path, directory = os.path.realpath(path), os.path.realpath(directory)
+    return path == directory or path.startswith(directory + os.sep)
+
+if OFFLINE:
+    # Replay ska ge identiska loggar mellan körningar → börja från tomma filer.
+    # Rensas bara i replay-katalogen (och fan-outens egna variantkataloger); en
+    # annan --log-dir med befintliga loggar kan vara live-loggarna → avbryt.
+    _old_logs = [p for p in (ORDERS_CSV, SUMMARY_CSV, TRADE_METRICS_CSV, TRADE_METRICS_CSV + SIDECAR_SUFFIX)
+                 if os.path.exists(p)]
+    if _old_logs and not FANOUT and not _inside_dir(LOG_DIR, REPLAY_LOG_DIR):
+        raise SystemExit(
+            f"❌ Replay skriver inte över befintliga loggar i {LOG_DIR} "
+            f"({', '.join(os.path.basename(p) for p in _old_logs)}).\n"
+            f"   Välj en tom --log-dir (eller utelämna den → {REPLAY_LOG_DIR}), eller flytta filerna först."
+        )
+    for _log_path in _old_logs:
+        os.remove(_log_path)
+if REPLAY:
+    print(f"⏪ REPLAY: {REPLAY.describe()} → loggar i {LOG_DIR}")
+
+# Percentil-sketches (MFE/MAE/duration) bredvid trade-loggen, uppdateras vid varje exit
+# (se quantile_sketch.py). Sidecaren hämtar ikapp rader som loggats efter senaste sparning.
+TRADE_SKETCHES: Optional[TradeSketches] = (
+    TradeSketches(TRADE_METRICS_CSV, save_every=int(cfg.get("trade_sketch_save_every", 10)))
+    if bool(cfg.get("trade_sketches_enabled", True)) else None
+)
+
+# Spela in varje observerad tick till kompakt binärlogg (inte vid replay/fan-out)
+TICK_RECORD_ENABLED = bool(cfg.get("tick_record_enabled", False)) and not OFFLINE and not FANOUT
+if TICK_RECORD_ENABLED:
+    tick_recorder: Optional[TickRecorder] = TickRecorder(
+        directory=os.path.join(ROOT, cfg.get("tick_record_dir", "recordings")),
+        symbol=SYMBOL,
+        price_decimals=int(cfg.get("tick_record_decimals", 2)),
+    ).start()
+    print(f"📼 Tick-inspelning aktiv → {tick_recorder.directory}")
+else:
+    tick_recorder = None
+
+# Förfyll graf- och trendbuffertar vid start (se warm_start.py). Inte vid replay:
+# där ska allt komma ur tickfilen. Inte heller i fan-out/farm: där hämtar bara
+# mataren från nätet, en klines-förfrågan per variant skulle slå i rate limits.
+WARM_START_ENABLED = bool(cfg.get("warm_start_enabled", True)) and not OFFLINE and not FANOUT
+WARM_START_SOURCE = cfg.get("warm_start_source", "auto")
+WARM_START_MAX_GAP_SEC = float(cfg.get("warm_start_max_gap_sec", 30))
+
+# Checkpoint av motorns tillstånd för --resume efter krasch/deploy (se checkpoint.py).
+# Inte vid replay: där börjar varje körning om från tickfilens start.
+CHECKPOINT = Checkpointer(
+    path=os.path.join(ROOT, cfg.get("checkpoint_path") or os.path.join(LOG_DIR, "engine_checkpoint.json")),
+    interval_sec=float(cfg.get("checkpoint_interval_sec", 5)),
+    enabled=bool(cfg.get("checkpoint_enabled", True)) and not OFFLINE,
+)
+
+# Latens per steg i huvudloopen (fetch/scale/exit/csv/refresh ...), se latency_stats.py
+LATENCY = LatencyStats(
+    enabled=bool(cfg.get("latency_stats_enabled", False)),
+    metrics_path=os.path.join(LOG_DIR, "latency_metrics.jsonl"),
+    report_sec=float(cfg.get("latency_report_sec", 60)),
+    prometheus_port=int(cfg.get("latency_prometheus_port", 0)),
+)
+
+# Profilering på begäran i den körande processen (profile.cmd i LOG_DIR eller SIGUSR1/SIGUSR2), se live_profiler.py
+PROFILER = LiveProfiler(
+    LOG_DIR,
+    enabled=bool(cfg.get("profiler_enabled", True)),
+    default_sec=float(cfg.get("profiler_default_sec", 30)),
+    default_mode=str(cfg.get("profiler_mode", "sample")),
+    tracemalloc_at_start=bool(cfg.get("profiler_tracemalloc", False)),
+)
 
 # Börja med riktiga priser
 BINANCE_PUBLIC = "https://api.binance.com"
 
 def get_live_price(symbol: str) -> Decimal:
+    if FANOUT:
+        return FANOUT.get_price(symbol)
+    if REPLAY:
+        return REPLAY.get_price(symbol)
     r = requests.get(f"{BINANCE_PUBLIC}/api/v3/ticker/price",
                      params={"symbol": symbol},
                      timeout=5)
@@ -501,27 +629,28 @@ def get_live_price(symbol: str) -> Decimal:
 
 # ----------------------- CSV-hjälp -------------------------------------------
 def append_csv_row(path: str, row: list, header: Optional[list] = None) -> None:
-    max_retries = 5
-    retry_delay = 0.2
-    exists = os.path.exists(path)
-    for attempt in range(max_retries):
-        try:
-            with open(path, "a", newline="", encoding="utf-8") as wf:
-                cw = csv.writer(wf)
-                if (not exists) and header:
-                    cw.writerow(header)
-                    exists = True
-                cw.writerow(row)
-            return
-        except PermissionError:
-            if attempt < max_retries - 1:
-                time.sleep(retry_delay)
-            else:
-                print(f"⚠️ Kan inte skriva till {path} - stäng Excel om den är öppen")
+    with LATENCY.measure("csv"):
+        max_retries = 5
+        retry_delay = 0.2
+        exists = os.path.exists(path)
+        for attempt in range(max_retries):
+            try:
+                with open(path, "a", newline="", encoding="utf-8") as wf:
+                    cw = csv.writer(wf)
+                    if (not exists) and header:
+                        cw.writerow(header)
+                        exists = True
+                    cw.writerow(row)
+                return
+            except PermissionError:
+                if attempt < max_retries - 1:
+                    time.sleep(retry_delay)
+                else:
+                    print(f"⚠️ Kan inte skriva till {path} - stäng Excel om den är öppen")
+                    return
+            except Exception as e:
+                print(f"⚠️ Loggningsfel för {path}: {e}")
                 return
-        except Exception as e:
-            print(f"⚠️ Loggningsfel för {path}: {e}")
-            return
 
 # ----------------------- PaperBroker -----------------------------------------
 class PaperBroker:
@@ -544,8 +673,7 @@ class PaperBroker:
 
     def market_buy(self, symbol: str, qty: Decimal, price: Decimal) -> None:
         # FUTURES-STYLE: Can buy even if we're in SHORT (negative BTC balance)
-        cost = (price * qty).quantize(Decimal("0.00000001"), rounding=ROUND_DOWN)
-        fee  = (cost * TAKER_FEE_PCT).quantize(Decimal("0.00000001"), rounding=ROUND_DOWN)
+        cost, fee = TAKER_FEE.notional_and_fee(price, qty)
         total = cost + fee
         
         # Only check USDT if we're buying MORE than our SHORT position
@@ -558,19 +686,19 @@ class PaperBroker:
         
         self.balances["USDT"] -= total
         self.balances["BTC"]  += qty
+        CHECKPOINT.mark_dirty()
         append_csv_row(ORDERS_CSV, [
-            datetime.now(timezone.utc).isoformat(timespec="seconds")+"Z",
+            CLOCK.now_utc().isoformat(timespec="seconds")+"Z",
             "", "BUY", symbol, f"{qty}", f"{price}", f"{-total}", f"{qty}", "", "", "paper-futures"
         ])
 
     def market_sell(self, symbol: str, qty: Decimal, price: Decimal) -> None:
         # FUTURES-STYLE: Allow SHORT even with 0 BTC (simulates borrowing)
-        proceeds = (price * qty).quantize(Decimal("0.00000001"), rounding=ROUND_DOWN)
-        fee  = (proceeds * TAKER_FEE_PCT).quantize(Decimal("0.00000001"), rounding=ROUND_DOWN)
+        proceeds, fee = TAKER_FEE.notional_and_fee(price, qty)
         net  = proceeds - fee
         
         # Check if we have enough USDT for margin (2x leverage = 50% margin)
-        required_margin = proceeds * Decimal("0.5")  # 2x leverage
+        required_margin = proceeds * HALF  # 2x leverage
         if self.balances["USDT"] < required_margin:
             raise RuntimeError(f"Otillräcklig margin: behöver {required_margin} USDT, har {self.balances['USDT']}")
         
@@ -578,9 +706,10 @@ class PaperBroker:
         self.balances["BTC"]  -= qty
         # Add proceeds to USDT
         self.balances["USDT"] += net
+        CHECKPOINT.mark_dirty()
         
         append_csv_row(ORDERS_CSV, [
-            datetime.now(timezone.utc).isoformat(timespec="seconds")+"Z",
+            CLOCK.now_utc().isoformat(timespec="seconds")+"Z",
             "", "SELL", symbol, f"{qty}", f"{price}", f"{net}", f"{-qty}", "", "", "paper-futures"
         ])
 
@@ -590,9 +719,9 @@ class PaperBroker:
             pnl_usd = (exit_price - entry_price) * qty
         else:
             pnl_usd = (entry_price - exit_price) * qty
-        pnl_pct = (pnl_usd / (entry_price * qty) * Decimal("100")) if entry_price != 0 else Decimal("0")
+        pnl_pct = (pnl_usd / (entry_price * qty) * HUNDRED) if entry_price != 0 else ZERO
         append_csv_row(ORDERS_CSV, [
-            datetime.now(timezone.utc).isoformat(timespec="seconds")+"Z",
+            CLOCK.now_utc().isoformat(timespec="seconds")+"Z",
             state, "EXIT", symbol, f"{qty}", f"{exit_price}", "", "", f"{pnl_usd:.8f}", f"{pnl_pct:.6f}", "paper-exit"
         ])
         self.exits += 1
@@ -603,53 +732,18 @@ class PaperBroker:
 
     def session_pnl(self) -> Tuple[Decimal, Decimal]:
         change = self.balances["USDT"] - self.start_usdt
-        pct = (change / self.start_usdt * Decimal("100")) if self.start_usdt != 0 else Decimal("0")
-        return change.quantize(Decimal("0.0001")), pct.quantize(Decimal("0.0001"))
-
-# ----------------------- Markov-räknare --------------------------------------
-class MarkovState:
-    STATES = ("LW", "LB", "SW", "SB")
-
-    def __init__(self):
-        self.counts = {s: 0 for s in self.STATES}
-        self.trans = {s: {t: 0 for t in self.STATES} for s in self.STATES}
-        self.prev_state: Optional[str] = None
-        max_len = max(2, LOSS_PAUSE_CNT or 0, DIR_BIAS_COUNT or 0)
-        self.last_states: deque[str] = deque(maxlen=max_len if max_len > 0 else 2)
-
-    def on_state(self, state: str):
-        if state not in self.STATES:
-            return
-        self.counts[state] += 1
-        if self.prev_state is not None and self.prev_state in self.STATES:
-            self.trans[self.prev_state][state] += 1
-        self.prev_state = state
-        self.last_states.append(state)
-
-    def empirical_stationary(self) -> Dict[str, float]:
-        total = sum(self.counts.values())
-        if total == 0:
-            return {s: 0.0 for s in self.STATES}
-        return {s: float(self.counts[s]) / float(total) for s in self.STATES}
-
-    def transition_matrix(self) -> list[list[float]]:
-        mat = []
-        for s in self.STATES:
-            row_sum = sum(self.trans[s].values())
-            if row_sum == 0:
-                mat.append([0.0 for _ in self.STATES])
-            else:
-                mat.append([self.trans[s][t] / row_sum for t in self.STATES])
-        return mat
+        pct = (change / self.start_usdt * HUNDRED) if self.start_usdt != 0 else ZERO
+        return change.quantize(Q4), pct.quantize(Q4)
 
 # ----------------------- Globalt tillstånd -----------------------------------
 class Position:
     def __init__(self):
         self.side: Literal["LONG","SHORT","FLAT"] = "FLAT"
         self.entry: Optional[Decimal] = None
-        self.qty: Decimal = Decimal("0")
-        self.initial_qty: Decimal = Decimal("0")  # För scaling tracking
-        self.total_cost: Decimal = Decimal("0")  # Totalt investerat (för avg pris)
+        self.qty: Decimal = ZERO
+        self.initial_qty: Decimal = ZERO  # För scaling tracking
+        self.total_cost: Decimal = ZERO  # Totalt investerat (för avg pris)
+        self._avg_cache: Tuple[Optional[Decimal], Optional[Decimal], Decimal] = (None, None, ZERO)
         self.tp_chain_count: int = 0
         self.entry_time: float = 0.0
         self.high: Optional[Decimal] = None
@@ -661,9 +755,9 @@ class Position:
     def flat(self):
         self.side = "FLAT"
         self.entry = None
-        self.qty = Decimal("0")
-        self.initial_qty = Decimal("0")
-        self.total_cost = Decimal("0")
+        self.qty = ZERO
+        self.initial_qty = ZERO
+        self.total_cost = ZERO
         self.tp_chain_count = 0
         self.entry_time = 0.0
         self.high = None
@@ -675,8 +769,13 @@ class Position:
     def avg_entry_price(self) -> Decimal:
         """Beräkna genomsnittligt entry-pris baserat på total cost och qty"""
         if self.qty > 0:
-            return self.total_cost / self.qty
-        return self.entry if self.entry else Decimal("0")
+            # Samma total_cost- och qty-objekt → samma kvot; räkna bara om vid ändring
+            cached_cost, cached_qty, avg = self._avg_cache
+            if cached_cost is not self.total_cost or cached_qty is not self.qty:
+                avg = self.total_cost / self.qty
+                self._avg_cache = (self.total_cost, self.qty, avg)
+            return avg
+        return self.entry if self.entry else ZERO
 
     def update_extremes(self, price: Decimal) -> None:
         if self.entry is None or self.side == "FLAT":
@@ -689,20 +788,27 @@ class Position:
     def unrealized_pnl_pct(self, current_price: Decimal) -> Decimal:
         """Beräkna unrealized PnL% baserat på genomsnittligt entry-pris"""
         if self.qty == 0 or self.entry is None:
-            return Decimal("0")
+            return ZERO
         
         avg_entry = self.avg_entry_price()
         if avg_entry == 0:
-            return Decimal("0")
+            return ZERO
         
         if self.side == "LONG":
-            return (current_price - avg_entry) / avg_entry * Decimal("100")
+            return (current_price - avg_entry) / avg_entry * HUNDRED
         else:  # SHORT
-            return (avg_entry - current_price) / avg_entry * Decimal("100")
+            return (avg_entry - current_price) / avg_entry * HUNDRED
 
 pos   = Position()
-mk    = MarkovState()
+mk    = MarkovState(history_len=max(2, LOSS_PAUSE_CNT or 0, DIR_BIAS_COUNT or 0), order=MARKOV_ORDER)
 paper = PaperBroker(START_USDT, START_BTC)
+perf  = PerformanceTracker(float(START_USDT), keep_history=False)  # Sharpe/drawdown/PF löpande, O(1) per exit
+if MARKOV_FIT_FROM_LOGS:
+    _fitted = mk.outcomes.fit_from_trade_metrics(TRADE_METRICS_CSV)
+    if _fitted:
+        print(f"🎲 Markov ordning {MARKOV_ORDER}: {_fitted} utfall från {TRADE_METRICS_CSV}")
+markov_gate_logged: Dict[str, int] = {}  # sida → modellversion som senast loggades som blockerad
+markov_gate_blocked_since = 0.0          # CLOCK-tid när grinden började blockera (0 = släpper igenom)
 
 # v2.9.4: BREAKOUT-ONLY MODE (förenkling)
 # Använder bara BREAKOUT-strategi (följ trenden vid L-brytning)
@@ -725,9 +831,9 @@ position_size_state = {
 loss_pause_state: Dict[str, Optional[object]] = {
     "active": False,
     "direction": None,
-    "anchor": Decimal("0"),
-    "high": Decimal("0"),
-    "low": Decimal("0"),
+    "anchor": ZERO,
+    "high": ZERO,
+    "low": ZERO,
     "resume_at": 0.0,
     "started_at": 0.0,
 }
@@ -735,17 +841,17 @@ loss_pause_state: Dict[str, Optional[object]] = {
 def reset_loss_pause_state() -> None:
     loss_pause_state["active"] = False
     loss_pause_state["direction"] = None
-    loss_pause_state["anchor"] = Decimal("0")
-    loss_pause_state["high"] = Decimal("0")
-    loss_pause_state["low"] = Decimal("0")
+    loss_pause_state["anchor"] = ZERO
+    loss_pause_state["high"] = ZERO
+    loss_pause_state["low"] = ZERO
     loss_pause_state["resume_at"] = 0.0
     loss_pause_state["started_at"] = 0.0
 block_long_until: float = 0.0
 block_short_until: float = 0.0
 consec_long_losses: int = 0
 consec_short_losses: int = 0
-last_long_rearm: Decimal = Decimal("0")
-last_short_rearm: Decimal = Decimal("0")
+last_long_rearm: Decimal = ZERO
+last_short_rearm: Decimal = ZERO
 
 print("🔄 Hämtar startpris från Binance...")
 START_PRICE = get_live_price(SYMBOL)
@@ -754,8 +860,8 @@ last_short_rearm = START_PRICE
 
 # Startband ±0.05% (kan justeras)
 START_BAND_PCT = Decimal(str(cfg.get("start_band_pct", 0.0005)))
-L_lower = (START_PRICE * (Decimal("1") - START_BAND_PCT)).quantize(Decimal("0.01"))
-L_upper = (START_PRICE * (Decimal("1") + START_BAND_PCT)).quantize(Decimal("0.01"))
+L_lower = (START_PRICE * (ONE - START_BAND_PCT)).quantize(Q2)
+L_upper = (START_PRICE * (ONE + START_BAND_PCT)).quantize(Q2)
 START_MODE = True
 
 # v2.9.3: FAST L-LINJE (icke-adaptiv)
@@ -798,7 +904,7 @@ if PROGRESSIVE_SCALING:
         print(f"➖ Scale OUT: {out_levels} (exita {float(SCALE_OUT_MULT)*100:.0f}% per nivå, min {float(MIN_SCALE_MULT)*100:.0f}%)")
 print(f"💰 Startbalans: {paper.snapshot()}\n")
 
-SESSION_START = datetime.now(timezone.utc)
+SESSION_START = CLOCK.now_utc()
 
 # ----------------------- Hjälpfunktioner -------------------------------------
 def crossed(a: Decimal, b: Decimal, direction: Literal["up","down"]) -> bool:
@@ -815,11 +921,11 @@ def get_dynamic_qty() -> Decimal:
     # Applicera dynamic sizing (loss streak reduction)
     if DYNAMIC_SIZING:
         multiplier = SIZE_LEVELS[position_size_state["current_level_index"]]
-        base_qty = (base_qty * Decimal(str(multiplier))).quantize(Decimal("0.00000001"), rounding=ROUND_DOWN)
+        base_qty = mul_down(base_qty, Decimal(str(multiplier)))
     
     # Applicera initial position multiplier (börja liten om progressive scaling)
     if PROGRESSIVE_SCALING:
-        base_qty = (base_qty * INITIAL_POS_MULT).quantize(Decimal("0.00000001"), rounding=ROUND_DOWN)
+        base_qty = mul_down(base_qty, INITIAL_POS_MULT)
     
     return base_qty
 
@@ -856,7 +962,7 @@ def enter_long(price: Decimal):
     pos.qty = get_dynamic_qty()
     pos.initial_qty = pos.qty  # Spara initial för scaling
     pos.total_cost = price * pos.qty  # Initial kostnad
-    pos.entry_time = time.time()
+    pos.entry_time = CLOCK.time()
     pos.high = price
     pos.low = price
     pos.scaled_in_levels = []
@@ -886,7 +992,7 @@ def enter_short(price: Decimal):
     pos.qty = get_dynamic_qty()
     pos.initial_qty = pos.qty  # Spara initial för scaling
     pos.total_cost = price * pos.qty  # Initial kostnad
-    pos.entry_time = time.time()
+    pos.entry_time = CLOCK.time()
     pos.high = price
     pos.low = price
     pos.scaled_in_levels = []
@@ -912,9 +1018,9 @@ def enter_short(price: Decimal):
 def chain_threshold(side: str, L_: Decimal) -> Decimal:
     """Litet extra brott som krävs för kedje-entry efter TP (anti-dubbeltick)."""
     if side == "LONG":
-        return (L_ * (Decimal("1") + TP_CHAIN_GAP_PCT)).quantize(Decimal("0.01"))
+        return (L_ * (ONE + TP_CHAIN_GAP_PCT)).quantize(Q2)
     else:
-        return (L_ * (Decimal("1") - TP_CHAIN_GAP_PCT)).quantize(Decimal("0.01"))
+        return (L_ * (ONE - TP_CHAIN_GAP_PCT)).quantize(Q2)
 
 # ----------------------- SCALING IN/OUT --------------------------------------
 def check_scale_in(price: Decimal):
@@ -930,16 +1036,19 @@ def check_scale_in(price: Decimal):
     # Detta gör att scale IN triggar på SAMMA pris som scale OUT
     if pos.side == "LONG":
         # LONG: worst = pos.low, retracement = priset går UPP från low
-        retracement_pct = (price - pos.low) / pos.low if pos.low > 0 else Decimal("0")
+        retracement_pct = (price - pos.low) / pos.low if pos.low > 0 else ZERO
         direction_str = f"UP from low {pos.low:.2f} to {price:.2f}"
     else:
         # SHORT: worst = pos.high, retracement = priset går NER från high
-        retracement_pct = (pos.high - price) / pos.high if pos.high > 0 else Decimal("0")
+        retracement_pct = (pos.high - price) / pos.high if pos.high > 0 else ZERO
         direction_str = f"DOWN from high {pos.high:.2f} to {price:.2f}"
     
     # Debug: visa retracement_pct och första nivån
-    first_level = SCALE_IN_LEVELS[0] if SCALE_IN_LEVELS else Decimal("0")
-    if retracement_pct >= first_level * Decimal("0.8"):  # Visa när vi är nära första nivån
+    if retracement_pct < SCALE_IN_GATE:
+        return  # Under lägsta tröskeln: inget att skriva ut, trigga eller resetta
+    
+    first_level = SCALE_IN_LEVELS[0] if SCALE_IN_LEVELS else ZERO
+    if retracement_pct >= SCALE_IN_DEBUG_LEVEL:  # Visa när vi är nära första nivån (80%)
         print(f"🔍 SCALE IN check ({pos.side}): {direction_str} = retracement {float(retracement_pct)*100:.4f}%, need {float(first_level)*100:.2f}% for first scale")
     
     # Kolla varje scale-in nivå (triggad vid retracement från worst)
@@ -966,7 +1075,7 @@ def check_scale_in(price: Decimal):
                 print(f"📥 Återställer exakt mängd från scale-out nivå {i}: {add_qty}")
             else:
                 # Om inget scalades out på denna nivå, lägg till standard-belopp
-                add_qty = (pos.initial_qty * SCALE_IN_MULT).quantize(Decimal("0.00000001"), rounding=ROUND_DOWN)
+                add_qty = mul_down(pos.initial_qty, SCALE_IN_MULT)
             
             new_qty = pos.qty + add_qty
             
@@ -1011,14 +1120,17 @@ def check_scale_out(price: Decimal):
     # Beräkna loss % från ENTRY (priset rör sig BORT från L = dåligt!)
     if pos.side == "LONG":
         # LONG entry UNDER L: loss = priset går NER (bort från L)
-        loss_pct = (pos.entry - price) / pos.entry if pos.entry > 0 else Decimal("0")
+        loss_pct = (pos.entry - price) / pos.entry if pos.entry > 0 else ZERO
     else:
         # SHORT entry ÖVER L: loss = priset går UPP (bort från L)
-        loss_pct = (price - pos.entry) / pos.entry if pos.entry > 0 else Decimal("0")
+        loss_pct = (price - pos.entry) / pos.entry if pos.entry > 0 else ZERO
     
     # Debug när nära första nivån
-    first_level = SCALE_OUT_LEVELS[0] if SCALE_OUT_LEVELS else Decimal("0")
-    if loss_pct >= first_level * Decimal("0.5"):
+    if loss_pct < SCALE_OUT_GATE:
+        return  # Under lägsta tröskeln: inget att skriva ut, trigga eller resetta
+    
+    first_level = SCALE_OUT_LEVELS[0] if SCALE_OUT_LEVELS else ZERO
+    if loss_pct >= SCALE_OUT_DEBUG_LEVEL:
         direction_str = "DOWN" if pos.side == "LONG" else "UP"
         print(f"🔍 SCALE OUT check ({pos.side}): price {direction_str} from {pos.entry:.2f} to {price:.2f} = loss {float(loss_pct)*100:.4f}%, need {float(first_level)*100:.2f}% for first scale")
     
@@ -1035,13 +1147,13 @@ def check_scale_out(price: Decimal):
         
         if loss_pct >= level:  # När förlusten når nivån, minska position!
             # Scala ner hela vägen till 0% (ingen min-gräns)
-            reduce_qty = (pos.qty * SCALE_OUT_MULT).quantize(Decimal("0.00000001"), rounding=ROUND_DOWN)
+            reduce_qty = mul_down(pos.qty, SCALE_OUT_MULT)
             new_qty = pos.qty - reduce_qty
             
             # Om vi når nästan 0, stäng helt och börja om
-            if new_qty < pos.initial_qty * Decimal("0.05"):  # Under 5% = stäng helt
+            if new_qty < pos.initial_qty * SCALE_OUT_CLOSE_FRACTION:  # Under 5% = stäng helt
                 reduce_qty = pos.qty  # Stäng allt
-                new_qty = Decimal("0")
+                new_qty = ZERO
             
             if reduce_qty > 0:
                 if ORDER_TEST:
@@ -1056,7 +1168,7 @@ def check_scale_out(price: Decimal):
                 pos.qty = new_qty
                 pos.scaled_out_levels.append(i)
                 pos.scaled_out_amounts[i] = reduce_qty  # Spara hur mycket som togs bort
-                total_mult = pos.qty / pos.initial_qty if pos.initial_qty > 0 else Decimal("0")
+                total_mult = pos.qty / pos.initial_qty if pos.initial_qty > 0 else ZERO
                 
                 # Om positionen tynde bort helt (0%), exit och börja om
                 if pos.qty == 0:
@@ -1135,11 +1247,11 @@ def do_exit(side: str, exit_price: Decimal, state_tag: str):
         'price': float(exit_price)
     })
 
-    exit_epoch = time.time()
+    exit_epoch = CLOCK.time()
     exit_ts_iso = datetime.fromtimestamp(exit_epoch, tz=timezone.utc).isoformat(timespec="seconds") + "Z"
     duration_sec = exit_epoch - entry_time if entry_time else 0.0
-    zero = Decimal("0")
-    denom = entry_price if entry_price != zero else Decimal("1")
+    zero = ZERO
+    denom = entry_price if entry_price != zero else ONE
     # Mean Reversion: MFE = rörelse MOT L, MAE = rörelse BORT från L
     mfe_abs: Decimal
     mae_abs: Decimal
@@ -1163,7 +1275,7 @@ def do_exit(side: str, exit_price: Decimal, state_tag: str):
 
     # L flyttas INTE här - flyttas endast vid L-korsning i maybe_exit
     # (last_long_rearm används inte i denna strategi)
-    mk.on_state(state_tag)
+    mk.on_state(state_tag, outcome_state(state_tag, side, pnl_pct))
 
     if LOSS_PAUSE_CNT > 0 and len(mk.last_states) >= LOSS_PAUSE_CNT:
         recent = list(mk.last_states)[-LOSS_PAUSE_CNT:]
@@ -1217,6 +1329,21 @@ def do_exit(side: str, exit_price: Decimal, state_tag: str):
         ],
         header=TRADE_METRICS_HEADER,
     )
+    if TRADE_SKETCHES is not None:
+        TRADE_SKETCHES.sync()  # bara raden som just skrevs
+        TRADE_SKETCHES.maybe_save()
+    perf.add_trade(TradeResult(
+        entry_time=datetime.fromtimestamp(entry_time, tz=timezone.utc).isoformat(timespec="seconds") if entry_time else "",
+        exit_time=exit_ts_iso,
+        side=side,
+        entry_price=entry_price,
+        exit_price=exit_price,
+        qty=qty,
+        pnl_pct=float(pnl_pct) / 100.0,
+        pnl_usd=pnl_usd,
+        exit_reason=state_tag,
+        duration_sec=max(0.0, duration_sec),
+    ))
 
     # Uppdatera positionsstorlek baserat på win/loss
     if state_tag in ("LW", "SW"):
@@ -1292,7 +1419,7 @@ def check_max_loss_protection(price: Decimal) -> bool:
     
     # 2. Kolla position tid
     if pos.entry_time > 0:
-        time_in_position = time.time() - pos.entry_time
+        time_in_position = CLOCK.time() - pos.entry_time
         if time_in_position > MAX_POSITION_TIME_SEC:
             print(f"\n{'='*70}")
             print(f"⏰ MAX TIME PROTECTION TRIGGERED!")
@@ -1329,7 +1456,7 @@ def maybe_exit(price: Decimal):
     # UNDANTAG 1: Om positionen är nästan helt utfasad (< 10% kvar), exit direkt
     # UNDANTAG 2: Om TP nådd (meningsfull vinst), exit direkt
     if pos.side != "FLAT" and pos.entry_time > 0:
-        time_in_position = time.time() - pos.entry_time
+        time_in_position = CLOCK.time() - pos.entry_time
         position_pct = (pos.qty / pos.initial_qty * 100) if pos.initial_qty > 0 else 100
         
         # Beräkna aktuell P&L
@@ -1356,7 +1483,7 @@ def maybe_exit(price: Decimal):
         if current_mode == "BREAKOUT":
             # BREAKOUT LONG: TP när priset går UPP (fortsatt momentum), Stop vid återgång till L
             # TP: price >= entry + TP_PCT
-            tp_target = pos.avg_entry_price() * (Decimal("1") + TP_PCT)
+            tp_target = pos.avg_entry_price() * TP_LONG_MULT
             if price >= tp_target:
                 print(f"✅ LONG EXIT [BREAKOUT]: TP nådd @ {price:.2f} (target {tp_target:.2f})")
                 if ORDER_TEST:
@@ -1402,7 +1529,7 @@ def maybe_exit(price: Decimal):
         if current_mode == "BREAKOUT":
             # BREAKOUT SHORT: TP när priset går NER (fortsatt momentum), Stop vid återgång till L
             # TP: price <= entry - TP_PCT
-            tp_target = pos.avg_entry_price() * (Decimal("1") - TP_PCT)
+            tp_target = pos.avg_entry_price() * TP_SHORT_MULT
             if price <= tp_target:
                 print(f"✅ SHORT EXIT [BREAKOUT]: TP nådd @ {price:.2f} (target {tp_target:.2f})")
                 if ORDER_TEST:
@@ -1443,6 +1570,34 @@ def maybe_exit(price: Decimal):
                 print(f"✅ Win exit - going FLAT. PnL: {float(pnl_pct):.2f}%")
                 refresh_lines(price)
 
+def markov_gate_allows(side: str) -> bool:
+    """
+    True om ordning-k-modellen inte avråder från en entry åt `side`.
+    Uppslaget cachas i modellen tills nästa exit → i praktiken gratis per tick.
+    Efter MARKOV_GATE_MAX_BLOCK_SEC blockering släpps en prov-entry igenom.
+    """
+    global markov_gate_blocked_since
+    if not MARKOV_GATE_ENABLED:
+        return True
+    p_win, order, n = mk.outcomes.win_probability(side, MARKOV_GATE_MIN_SAMPLES)
+    if p_win is None or p_win >= MARKOV_GATE_MIN_WIN_PROB:
+        markov_gate_blocked_since = 0.0
+        return True
+    now_ts = CLOCK.time()
+    if not markov_gate_blocked_since:
+        markov_gate_blocked_since = now_ts
+    elif MARKOV_GATE_MAX_BLOCK_SEC > 0 and now_ts - markov_gate_blocked_since >= MARKOV_GATE_MAX_BLOCK_SEC:
+        print(f"🎲 Markov-grind: blockerad i {now_ts - markov_gate_blocked_since:.0f}s → "
+              f"släpper igenom en {side}-entry som prov (P(vinst) = {p_win:.2f}, n={n})")
+        markov_gate_blocked_since = 0.0
+        return True
+    if markov_gate_logged.get(side) != mk.outcomes.version:
+        markov_gate_logged[side] = mk.outcomes.version
+        hist = " ".join(mk.outcomes.history()[-order:]) if order else "-"
+        print(f"🎲 Markov-grind: {side} blockerad, P(vinst | {hist}) = {p_win:.2f} "
+              f"< {MARKOV_GATE_MIN_WIN_PROB:.2f} (n={n})")
+    return False
+
 def maybe_enter(price: Decimal):
     """
     ADAPTIVE ENTRY: Använder current_mode för att avgöra entry-riktning
@@ -1451,12 +1606,12 @@ def maybe_enter(price: Decimal):
     """
     global START_MODE, L, loss_pause_state
 
-    now_ts = time.time()
+    now_ts = CLOCK.time()
     if loss_pause_state["active"]:
         resume_at = float(loss_pause_state.get("resume_at") or 0.0)
         anchor_price = loss_pause_state.get("anchor")
         resume_reason = ""
-        move_delta = Decimal("0")
+        move_delta = ZERO
 
         if isinstance(anchor_price, Decimal) and anchor_price > 0:
             high_price = loss_pause_state.get("high")
@@ -1468,8 +1623,8 @@ def maybe_enter(price: Decimal):
                 loss_pause_state["low"] = price
                 low_price = price
 
-            high_delta = (high_price - anchor_price) / anchor_price if isinstance(high_price, Decimal) and high_price > anchor_price else Decimal("0")
-            low_delta = (anchor_price - low_price) / anchor_price if isinstance(low_price, Decimal) and low_price < anchor_price else Decimal("0")
+            high_delta = (high_price - anchor_price) / anchor_price if isinstance(high_price, Decimal) and high_price > anchor_price else ZERO
+            low_delta = (anchor_price - low_price) / anchor_price if isinstance(low_price, Decimal) and low_price < anchor_price else ZERO
             move_delta = high_delta if high_delta >= low_delta else low_delta
 
             if PAUSE_RESUME_PCT > 0 and move_delta >= PAUSE_RESUME_PCT:
@@ -1494,8 +1649,11 @@ def maybe_enter(price: Decimal):
         if len(py) < 20:
             return
         
-        START_MODE = False
         current_mode = mode_manager.current_mode
+        start_side = "LONG" if (price > L) == (current_mode == "BREAKOUT") else "SHORT"
+        if not markov_gate_allows(start_side):
+            return
+        START_MODE = False
         
         # Entry baserat på MODE och position relativt L
         if price > L:
@@ -1527,6 +1685,10 @@ def maybe_enter(price: Decimal):
     if pos.side == "FLAT":
         # Kolla om priset korsar L för att öppna ny position
         current_mode = mode_manager.current_mode
+        if price != L:
+            side = "LONG" if (price > L) == (current_mode == "BREAKOUT") else "SHORT"
+            if not markov_gate_allows(side):
+                return
         
         if price > L:
             # Priset ÖVER L
@@ -1636,6 +1798,128 @@ drawn_annotations = []
 # Offset för att tracka absolut tick-nummer (för att kunna rulla grafen)
 tick_offset = 0
 
+def warm_start_buffers() -> int:
+    """
+    Fyll py/px och trend_detector med senaste minuternas priser (samplade i
+    loopens takt) så att START_MODE och trendanalysen inte behöver vänta.
+    Returnerar antal förfyllda ticks (0 = kallstart).
+    """
+    global tick_offset
+    if not WARM_START_ENABLED:
+        return 0
+    t0 = time.perf_counter()
+    prices, source = load_seed_prices(
+        SYMBOL, GRAPH_UPDATE_SEC, max_points, WARM_START_SOURCE,
+        record_dir=os.path.join(ROOT, cfg.get("tick_record_dir", "recordings")),
+        max_gap_sec=WARM_START_MAX_GAP_SEC,
+        base_url=BINANCE_PUBLIC,
+    )
+    if not prices:
+        print("ℹ️ Warm start: ingen historik hittades – kallstart")
+        return 0
+    for tick, price in enumerate(prices):
+        py.append(float(price))
+        px.append(tick)
+        if len(py) == max_points:
+            tick_offset += 1
+        trend_detector.add_price(price)
+    elapsed_ms = (time.perf_counter() - t0) * 1000
+    print(f"🔥 Warm start: {len(prices)} priser från {source} ({len(prices) * GRAPH_UPDATE_SEC / 60:.1f} min) på {elapsed_ms:.0f} ms")
+    return len(prices)
+
+# ----------------------- Checkpoint / --resume -------------------------------
+def checkpoint_state() -> Dict[str, object]:
+    """Allt som behövs för att fortsätta exakt där motorn var (se checkpoint.py)."""
+    return {
+        "symbol": SYMBOL,
+        "position": {
+            "side": pos.side,
+            "entry": pos.entry,
+            "qty": pos.qty,
+            "initial_qty": pos.initial_qty,
+            "total_cost": pos.total_cost,
+            "tp_chain_count": pos.tp_chain_count,
+            "entry_time": pos.entry_time,
+            "high": pos.high,
+            "low": pos.low,
+            "scaled_in_levels": pos.scaled_in_levels,
+            "scaled_out_levels": pos.scaled_out_levels,
+            "scaled_out_amounts": pos.scaled_out_amounts,
+        },
+        "L": L,
+        "start_mode": START_MODE,
+        "block_long_until": block_long_until,
+        "block_short_until": block_short_until,
+        "consec_long_losses": consec_long_losses,
+        "consec_short_losses": consec_short_losses,
+        "last_long_rearm": last_long_rearm,
+        "last_short_rearm": last_short_rearm,
+        "loss_pause": loss_pause_state,
+        "position_size": position_size_state,
+        "markov": mk.to_dict(),  # inkl. ordning-k-modellen (outcomes)
+        "paper": {
+            "balances": paper.balances,
+            "start_usdt": paper.start_usdt,
+            "exits": paper.exits,
+        },
+        "exit_history": exit_history,
+        "performance": perf.to_dict(),
+    }
+
+def resume_from_checkpoint() -> bool:
+    """Återställ tillståndet från CHECKPOINT.path. False = kallstart."""
+    global L, START_MODE, block_long_until, block_short_until
+    global consec_long_losses, consec_short_losses, last_long_rearm, last_short_rearm
+    t0 = time.perf_counter()
+    state = CHECKPOINT.load()
+    if state is None:
+        print(f"ℹ️ --resume: ingen checkpoint i {CHECKPOINT.path} – kallstart")
+        return False
+    if state.get("symbol") != SYMBOL:
+        print(f"⚠️ --resume: checkpoint gäller {state.get('symbol')}, inte {SYMBOL} – kallstart")
+        return False
+
+    p = state["position"]
+    pos.side = p["side"]
+    pos.entry = p["entry"]
+    pos.qty = p["qty"]
+    pos.initial_qty = p["initial_qty"]
+    pos.total_cost = p["total_cost"]
+    pos.tp_chain_count = int(p["tp_chain_count"])
+    pos.entry_time = float(p["entry_time"])
+    pos.high = p["high"]
+    pos.low = p["low"]
+    pos.scaled_in_levels = list(p["scaled_in_levels"])
+    pos.scaled_out_levels = list(p["scaled_out_levels"])
+    pos.scaled_out_amounts = {int(k): v for k, v in p["scaled_out_amounts"].items()}
+
+    L = state["L"]
+    START_MODE = bool(state["start_mode"])
+    block_long_until = float(state["block_long_until"])
+    block_short_until = float(state["block_short_until"])
+    consec_long_losses = int(state["consec_long_losses"])
+    consec_short_losses = int(state["consec_short_losses"])
+    last_long_rearm = state["last_long_rearm"]
+    last_short_rearm = state["last_short_rearm"]
+    loss_pause_state.update(state["loss_pause"])
+    position_size_state.update(state["position_size"])
+
+    mk.load_dict(state["markov"])
+
+    paper.balances = dict(state["paper"]["balances"])
+    paper.start_usdt = state["paper"]["start_usdt"]
+    paper.exits = int(state["paper"]["exits"])
+    exit_history.clear()
+    exit_history.extend(state["exit_history"])
+    if "performance" in state:
+        perf.load_dict(state["performance"])
+
+    age = checkpoint_age_sec(state, CLOCK.time())
+    elapsed_ms = (time.perf_counter() - t0) * 1000
+    where = f"{pos.side} {pos.qty} @ {_fmt_opt_decimal(pos.avg_entry_price())}" if pos.side != "FLAT" else "FLAT"
+    print(f"♻️ Återupptog checkpoint ({age:.0f}s gammal, {elapsed_ms:.1f} ms): {where} | L={L:.2f} | saldon {paper.snapshot()}")
+    return True
+
 def _fmt_opt_decimal(d: Optional[Decimal]) -> str:
     """Säker formattering för valfri Decimal (undviker NoneType.__format__-fel)."""
     if d is None:
@@ -1646,6 +1930,8 @@ def _fmt_opt_decimal(d: Optional[Decimal]) -> str:
         return str(d)
 
 def refresh_lines(current_price: Decimal):
+    if HEADLESS:
+        return
     # Pris
     xs = list(range(len(py)))
     price_line.set_data(xs, list(py))
@@ -1658,7 +1944,7 @@ def refresh_lines(current_price: Decimal):
     # TP-linje visas när position är öppen
     if not START_MODE and pos.entry is not None and pos.side != "FLAT":
         # Beräkna TP-nivå baserat på entry
-        tp_target = float(pos.avg_entry_price() * (Decimal("1") + TP_PCT))
+        tp_target = float(pos.avg_entry_price() * TP_LONG_MULT)
         
         if pos.side == "LONG":
             # LONG: TP ovanför L-linjen (priset går uppåt)
@@ -1700,7 +1986,7 @@ def refresh_lines(current_price: Decimal):
         
         # ALLTID inkludera TP-linjen om position är öppen
         if not START_MODE and pos.entry is not None and pos.side != "FLAT":
-            tp_target = float(pos.avg_entry_price() * (Decimal("1") + TP_PCT))
+            tp_target = float(pos.avg_entry_price() * TP_LONG_MULT)
             lo = min(lo, tp_target)
             hi = max(hi, tp_target)
         
@@ -1720,7 +2006,7 @@ def refresh_lines(current_price: Decimal):
         
         # TP label (när position är öppen)
         if not START_MODE and pos.entry is not None and pos.side != "FLAT":
-            tp_target = float(pos.avg_entry_price() * (Decimal("1") + TP_PCT))
+            tp_target = float(pos.avg_entry_price() * TP_LONG_MULT)
             TP_text.set_position((x_pos, tp_target))
             TP_text.set_text(f' TP: {tp_target:.2f}')
             TP_text.set_visible(True)
@@ -1854,6 +2140,9 @@ def refresh_lines(current_price: Decimal):
             
             # Format: 🟢L✓ $12.34 +1.2%
             history_lines.append(f"{side_symbol}{result} ${pnl_usd:>6.2f} {pnl_pct:>+5.1f}%")
+        history_lines.append("━━━━━━━━━━━━━━━")
+        history_lines.append(f"SR {perf.sharpe_ratio:.2f} PF {perf.profit_factor:.2f}")
+        history_lines.append(f"DD ${perf.max_drawdown_usd:.2f}")
         
         exit_history_info = "\n".join(history_lines)
     else:
@@ -1921,13 +2210,113 @@ def refresh_lines(current_price: Decimal):
         # Ignorera matplotlib errors (t.ex. om fönster stängs)
         pass
 
+def print_session_summary() -> None:
+    """Skriv sessionens resultat och session_summary.csv (vid Ctrl+C eller slut på replay)."""
+    change, pct = paper.session_pnl()
+    print("\n🛑 Avslutar...")
+    print(f"💰 Sessionens resultat (USDT-förändring): {change:+.4f} USDT  ({pct:+.4f} %)")
+    
+    # Visa alla exit-resultat från denna session
+    print("\n📋 Exit-sammanfattning:")
+    total_exits = 0
+    wins = 0
+    losses = 0
+    breakevens = 0
+    total_pnl = ZERO
+    
+    # Läs sessions start-tid som string för jämförelse
+    session_start_str = SESSION_START.strftime("%Y-%m-%d")
+    
+    try:
+        with open(ORDERS_CSV, 'r', encoding='utf-8') as f:
+            lines = f.readlines()
+            for line in lines:
+                # Kolla om det är en EXIT-rad från dagens session
+                if 'EXIT' in line and session_start_str in line:
+                    parts = line.strip().split(',')
+                    if len(parts) >= 10:
+                        timestamp = parts[0]
+                        state = parts[1]
+                        pnl_usd = Decimal(parts[8]) if parts[8] else ZERO
+                        pnl_pct = Decimal(parts[9]) if parts[9] else ZERO
+                        total_exits += 1
+                        total_pnl += pnl_usd
+                        
+                        if pnl_usd > 0:
+                            wins += 1
+                            print(f"  ✅ {timestamp[:19]} {state}: +{pnl_usd:.4f} USDT (+{pnl_pct:.2f}%)")
+                        elif pnl_usd < 0:
+                            losses += 1
+                            print(f"  ❌ {timestamp[:19]} {state}: {pnl_usd:.4f} USDT ({pnl_pct:.2f}%)")
+                        else:
+                            breakevens += 1
+                            print(f"  ➖ {timestamp[:19]} {state}: {pnl_usd:.4f} USDT ({pnl_pct:.2f}%)")
+    except Exception as e:
+        print(f"⚠️ Kunde inte läsa exit-historik: {e}")
+    
+    if total_exits > 0:
+        win_rate = (wins / total_exits * 100) if total_exits > 0 else 0
+        print(f"\n📊 Totalt: {total_exits} exits | Vinster: {wins} | Förluster: {losses} | BE: {breakevens}")
+        print(f"📈 Win rate: {win_rate:.1f}% | Total PnL från exits: {total_pnl:+.4f} USDT")
+    
+    if perf.total_trades:
+        m = perf.calculate_metrics()
+        print(f"📐 Sharpe {m.sharpe_ratio:.2f} | Profit factor {m.profit_factor:.2f} | "
+              f"Max DD ${m.max_drawdown_usd:.2f} ({m.max_drawdown_pct:.2f}%) | "
+              f"Längsta svit: {m.longest_win_streak} vinster / {m.longest_loss_streak} förluster")
+    
+    print(f"\n💼 Slutliga saldon: {paper.snapshot()}")
+    print(f"📁 Orders logg: {ORDERS_CSV}")
+
+    # session summary
+    end_usdt = paper.balances["USDT"]
+    end_btc  = paper.balances["BTC"]
+    SESSION_END = CLOCK.now_utc()
+    emp_stat = mk.empirical_stationary()
+    trans = mk.transition_matrix()
+
+    header = [
+        "session_start_utc","session_end_utc","symbol",
+        "tp_pct","taker_fee_pct","poll_sec","rearm_gap_pct","min_move_pct",
+        "tp_chain","tp_chain_gap_pct","tp_chain_max","cooldown_sec",
+        "vol_filter","vol_period","min_volatility",
+        "loss_pause_cnt","loss_pause_sec","pause_resume_pct","reentry_break_pct",
+        "dir_bias_count","dir_bias_cooldown",
+        "exits","pnl_usdt","pnl_pct","end_usdt","end_btc","mode",
+        "cnt_LW","cnt_LB","cnt_SW","cnt_SB",
+        "emp_LW","emp_LB","emp_SW","emp_SB",
+        "T_LW->LW","T_LW->LB","T_LW->SW","T_LW->SB",
+        "T_LB->LW","T_LB->LB","T_LB->SW","T_LB->SB",
+        "T_SW->LW","T_SW->LB","T_SW->SW","T_SW->SB",
+        "T_SB->LW","T_SB->LB","T_SB->SW","T_SB->SB",
+    ]
+    row = [
+        SESSION_START.isoformat(timespec="seconds")+"Z",
+        SESSION_END.isoformat(timespec="seconds")+"Z",
+        SYMBOL,
+        f"{TP_PCT}", f"{TAKER_FEE_PCT}", f"{POLL_SEC}", f"{REARM_GAP_PCT}", f"{MIN_MOVE_PCT}",
+        f"{TP_CHAIN}", f"{TP_CHAIN_GAP_PCT}", f"{TP_CHAIN_MAX}", f"{COOLDOWN_SEC}",
+        f"{VOL_FILTER}", f"{VOL_PERIOD}", f"{MIN_VOL}",
+        f"{LOSS_PAUSE_CNT}", f"{LOSS_PAUSE_SEC}", f"{PAUSE_RESUME_PCT}", f"{REENTRY_BREAK_PCT}",
+        f"{DIR_BIAS_COUNT}", f"{DIR_BIAS_COOLDOWN}",
+        paper.exits, *paper.session_pnl(), f"{end_usdt}", f"{end_btc}", "paper",
+        mk.counts["LW"], mk.counts["LB"], mk.counts["SW"], mk.counts["SB"],
+        f"{emp_stat['LW']:.6f}", f"{emp_stat['LB']:.6f}", f"{emp_stat['SW']:.6f}", f"{emp_stat['SB']:.6f}",
+        f"{trans[0][0]:.6f}", f"{trans[0][1]:.6f}", f"{trans[0][2]:.6f}", f"{trans[0][3]:.6f}",
+        f"{trans[1][0]:.6f}", f"{trans[1][1]:.6f}", f"{trans[1][2]:.6f}", f"{trans[1][3]:.6f}",
+        f"{trans[2][0]:.6f}", f"{trans[2][1]:.6f}", f"{trans[2][2]:.6f}", f"{trans[2][3]:.6f}",
+        f"{trans[3][0]:.6f}", f"{trans[3][1]:.6f}", f"{trans[3][2]:.6f}", f"{trans[3][3]:.6f}",
+    ]
+    append_csv_row(SUMMARY_CSV, row, header=header)
+    print(f"🧾 Sessions-summering: {SUMMARY_CSV}")
+
 # ----------------------- Huvudloop -------------------------------------------
 last_price_cache: Optional[Decimal] = None
 
 def main():
     global last_price_cache, L, INITIAL_TOTAL_USDT
     tick = 0
-    last_trade_check = time.time()  # Timer för trading-beslut
+    last_trade_check = CLOCK.time()  # Timer för trading-beslut
     
     print("▶️  Startar trading loop... (Ctrl+C för att avsluta)")
     print(f"📊 Graf uppdateras var {GRAPH_UPDATE_SEC}s, trading-beslut var {POLL_SEC}s")
@@ -1937,6 +2326,12 @@ def main():
         print(f"📊 Pause-resume default: {PAUSE_RESUME_PCT*100:.4f}%")
     if ADAPTIVE_L_ENABLED:
         print(f"🧠 Adaptive L: baseline={adaptive_L_calc.baseline_window}, trend={adaptive_L_calc.trend_window}, update var {ADAPTIVE_L_UPDATE_INTERVAL}:e tick")
+    if CLI_ARGS.resume:
+        if CHECKPOINT.enabled:
+            resume_from_checkpoint()
+        else:
+            print("ℹ️ --resume ignoreras: checkpoints är avstängda (checkpoint_enabled=false eller replay)")
+    tick = warm_start_buffers()
     print()
     
     # Beräkna initial total value (USDT + BTC värde) vid första price fetch
@@ -1947,7 +2342,11 @@ def main():
 
     try:
         while True:
+            mark = LATENCY.start()
             price = get_live_price(SYMBOL)
+            mark = LATENCY.lap("fetch", mark)
+            if tick_recorder is not None:
+                tick_recorder.record(int(time.time() * 1000), last=price)
             last_price_cache = price
             py.append(float(price))
             px.append(tick)
@@ -1983,9 +2382,10 @@ def main():
             # Scaling fungerar som säkerhet om priset går åt "fel" håll
             
             pos.update_extremes(price)
+            mark = LATENCY.lap("update", mark)
 
             # ========== TRADING LOGIC (körs endast var POLL_SEC) ==========
-            current_time = time.time()
+            current_time = CLOCK.time()
             if current_time - last_trade_check >= POLL_SEC:
                 last_trade_check = current_time
                 
@@ -2005,118 +2405,44 @@ def main():
                             check_scale_out(price)  # Price moving away from L (up)
                         elif price < pos.high:  # Only scale in if recovering from high
                             check_scale_in(price)   # Price recovering toward L
+                    mark = LATENCY.lap("scale", mark)
 
                 # 🛡️ KRITISK: Kolla max loss protection FÖRST (innan normal exit)
                 if pos.side != "FLAT":
-                    if check_max_loss_protection(price):
+                    closed = check_max_loss_protection(price)
+                    mark = LATENCY.lap("protection", mark)
+                    if closed:
                         # Position stängdes av safety - skippa normal exit/entry
                         refresh_lines(price)
+                        LATENCY.lap("refresh", mark)
+                        LATENCY.maybe_report()
+                        PROFILER.poll()
+                        CHECKPOINT.maybe_save(checkpoint_state, CLOCK.time())
                         tick += 1
-                        time.sleep(GRAPH_UPDATE_SEC)
+                        CLOCK.sleep(GRAPH_UPDATE_SEC)
                         continue
 
                 # EXIT → ENTRY (kedja/vändning) sker inne i do_exit/maybe_exit
                 maybe_exit(price)
+                mark = LATENCY.lap("exit", mark)
                 maybe_enter(price)
+                mark = LATENCY.lap("enter", mark)
 
             # ========== GRAF UPPDATERING (körs varje loop) ==========
             refresh_lines(price)
+            LATENCY.lap("refresh", mark)
+            LATENCY.maybe_report()
+            PROFILER.poll()
+            # Efter hela ticken → konsistent tillstånd; direkt vid trade, annars med intervall
+            CHECKPOINT.maybe_save(checkpoint_state, CLOCK.time())
 
             tick += 1
-            time.sleep(GRAPH_UPDATE_SEC)  # Graf uppdateras snabbt (0.5s)
+            CLOCK.sleep(GRAPH_UPDATE_SEC)  # Graf uppdateras snabbt (0.5s)
 
-    except KeyboardInterrupt:
-        change, pct = paper.session_pnl()
-        print("\n🛑 Avslutar...")
-        print(f"💰 Sessionens resultat (USDT-förändring): {change:+.4f} USDT  ({pct:+.4f} %)")
-        
-        # Visa alla exit-resultat från denna session
-        print("\n📋 Exit-sammanfattning:")
-        total_exits = 0
-        wins = 0
-        losses = 0
-        breakevens = 0
-        total_pnl = Decimal("0")
-        
-        # Läs sessions start-tid som string för jämförelse
-        session_start_str = SESSION_START.strftime("%Y-%m-%d")
-        
-        try:
-            with open(ORDERS_CSV, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-                for line in lines:
-                    # Kolla om det är en EXIT-rad från dagens session
-                    if 'EXIT' in line and session_start_str in line:
-                        parts = line.strip().split(',')
-                        if len(parts) >= 10:
-                            timestamp = parts[0]
-                            state = parts[1]
-                            pnl_usd = Decimal(parts[8]) if parts[8] else Decimal("0")
-                            pnl_pct = Decimal(parts[9]) if parts[9] else Decimal("0")
-                            total_exits += 1
-                            total_pnl += pnl_usd
-                            
-                            if pnl_usd > 0:
-                                wins += 1
-                                print(f"  ✅ {timestamp[:19]} {state}: +{pnl_usd:.4f} USDT (+{pnl_pct:.2f}%)")
-                            elif pnl_usd < 0:
-                                losses += 1
-                                print(f"  ❌ {timestamp[:19]} {state}: {pnl_usd:.4f} USDT ({pnl_pct:.2f}%)")
-                            else:
-                                breakevens += 1
-                                print(f"  ➖ {timestamp[:19]} {state}: {pnl_usd:.4f} USDT ({pnl_pct:.2f}%)")
-        except Exception as e:
-            print(f"⚠️ Kunde inte läsa exit-historik: {e}")
-        
-        if total_exits > 0:
-            win_rate = (wins / total_exits * 100) if total_exits > 0 else 0
-            print(f"\n📊 Totalt: {total_exits} exits | Vinster: {wins} | Förluster: {losses} | BE: {breakevens}")
-            print(f"📈 Win rate: {win_rate:.1f}% | Total PnL från exits: {total_pnl:+.4f} USDT")
-        
-        print(f"\n💼 Slutliga saldon: {paper.snapshot()}")
-        print(f"📁 Orders logg: {ORDERS_CSV}")
-
-        # session summary
-        end_usdt = paper.balances["USDT"]
-        end_btc  = paper.balances["BTC"]
-        SESSION_END = datetime.now(timezone.utc)
-        emp_stat = mk.empirical_stationary()
-        trans = mk.transition_matrix()
-
-        header = [
-            "session_start_utc","session_end_utc","symbol",
-            "tp_pct","taker_fee_pct","poll_sec","rearm_gap_pct","min_move_pct",
-            "tp_chain","tp_chain_gap_pct","tp_chain_max","cooldown_sec",
-            "vol_filter","vol_period","min_volatility",
-            "loss_pause_cnt","loss_pause_sec","pause_resume_pct","reentry_break_pct",
-            "dir_bias_count","dir_bias_cooldown",
-            "exits","pnl_usdt","pnl_pct","end_usdt","end_btc","mode",
-            "cnt_LW","cnt_LB","cnt_SW","cnt_SB",
-            "emp_LW","emp_LB","emp_SW","emp_SB",
-            "T_LW->LW","T_LW->LB","T_LW->SW","T_LW->SB",
-            "T_LB->LW","T_LB->LB","T_LB->SW","T_LB->SB",
-            "T_SW->LW","T_SW->LB","T_SW->SW","T_SW->SB",
-            "T_SB->LW","T_SB->LB","T_SB->SW","T_SB->SB",
-        ]
-        row = [
-            SESSION_START.isoformat(timespec="seconds")+"Z",
-            SESSION_END.isoformat(timespec="seconds")+"Z",
-            SYMBOL,
-            f"{TP_PCT}", f"{TAKER_FEE_PCT}", f"{POLL_SEC}", f"{REARM_GAP_PCT}", f"{MIN_MOVE_PCT}",
-            f"{TP_CHAIN}", f"{TP_CHAIN_GAP_PCT}", f"{TP_CHAIN_MAX}", f"{COOLDOWN_SEC}",
-            f"{VOL_FILTER}", f"{VOL_PERIOD}", f"{MIN_VOL}",
-            f"{LOSS_PAUSE_CNT}", f"{LOSS_PAUSE_SEC}", f"{PAUSE_RESUME_PCT}", f"{REENTRY_BREAK_PCT}",
-            f"{DIR_BIAS_COUNT}", f"{DIR_BIAS_COOLDOWN}",
-            paper.exits, *paper.session_pnl(), f"{end_usdt}", f"{end_btc}", "paper",
-            mk.counts["LW"], mk.counts["LB"], mk.counts["SW"], mk.counts["SB"],
-            f"{emp_stat['LW']:.6f}", f"{emp_stat['LB']:.6f}", f"{emp_stat['SW']:.6f}", f"{emp_stat['SB']:.6f}",
-            f"{trans[0][0]:.6f}", f"{trans[0][1]:.6f}", f"{trans[0][2]:.6f}", f"{trans[0][3]:.6f}",
-            f"{trans[1][0]:.6f}", f"{trans[1][1]:.6f}", f"{trans[1][2]:.6f}", f"{trans[1][3]:.6f}",
-            f"{trans[2][0]:.6f}", f"{trans[2][1]:.6f}", f"{trans[2][2]:.6f}", f"{trans[2][3]:.6f}",
-            f"{trans[3][0]:.6f}", f"{trans[3][1]:.6f}", f"{trans[3][2]:.6f}", f"{trans[3][3]:.6f}",
-        ]
-        append_csv_row(SUMMARY_CSV, row, header=header)
-        print(f"🧾 Sessions-summering: {SUMMARY_CSV}")
+    except (KeyboardInterrupt, ReplayFinished):
+        if REPLAY:
+            print(f"\n{REPLAY.speed_report()}")
+        print_session_summary()
 
     except requests.exceptions.RequestException as ex:
         print(f"⚠️ Nätverksfel vid prishämtning: {ex}")
@@ -2126,5 +2452,22 @@ def main():
         print(f"❌ Fel i huvudloopen: {ex}")
         time.sleep(1.0)
 
+    finally:
+        if TRADE_SKETCHES is not None and TRADE_SKETCHES.sketches:
+            TRADE_SKETCHES.save()
+            mfe_75 = TRADE_SKETCHES.quantile("mfe_pct", 0.75, group="win")
+            if mfe_75 is not None:
+                print(f"📐 Sketches: {TRADE_SKETCHES.count()} trades | MFE p75 (vinster) {mfe_75 * 100:.4f}% → {TRADE_SKETCHES.sidecar_path}")
+        if CHECKPOINT.enabled:
+            CHECKPOINT.save(checkpoint_state(), CLOCK.time())
+            print(f"💾 Checkpoint: {CHECKPOINT.path} ({CHECKPOINT.saves} sparningar)")
+        if LATENCY.enabled:
+            LATENCY.report()
+            LATENCY.close()
+        PROFILER.close()
+        if tick_recorder is not None:
+            tick_recorder.close()
+            print(f"📼 Tick-inspelning: {tick_recorder.recorded} ticks → {tick_recorder.path}")
+
 if __name__ == "__main__":
     main()
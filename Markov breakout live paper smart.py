@@ -36,9 +36,17 @@ except ImportError as e:
         "och starta sedan om skriptet."
     ) from e
 
+# Körs skriptet som variant i paper_fanout.py kommer priser, config och loggkatalog därifrån
+from paper_fanout import attached_variant
+from replay import SystemClock
+FANOUT = attached_variant()
+# Klocka: riktig tid live, flödets virtuella tid i fan-out (pauser/cooldowns följer ticksen)
+CLOCK = FANOUT.clock if FANOUT else SystemClock()
+
 # (Valfritt men fint): realtids-graf
 import matplotlib.pyplot as plt
 from collections import deque
+from markov_model import MarkovState  # Markov-räknare (delas med live-skripten)
 
 # Adaptive L-module (DIN IDÉ!)
 try:
@@ -50,7 +58,7 @@ except ImportError:
 
 # ----------------------- Konfig ----------------------------------------------
 ROOT = os.path.dirname(__file__)
-CONFIG_PATH = os.path.join(ROOT, "config.json")
+CONFIG_PATH = FANOUT.config_path if FANOUT else os.path.join(ROOT, "config.json")
 with open(CONFIG_PATH, "r", encoding="utf-8-sig") as f:
     cfg = json.load(f)
 
@@ -134,7 +142,7 @@ START_USDT     = Decimal(str(cfg.get("paper_usdt", "10000")))
 START_BTC      = Decimal(str(cfg.get("paper_btc",  "0.0")))
 
 # Logg-filer
-LOG_DIR        = os.path.join(ROOT, "logs")
+LOG_DIR        = FANOUT.log_dir if FANOUT else os.path.join(ROOT, "logs")
 ORDERS_CSV     = os.path.join(LOG_DIR, "orders_paper.csv")
 SUMMARY_CSV    = os.path.join(LOG_DIR, "session_summary.csv")
 TRADE_METRICS_CSV = os.path.join(LOG_DIR, "trade_metrics.csv")
@@ -164,6 +172,8 @@ os.makedirs(LOG_DIR, exist_ok=True)
 BINANCE_PUBLIC = "https://api.binance.com"
 
 def get_live_price(symbol: str) -> Decimal:
+    if FANOUT:
+        return FANOUT.get_price(symbol)
     r = requests.get(f"{BINANCE_PUBLIC}/api/v3/ticker/price",
                      params={"symbol": symbol},
                      timeout=5)
@@ -222,7 +232,7 @@ class PaperBroker:
         self.balances["USDT"] -= total
         self.balances["BTC"]  += qty
         append_csv_row(ORDERS_CSV, [
-            datetime.now(timezone.utc).isoformat(timespec="seconds")+"Z",
+            CLOCK.now_utc().isoformat(timespec="seconds")+"Z",
             "", "BUY", symbol, f"{qty}", f"{price}", f"{-total}", f"{qty}", "", "", "paper"
         ])
 
@@ -235,7 +245,7 @@ class PaperBroker:
         self.balances["BTC"]  -= qty
         self.balances["USDT"] += net
         append_csv_row(ORDERS_CSV, [
-            datetime.now(timezone.utc).isoformat(timespec="seconds")+"Z",
+            CLOCK.now_utc().isoformat(timespec="seconds")+"Z",
             "", "SELL", symbol, f"{qty}", f"{price}", f"{net}", f"{-qty}", "", "", "paper"
         ])
 
@@ -247,7 +257,7 @@ class PaperBroker:
             pnl_usd = (entry_price - exit_price) * qty
         pnl_pct = (pnl_usd / (entry_price * qty) * Decimal("100")) if entry_price != 0 else Decimal("0")
         append_csv_row(ORDERS_CSV, [
-            datetime.now(timezone.utc).isoformat(timespec="seconds")+"Z",
+            CLOCK.now_utc().isoformat(timespec="seconds")+"Z",
             state, "EXIT", symbol, f"{qty}", f"{exit_price}", "", "", f"{pnl_usd:.8f}", f"{pnl_pct:.6f}", "paper-exit"
         ])
         self.exits += 1
@@ -261,42 +271,6 @@ class PaperBroker:
         pct = (change / self.start_usdt * Decimal("100")) if self.start_usdt != 0 else Decimal("0")
         return change.quantize(Decimal("0.0001")), pct.quantize(Decimal("0.0001"))
 
-# ----------------------- Markov-räknare --------------------------------------
-class MarkovState:
-    STATES = ("LW", "LB", "SW", "SB")
-
-    def __init__(self):
-        self.counts = {s: 0 for s in self.STATES}
-        self.trans = {s: {t: 0 for t in self.STATES} for s in self.STATES}
-        self.prev_state: Optional[str] = None
-        max_len = max(2, LOSS_PAUSE_CNT or 0, DIR_BIAS_COUNT or 0)
-        self.last_states: deque[str] = deque(maxlen=max_len if max_len > 0 else 2)
-
-    def on_state(self, state: str):
-        if state not in self.STATES:
-            return
-        self.counts[state] += 1
-        if self.prev_state is not None and self.prev_state in self.STATES:
-            self.trans[self.prev_state][state] += 1
-        self.prev_state = state
-        self.last_states.append(state)
-
-    def empirical_stationary(self) -> Dict[str, float]:
-        total = sum(self.counts.values())
-        if total == 0:
-            return {s: 0.0 for s in self.STATES}
-        return {s: float(self.counts[s]) / float(total) for s in self.STATES}
-
-    def transition_matrix(self) -> list[list[float]]:
-        mat = []
-        for s in self.STATES:
-            row_sum = sum(self.trans[s].values())
-            if row_sum == 0:
-                mat.append([0.0 for _ in self.STATES])
-            else:
-                mat.append([self.trans[s][t] / row_sum for t in self.STATES])
-        return mat
-
 # ----------------------- Globalt tillstånd -----------------------------------
 class Position:
     def __init__(self):
@@ -332,7 +306,7 @@ class Position:
             self.low = price
 
 pos   = Position()
-mk    = MarkovState()
+mk    = MarkovState(history_len=max(2, LOSS_PAUSE_CNT or 0, DIR_BIAS_COUNT or 0))
 paper = PaperBroker(START_USDT, START_BTC)
 
 # Dynamisk positionsstorlek state
@@ -411,7 +385,7 @@ if PROGRESSIVE_SCALING:
         print(f"➖ Scale OUT: {out_levels} (exita {float(SCALE_OUT_MULT)*100:.0f}% per nivå, min {float(MIN_SCALE_MULT)*100:.0f}%)")
 print(f"💰 Startbalans: {paper.snapshot()}\n")
 
-SESSION_START = datetime.now(timezone.utc)
+SESSION_START = CLOCK.now_utc()
 
 # ----------------------- Hjälpfunktioner -------------------------------------
 def crossed(a: Decimal, b: Decimal, direction: Literal["up","down"]) -> bool:
@@ -468,7 +442,7 @@ def enter_long(price: Decimal):
     pos.entry = price
     pos.qty = get_dynamic_qty()
     pos.initial_qty = pos.qty  # Spara initial för scaling
-    pos.entry_time = time.time()
+    pos.entry_time = CLOCK.time()
     pos.high = price
     pos.low = price
     pos.scaled_in_levels = []
@@ -497,7 +471,7 @@ def enter_short(price: Decimal):
     pos.entry = price
     pos.qty = get_dynamic_qty()
     pos.initial_qty = pos.qty  # Spara initial för scaling
-    pos.entry_time = time.time()
+    pos.entry_time = CLOCK.time()
     pos.high = price
     pos.low = price
     pos.scaled_in_levels = []
@@ -675,7 +649,7 @@ def do_exit(side: str, exit_price: Decimal, state_tag: str):
         'size': 6
     })
 
-    exit_epoch = time.time()
+    exit_epoch = CLOCK.time()
     exit_ts_iso = datetime.fromtimestamp(exit_epoch, tz=timezone.utc).isoformat(timespec="seconds") + "Z"
     duration_sec = exit_epoch - entry_time if entry_time else 0.0
     zero = Decimal("0")
@@ -810,7 +784,7 @@ def do_exit(side: str, exit_price: Decimal, state_tag: str):
                     last_price_cache is not None
                     and last_price_cache >= thr
                     and (REENTRY_BREAK_PCT == 0 or last_price_cache >= last_long_rearm * (Decimal("1") + REENTRY_BREAK_PCT))
-                    and time.time() >= block_long_until
+                    and CLOCK.time() >= block_long_until
                 )
                 if instant_ok:
                     enter_long(last_price_cache)
@@ -821,14 +795,14 @@ def do_exit(side: str, exit_price: Decimal, state_tag: str):
                     last_price_cache is not None
                     and last_price_cache <= thr
                     and (REENTRY_BREAK_PCT == 0 or last_price_cache <= last_short_rearm * (Decimal("1") - REENTRY_BREAK_PCT))
-                    and time.time() >= block_short_until
+                    and CLOCK.time() >= block_short_until
                 )
                 if instant_ok:
                     enter_short(last_price_cache)
                 else:
                     pos.side = "FLAT"
             if COOLDOWN_SEC > 0:
-                time.sleep(COOLDOWN_SEC)
+                CLOCK.sleep(COOLDOWN_SEC)
             return
         else:
             pos.flat()
@@ -879,7 +853,7 @@ def maybe_enter(price: Decimal):
     """Startband → första entry. I drift → entry på faktisk korsning med rearm-gap och min move."""
     global START_MODE, L, loss_pause_state
 
-    now_ts = time.time()
+    now_ts = CLOCK.time()
     if loss_pause_state["active"]:
         resume_at = float(loss_pause_state.get("resume_at") or 0.0)
         anchor_price = loss_pause_state.get("anchor")
@@ -1021,6 +995,8 @@ def _fmt_opt_decimal(d: Optional[Decimal]) -> str:
         return str(d)
 
 def refresh_lines(current_price: Decimal):
+    if FANOUT:
+        return  # ingen graf i fan-out (scoreboarden jämför varianterna)
     # Pris
     xs = list(range(len(py)))
     price_line.set_data(xs, list(py))
@@ -1237,7 +1213,8 @@ def main():
                 refresh_lines(price)
 
             tick += 1
-            time.sleep(POLL_SEC)
+            if not FANOUT:  # fan-out: flödet sätter takten
+                time.sleep(POLL_SEC)
 
     except KeyboardInterrupt:
         change, pct = paper.session_pnl()
@@ -1249,7 +1226,7 @@ def main():
         # session summary
         end_usdt = paper.balances["USDT"]
         end_btc  = paper.balances["BTC"]
-        SESSION_END = datetime.now(timezone.utc)
+        SESSION_END = CLOCK.now_utc()
         emp_stat = mk.empirical_stationary()
         trans = mk.transition_matrix()
 
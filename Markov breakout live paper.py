@@ -30,9 +30,13 @@ except ImportError as e:
         "och starta sedan om skriptet."
     ) from e
 
+# Körs skriptet som variant i paper_fanout.py kommer priser, config och loggkatalog därifrån
+from paper_fanout import attached_variant
+FANOUT = attached_variant()
+
 # === Ladda config (tål UTF-8 BOM) ============================================
 ROOT = os.path.dirname(__file__)
-CONFIG_PATH = os.path.join(ROOT, "config.json")
+CONFIG_PATH = FANOUT.config_path if FANOUT else os.path.join(ROOT, "config.json")
 with open(CONFIG_PATH, "r", encoding="utf-8-sig") as f:
     cfg = json.load(f)
 
@@ -48,7 +52,7 @@ TAKER_FEE_PCT   = Decimal(str(cfg.get("taker_fee_pct", 0.0004))) # 0.04% default
 POLL_SEC        = float(cfg.get("poll_sec", 0.5))                 # polling-intervall sek
 
 # Fil/loggar
-LOG_DIR     = os.path.join(ROOT, "logs")
+LOG_DIR     = FANOUT.log_dir if FANOUT else os.path.join(ROOT, "logs")
 ORDERS_CSV  = os.path.join(LOG_DIR, "orders_paper.csv")
 os.makedirs(LOG_DIR, exist_ok=True)
 
@@ -57,6 +61,8 @@ BINANCE_PUBLIC = "https://api.binance.com"      # ✅ RIKTIGA MARKNADSPRISER!
 
 def get_live_price(symbol: str) -> Decimal:
     """Hämtar det senaste priset från Binance (RIKTIGT marknadspris)"""
+    if FANOUT:
+        return FANOUT.get_price(symbol)
     r = requests.get(f"{BINANCE_PUBLIC}/api/v3/ticker/price",
                      params={"symbol": symbol},
                      timeout=5)
@@ -306,7 +312,8 @@ def main():
                 print(f"ℹ️  Pris: {price:.2f} | L: {L:.2f} | Pos: {pos.side} | USDT={paper.balances['USDT']:.2f} BTC={paper.balances['BTC']:.8f}")
             
             last_price = price
-            time.sleep(POLL_SEC)
+            if not FANOUT:  # fan-out: flödet sätter takten
+                time.sleep(POLL_SEC)
 
         except KeyboardInterrupt:
             print("\n🛑 Avslutar...")
@@ -5,11 +5,14 @@ import time
 import threading
 from decimal import Decimal, ROUND_DOWN
 from datetime import datetime, timezone
-from collections import defaultdict
 
 from binance.client import Client
 from binance.exceptions import BinanceAPIException, BinanceRequestException
 
+from balance_cache import BalanceCache
+from local_order_book import OrderBookFeed
+from markov_model import MarkovCountStore
+
 
 # === Ladda config (tål UTF-8 BOM) ===
 ROOT = os.path.dirname(__file__)
@@ -26,6 +29,9 @@ TESTNET = cfg.get("testnet", True)
 TP_PCT = Decimal(str(cfg.get("tp_pct", 0.0010)))              # 0.10% take profit
 TAKER_FEE_PCT = Decimal(str(cfg.get("taker_fee_pct", 0.0004))) # ungefärlig taker-fee
 ORDER_QTY = Decimal(str(cfg.get("order_qty", 0.001)))         # kvantitet per affär
+BALANCE_REFRESH_SEC = float(cfg.get("balance_refresh_sec", 60))  # saldon via REST i bakgrunden
+LOCAL_ORDER_BOOK = bool(cfg.get("local_order_book", True))       # bästa bid/ask ur lokal bok (diff-depth)
+DEPTH_RECORD_PATH = cfg.get("depth_record_path")                 # spela in snapshot + diffs (JSONL)
 
 # Loggar
 LOG_DIR = os.path.join(ROOT, "logs")
@@ -104,53 +110,14 @@ def log_order(row: list):
             return
 
 
-def load_markov_counts() -> dict:
-    counts = defaultdict(int)
-    if os.path.exists(MARKOV_CSV):
-        with open(MARKOV_CSV, "r", encoding="utf-8") as fp:
-            r = csv.reader(fp)
-            _ = next(r, None)
-            for row in r:
-                a, b, c = row
-                counts[(a, b)] = int(c)
-    return counts
-
-
-def save_markov_counts(counts: dict):
-    with open(MARKOV_CSV, "w", newline="", encoding="utf-8") as fp:
-        w = csv.writer(fp)
-        w.writerow(["from_state", "to_state", "count"])
-        for (a, b), c in sorted(counts.items()):
-            w.writerow([a, b, c])
-
-
-def stationary_distribution(counts: dict) -> dict:
-    states = ["LW", "LB", "SW", "SB"]
-    P = {s: {t: 0.0 for t in states} for s in states}
-    for s in states:
-        row_sum = sum(counts.get((s, t), 0) for t in states)
-        if row_sum == 0:
-            for t in states:
-                P[s][t] = 1.0 / len(states)
-        else:
-            for t in states:
-                P[s][t] = counts.get((s, t), 0) / row_sum
-    pi = {s: 1.0 / len(states) for s in states}
-    for _ in range(100):
-        new = {t: 0.0 for t in states}
-        for s in states:
-            for t in states:
-                new[t] += pi[s] * P[s][t]
-        pi = new
-    return pi
-
-
 # === Strategi ===
 class Strategy:
     def __init__(self, client: Client, symbol: str):
         self.client = client
         self.symbol = symbol
         self.filters = exchange_filters(client, symbol)
+        self.base_asset = symbol.replace("USDT", "")
+        self.balances = BalanceCache(client, refresh_sec=BALANCE_REFRESH_SEC).start()
 
         self.level = last_price(client, symbol)  # L := senaste pris vid start
         self.position = None                     # None | "LONG" | "SHORT" (SHORT i spot = simulerad)
@@ -158,7 +125,7 @@ class Strategy:
         self.entry_qty = Decimal("0")
 
         self.prev_state = None                   # "LW"/"LB"/"SW"/"SB"
-        self.counts = load_markov_counts()
+        self.markov = MarkovCountStore(MARKOV_CSV)  # append-only logg + periodisk snapshot
 
         print(f"🔧 Startnivå L={self.level} för {symbol}")
 
@@ -171,11 +138,20 @@ class Strategy:
         return q
 
     def _free_quote(self, asset="USDT") -> Decimal:
-        acct = self.client.get_account()
-        for b in acct["balances"]:
-            if b["asset"] == asset:
-                return Decimal(b["free"])
-        return Decimal("0")
+        return self.balances.free(asset)  # minnesuppslag, se balance_cache.py
+
+    def _market_order(self, side: str, qty: Decimal) -> dict:
+        """Market-order som håller saldocachen i synk (invaliderar vid fel)."""
+        try:
+            if side == "BUY":
+                resp = self.client.order_market_buy(symbol=self.symbol, quantity=float(qty))
+            else:
+                resp = self.client.order_market_sell(symbol=self.symbol, quantity=float(qty))
+        except Exception:
+            self.balances.invalidate()
+            raise
+        self.balances.apply_order(resp, self.base_asset, "USDT")
+        return resp
 
     def enter_long(self, px: Decimal):
         q = self._legal_qty(ORDER_QTY, px)
@@ -184,7 +160,7 @@ class Strategy:
             print(f"⛔ Otillräckligt USDT ({need:.2f} krävs). Skip LONG.")
             return False
 
-        resp = self.client.order_market_buy(symbol=self.symbol, quantity=float(q))
+        resp = self._market_order("BUY", q)
         avg_px = avg_fill_price(resp) or px
         self.position = "LONG"
         self.entry_price = avg_px
@@ -197,15 +173,13 @@ class Strategy:
 
     def enter_short(self, px: Decimal):
         # Spot kan inte gå "äkta" kort. Försöker sälja om bas-saldo finns (simulerad short).
-        acct = self.client.get_account()
-        base_asset = self.symbol.replace("USDT", "")
-        base_free = Decimal(next((b["free"] for b in acct["balances"] if b["asset"] == base_asset), "0"))
+        base_free = self.balances.free(self.base_asset)
         if base_free <= Decimal("0"):
             print("ℹ️ Inget bas-saldo – hoppar över SHORT i spot. (Futures rekommenderas för short.)")
             return False
 
         q = self._legal_qty(min(base_free, ORDER_QTY), px)
-        resp = self.client.order_market_sell(symbol=self.symbol, quantity=float(q))
+        resp = self._market_order("SELL", q)
         avg_px = avg_fill_price(resp) or px
         self.position = "SHORT"
         self.entry_price = avg_px
@@ -221,13 +195,13 @@ class Strategy:
             return
 
         if self.position == "LONG":
-            resp = self.client.order_market_sell(symbol=self.symbol, quantity=float(self.entry_qty))
+            resp = self._market_order("SELL", self.entry_qty)
             avg_px = avg_fill_price(resp) or px
             pnl_pct = (avg_px / self.entry_price - 1) - (2 * TAKER_FEE_PCT)
             state = "LW" if pnl_pct > 0 else "LB"
             side = "SELL"
         else:
-            resp = self.client.order_market_buy(symbol=self.symbol, quantity=float(self.entry_qty))
+            resp = self._market_order("BUY", self.entry_qty)
             avg_px = avg_fill_price(resp) or px
             pnl_pct = (1 - (avg_px / self.entry_price)) - (2 * TAKER_FEE_PCT)
             state = "SW" if pnl_pct > 0 else "SB"
@@ -239,10 +213,9 @@ class Strategy:
         print(f"🔚 EXIT {self.position} @ {avg_px} (entry {self.entry_price})  ≈ PnL {pnl_pct*100:.3f}%  [{reason}]")
 
         if self.prev_state:
-            self.counts[(self.prev_state, state)] += 1
+            self.markov.record(self.prev_state, state)
         self.prev_state = state
-        save_markov_counts(self.counts)
-        pi = stationary_distribution(self.counts)
+        pi = self.markov.counts.stationary()  # exakt lösning, cachad tills räknarna ändras
         print(f"🧮 Stationär ~ {{ {', '.join([f'{k}:{round(v,3)}' for k,v in pi.items()])} }}")
 
         self.level = avg_px  # ny nivå = utgångspris
@@ -276,22 +249,25 @@ class Strategy:
 
 
 # === REST API polling loop (mer tillförlitlig för testnet) ===
-def start_polling_loop(strat: Strategy, symbol: str, interval: float = 0.5):
+def start_polling_loop(strat: Strategy, symbol: str, interval: float = 0.5, book: OrderBookFeed = None):
     """
-    Pollar bokdjup via REST API istället för WebSocket.
-    Mer tillförlitligt för testnet där WebSocket inte alltid fungerar.
+    Pollar bästa bid/ask var interval:e sekund. Med en lokal orderbok (book)
+    läses de ur minnet; REST-anropet görs bara när boken inte är synkad.
     """
-    print(f"📡 Startar polling för {symbol} (interval: {interval}s)")
+    print(f"📡 Startar polling för {symbol} (interval: {interval}s"
+          f"{', lokal orderbok' if book is not None else ''})")
     
     while True:
         try:
-            # Hämta order book
-            depth = strat.client.get_order_book(symbol=symbol, limit=5)
+            quote = book.best_bid_ask() if book is not None else None
+            if quote is None:
+                # Hämta order book
+                depth = strat.client.get_order_book(symbol=symbol, limit=5)
+                if depth.get("bids") and depth.get("asks"):
+                    quote = Decimal(depth["bids"][0][0]), Decimal(depth["asks"][0][0])
             
-            if depth.get("bids") and depth.get("asks"):
-                best_bid = Decimal(depth["bids"][0][0])
-                best_ask = Decimal(depth["asks"][0][0])
-                strat.on_tick(best_bid, best_ask)
+            if quote is not None:
+                strat.on_tick(*quote)
             
             time.sleep(interval)
             
@@ -311,8 +287,12 @@ def main():
     print("🚀 Startar Binance Testnet live-strategi (REST API polling)...")
     client = Client(API_KEY, API_SECRET, testnet=TESTNET)
     strat = Strategy(client, SYMBOL)
+    book = None
+    if LOCAL_ORDER_BOOK:
+        record_path = os.path.join(ROOT, DEPTH_RECORD_PATH) if DEPTH_RECORD_PATH else None
+        book = OrderBookFeed(client, SYMBOL, testnet=TESTNET, record_path=record_path).start()
 
-    t = threading.Thread(target=start_polling_loop, args=(strat, SYMBOL, 0.5), daemon=True)
+    t = threading.Thread(target=start_polling_loop, args=(strat, SYMBOL, 0.5, book), daemon=True)
     t.start()
 
     try:
@@ -320,6 +300,13 @@ def main():
             time.sleep(1)
     except KeyboardInterrupt:
         print("\n🛑 Avslutar…")
+    finally:
+        strat.markov.close()
+        strat.balances.stop()
+        if book is not None:
+            stats = book.sync.stats
+            print(f"📚 Orderbok: {stats['applied']} diffs, {stats['gaps']} gap, {stats['snapshots']} snapshots")
+            book.stop()
 
 
 if __name__ == "__main__":
@@ -13,187 +13,102 @@ Använder historisk data (eller live paper trading) för att mäta:
 - Antal trades
 - Genomsnittlig trade-duration
 
+PerformanceTracker (performance_tracker.py) uppdaterar alla metrics löpande
+i add_trade(), så calculate_metrics() är O(1) och kan anropas inne i
+sökloopar och live-dashboards.
+
+Pruning: med PruneRules utvärderas varje körning vid kontrollpunkter (t.ex.
+var 10:e % av datat) och avbryts om den redan är klart dålig – för stor
+drawdown, equity under en percentil av redan färdiga körningar vid samma
+kontrollpunkt, eller för få trades. Avbrutna körningar markeras pruned i
+resultaten och räknas inte in i topplistorna.
+
 Kör:
     python strategy_optimizer.py
 """
 
+import bisect
 import json
 import csv
 import itertools
 from pathlib import Path
 from decimal import Decimal
 from datetime import datetime, timezone
-from typing import Dict, List, Any
-from dataclasses import dataclass, asdict
+from typing import Dict, Iterator, List, Any, Optional, Sequence, Tuple
+from dataclasses import asdict, dataclass, field
 
-@dataclass
-class TradeResult:
-    """Resultat från en enskild trade"""
-    entry_time: str
-    exit_time: str
-    side: str  # "LONG" / "SHORT"
-    entry_price: Decimal
-    exit_price: Decimal
-    qty: Decimal
-    pnl_pct: float
-    pnl_usd: float
-    exit_reason: str  # "TP" / "BE" / "SL" / "TRAILING"
-    duration_sec: float
+# Metrics-ackumulatorerna delas med paper-skripten (se performance_tracker.py)
+from performance_tracker import PerformanceTracker, StrategyMetrics, TradeResult
 
 @dataclass
-class StrategyMetrics:
-    """Prestanda-metrics för en strategi-konfiguration"""
-    # Parametrar som testades
-    params: Dict[str, Any]
-    
-    # Resultat
-    total_trades: int
-    long_trades: int
-    short_trades: int
-    
-    wins: int
-    losses: int
-    win_rate: float
-    
-    total_pnl_usd: float
-    total_pnl_pct: float
-    avg_win: float
-    avg_loss: float
-    
-    largest_win: float
-    largest_loss: float
-    
-    max_drawdown_pct: float
-    max_drawdown_usd: float
-    
-    sharpe_ratio: float
-    profit_factor: float
-    
-    avg_trade_duration_sec: float
-    
-    start_capital: float
-    end_capital: float
-    roi_pct: float
+class PruneRules:
+    """
+    Regler för att avbryta en körning i förtid (None = regeln används inte).
+
+    Args:
+        max_drawdown_pct: Avbryt när max drawdown överstiger X %
+        equity_percentile: Avbryt om equity ligger under denna percentil (0-100)
+                           av färdiga körningars equity vid samma kontrollpunkt
+        min_trades: (andel, antal) – t.ex. (0.5, 10): minst 10 trades vid halva datat
+        checkpoints: Andelar av datat där reglerna utvärderas
+        grace: Ingen pruning före denna andel (percentil/drawdown behöver några trades)
+        min_completed: Färdiga körningar som krävs innan percentilregeln används
+    """
+    max_drawdown_pct: Optional[float] = None
+    equity_percentile: Optional[float] = None
+    min_trades: Optional[Tuple[float, int]] = None
+    checkpoints: Sequence[float] = field(default_factory=lambda: [i / 10 for i in range(1, 10)])
+    grace: float = 0.1
+    min_completed: int = 5
+
+
+class Pruner:
+    """Utvärderar PruneRules och minns färdiga körningars equity per kontrollpunkt."""
+
+    def __init__(self, rules: PruneRules):
+        self.rules = rules
+        self.checkpoints = sorted(c for c in rules.checkpoints if 0 < c < 1)
+        self.completed_equity: Dict[float, List[float]] = {c: [] for c in self.checkpoints}
+        self.stats = {"runs": 0, "pruned": 0, "steps": 0, "steps_full": 0}
+
+    def check(self, checkpoint: float, tracker: PerformanceTracker) -> Optional[str]:
+        """Anledning att avbryta vid checkpoint, annars None."""
+        rules = self.rules
+        if checkpoint < rules.grace:
+            return None
+        if rules.max_drawdown_pct is not None and tracker.peak_capital > 0:
+            dd_pct = tracker.max_drawdown_usd / tracker.peak_capital * 100
+            if dd_pct > rules.max_drawdown_pct:
+                return f"drawdown {dd_pct:.2f}% > {rules.max_drawdown_pct}%"
+        if rules.min_trades is not None:
+            at, needed = rules.min_trades
+            if checkpoint >= at and tracker.total_trades < needed:
+                return f"{tracker.total_trades} trades < {needed} vid {at:.0%}"
+        if rules.equity_percentile is not None:
+            done = self.completed_equity.get(checkpoint, [])
+            if len(done) >= rules.min_completed:
+                idx = min(len(done) - 1, int(rules.equity_percentile / 100 * (len(done) - 1)))
+                threshold = done[idx]
+                if tracker.current_capital < threshold:
+                    return f"equity {tracker.current_capital:.2f} < p{rules.equity_percentile:g} {threshold:.2f}"
+        return None
+
+    def record(self, equity_at: Dict[float, float], steps: int, steps_full: int, pruned: bool) -> None:
+        """Registrera en körning; bara färdiga körningar blir referens för percentilregeln."""
+        self.stats["runs"] += 1
+        self.stats["steps"] += steps
+        self.stats["steps_full"] += steps_full
+        if pruned:
+            self.stats["pruned"] += 1
+            return
+        for checkpoint, equity in equity_at.items():
+            bisect.insort(self.completed_equity[checkpoint], equity)
+
+    def summary(self) -> str:
+        s = self.stats
+        skipped = 1 - s["steps"] / s["steps_full"] if s["steps_full"] else 0.0
+        return f"✂️ Pruning: {s['pruned']}/{s['runs']} körningar avbrutna, {skipped:.0%} av backtest-stegen sparade"
 
-class PerformanceTracker:
-    """Spårar prestanda under backtest/live trading"""
-    
-    def __init__(self, start_capital: float):
-        self.start_capital = start_capital
-        self.current_capital = start_capital
-        self.peak_capital = start_capital
-        
-        self.trades: List[TradeResult] = []
-        self.equity_curve: List[float] = [start_capital]
-        
-    def add_trade(self, trade: TradeResult):
-        """Lägg till en trade och uppdatera metrics"""
-        self.trades.append(trade)
-        
-        # Uppdatera kapital
-        self.current_capital += trade.pnl_usd
-        self.equity_curve.append(self.current_capital)
-        
-        # Uppdatera peak för drawdown-beräkning
-        if self.current_capital > self.peak_capital:
-            self.peak_capital = self.current_capital
-    
-    def calculate_metrics(self, params: Dict[str, Any]) -> StrategyMetrics:
-        """Beräkna alla performance metrics"""
-        if not self.trades:
-            return StrategyMetrics(
-                params=params,
-                total_trades=0, long_trades=0, short_trades=0,
-                wins=0, losses=0, win_rate=0.0,
-                total_pnl_usd=0.0, total_pnl_pct=0.0,
-                avg_win=0.0, avg_loss=0.0,
-                largest_win=0.0, largest_loss=0.0,
-                max_drawdown_pct=0.0, max_drawdown_usd=0.0,
-                sharpe_ratio=0.0, profit_factor=0.0,
-                avg_trade_duration_sec=0.0,
-                start_capital=self.start_capital,
-                end_capital=self.current_capital,
-                roi_pct=0.0
-            )
-        
-        # Grundläggande counts
-        total_trades = len(self.trades)
-        long_trades = sum(1 for t in self.trades if t.side == "LONG")
-        short_trades = sum(1 for t in self.trades if t.side == "SHORT")
-        
-        # Wins/Losses
-        wins = sum(1 for t in self.trades if t.pnl_usd > 0)
-        losses = sum(1 for t in self.trades if t.pnl_usd <= 0)
-        win_rate = wins / total_trades if total_trades > 0 else 0.0
-        
-        # PnL
-        total_pnl_usd = sum(t.pnl_usd for t in self.trades)
-        total_pnl_pct = (self.current_capital / self.start_capital - 1) * 100
-        
-        winning_trades = [t for t in self.trades if t.pnl_usd > 0]
-        losing_trades = [t for t in self.trades if t.pnl_usd <= 0]
-        
-        avg_win = sum(t.pnl_usd for t in winning_trades) / len(winning_trades) if winning_trades else 0.0
-        avg_loss = sum(t.pnl_usd for t in losing_trades) / len(losing_trades) if losing_trades else 0.0
-        
-        largest_win = max((t.pnl_usd for t in self.trades), default=0.0)
-        largest_loss = min((t.pnl_usd for t in self.trades), default=0.0)
-        
-        # Max Drawdown
-        max_dd_usd = 0.0
-        peak = self.start_capital
-        for capital in self.equity_curve:
-            if capital > peak:
-                peak = capital
-            dd = peak - capital
-            if dd > max_dd_usd:
-                max_dd_usd = dd
-        
-        max_dd_pct = (max_dd_usd / self.peak_capital * 100) if self.peak_capital > 0 else 0.0
-        
-        # Sharpe Ratio (simplified - använder trade returns)
-        returns = [t.pnl_pct for t in self.trades]
-        if len(returns) > 1:
-            avg_return = sum(returns) / len(returns)
-            std_return = (sum((r - avg_return) ** 2 for r in returns) / (len(returns) - 1)) ** 0.5
-            sharpe_ratio = (avg_return / std_return * (252 ** 0.5)) if std_return > 0 else 0.0
-        else:
-            sharpe_ratio = 0.0
-        
-        # Profit Factor
-        total_wins = sum(t.pnl_usd for t in winning_trades)
-        total_losses = abs(sum(t.pnl_usd for t in losing_trades))
-        profit_factor = total_wins / total_losses if total_losses > 0 else float('inf')
-        
-        # Avg trade duration
-        avg_duration = sum(t.duration_sec for t in self.trades) / len(self.trades)
-        
-        # ROI
-        roi_pct = ((self.current_capital - self.start_capital) / self.start_capital) * 100
-        
-        return StrategyMetrics(
-            params=params,
-            total_trades=total_trades,
-            long_trades=long_trades,
-            short_trades=short_trades,
-            wins=wins,
-            losses=losses,
-            win_rate=win_rate,
-            total_pnl_usd=total_pnl_usd,
-            total_pnl_pct=total_pnl_pct,
-            avg_win=avg_win,
-            avg_loss=avg_loss,
-            largest_win=largest_win,
-            largest_loss=largest_loss,
-            max_drawdown_pct=max_dd_pct,
-            max_drawdown_usd=max_dd_usd,
-            sharpe_ratio=sharpe_ratio,
-            profit_factor=profit_factor,
-            avg_trade_duration_sec=avg_duration,
-            start_capital=self.start_capital,
-            end_capital=self.current_capital,
-            roi_pct=roi_pct
-        )
 
 class StrategyOptimizer:
     """Grid Search för strategi-parametrar"""
@@ -202,9 +117,11 @@ class StrategyOptimizer:
         with open(base_config_path, 'r', encoding='utf-8-sig') as f:
             self.base_config = json.load(f)
     
-    def grid_search(self, param_grid: Dict[str, List[Any]]) -> List[StrategyMetrics]:
+    def grid_search(self, param_grid: Dict[str, List[Any]],
+                    prune: Optional[PruneRules] = None) -> List[StrategyMetrics]:
         """
         Grid search över alla kombinationer av parametrar.
+        Med prune avbryts uppenbart dåliga kombinationer i förtid (se PruneRules).
         
         param_grid exempel:
         {
@@ -224,6 +141,7 @@ class StrategyOptimizer:
         print(f"📊 Parametrar: {param_names}\n")
         
         results = []
+        pruner = Pruner(prune) if prune else None
         
         for idx, combination in enumerate(all_combinations, 1):
             # Skapa config för denna kombination
@@ -234,28 +152,67 @@ class StrategyOptimizer:
             print(f"Test {idx}/{total_tests}: {test_params}")
             
             # Kör backtest med denna config
-            metrics = self._run_backtest(test_config, test_params)
+            metrics = self._run_backtest(test_config, test_params, pruner)
             results.append(metrics)
             
+            if metrics.pruned:
+                print(f"  ✂️ Avbruten vid {metrics.pruned_at:.0%}: {metrics.prune_reason}\n")
+                continue
             print(f"  → Trades: {metrics.total_trades}, Win Rate: {metrics.win_rate:.1%}, "
                   f"PnL: ${metrics.total_pnl_usd:.2f}, Sharpe: {metrics.sharpe_ratio:.2f}\n")
         
+        if pruner:
+            print(pruner.summary())
         return results
     
-    def _run_backtest(self, config: Dict, params: Dict) -> StrategyMetrics:
+    def _run_backtest(self, config: Dict, params: Dict, pruner: Optional[Pruner] = None) -> StrategyMetrics:
         """
-        Kör backtest med given config.
+        Kör backtest med given config. Vid varje kontrollpunkt (andel av datat)
+        frågas pruner om körningen ska avbrytas.
+        """
+        tracker = PerformanceTracker(start_capital=10000, keep_history=False)
+        checkpoints = pruner.checkpoints if pruner else []
+        next_cp = 0
+        equity_at: Dict[float, float] = {}
+        steps = total_steps = 0
+        reason = None
+        progress = 0.0
+        
+        for progress, steps, total_steps, trade in self._simulate_trades(config):
+            if trade is not None:
+                tracker.add_trade(trade)
+            while next_cp < len(checkpoints) and progress >= checkpoints[next_cp]:
+                checkpoint = checkpoints[next_cp]
+                equity_at[checkpoint] = tracker.current_capital
+                next_cp += 1
+                reason = pruner.check(checkpoint, tracker)
+                if reason:
+                    break
+            if reason:
+                break
+        
+        metrics = tracker.calculate_metrics(params)
+        if pruner:
+            pruner.record(equity_at, steps, total_steps, pruned=reason is not None)
+        if reason:
+            metrics.pruned = True
+            metrics.pruned_at = progress
+            metrics.prune_reason = reason
+        return metrics
+    
+    def _simulate_trades(self, config: Dict) -> Iterator[Tuple[float, int, int, Optional[TradeResult]]]:
+        """
+        (andel av datat, steg hittills, totalt antal steg, trade eller None) per steg.
         OBS: Detta är en placeholder - du måste implementera din egen backtest-logik
-        eller integrera med live paper trading.
+        (ett steg per tick/candle) eller integrera med live paper trading.
         """
         # TODO: Implementera faktisk backtest här
         # För nu returnerar vi mock data
         
-        tracker = PerformanceTracker(start_capital=10000)
-        
         # Mock: simulera några trades
         import random
-        for _ in range(50):
+        total = 50
+        for step in range(1, total + 1):
             trade = TradeResult(
                 entry_time=datetime.now(timezone.utc).isoformat(),
                 exit_time=datetime.now(timezone.utc).isoformat(),
@@ -268,9 +225,7 @@ class StrategyOptimizer:
                 exit_reason=random.choice(["TP", "BE", "SL"]),
                 duration_sec=random.uniform(30, 600)
             )
-            tracker.add_trade(trade)
-        
-        return tracker.calculate_metrics(params)
+            yield step / total, step, total, trade
     
     def save_results(self, results: List[StrategyMetrics], output_path: str):
         """Spara resultat till CSV"""
@@ -296,8 +251,8 @@ class StrategyOptimizer:
     
     def print_top_results(self, results: List[StrategyMetrics], top_n: int = 10, 
                          sort_by: str = 'sharpe_ratio'):
-        """Visa de bästa resultaten"""
-        sorted_results = sorted(results, key=lambda x: getattr(x, sort_by), reverse=True)
+        """Visa de bästa resultaten (avbrutna körningar räknas inte)"""
+        sorted_results = sorted((r for r in results if not r.pruned), key=lambda x: getattr(x, sort_by), reverse=True)
         
         print(f"\n🏆 TOP {top_n} RESULTAT (sorterat efter {sort_by}):\n")
         print(f"{'Rank':<6} {'Params':<50} {sort_by:<15} {'Win%':<8} {'PnL$':<10} {'Trades':<8}")
@@ -322,8 +277,15 @@ def main():
         'min_movement_pct': [0.00005, 0.0001, 0.0002]
     }
     
+    # Avbryt uppenbart dåliga kombinationer i förtid
+    prune = PruneRules(
+        max_drawdown_pct=1.0,
+        equity_percentile=25,
+        min_trades=(0.5, 10),
+    )
+    
     # Kör grid search
-    results = optimizer.grid_search(param_grid)
+    results = optimizer.grid_search(param_grid, prune=prune)
     
     # Visa resultat
     optimizer.print_top_results(results, top_n=10, sort_by='sharpe_ratio')
@@ -10,68 +10,109 @@ Analyserar senaste N trades och justerar:
 - Trading hours baserat på hourly win-rate
 
 Kör detta script regelbundet (t.ex. var 100:e trade) för att hålla strategin optimerad.
+
+Loggen läses bakifrån (csv_tail.py): bara de sista N raderna, eller med
+--hours bara dagarna i fönstret via en sidecar med byteoffset per dag.
+Med --watch körs analysen om med jämna mellanrum och läser då bara rader
+som tillkommit sedan förra varvet, så kostnaden växer inte med historiken.
+
+Med --sketches tas MFE-percentilen (TP) och andelen snabba trades (MIN_MOVE,
+COOLDOWN) ur live-skriptets percentil-sketches (quantile_sketch.py) över hela
+historiken istället för att sortera fönstrets värden; övriga mått gäller
+fortfarande fönstret.
+
+    python auto_tune.py                      # senaste 100 trades, fråga innan ändring
+    python auto_tune.py --hours 24           # trades senaste dygnet
+    python auto_tune.py --watch 5            # visa rekommendationer var 5:e minut
+    python auto_tune.py --sketches           # TP/quick-trades ur sketches över hela historiken
 """
 
-import csv
+import argparse
 import json
 import os
-from collections import defaultdict
-from datetime import datetime, timedelta
-from typing import Dict, List, Tuple
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
 import statistics
 
+from csv_tail import CsvTail, DayIndex, parse_utc_ts
+from quantile_sketch import TradeSketches
+
+QUICK_TRADE_SEC = 60
+
 
 class AutoTuner:
-    def __init__(self, config_path: str = "config.json", metrics_path: str = "logs/trade_metrics.csv"):
+    def __init__(self, config_path: str = "config.json", metrics_path: str = "logs/trade_metrics.csv",
+                 lookback_trades: int = 100, lookback_hours: Optional[float] = None,
+                 use_sketches: bool = False):
         self.config_path = config_path
         self.metrics_path = metrics_path
+        self.lookback_trades = lookback_trades
+        self.lookback_hours = lookback_hours
         self.config = self._load_config()
-        self.trades = self._load_recent_trades(lookback_trades=100)
+        self._tail = CsvTail(metrics_path)
+        self._day_index = DayIndex(metrics_path)
+        if lookback_hours is not None:
+            since = datetime.now(timezone.utc) - timedelta(hours=lookback_hours)
+            self.trades = self.load_trades_since(since)
+            self._tail.last(0)  # följ filen från slutet vid refresh()
+        else:
+            self.trades = self._load_recent_trades(lookback_trades=lookback_trades)
+        # Läser sidecaren och hämtar ikapp i minnet, men skriver aldrig i live-skriptets filer
+        self.sketches = TradeSketches(metrics_path, persist=False) if use_sketches else None
         
     def _load_config(self) -> dict:
         """Ladda nuvarande config"""
         with open(self.config_path, "r", encoding="utf-8-sig") as f:
             return json.load(f)
     
+    @staticmethod
+    def _parse_trade(row: dict) -> Optional[dict]:
+        try:
+            return {
+                "timestamp": parse_utc_ts(row["exit_ts"]),
+                "state": row["state"],
+                "side": row["side"],
+                "entry_price": float(row["entry_price"]),
+                "exit_price": float(row["exit_price"]),
+                "duration_sec": float(row["duration_sec"]),
+                "mfe_pct": float(row["mfe_pct"]),
+                "mae_pct": float(row["mae_pct"]),
+            }
+        except (KeyError, ValueError, TypeError):
+            return None
+
     def _load_recent_trades(self, lookback_trades: int = 100) -> List[dict]:
-        """Ladda senaste N trades"""
-        trades = []
-        
+        """Ladda senaste N trades (läser bakifrån – bara de sista raderna)"""
+        if not os.path.exists(self.metrics_path):
+            print(f"⚠️ Hittade inte {self.metrics_path}")
+            return []
+        rows = self._tail.last(lookback_trades)
+        return [t for t in map(self._parse_trade, rows) if t is not None]
+
+    def load_trades_since(self, since: datetime) -> List[dict]:
+        """Alla trades sedan since (seekar till dagen via sidecar-indexet)"""
         if not os.path.exists(self.metrics_path):
             print(f"⚠️ Hittade inte {self.metrics_path}")
-            return trades
-        
-        with open(self.metrics_path, "r", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            all_trades = list(reader)
-            
-        # Ta senaste N trades
-        recent = all_trades[-lookback_trades:] if len(all_trades) > lookback_trades else all_trades
-        
-        for row in recent:
-            try:
-                # Fix timestamp
-                ts_str = row["exit_ts"].replace("Z", "")
-                if ts_str.count("+00:00") > 1:
-                    ts_str = ts_str.replace("+00:00", "", 1)
-                if not ts_str.endswith("+00:00"):
-                    ts_str += "+00:00"
-                
-                trade = {
-                    "timestamp": datetime.fromisoformat(ts_str),
-                    "state": row["state"],
-                    "side": row["side"],
-                    "entry_price": float(row["entry_price"]),
-                    "exit_price": float(row["exit_price"]),
-                    "duration_sec": float(row["duration_sec"]),
-                    "mfe_pct": float(row["mfe_pct"]),
-                    "mae_pct": float(row["mae_pct"]),
-                }
-                trades.append(trade)
-            except (KeyError, ValueError) as e:
-                continue
-        
-        return trades
+            return []
+        rows = self._day_index.rows_since(since)
+        return [t for t in map(self._parse_trade, rows) if t is not None]
+
+    def refresh(self) -> int:
+        """
+        Läs in trades som loggats sedan förra laddningen/refresh (bara nya
+        bytes) och släpp de som fallit ur fönstret. Returnerar antal nya.
+        """
+        new = [t for t in map(self._parse_trade, self._tail.read_new()) if t is not None]
+        if self.sketches is not None:
+            self.sketches.sync()
+        if self.lookback_hours is not None:
+            since = datetime.now(timezone.utc) - timedelta(hours=self.lookback_hours)
+            self.trades = [t for t in self.trades + new if t["timestamp"] >= since]
+        else:
+            self.trades = list(deque(self.trades + new, maxlen=self.lookback_trades))
+        return len(new)
     
     def calculate_win_rate(self) -> float:
         """Beräkna win-rate för senaste trades"""
@@ -89,7 +130,15 @@ class AutoTuner:
     
     def analyze_quick_trades(self) -> Tuple[int, float]:
         """Analysera snabba trades (<60s)"""
-        quick = [t for t in self.trades if t["duration_sec"] < 60]
+        if self.sketches is not None:
+            # Andel under QUICK_TRADE_SEC ur duration-sketcherna (alla resp. vinster)
+            all_d = self.sketches.sketch("duration_sec")
+            win_d = self.sketches.sketch("duration_sec", "win")
+            quick_n = all_d.count * all_d.cdf(QUICK_TRADE_SEC)
+            if quick_n < 1:
+                return 0, 0.0
+            return int(round(quick_n)), min(1.0, win_d.count * win_d.cdf(QUICK_TRADE_SEC) / quick_n)
+        quick = [t for t in self.trades if t["duration_sec"] < QUICK_TRADE_SEC]
         if not quick:
             return 0, 0.0
         wins = sum(1 for t in quick if t["state"] in ["LW", "SW"])
@@ -116,13 +165,16 @@ class AutoTuner:
             return self.config.get("tp_pct", 0.001)
         
         # Beräkna 75:e percentilen av MFE för vinnande trades
-        wins = [t for t in self.trades if t["state"] in ["LW", "SW"]]
-        if not wins:
+        if self.sketches is not None:
+            mfe_75 = self.sketches.quantile("mfe_pct", 0.75, group="win")
+        else:
+            wins = [t["mfe_pct"] for t in self.trades if t["state"] in ["LW", "SW"]]
+            mfe_75 = statistics.quantiles(wins, n=4)[2] if len(wins) >= 2 else (wins[0] if wins else None)
+        if mfe_75 is None:
             # Inga wins → öka TP för att ge mer rum
             current_tp = self.config.get("tp_pct", 0.001)
             return min(current_tp * 1.2, 0.003)  # Öka 20%, max 0.3%
         
-        mfe_75 = statistics.quantiles([t["mfe_pct"] for t in wins], n=4)[2]  # 75th percentile
         
         # TP borde vara lite under 75:e percentilen av MFE
         suggested_tp = mfe_75 * 0.85
@@ -283,11 +335,48 @@ class AutoTuner:
         print(f"✅ Config uppdaterad: {self.config_path}")
 
 
+def watch(tuner: AutoTuner, interval_min: float) -> None:
+    """Analysera om var interval_min minut (bara nya rader läses). Ändrar aldrig config."""
+    print(f"👀 Watch-läge: analys var {interval_min:g} min (Ctrl+C för att avsluta)")
+    try:
+        while True:
+            t0 = time.perf_counter()
+            new = tuner.refresh()
+            recommendations = tuner.generate_recommendations()
+            elapsed_ms = (time.perf_counter() - t0) * 1000
+            stamp = datetime.now().strftime("%H:%M:%S")
+            if "error" in recommendations:
+                print(f"[{stamp}] {recommendations['error']} ({elapsed_ms:.1f} ms)")
+            else:
+                perf = recommendations["current_performance"]
+                print(f"[{stamp}] {perf['trades_analyzed']} trades (+{new}) | WR {perf['win_rate']} | "
+                      f"BE {perf['be_ratio']} | {elapsed_ms:.1f} ms")
+                for reason in recommendations["reasoning"]:
+                    print(f"  • {reason}")
+            time.sleep(interval_min * 60)
+    except KeyboardInterrupt:
+        print("\n🛑 Avslutar watch-läget")
+
+
 def main():
+    parser = argparse.ArgumentParser(description="Föreslå parameterändringar utifrån senaste trades.")
+    parser.add_argument("--config", default="config.json")
+    parser.add_argument("--metrics", default="logs/trade_metrics.csv", help="trade_metrics.csv från live-skriptet")
+    parser.add_argument("--trades", type=int, default=100, help="Antal senaste trades att analysera")
+    parser.add_argument("--hours", type=float, help="Analysera alla trades senaste H timmar istället för --trades")
+    parser.add_argument("--watch", type=float, metavar="MIN", help="Kör om analysen var MIN minut (ändrar inte config)")
+    parser.add_argument("--sketches", action="store_true",
+                        help="TP/quick-trades ur percentil-sketches över hela historiken (quantile_sketch.py)")
+    args = parser.parse_args()
+
     print("🤖 Auto-Tune System - Automatic Strategy Optimization")
     print("="*80)
     
-    tuner = AutoTuner()
+    tuner = AutoTuner(args.config, args.metrics, lookback_trades=args.trades, lookback_hours=args.hours,
+                      use_sketches=args.sketches)
+    if args.watch:
+        watch(tuner, args.watch)
+        return
     
     if not tuner.trades:
         print("❌ Ingen data att analysera. Kör live-scriptet först!")
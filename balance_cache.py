@@ -0,0 +1,245 @@
+"""
+Balance Cache – kontosaldon i minnet istället för get_account() före varje order
+===============================================================================
+Live-strategin (markov_breakout_live.py / Markov breakout live polling.py)
+gjorde tidigare ett REST-anrop till /api/v3/account före varje entry – en full
+rundresa plus request-weight framför varje order. Här hålls saldona lokalt:
+
+    BalanceCache    → free()/locked() är minnesuppslag. Hålls aktuell av
+                      user-data-streamens händelser och av fyllda ordrar
+                      (apply_order), uppdateras periodiskt via REST och
+                      invalideras vid orderfel (nästa free() läser om kontot).
+    UserDataStream  → listenKey + websocket mot Binance user-data-stream,
+                      keepalive var 30:e minut, återansluter vid avbrott.
+
+Ordningen mellan källorna avgörs av Binance tidsstämplar: en REST-snapshot har
+updateTime, outboundAccountPosition har "u" och en order har transactTime.
+Det som redan ingår i senast kända saldo räknas inte en gång till – t.ex. när
+streamen hinner leverera saldot innan orderns REST-svar kommer tillbaka.
+
+Lokal ersättare för tester (ingen nyckel/nätverk): binance_stub.StubAccountClient.
+"""
+
+import json
+import threading
+import time
+from decimal import Decimal
+from typing import Any, Callable, Dict, Optional, Tuple
+
+try:
+    import websocket  # python -m pip install websocket-client
+    WEBSOCKET_AVAILABLE = True
+except ImportError:
+    WEBSOCKET_AVAILABLE = False
+
+ZERO = Decimal("0")
+DEFAULT_REFRESH_SEC = 60.0
+LISTEN_KEY_KEEPALIVE_SEC = 30 * 60
+USER_STREAM_URL = "wss://stream.binance.com:9443/ws/"
+USER_STREAM_URL_TESTNET = "wss://stream.testnet.binance.vision/ws/"
+
+
+class BalanceCache:
+    """
+    Trådsäkra saldon per tillgång (free, locked).
+
+    Args:
+        client: python-binance Client (eller binance_stub.StubAccountClient)
+        refresh_sec: Periodisk REST-uppdatering i bakgrunden (0 = av)
+    """
+
+    def __init__(self, client: Any, refresh_sec: float = DEFAULT_REFRESH_SEC):
+        self.client = client
+        self.refresh_sec = refresh_sec
+        self.balances: Dict[str, Tuple[Decimal, Decimal]] = {}
+        self.as_of_ms = 0           # Binance-tid för senast kända saldo
+        self.valid = False
+        self.stats = {"lookups": 0, "refreshes": 0, "events": 0, "fills": 0, "skipped_fills": 0,
+                      "stale_refreshes": 0}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ----------------------- läsning ------------------------------------------
+    def free(self, asset: str) -> Decimal:
+        """Fritt saldo. REST-anrop bara om cachen är invaliderad."""
+        if not self.valid:
+            self.refresh()
+        with self._lock:
+            self.stats["lookups"] += 1
+            return self.balances.get(asset, (ZERO, ZERO))[0]
+
+    def locked(self, asset: str) -> Decimal:
+        if not self.valid:
+            self.refresh()
+        with self._lock:
+            return self.balances.get(asset, (ZERO, ZERO))[1]
+
+    # ----------------------- källor -------------------------------------------
+    def refresh(self) -> None:
+        """Läs hela kontot via REST (samma som get_account() tidigare)."""
+        acct = self.client.get_account()
+        balances = {b["asset"]: (Decimal(b["free"]), Decimal(b["locked"])) for b in acct["balances"]}
+        update_ms = int(acct.get("updateTime") or 0)
+        with self._lock:
+            if update_ms < self.as_of_ms:
+                # En händelse/fyllnad hann in medan anropet pågick – snapshoten är äldre
+                self.stats["stale_refreshes"] += 1
+                return
+            self.balances = balances
+            self.as_of_ms = max(self.as_of_ms, update_ms)
+            self.valid = True
+            self.stats["refreshes"] += 1
+
+    def invalidate(self) -> None:
+        """Efter orderfel/avbrott: lita inte på cachen förrän kontot lästs om."""
+        self.valid = False
+
+    def apply_event(self, event: Dict[str, Any]) -> None:
+        """Händelse från user-data-streamen (okända typer ignoreras)."""
+        etype = event.get("e")
+        with self._lock:
+            if etype == "outboundAccountPosition":
+                update_ms = int(event.get("u") or event.get("E") or 0)
+                if update_ms < self.as_of_ms:
+                    return  # äldre än snapshot vi redan har
+                for b in event.get("B", []):
+                    self.balances[b["a"]] = (Decimal(b["f"]), Decimal(b["l"]))
+                self.as_of_ms = update_ms
+                self.stats["events"] += 1
+            elif etype == "balanceUpdate":
+                # Insättning/uttag/överföring: delta på fritt saldo
+                if int(event.get("T") or 0) <= self.as_of_ms:
+                    return
+                free, locked = self.balances.get(event["a"], (ZERO, ZERO))
+                self.balances[event["a"]] = (free + Decimal(event["d"]), locked)
+                self.stats["events"] += 1
+
+    def apply_order(self, resp: Dict[str, Any], base_asset: str, quote_asset: str) -> None:
+        """
+        Räkna in en fylld market-order (FULL-svar) lokalt. Ignoreras om
+        streamen redan levererat ett saldo från efter ordern; invaliderar
+        cachen om svaret saknar fyllnadsdata.
+        """
+        try:
+            executed = Decimal(str(resp["executedQty"]))
+            quote_qty = Decimal(str(resp["cummulativeQuoteQty"]))
+            side = resp["side"]
+        except (KeyError, ArithmeticError):
+            self.invalidate()
+            return
+        transact_ms = int(resp.get("transactTime") or 0)
+        with self._lock:
+            if transact_ms and transact_ms <= self.as_of_ms:
+                self.stats["skipped_fills"] += 1
+                return
+            sign = 1 if side == "BUY" else -1
+            self._add(base_asset, sign * executed)
+            self._add(quote_asset, -sign * quote_qty)
+            for f in resp.get("fills") or []:
+                if f.get("commission"):
+                    self._add(f["commissionAsset"], -Decimal(str(f["commission"])))
+            # Försenade händelser från före ordern skulle annars skriva över fyllnaden
+            self.as_of_ms = max(self.as_of_ms, transact_ms)
+            self.stats["fills"] += 1
+
+    def _add(self, asset: str, delta: Decimal) -> None:
+        free, locked = self.balances.get(asset, (ZERO, ZERO))
+        self.balances[asset] = (free + delta, locked)
+
+    # ----------------------- periodisk uppdatering ----------------------------
+    def start(self) -> "BalanceCache":
+        """Läs kontot nu och starta bakgrundstråd för periodisk REST-uppdatering."""
+        self.refresh()
+        if self.refresh_sec > 0:
+            self._thread = threading.Thread(target=self._refresh_loop, name="balance-refresh", daemon=True)
+            self._thread.start()
+        return self
+
+    def _refresh_loop(self) -> None:
+        while not self._stop.wait(self.refresh_sec):
+            try:
+                self.refresh()
+            except Exception as err:
+                print(f"⚠️ Saldouppdatering misslyckades: {err}")
+                self.invalidate()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+class UserDataStream:
+    """
+    Binance user-data-stream → BalanceCache.apply_event.
+
+    Args:
+        client: python-binance Client (stream_get_listen_key/stream_keepalive/stream_close)
+        cache: BalanceCache som ska hållas aktuell
+        testnet: Spot-testnätets stream istället för produktion
+        on_event: Valfri extra callback för varje händelse (t.ex. executionReport)
+    """
+
+    def __init__(self, client: Any, cache: BalanceCache, testnet: bool = True,
+                 on_event: Optional[Callable[[Dict[str, Any]], None]] = None):
+        if not WEBSOCKET_AVAILABLE:
+            raise SystemExit(
+                "websocket-client saknas. Kör:\n    python -m pip install websocket-client\n"
+                "och starta sedan om skriptet."
+            )
+        self.client = client
+        self.cache = cache
+        self.url = USER_STREAM_URL_TESTNET if testnet else USER_STREAM_URL
+        self.on_event = on_event
+        self.listen_key: Optional[str] = None
+        self._ws = None
+        self._stop = threading.Event()
+
+    def start(self) -> "UserDataStream":
+        threading.Thread(target=self._run, name="user-data-stream", daemon=True).start()
+        threading.Thread(target=self._keepalive_loop, name="listen-key-keepalive", daemon=True).start()
+        return self
+
+    def _on_message(self, _ws, message: str) -> None:
+        try:
+            event = json.loads(message)
+            self.cache.apply_event(event)
+            if self.on_event is not None:
+                self.on_event(event)
+        except Exception as err:
+            print("⚠️ User-data-fel:", err)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.listen_key = self.client.stream_get_listen_key()
+                self._ws = websocket.WebSocketApp(
+                    self.url + self.listen_key,
+                    on_open=lambda _ws: print("👛 User-data-stream ansluten"),
+                    on_message=self._on_message,
+                    on_error=lambda _ws, err: print("⚠️ User-data WS-fel:", err),
+                )
+                self._ws.run_forever(ping_interval=20, ping_timeout=10)
+            except Exception as err:
+                print("⚠️ User-data-stream:", err)
+            # Händelser kan ha missats medan vi var bortkopplade
+            self.cache.invalidate()
+            if not self._stop.is_set():
+                time.sleep(3)
+
+    def _keepalive_loop(self) -> None:
+        while not self._stop.wait(LISTEN_KEY_KEEPALIVE_SEC):
+            if self.listen_key:
+                try:
+                    self.client.stream_keepalive(self.listen_key)
+                except Exception as err:
+                    print("⚠️ listenKey keepalive misslyckades:", err)
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._ws is not None:
+            self._ws.close()
+        if self.listen_key:
+            try:
+                self.client.stream_close(self.listen_key)
+            except Exception:
+                pass
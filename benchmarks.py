@@ -0,0 +1,444 @@
+"""
+Benchmarks – mät kostnaden för hot paths
+========================================
+Fasta seeds + syntetisk data (eller en inspelning) så att körningar går att
+jämföra över tid. Resultaten skrivs som JSON:
+
+    python benchmarks.py                          # allt, skriver bench_results/<tid>.json
+    python benchmarks.py --quick                  # färre iterationer
+    python benchmarks.py --only trend broker      # bara sviter vars namn innehåller orden
+    python benchmarks.py --ticks recordings/      # använd inspelade ticks (.ttk/.csv) istället för syntetiska
+    python benchmarks.py --compare bench_results/baseline.json
+
+Mäter:
+    trend_strength_w{N}     TrendDetector.calculate_trend_strength (live-skriptet)
+    adaptive_L              AdaptiveLCalculator.calculate_adaptive_L
+    broker_buy/sell/exit    PaperBroker.market_buy / market_sell / log_exit (inkl. CSV-loggning)
+    csv_append              append_csv_row, rader per sekund
+    backtest                markov_adaptive_backtest.run_backtest, ticks per sekund
+    refresh_lines_a{N}      en grafram med N trade-annotations (Agg-backend)
+    live_replay             hela live-loopen i replay-läge, ticks per sekund
+    ring_write              PriceRing.write (price_ring.py), µs per tick
+    ring_read_w{N}          ticks/s per läsarprocess med N arbetare (mottryck, ingen paus)
+    ring_latency_w{N}       fan-out-latens skriven → läst i N processer, ticks var RING_PACE_SEC
+
+Live-skriptet laddas i replay-läge (ingen nätverkstrafik) med loggar i en temporär katalog.
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+LIVE_SCRIPT = os.path.join(ROOT, "Markov adaptive live paper.py")
+DEFAULT_OUT_DIR = os.path.join(ROOT, "bench_results")
+
+SEED = 42
+SYNTH_TICKS = 20_000
+SYNTH_START_MS = 1_762_732_800_000
+TREND_WINDOWS = (20, 50, 100, 200)
+ANNOTATION_COUNTS = (0, 50, 200)
+RING_WORKERS = (1, 4)
+RING_TICKS = 50_000
+RING_LATENCY_TICKS = 2000
+RING_PACE_SEC = 0.001
+
+
+# ----------------------- Data ------------------------------------------------
+def synthetic_ticks(n: int, seed: int = SEED, start_price: float = 95_000.0,
+                    step_ms: int = 1000) -> Tuple[List[int], List[Decimal]]:
+    """Deterministisk random walk med 0.01-upplösning."""
+    rng = random.Random(seed)
+    price = int(start_price * 100)
+    timestamps, prices = [], []
+    ts = SYNTH_START_MS
+    for _ in range(n):
+        ts += step_ms
+        price += int(rng.gauss(0, 1) * price * 0.00015)
+        timestamps.append(ts)
+        prices.append(Decimal(price).scaleb(-2))
+    return timestamps, prices
+
+
+def write_ticks_csv(path: str, timestamps: List[int], prices: List[Decimal]) -> None:
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write("ts,price\n")
+        for ts, p in zip(timestamps, prices):
+            f.write(f"{ts},{p}\n")
+
+
+# ----------------------- Tidtagning ------------------------------------------
+def time_calls(fn: Callable[[], Any], number: int, repeat: int) -> Dict[str, float]:
+    """Kör fn number gånger per omgång, repeat omgångar. Rapporterar per anrop."""
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - t0) / number)
+    best = min(samples)
+    return {
+        "per_call_us": best * 1e6,
+        "median_us": statistics.median(samples) * 1e6,
+        "ops_per_sec": 1.0 / best if best > 0 else 0.0,
+        "calls": number * repeat,
+    }
+
+
+def time_throughput(fn: Callable[[], int], repeat: int = 1) -> Dict[str, float]:
+    """fn returnerar antal bearbetade enheter (ticks/rader). Rapporterar enheter/s (bästa omgång)."""
+    best = None
+    units = 0
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        units = fn()
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return {
+        "seconds": best,
+        "units": units,
+        "per_sec": units / best if best else 0.0,
+        "per_unit_us": best / units * 1e6 if units else 0.0,
+    }
+
+
+@contextlib.contextmanager
+def quiet():
+    """Tysta print() från skripten under mätning."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+# ----------------------- Laddning av skript ----------------------------------
+def load_live_module(tick_file: str, log_dir: str, config: Optional[str] = None):
+    """Importera live-skriptet i replay-läge (Agg-backend, inga nätverksanrop)."""
+    argv = [LIVE_SCRIPT, "--replay", tick_file, "--log-dir", log_dir]
+    if config:
+        argv += ["--config", config]
+    saved_argv = sys.argv
+    sys.argv = argv
+    try:
+        spec = importlib.util.spec_from_file_location("live_paper_bench", LIVE_SCRIPT)
+        module = importlib.util.module_from_spec(spec)
+        with quiet():
+            spec.loader.exec_module(module)
+    finally:
+        sys.argv = saved_argv
+    return module
+
+
+def load_backtest_module():
+    """markov_adaptive_backtest läser config.json relativt arbetskatalogen."""
+    cwd = os.getcwd()
+    os.chdir(ROOT)
+    try:
+        with quiet():
+            import markov_adaptive_backtest
+    finally:
+        os.chdir(cwd)
+    return markov_adaptive_backtest
+
+
+# ----------------------- Benchmarks ------------------------------------------
+def bench_trend(live, prices: List[Decimal], scale: float) -> Dict[str, Any]:
+    results = {}
+    for window in TREND_WINDOWS:
+        detector = live.TrendDetector(window_size=window)
+        for p in prices[:window]:
+            detector.add_price(p)
+        results[f"trend_strength_w{window}"] = time_calls(
+            detector.calculate_trend_strength, number=max(1, int(200 * scale)), repeat=5)
+    return results
+
+
+def bench_adaptive_L(prices: List[Decimal], scale: float) -> Dict[str, Any]:
+    from adaptive_L import AdaptiveLCalculator
+
+    calc = AdaptiveLCalculator()
+    window = prices[:calc.baseline_window]
+    return {"adaptive_L": time_calls(lambda: calc.calculate_adaptive_L(window),
+                                     number=max(1, int(100 * scale)), repeat=5)}
+
+
+def bench_broker(live, prices: List[Decimal], scale: float) -> Dict[str, Any]:
+    broker = live.PaperBroker(Decimal("1000000000"), Decimal("0"))
+    qty = Decimal("0.001")
+    price = prices[0]
+    number = max(1, int(200 * scale))
+    results = {}
+    with quiet():
+        results["broker_buy"] = time_calls(lambda: broker.market_buy(live.SYMBOL, qty, price), number, 5)
+        results["broker_sell"] = time_calls(lambda: broker.market_sell(live.SYMBOL, qty, price), number, 5)
+        results["broker_exit"] = time_calls(
+            lambda: broker.log_exit("LW", "LONG", live.SYMBOL, qty, price * Decimal("1.001"), price), number, 5)
+    return results
+
+
+def bench_csv(live, log_dir: str, scale: float) -> Dict[str, Any]:
+    path = os.path.join(log_dir, "bench_csv.csv")
+    header = list(live.TRADE_METRICS_HEADER)
+    row = ["2025-11-10T00:00:00Z", "LW", "LONG"] + ["95000.00"] * (len(header) - 3)
+    rows = max(1, int(2000 * scale))
+
+    def write_rows() -> int:
+        if os.path.exists(path):
+            os.remove(path)
+        for _ in range(rows):
+            live.append_csv_row(path, row, header=header)
+        return rows
+
+    return {"csv_append": time_throughput(write_rows, repeat=3)}
+
+
+def bench_backtest(prices: List[Decimal], timestamps: List[int]) -> Dict[str, Any]:
+    backtest = load_backtest_module()
+    data = [{"timestamp": ts // 1000, "close": float(p)} for ts, p in zip(timestamps, prices)]
+
+    def run() -> int:
+        with quiet():
+            backtest.run_backtest(data=data, plot=False)
+        return len(data)
+
+    return {"backtest": time_throughput(run, repeat=2)}
+
+
+def bench_refresh(live, prices: List[Decimal], scale: float) -> Dict[str, Any]:
+    live.HEADLESS = False  # rita på Agg-canvasen
+    warnings.filterwarnings("ignore", message="Glyph .* missing from font")  # emoji i etiketter
+    try:
+        live.py.clear()
+        live.px.clear()
+        for i, p in enumerate(prices[:live.max_points]):
+            live.py.append(float(p))
+            live.px.append(i)
+        live.tick_offset = 0
+        current = prices[len(live.py) - 1]
+        results = {}
+        for count in ANNOTATION_COUNTS:
+            live.trade_annotations.clear()
+            step = max(1, len(live.py) // max(1, count))
+            for k in range(count):
+                live.trade_annotations.append({
+                    "abs_tick": (k * step) % len(live.py), "y": live.py[(k * step) % len(live.py)],
+                    "text": "✓0.10%" if k % 2 else "L↑100", "color": "white",
+                    "bgcolor": "darkgreen", "size": 6,
+                })
+            results[f"refresh_lines_a{count}"] = time_calls(
+                lambda: live.refresh_lines(current), number=max(1, int(5 * scale)), repeat=3)
+        return results
+    finally:
+        live.trade_annotations.clear()
+        live.drawn_annotations.clear()
+        live.py.clear()
+        live.px.clear()
+        live.HEADLESS = True
+
+
+def bench_live_replay(live) -> Dict[str, Any]:
+    """Kör hela live-loopen över replay-filen (sist – modulens tillstånd förbrukas)."""
+    def run() -> int:
+        with quiet():
+            live.main()
+        return live.REPLAY.feed.calls
+
+    return {"live_replay": time_throughput(run, repeat=1)}
+
+
+def _ring_reader(name: str, index: int, out) -> None:
+    """Läsarprocess: räkna ticks och latens (skriven_ns → läst) tills matningen stängs."""
+    from price_ring import PriceRing
+
+    reader = PriceRing.attach(name).reader(index)
+    latencies = []
+    t0 = None
+    while True:
+        tick = reader.next(timeout=10)
+        if tick is None:
+            break
+        now = time.monotonic_ns()
+        if t0 is None:
+            t0 = now
+        latencies.append(now - tick[2])
+    elapsed = (time.monotonic_ns() - t0) / 1e9 if t0 is not None else 0.0
+    out.put((len(latencies), elapsed, reader.stats["lost"], sorted(latencies)))
+    reader.detach()
+
+
+def _run_ring(prices: List[Decimal], workers: int, pace_sec: float) -> List[Tuple[int, float, int, List[int]]]:
+    import multiprocessing as mp
+    from price_ring import PriceRing
+
+    ring = PriceRing.create(capacity=4096, readers=workers)
+    out = mp.Queue()
+    procs = [mp.Process(target=_ring_reader, args=(ring.name, i, out)) for i in range(workers)]
+    for p in procs:
+        p.start()
+    try:
+        for i, price in enumerate(prices):
+            if pace_sec:
+                time.sleep(pace_sec)
+            else:
+                ring.wait_for_readers()
+            ring.write(float(i), price)
+        ring.close_feed()
+        results = [out.get(timeout=60) for _ in procs]
+        for p in procs:
+            p.join(timeout=10)
+    finally:
+        ring.close()
+    return results
+
+
+def bench_price_ring(prices: List[Decimal], scale: float) -> Dict[str, Any]:
+    """Delat minne → arbetarprocesser (paper_farm.py): genomströmning och fan-out-latens."""
+    from price_ring import PriceRing
+
+    ring = PriceRing.create(capacity=4096)
+    try:
+        i = iter(range(10 ** 9))
+        results = {"ring_write": time_calls(lambda: ring.write(0.0, prices[next(i) % len(prices)]),
+                                            number=max(1, int(20_000 * scale)), repeat=5)}
+    finally:
+        ring.close()
+    n = max(1, int(RING_TICKS * scale))
+    feed = [prices[k % len(prices)] for k in range(n)]
+    for workers in RING_WORKERS:
+        runs = _run_ring(feed, workers, pace_sec=0.0)
+        slowest = min(runs, key=lambda r: r[0] / r[1] if r[1] else 0.0)
+        results[f"ring_read_w{workers}"] = {
+            "seconds": slowest[1], "units": slowest[0], "workers": workers,
+            "per_sec": slowest[0] / slowest[1] if slowest[1] else 0.0,
+            "per_unit_us": slowest[1] / slowest[0] * 1e6 if slowest[0] else 0.0,
+            "lost": sum(r[2] for r in runs),
+        }
+        runs = _run_ring(feed[:max(1, int(RING_LATENCY_TICKS * scale))], workers, pace_sec=RING_PACE_SEC)
+        merged = sorted(x for r in runs for x in r[3])
+        pick = lambda q: merged[min(len(merged) - 1, int(len(merged) * q))] / 1000.0 if merged else 0.0
+        results[f"ring_latency_w{workers}"] = {
+            "p50_us": pick(0.50), "p99_us": pick(0.99), "max_us": merged[-1] / 1000.0 if merged else 0.0,
+            "workers": workers, "ticks": len(merged), "pace_sec": RING_PACE_SEC,
+        }
+    return results
+
+
+# ----------------------- Jämförelse ------------------------------------------
+def headline(result: Dict[str, Any]) -> Tuple[str, float, bool]:
+    """(enhet, värde, högre_är_bättre) för en benchmark-rad."""
+    if "p50_us" in result:
+        return "µs p50", result["p50_us"], False
+    if "per_call_us" in result:
+        return "µs/anrop", result["per_call_us"], False
+    return "/s", result["per_sec"], True
+
+
+def print_results(results: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> None:
+    print(f"\n{'Benchmark':<24} {'Värde':>14}  {'Enhet':<9} {'Mot baseline':>14}")
+    print("-" * 66)
+    for name, result in results.items():
+        unit, value, higher_better = headline(result)
+        cmp = ""
+        if baseline and name in baseline:
+            _, old, _ = headline(baseline[name])
+            if old:
+                ratio = value / old
+                better = ratio > 1 if higher_better else ratio < 1
+                speed = ratio if higher_better else (1 / ratio if ratio else 0.0)
+                cmp = f"{speed:.2f}x {'🟢' if better else '🔴'}"
+        print(f"{name:<24} {value:>14,.2f}  {unit:<9} {cmp:>14}")
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmarks för indikatorer, broker, backtest och rendering.")
+    parser.add_argument("--ticks", help="Inspelade ticks (.ttk-fil/katalog eller CSV) istället för syntetiska")
+    parser.add_argument("--synthetic-ticks", type=int, default=SYNTH_TICKS, help="Antal syntetiska ticks")
+    parser.add_argument("--config", help="Config för live-skriptet (default config.json)")
+    parser.add_argument("--quick", action="store_true", help="Färre iterationer (snabb rökprovning)")
+    parser.add_argument("--only", nargs="+", help="Kör bara benchmarks vars namn innehåller något av orden")
+    parser.add_argument("--out", help="JSON-fil för resultat (default bench_results/<tid>.json)")
+    parser.add_argument("--compare", help="Tidigare JSON-resultat att jämföra mot")
+    args = parser.parse_args()
+
+    scale = 0.2 if args.quick else 1.0
+    with tempfile.TemporaryDirectory(prefix="bench_") as tmp:
+        if args.ticks:
+            from replay import load_ticks
+            timestamps, prices = load_ticks(args.ticks)
+            source = args.ticks
+        else:
+            n = min(args.synthetic_ticks, 5000) if args.quick else args.synthetic_ticks
+            timestamps, prices = synthetic_ticks(n)
+            source = f"synthetic(seed={SEED})"
+        tick_file = os.path.join(tmp, "ticks.csv")
+        write_ticks_csv(tick_file, timestamps, prices)
+
+        print(f"🏁 Benchmarks på {source} ({len(prices)} ticks)")
+        random.seed(SEED)
+        live = load_live_module(tick_file, tmp, args.config)
+
+        suites = [
+            ("trend", lambda: bench_trend(live, prices, scale)),
+            ("adaptive_L", lambda: bench_adaptive_L(prices, scale)),
+            ("broker", lambda: bench_broker(live, prices, scale)),
+            ("csv", lambda: bench_csv(live, tmp, scale)),
+            ("backtest", lambda: bench_backtest(prices, timestamps)),
+            ("refresh_lines", lambda: bench_refresh(live, prices, scale)),
+            ("price_ring", lambda: bench_price_ring(prices, scale)),
+            ("live_replay", lambda: bench_live_replay(live)),
+        ]
+        results: Dict[str, Any] = {}
+        for name, suite in suites:
+            if args.only and not any(word in name for word in args.only):
+                continue
+            print(f"  ⏱️ {name}...")
+            results.update(suite())
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f).get("results", {})
+    print_results(results, baseline)
+
+    report = {
+        "meta": {
+            "created_utc": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_commit": git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "seed": SEED,
+            "data": source,
+            "ticks": len(prices),
+            "quick": args.quick,
+        },
+        "results": results,
+    }
+    out = args.out or os.path.join(DEFAULT_OUT_DIR, datetime.now().strftime("%Y%m%d_%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n💾 Resultat sparade till {out}")
+
+
+if __name__ == "__main__":
+    main()
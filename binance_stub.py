@@ -0,0 +1,383 @@
+"""
+Binance Stub Server
+===================
+Lokal ersättare för de delar av Binance REST-API:t som våra verktyg använder.
+
+Används för att testa nedladdning/cache utan nätverk och utan att bränna
+request-weight mot riktiga Binance:
+- /api/v3/time     → servertid
+- /api/v3/klines   → deterministiska syntetiska klines (samma candle ger alltid
+                     samma värden oavsett hur förfrågan delas upp)
+
+Servern räknar förfrågningar och weight så att man kan verifiera att en andra
+körning mot en varm cache inte gör några anrop alls.
+
+StubAccountClient är en ersättare i samma process för python-binance Client
+(konto, market-ordrar, exchange info, ticker/orderbok). Varje order skickar en
+outboundAccountPosition-händelse till prenumeranter, precis som Binance
+user-data-stream, så att balance_cache.py kan testas utan nycklar.
+
+Kör fristående:
+    python binance_stub.py --port 8765
+och peka verktygen mot http://127.0.0.1:8765 (t.ex. --base-url).
+"""
+
+import argparse
+import json
+import math
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+INTERVAL_MS = {
+    "1s": 1_000,
+    "1m": 60_000,
+    "3m": 180_000,
+    "5m": 300_000,
+    "15m": 900_000,
+    "30m": 1_800_000,
+    "1h": 3_600_000,
+    "2h": 7_200_000,
+    "4h": 14_400_000,
+    "6h": 21_600_000,
+    "8h": 28_800_000,
+    "12h": 43_200_000,
+    "1d": 86_400_000,
+    "3d": 259_200_000,
+    "1w": 604_800_000,
+}
+
+KLINES_WEIGHT = 2
+
+
+def synthetic_kline(symbol: str, interval_ms: int, open_time: int) -> List[Any]:
+    """Deterministisk candle i Binance råformat (samma fält/ordning som API:t)."""
+    seed = zlib.crc32(symbol.encode("utf-8"))
+    base = 1000.0 + (seed % 90_000)
+    step = open_time // interval_ms
+    # Mjuk våg + deterministiskt brus → realistiskt "pris" utan slumpgenerator
+    noise = (zlib.crc32(f"{symbol}:{step}".encode("utf-8")) % 10_000) / 10_000.0 - 0.5
+    center = base * (1.0 + 0.02 * math.sin(step / 500.0) + 0.001 * noise)
+    open_ = center * (1.0 - 0.0002 * noise)
+    close = center * (1.0 + 0.0002 * noise)
+    high = max(open_, close) * 1.0003
+    low = min(open_, close) * 0.9997
+    volume = 10.0 + abs(noise) * 5.0
+    close_time = open_time + interval_ms - 1
+    return [
+        open_time,
+        f"{open_:.2f}",
+        f"{high:.2f}",
+        f"{low:.2f}",
+        f"{close:.2f}",
+        f"{volume:.8f}",
+        close_time,
+        f"{volume * center:.8f}",
+        100,
+        f"{volume / 2:.8f}",
+        f"{volume * center / 2:.8f}",
+        "0",
+    ]
+
+
+class BinanceStubServer:
+    """
+    Trådad HTTP-server som efterliknar Binance REST för tester.
+
+    Args:
+        port: 0 = välj ledig port automatiskt
+        weight_limit: Max weight per rullande minut innan 429 returneras (None = ingen gräns)
+        now_ms: Fast "nu" för servern (None = riktig klocka). Klines efter nu returneras inte.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0,
+                 weight_limit: Optional[int] = None, now_ms: Optional[int] = None):
+        self.weight_limit = weight_limit
+        self.now_ms = now_ms
+        self.request_count = 0
+        self.rejected_count = 0
+        self.request_log: List[Dict[str, Any]] = []
+        self._weight_events: List[tuple] = []
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def current_ms(self) -> int:
+        return self.now_ms if self.now_ms is not None else int(time.time() * 1000)
+
+    def start(self) -> "BinanceStubServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "BinanceStubServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    # ----------------------- weight-räkning -----------------------------------
+    def _register_weight(self, weight: int) -> Optional[int]:
+        """Registrera weight. Returnerar använd weight, eller None om gränsen sprängs."""
+        now = time.monotonic()
+        with self._lock:
+            self._weight_events = [(t, w) for t, w in self._weight_events if now - t < 60.0]
+            used = sum(w for _, w in self._weight_events)
+            if self.weight_limit is not None and used + weight > self.weight_limit:
+                self.rejected_count += 1
+                return None
+            self._weight_events.append((now, weight))
+            self.request_count += 1
+            return used + weight
+
+    def retry_after(self) -> int:
+        """Sekunder tills äldsta weight-posten faller ur minutfönstret."""
+        with self._lock:
+            if not self._weight_events:
+                return 1
+            oldest = self._weight_events[0][0]
+        return max(1, math.ceil(60.0 - (time.monotonic() - oldest)))
+
+    # ----------------------- endpoints ----------------------------------------
+    def _klines(self, params: Dict[str, str]) -> List[List[Any]]:
+        symbol = params.get("symbol", "BTCUSDT")
+        interval_ms = INTERVAL_MS.get(params.get("interval", "1m"))
+        if interval_ms is None:
+            raise ValueError("Invalid interval.")
+        limit = min(int(params.get("limit", 500)), 1000)
+        now = self.current_ms()
+        end_time = int(params["endTime"]) if "endTime" in params else now
+        if "startTime" in params:
+            start = int(params["startTime"])
+            first = -(-start // interval_ms) * interval_ms
+        else:
+            last_open = (min(end_time, now) // interval_ms) * interval_ms
+            first = last_open - (limit - 1) * interval_ms
+        rows = []
+        open_time = first
+        while len(rows) < limit and open_time <= end_time and open_time <= now:
+            rows.append(synthetic_kline(symbol, interval_ms, open_time))
+            open_time += interval_ms
+        return rows
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, fmt, *args):  # tyst i tester
+                return
+
+            def _send(self, status: int, payload: Any, headers: Optional[Dict[str, str]] = None) -> None:
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                params = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+                with server._lock:
+                    server.request_log.append({"path": parsed.path, "params": params})
+                if parsed.path == "/api/v3/time":
+                    self._send(200, {"serverTime": server.current_ms()})
+                    return
+                if parsed.path == "/api/v3/klines":
+                    used = server._register_weight(KLINES_WEIGHT)
+                    if used is None:
+                        self._send(429, {"code": -1003, "msg": "Too much request weight used."},
+                                   {"Retry-After": str(server.retry_after())})
+                        return
+                    try:
+                        rows = server._klines(params)
+                    except (ValueError, KeyError) as e:
+                        self._send(400, {"code": -1100, "msg": str(e)})
+                        return
+                    self._send(200, rows, {"X-MBX-USED-WEIGHT-1M": str(used)})
+                    return
+                self._send(404, {"code": -1, "msg": f"Okänd endpoint {parsed.path}"})
+
+        return Handler
+
+
+class StubOrderError(Exception):
+    """Motsvarar BinanceAPIException för StubAccountClient."""
+
+
+class StubAccountClient:
+    """
+    Spot-konto i minnet med python-binance-metodernas namn och svarsformat.
+
+    Args:
+        balances: Startsaldon, t.ex. {"USDT": "10000", "BTC": "0"}
+        price: Marknadspris som ordrar fylls till
+        fee_pct: Taker-avgift (dras i mottagen tillgång, som BNB-fri Binance)
+        event_delay_sec: Fördröjning innan kontohändelsen skickas
+                         (None = skickas innan orderns svar returneras)
+        order_latency_sec: Simulerad REST-rundresa per order
+    """
+
+    def __init__(self, balances: Optional[Dict[str, str]] = None, price: str = "95000",
+                 fee_pct: str = "0.001", event_delay_sec: Optional[float] = 0.0,
+                 symbol: str = "BTCUSDT", order_latency_sec: float = 0.0):
+        self.symbol = symbol
+        self.base_asset, self.quote_asset = symbol[:-4], symbol[-4:]
+        self.balances = {a: Decimal(v) for a, v in (balances or {"USDT": "10000", "BTC": "0"}).items()}
+        self.price = Decimal(price)
+        self.fee_pct = Decimal(fee_pct)
+        self.event_delay_sec = event_delay_sec
+        self.order_latency_sec = order_latency_sec
+        self.calls: Dict[str, int] = {}
+        self.fail_next_order = False
+        self.orders: Dict[str, Dict[str, Any]] = {}
+        self._order_id = 0
+        self._clock_ms = int(time.time() * 1000)
+        self._subscribers: List[Callable[[Dict[str, Any]], None]] = []
+        self._lock = threading.Lock()
+
+    def _count(self, name: str) -> None:
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def _now_ms(self) -> int:
+        # Strikt växande så att händelser och ordrar alltid går att ordna
+        self._clock_ms = max(self._clock_ms + 1, int(time.time() * 1000))
+        return self._clock_ms
+
+    def subscribe(self, callback: Callable[[Dict[str, Any]], None]) -> None:
+        """Ta emot kontohändelser (samma format som user-data-streamen)."""
+        self._subscribers.append(callback)
+
+    def _emit(self, event: Dict[str, Any]) -> None:
+        for cb in self._subscribers:
+            cb(event)
+
+    # ----------------------- REST-metoder ------------------------------------
+    def get_exchange_info(self) -> Dict[str, Any]:
+        self._count("get_exchange_info")
+        return {"symbols": [{
+            "symbol": self.symbol,
+            "filters": [
+                {"filterType": "PRICE_FILTER", "tickSize": "0.01"},
+                {"filterType": "LOT_SIZE", "stepSize": "0.00001", "minQty": "0.00001"},
+                {"filterType": "NOTIONAL", "minNotional": "5"},
+            ],
+        }]}
+
+    def get_symbol_ticker(self, symbol: str) -> Dict[str, str]:
+        self._count("get_symbol_ticker")
+        return {"symbol": symbol, "price": str(self.price)}
+
+    def get_order_book(self, symbol: str, limit: int = 5) -> Dict[str, Any]:
+        self._count("get_order_book")
+        return {"bids": [[str(self.price - Decimal("0.01")), "1"]], "asks": [[str(self.price + Decimal("0.01")), "1"]]}
+
+    def get_account(self) -> Dict[str, Any]:
+        self._count("get_account")
+        with self._lock:
+            return {
+                "updateTime": self._clock_ms,
+                "balances": [{"asset": a, "free": str(v), "locked": "0"} for a, v in self.balances.items()],
+            }
+
+    def order_market_buy(self, symbol: str, quantity: float, **params: Any) -> Dict[str, Any]:
+        return self._market_order("BUY", Decimal(str(quantity)), params.get("newClientOrderId"))
+
+    def order_market_sell(self, symbol: str, quantity: float, **params: Any) -> Dict[str, Any]:
+        return self._market_order("SELL", Decimal(str(quantity)), params.get("newClientOrderId"))
+
+    def get_order(self, symbol: str, origClientOrderId: str) -> Dict[str, Any]:
+        self._count("get_order")
+        if origClientOrderId not in self.orders:
+            raise StubOrderError("APIError(code=-2013): Order does not exist.")
+        return {k: v for k, v in self.orders[origClientOrderId].items() if k != "fills"}
+
+    def stream_get_listen_key(self) -> str:
+        self._count("stream_get_listen_key")
+        return "stub-listen-key"
+
+    def stream_keepalive(self, listenKey: str) -> None:
+        self._count("stream_keepalive")
+
+    def stream_close(self, listenKey: str) -> None:
+        self._count("stream_close")
+
+    def _market_order(self, side: str, qty: Decimal, client_order_id: Optional[str] = None) -> Dict[str, Any]:
+        self._count(f"order_market_{side.lower()}")
+        if self.order_latency_sec:
+            time.sleep(self.order_latency_sec)
+        if self.fail_next_order:
+            self.fail_next_order = False
+            raise StubOrderError("APIError(code=-2010): Account has insufficient balance for requested action.")
+        with self._lock:
+            quote_qty = (qty * self.price).quantize(Decimal("0.00000001"))
+            if side == "BUY":
+                fee, fee_asset = (qty * self.fee_pct).quantize(Decimal("0.00000001")), self.base_asset
+                if self.balances.get(self.quote_asset, Decimal("0")) < quote_qty:
+                    raise StubOrderError("APIError(code=-2010): Account has insufficient balance for requested action.")
+                self.balances[self.quote_asset] -= quote_qty
+                self.balances[self.base_asset] = self.balances.get(self.base_asset, Decimal("0")) + qty - fee
+            else:
+                fee, fee_asset = (quote_qty * self.fee_pct).quantize(Decimal("0.00000001")), self.quote_asset
+                if self.balances.get(self.base_asset, Decimal("0")) < qty:
+                    raise StubOrderError("APIError(code=-2010): Account has insufficient balance for requested action.")
+                self.balances[self.base_asset] -= qty
+                self.balances[self.quote_asset] = self.balances.get(self.quote_asset, Decimal("0")) + quote_qty - fee
+            self._order_id += 1
+            transact_ms = self._now_ms()
+            event = {
+                "e": "outboundAccountPosition", "E": transact_ms, "u": transact_ms,
+                "B": [{"a": a, "f": str(self.balances[a]), "l": "0"} for a in (self.base_asset, self.quote_asset)],
+            }
+            resp = {
+                "symbol": self.symbol, "orderId": self._order_id, "transactTime": transact_ms,
+                "clientOrderId": client_order_id or f"stub{self._order_id}",
+                "side": side, "type": "MARKET", "status": "FILLED",
+                "executedQty": str(qty), "cummulativeQuoteQty": str(quote_qty),
+                "fills": [{"price": str(self.price), "qty": str(qty),
+                           "commission": str(fee), "commissionAsset": fee_asset}],
+            }
+            self.orders[resp["clientOrderId"]] = resp
+        if self.event_delay_sec is None:
+            self._emit(event)
+        elif self.event_delay_sec == 0:
+            threading.Thread(target=self._emit, args=(event,), daemon=True).start()
+        else:
+            threading.Timer(self.event_delay_sec, self._emit, args=(event,)).start()
+        return resp
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Lokal Binance-stub för tester av nedladdning/cache.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--weight-limit", type=int, help="Returnera 429 över denna weight per minut")
+    args = parser.parse_args()
+
+    server = BinanceStubServer(args.host, args.port, weight_limit=args.weight_limit).start()
+    print(f"🧪 Binance-stub lyssnar på {server.base_url} (Ctrl+C för att avsluta)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print(f"\n🛑 Avslutar. Förfrågningar: {server.request_count}")
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
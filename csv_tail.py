@@ -0,0 +1,277 @@
+"""
+CSV Tail – läs slutet av växande loggar utan att läsa hela filen
+===============================================================
+auto_tune.py läste hela trade_metrics.csv med csv.DictReader bara för att
+behålla de sista 100 raderna; kostnaden växte med historiken. Här:
+
+    tail_rows(path, n)  → de sista n raderna: läser block bakåt från slutet
+                          tills n radbrytningar hittats (O(n), inte O(fil))
+    CsvTail             → samma sak + följ filen: read_new() läser bara det
+                          som lagts till sedan förra anropet
+    DayIndex            → liten sidecar (<fil>.dayidx.json) med byteoffset
+                          för första raden per UTC-dag; rows_since(t) seekar
+                          direkt till dagen → O(fönster). Indexet byggs på
+                          inkrementellt (bara nya bytes läses vid update)
+
+Loggarna skrivs med en rad per post (inga radbrytningar inom fält). En sista
+rad utan radbrytning räknas som halvskriven och tas med först när den är klar.
+Om filen krympt eller fått ny header (roterad) byggs indexet om.
+
+    rows = tail_rows("logs/trade_metrics.csv", 100)
+    week = DayIndex("logs/trade_metrics.csv").rows_since(now - timedelta(days=7))
+"""
+
+import bisect
+import csv
+import json
+import os
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_CHUNK = 64 * 1024
+INDEX_SUFFIX = ".dayidx.json"
+INDEX_VERSION = 1
+DEFAULT_TS_COLUMN = "exit_ts"
+
+
+def parse_utc_ts(text: str) -> datetime:
+    """
+    Tidsstämpel från loggarna → aware datetime (UTC). Tål live-skriptens
+    "2025-11-10T12:00:00+00:00Z" (isoformat + "Z"), ren "Z" och naiv tid.
+    """
+    ts = text.strip()
+    if ts.endswith("Z"):
+        ts = ts[:-1]
+    if ts.count("+00:00") > 1:
+        ts = ts.replace("+00:00", "", 1)
+    dt = datetime.fromisoformat(ts)
+    return dt if dt.tzinfo is not None else dt.replace(tzinfo=timezone.utc)
+
+
+def _read_header(f) -> Tuple[List[str], int]:
+    """(kolumner, byteoffset efter headern) för en binärt öppnad fil."""
+    f.seek(0)
+    line = f.readline()
+    if not line.endswith(b"\n"):
+        return [], 0
+    return next(csv.reader([line.decode("utf-8-sig").rstrip("\r\n")])), len(line)
+
+
+def _complete_end(f, size: int) -> int:
+    """Offset efter sista radbrytningen (halvskriven sista rad räknas inte)."""
+    pos = size
+    while pos > 0:
+        step = min(DEFAULT_CHUNK, pos)
+        f.seek(pos - step)
+        block = f.read(step)
+        i = block.rfind(b"\n")
+        if i >= 0:
+            return pos - step + i + 1
+        pos -= step
+    return 0
+
+
+def _to_dicts(header: List[str], lines: List[bytes]) -> List[Dict[str, str]]:
+    text = [line.decode("utf-8").rstrip("\r") for line in lines if line.strip()]
+    return [dict(zip(header, row)) for row in csv.reader(text)]
+
+
+def tail_lines(f, n: int, start: int, end: int, chunk_size: int = DEFAULT_CHUNK) -> List[bytes]:
+    """De sista n raderna i [start, end) – end ska ligga direkt efter en radbrytning."""
+    if n <= 0 or end <= start:
+        return []
+    pos = end
+    buf = b""
+    while pos > start and buf.count(b"\n") <= n:
+        step = min(chunk_size, pos - start)
+        pos -= step
+        f.seek(pos)
+        buf = f.read(step) + buf
+    lines = buf.split(b"\n")[:-1]  # sista elementet är tomt (end efter \n)
+    if pos > start:
+        lines = lines[1:]  # första raden kan vara avklippt
+    return lines[-n:]
+
+
+def tail_rows(path: str, n: int, chunk_size: int = DEFAULT_CHUNK) -> List[Dict[str, str]]:
+    """De sista n raderna som dicts (som csv.DictReader), äldst först."""
+    with open(path, "rb") as f:
+        header, data_start = _read_header(f)
+        if not header:
+            return []
+        end = _complete_end(f, os.fstat(f.fileno()).st_size)
+        return _to_dicts(header, tail_lines(f, n, data_start, end, chunk_size))
+
+
+class CsvTail:
+    """
+    Följ en växande CSV: last(n) läser bakifrån, read_new() bara tillägg.
+
+    Args:
+        path: CSV med header på första raden
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.header: List[str] = []
+        self.offset = 0  # läst t.o.m. (alltid direkt efter en radbrytning)
+        self.stats = {"bytes_read": 0, "rows": 0, "resets": 0}
+
+    def _open_checked(self):
+        """Öppna filen; börja om från början om den krympt eller bytt header."""
+        f = open(self.path, "rb")
+        header, data_start = _read_header(f)
+        size = os.fstat(f.fileno()).st_size
+        if header != self.header or size < self.offset:
+            if self.header:
+                self.stats["resets"] += 1
+            self.header = header
+            self.offset = data_start
+        return f, size, data_start
+
+    def last(self, n: int) -> List[Dict[str, str]]:
+        """De sista n raderna; därefter följer read_new() från filens slut."""
+        if not os.path.exists(self.path):
+            return []
+        f, size, data_start = self._open_checked()
+        with f:
+            if not self.header:
+                return []
+            end = _complete_end(f, size)
+            lines = tail_lines(f, n, data_start, end)
+            self.stats["bytes_read"] += sum(len(line) + 1 for line in lines)
+            self.offset = end
+        rows = _to_dicts(self.header, lines)
+        self.stats["rows"] += len(rows)
+        return rows
+
+    def read_new(self) -> List[Dict[str, str]]:
+        """Rader som tillkommit sedan förra last()/read_new()."""
+        if not os.path.exists(self.path):
+            return []
+        f, size, _ = self._open_checked()
+        with f:
+            if not self.header or size <= self.offset:
+                return []
+            f.seek(self.offset)
+            data = f.read(size - self.offset)
+        cut = data.rfind(b"\n") + 1
+        if cut == 0:
+            return []  # bara en halvskriven rad
+        self.offset += cut
+        self.stats["bytes_read"] += cut
+        rows = _to_dicts(self.header, data[:cut].split(b"\n")[:-1])
+        self.stats["rows"] += len(rows)
+        return rows
+
+
+class DayIndex:
+    """
+    Byteoffset för första raden per UTC-dag i en append-only CSV.
+
+    Args:
+        path: CSV-filen (sidecar sparas som path + ".dayidx.json")
+        ts_column: Kolumn med ISO-tidsstämpel (default exit_ts)
+        persist: Spara indexet till disk (False = bara i minnet)
+    """
+
+    def __init__(self, path: str, ts_column: str = DEFAULT_TS_COLUMN, persist: bool = True):
+        self.path = path
+        self.ts_column = ts_column
+        self.persist = persist
+        self.index_path = path + INDEX_SUFFIX
+        self.header: List[str] = []
+        self.days: List[str] = []       # "YYYY-MM-DD", stigande
+        self.offsets: List[int] = []
+        self.indexed_to = 0
+        self.stats = {"bytes_indexed": 0, "rebuilds": 0}
+        if persist:
+            self._load()
+
+    # ----------------------- sidecar ------------------------------------------
+    def _load(self) -> None:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") != INDEX_VERSION or data.get("ts_column") != self.ts_column:
+            return
+        self.header = data.get("header", [])
+        self.days = [d for d, _ in data.get("days", [])]
+        self.offsets = [int(o) for _, o in data.get("days", [])]
+        self.indexed_to = int(data.get("indexed_to", 0))
+
+    def _save(self) -> None:
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": INDEX_VERSION, "ts_column": self.ts_column, "header": self.header,
+                       "indexed_to": self.indexed_to, "days": list(zip(self.days, self.offsets))}, f)
+        os.replace(tmp, self.index_path)
+
+    # ----------------------- uppbyggnad ---------------------------------------
+    def update(self) -> int:
+        """Indexera det som lagts till sedan sist. Returnerar antal nya bytes."""
+        if not os.path.exists(self.path):
+            return 0
+        with open(self.path, "rb") as f:
+            header, data_start = _read_header(f)
+            size = os.fstat(f.fileno()).st_size
+            if header != self.header or size < self.indexed_to or self.indexed_to < data_start:
+                if self.header:
+                    self.stats["rebuilds"] += 1
+                self.header, self.days, self.offsets = header, [], []
+                self.indexed_to = data_start
+            if not header or self.ts_column not in header or size <= self.indexed_to:
+                return 0
+            f.seek(self.indexed_to)
+            data = f.read(size - self.indexed_to)
+        cut = data.rfind(b"\n") + 1
+        if cut == 0:
+            return 0
+        col = header.index(self.ts_column)
+        offset = self.indexed_to
+        last_day = self.days[-1] if self.days else ""
+        for line in data[:cut].split(b"\n")[:-1]:
+            if col == 0:
+                day = line[:10].decode("ascii", "replace")
+            else:
+                fields = next(csv.reader([line.decode("utf-8")]), [])
+                day = fields[col][:10] if len(fields) > col else ""
+            if day > last_day:
+                self.days.append(day)
+                self.offsets.append(offset)
+                last_day = day
+            offset += len(line) + 1
+        self.indexed_to += cut
+        self.stats["bytes_indexed"] += cut
+        if self.persist:
+            self._save()
+        return cut
+
+    # ----------------------- uppslag ------------------------------------------
+    def offset_for(self, day: str) -> Optional[int]:
+        """Offset för första raden med dag >= day (None om inga sådana rader)."""
+        i = bisect.bisect_left(self.days, day)
+        return self.offsets[i] if i < len(self.offsets) else None
+
+    def rows_since(self, since: datetime) -> List[Dict[str, str]]:
+        """Alla rader med tidsstämpel >= since (läser bara från sinces dag och framåt)."""
+        self.update()
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        start = self.offset_for(since.astimezone(timezone.utc).date().isoformat())
+        if start is None:
+            return []
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            data = f.read(self.indexed_to - start)
+        rows = _to_dicts(self.header, data.split(b"\n")[:-1])
+        out = []
+        for row in rows:
+            try:
+                if parse_utc_ts(row[self.ts_column]) >= since:
+                    out.append(row)
+            except (KeyError, ValueError):
+                continue
+        return out
@@ -0,0 +1,43 @@
+"""
+Decimal Math – förberäknade konstanter och hjälpare för pris/kvantitet
+======================================================================
+Live-loopen skapade tidigare nya Decimal-objekt i varje tick
+(Decimal("1"), Decimal("100"), Decimal("0.00000001") som quantize-mål ...).
+Att tolka en sträng till Decimal kostar mer än själva räkneoperationen, så
+konstanterna skapas en gång här och återanvänds.
+
+Allt räknas fortfarande i Decimal med exakt samma uttryck som förut →
+bit-identiska resultat och loggar. Heltal i 1e-8-steg (pris-tick/satoshi)
+provades men lönar sig inte i CPython: Decimal-modulen är skriven i C och en
+division tar ~0.2 µs, medan konvertering Decimal → int kostar 0.3–1 µs per värde.
+"""
+
+from decimal import ROUND_DOWN, Decimal
+from typing import Tuple
+
+ZERO = Decimal("0")
+ONE = Decimal("1")
+HALF = Decimal("0.5")
+HUNDRED = Decimal("100")
+Q2 = Decimal("0.01")
+Q4 = Decimal("0.0001")
+Q8 = Decimal("0.00000001")
+
+
+def mul_down(a: Decimal, b: Decimal) -> Decimal:
+    """a * b avrundat nedåt till 8 decimaler (satoshi)."""
+    return (a * b).quantize(Q8, rounding=ROUND_DOWN)
+
+
+class FeeModel:
+    """Taker-avgift på en orders notional, båda avrundade nedåt till 8 decimaler."""
+
+    __slots__ = ("fee_pct",)
+
+    def __init__(self, fee_pct: Decimal):
+        self.fee_pct = fee_pct
+
+    def notional_and_fee(self, price: Decimal, qty: Decimal) -> Tuple[Decimal, Decimal]:
+        notional = (price * qty).quantize(Q8, rounding=ROUND_DOWN)
+        fee = (notional * self.fee_pct).quantize(Q8, rounding=ROUND_DOWN)
+        return notional, fee
@@ -1,13 +1,23 @@
 import argparse
 import csv
+import json
 import os
 import time
 from datetime import datetime
 from statistics import mean, quantiles
-from typing import Any, Dict, Iterable, List, Optional
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
 import requests
 
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+from kline_cache import DEFAULT_CACHE_DIR, INTERVAL_MS, KlineCache
+from quantile_sketch import TDigest
+
 BINANCE_REST = "https://api.binance.com"
 
 
@@ -27,6 +37,7 @@ def fetch_klines(
     max_candles: int,
     start_time: Optional[int],
     end_time: Optional[int],
+    base_url: str = BINANCE_REST,
 ) -> List[Dict[str, Any]]:
     remaining = max_candles
     klines: List[Dict[str, Any]] = []
@@ -39,7 +50,7 @@ def fetch_klines(
             params["startTime"] = current_start
         if end_time is not None:
             params["endTime"] = end_time
-        resp = session.get(f"{BINANCE_REST}/api/v3/klines", params=params, timeout=10)
+        resp = session.get(f"{base_url}/api/v3/klines", params=params, timeout=10)
         resp.raise_for_status()
         batch = resp.json()
         if not batch:
@@ -76,7 +87,14 @@ def compute_forward_extremes(
     klines: List[Dict[str, Any]],
     lookahead: int,
 ) -> List[Dict[str, Any]]:
-    results: List[Dict[str, Any]] = []
+    return list(iter_forward_rows(klines, lookahead))
+
+
+def iter_forward_rows(
+    klines: List[Dict[str, Any]],
+    lookahead: int,
+) -> Iterator[Dict[str, Any]]:
+    """Raderna från compute_forward_extremes() en i taget (ingen lista)."""
     total = len(klines)
     for idx, kline in enumerate(klines):
         end_idx = min(total, idx + lookahead + 1)
@@ -91,18 +109,222 @@ def compute_forward_extremes(
         mfe = max(0.0, max_future - entry)
         mae = max(0.0, entry - min_future)
         denom = entry if entry != 0 else 1.0
-        results.append(
-            {
-                "open_time": kline["open_time"],
-                "close": entry,
-                "max_future": max_future,
-                "min_future": min_future,
-                "mfe_pct": mfe / denom,
-                "mae_pct": mae / denom,
-                "direction": "down" if kline["close"] < kline["open"] else "up",
-            }
+        yield {
+            "open_time": kline["open_time"],
+            "close": entry,
+            "max_future": max_future,
+            "min_future": min_future,
+            "mfe_pct": mfe / denom,
+            "mae_pct": mae / denom,
+            "direction": "down" if kline["close"] < kline["open"] else "up",
+        }
+
+
+def iter_forward_extremes(
+    klines: List[Dict[str, Any]],
+    lookaheads: Iterable[int],
+) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    Samma resultat som compute_forward_extremes() men för många lookaheads i ett svep.
+
+    Bygger en sparse table (max/min över fönster om 2^k candles) nivå för nivå och
+    besvarar varje lookahead så fort dess nivå finns: fönstret [i+1, i+L] täcks av två
+    överlappande 2^k-block. Endast aktuell nivå hålls i minnet → O(n) minne,
+    O(n·log(max L)) tid totalt. Svansen (färre än L candles kvar) tas från suffix-max/min.
+
+    Yields:
+        (lookahead, {"open_time", "close", "max_future", "min_future", "mfe_pct", "mae_pct", "down"})
+        i stigande lookahead-ordning, där varje värde är en NumPy-array (en rad per candle
+        som har minst en framtida candle). Konsumera en lookahead i taget så hålls bara
+        dess arrayer i minnet.
+    """
+    if not NUMPY_AVAILABLE:
+        raise RuntimeError("numpy saknas. Kör:\n    python -m pip install numpy")
+    wanted = sorted({int(l) for l in lookaheads if int(l) > 0})
+    n = len(klines)
+    if n < 2 or not wanted:
+        return
+
+    highs = np.fromiter((k["high"] for k in klines), dtype=np.float64, count=n)
+    lows = np.fromiter((k["low"] for k in klines), dtype=np.float64, count=n)
+    closes = np.fromiter((k["close"] for k in klines), dtype=np.float64, count=n)
+    opens = np.fromiter((k["open"] for k in klines), dtype=np.float64, count=n)
+    open_times = np.fromiter((k["open_time"] for k in klines), dtype=np.int64, count=n)
+
+    # Suffix-extremer för svansen: fönstret [i+1, n-1]
+    suffix_max = np.maximum.accumulate(highs[::-1])[::-1]
+    suffix_min = np.minimum.accumulate(lows[::-1])[::-1]
+
+    entry = closes[:-1]
+    denom = np.where(entry != 0, entry, 1.0)
+    down = closes[:-1] < opens[:-1]
+
+    level_max, level_min, width = highs, lows, 1  # nivå 0: fönster om 1 candle
+    for lookahead in wanted:
+        while width * 2 <= lookahead:
+            level_max = np.maximum(level_max[:-width], level_max[width:])
+            level_min = np.minimum(level_min[:-width], level_min[width:])
+            width *= 2
+        full = max(0, n - 1 - lookahead + 1)  # index i med hela fönstret [i+1, i+L] inom datat
+        max_future = np.empty(n - 1, dtype=np.float64)
+        min_future = np.empty(n - 1, dtype=np.float64)
+        if full:
+            a = np.arange(1, full + 1)
+            b = a + lookahead - width
+            max_future[:full] = np.maximum(level_max[a], level_max[b])
+            min_future[:full] = np.minimum(level_min[a], level_min[b])
+        max_future[full:] = suffix_max[full + 1:]
+        min_future[full:] = suffix_min[full + 1:]
+
+        yield lookahead, {
+            "open_time": open_times[:-1],
+            "close": entry,
+            "max_future": max_future,
+            "min_future": min_future,
+            "mfe_pct": np.maximum(0.0, max_future - entry) / denom,
+            "mae_pct": np.maximum(0.0, entry - min_future) / denom,
+            "down": down,
+        }
+
+
+def rows_from_arrays(arrays: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Arrayer från compute_forward_extremes_multi() → samma rad-dicts som compute_forward_extremes()."""
+    return [
+        {
+            "open_time": int(ot),
+            "close": float(c),
+            "max_future": float(hi),
+            "min_future": float(lo),
+            "mfe_pct": float(mfe),
+            "mae_pct": float(mae),
+            "direction": "down" if d else "up",
+        }
+        for ot, c, hi, lo, mfe, mae, d in zip(
+            arrays["open_time"], arrays["close"], arrays["max_future"], arrays["min_future"],
+            arrays["mfe_pct"], arrays["mae_pct"], arrays["down"],
         )
-    return results
+    ]
+
+
+def _quartiles_np(values: "np.ndarray") -> List[float]:
+    """Vektoriserad motsvarighet till _quartiles() (inclusive-metoden = linjär interpolation)."""
+    if values.size == 0:
+        return [0.0, 0.0, 0.0]
+    if values.size < 4:
+        values = np.concatenate([values, np.full(4 - values.size, values.max())])
+    return [float(q) for q in np.quantile(values, [0.25, 0.5, 0.75])]
+
+
+def build_stats_arrays(
+    mfe: "np.ndarray",
+    mae: "np.ndarray",
+    loss_threshold: float,
+) -> Dict[str, Any]:
+    """Samma nycklar som build_stats(), men direkt på NumPy-arrayer."""
+    count = int(mfe.size)
+    if not count:
+        return {"count": 0}
+    hits = mae >= loss_threshold
+    loss_hits = int(np.count_nonzero(hits))
+    stats: Dict[str, Any] = {
+        "count": count,
+        "loss_hits": loss_hits,
+        "loss_hit_ratio": loss_hits / count,
+        "mfe_mean": float(mfe.mean()),
+        "mae_mean": float(mae.mean()),
+        "mfe_quantiles": _quartiles_np(mfe),
+        "mae_quantiles": _quartiles_np(mae),
+    }
+    if loss_hits:
+        loss_mfe = mfe[hits]
+        loss_mae = mae[hits]
+        stats["loss_mfe_mean"] = float(loss_mfe.mean())
+        stats["loss_mae_mean"] = float(loss_mae.mean())
+        stats["loss_mfe_quantiles"] = _quartiles_np(loss_mfe)
+        stats["loss_mae_quantiles"] = _quartiles_np(loss_mae)
+    return stats
+
+
+PAUSE_MAP_STATS = {
+    "loss_mfe_mean": lambda st: st.get("loss_mfe_mean", st.get("mfe_mean", 0.0)),
+    "loss_mfe_median": lambda st: st.get("loss_mfe_quantiles", st.get("mfe_quantiles", [0.0] * 3))[1],
+    "mfe_mean": lambda st: st.get("mfe_mean", 0.0),
+    "mfe_median": lambda st: st.get("mfe_quantiles", [0.0] * 3)[1],
+}
+
+
+def build_pause_resume_map(stats_by_lookahead: Dict[int, Dict[str, Any]], stat: str) -> Dict[str, float]:
+    """{lookahead: stats} → pause_resume_map i samma format som config.json ({"20": 0.002586, ...})."""
+    pick = PAUSE_MAP_STATS[stat]
+    return {
+        str(lookahead): round(float(pick(stats)), 6)
+        for lookahead, stats in sorted(stats_by_lookahead.items())
+        if stats.get("count")
+    }
+
+
+def _sketch_quartiles(digest: TDigest) -> List[float]:
+    return [digest.quantile(q) for q in (0.25, 0.5, 0.75)] if digest.count else [0.0, 0.0, 0.0]
+
+
+class _StreamingStats:
+    """Ackumulatorer för build_stats()-nycklarna: summor exakt, kvartiler ur t-digest."""
+
+    def __init__(self, loss_threshold: float):
+        self.loss_threshold = loss_threshold
+        self.count = self.loss_hits = 0
+        self.mfe_sum = self.mae_sum = self.loss_mfe_sum = self.loss_mae_sum = 0.0
+        self.mfe_q, self.mae_q, self.loss_mfe_q, self.loss_mae_q = TDigest(), TDigest(), TDigest(), TDigest()
+
+    def add(self, mfe: float, mae: float) -> None:
+        self.count += 1
+        self.mfe_sum += mfe
+        self.mae_sum += mae
+        self.mfe_q.add(mfe)
+        self.mae_q.add(mae)
+        if mae >= self.loss_threshold:
+            self.loss_hits += 1
+            self.loss_mfe_sum += mfe
+            self.loss_mae_sum += mae
+            self.loss_mfe_q.add(mfe)
+            self.loss_mae_q.add(mae)
+
+    def to_stats(self) -> Dict[str, Any]:
+        if not self.count:
+            return {"count": 0}
+        stats: Dict[str, Any] = {
+            "count": self.count,
+            "loss_hits": self.loss_hits,
+            "loss_hit_ratio": self.loss_hits / self.count,
+            "mfe_mean": self.mfe_sum / self.count,
+            "mae_mean": self.mae_sum / self.count,
+            "mfe_quantiles": _sketch_quartiles(self.mfe_q),
+            "mae_quantiles": _sketch_quartiles(self.mae_q),
+        }
+        if self.loss_hits:
+            stats["loss_mfe_mean"] = self.loss_mfe_sum / self.loss_hits
+            stats["loss_mae_mean"] = self.loss_mae_sum / self.loss_hits
+            stats["loss_mfe_quantiles"] = _sketch_quartiles(self.loss_mfe_q)
+            stats["loss_mae_quantiles"] = _sketch_quartiles(self.loss_mae_q)
+        return stats
+
+
+def build_stats_streaming(
+    rows: Iterable[Dict[str, Any]],
+    loss_threshold: float,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    build_stats() för alla, ned- och upp-candles i ETT svep utan att spara
+    raderna: medel exakt, kvartiler ur t-digest (quantile_sketch.py) → minnet är
+    konstant oavsett antal candles. Returnerar {"all": .., "down": .., "up": ..}.
+    """
+    groups = {"all": _StreamingStats(loss_threshold), "down": _StreamingStats(loss_threshold),
+              "up": _StreamingStats(loss_threshold)}
+    for r in rows:
+        mfe, mae = r["mfe_pct"], r["mae_pct"]
+        groups["all"].add(mfe, mae)
+        groups[r["direction"]].add(mfe, mae)
+    return {name: acc.to_stats() for name, acc in groups.items()}
 
 
 def build_stats(
@@ -134,16 +356,28 @@ def build_stats(
 
 
 def save_csv(path: str, rows: Iterable[Dict[str, Any]]) -> None:
-    rows = list(rows)
-    if not rows:
-        return
-    directory = os.path.dirname(path)
-    if directory:
-        os.makedirs(directory, exist_ok=True)
-    with open(path, "w", newline="", encoding="utf-8") as wf:
-        writer = csv.DictWriter(wf, fieldnames=list(rows[0].keys()))
-        writer.writeheader()
-        writer.writerows(rows)
+    for _ in iter_save_csv(path, rows):
+        pass
+
+
+def iter_save_csv(path: str, rows: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """Skriv raderna till CSV medan de skickas vidare (ingen fil om inga rader)."""
+    wf = None
+    writer = None
+    try:
+        for row in rows:
+            if writer is None:
+                directory = os.path.dirname(path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                wf = open(path, "w", newline="", encoding="utf-8")
+                writer = csv.DictWriter(wf, fieldnames=list(row.keys()))
+                writer.writeheader()
+            writer.writerow(row)
+            yield row
+    finally:
+        if wf is not None:
+            wf.close()
 
 
 def fmt_pct(value: float) -> str:
@@ -166,18 +400,55 @@ def main() -> None:
         nargs="+",
         help="Anger en lista med lookahead-värden (överskriver positionella lookahead om satt)",
     )
+    parser.add_argument(
+        "--lookahead-range",
+        type=int,
+        nargs=3,
+        metavar=("START", "STOP", "STEP"),
+        help="Lookahead-värden START..STOP (inklusive) med steg STEP, t.ex. 5 500 5",
+    )
+    parser.add_argument("--brief", action="store_true", help="En rad per lookahead istället för full rapport")
+    parser.add_argument("--pause-map-out", help="Skriv pause_resume_map (JSON) för live-configen till denna fil")
+    parser.add_argument(
+        "--pause-map-stat",
+        choices=sorted(PAUSE_MAP_STATS),
+        default="loss_mfe_mean",
+        help="Vilken statistik (Totalt) som blir pause_resume_pct per lookahead",
+    )
+    parser.add_argument("--slow", action="store_true", help="Använd den gamla per-candle-beräkningen (referens)")
+    parser.add_argument(
+        "--sketch",
+        action="store_true",
+        help="Strömmande per-candle-väg (ersätter NumPy-svepet): kvartiler ur t-digest i ett svep, konstant minne",
+    )
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="Lokal kline-cache (hämtar bara saknade intervall)")
+    parser.add_argument("--no-cache", action="store_true", help="Hämta sekventiellt utan cache (gamla beteendet)")
+    parser.add_argument("--workers", type=int, default=8, help="Parallella förfrågningar vid cache-fyllning")
+    parser.add_argument("--base-url", default=BINANCE_REST, help="REST-bas, t.ex. lokal binance_stub.py")
     args = parser.parse_args()
 
     start_ms = _to_epoch_ms(args.start)
     end_ms = _to_epoch_ms(args.end)
     print(f"⬇️  Hämtar {args.max_candles} klines för {args.symbol} @ {args.interval}...")
-    klines = fetch_klines(args.symbol, args.interval, args.max_candles, start_ms, end_ms)
+    use_cache = not args.no_cache
+    if use_cache and args.interval not in INTERVAL_MS:
+        print(f"ℹ️  Intervall {args.interval} har ingen fast längd - hämtar direkt utan cache")
+        use_cache = False
+    if not use_cache:
+        klines = fetch_klines(args.symbol, args.interval, args.max_candles, start_ms, end_ms, args.base_url)
+    else:
+        cache = KlineCache(args.cache_dir, base_url=args.base_url, max_workers=args.workers)
+        klines = cache.get_klines(args.symbol, args.interval, args.max_candles, start_ms, end_ms)
     if not klines:
         print("Inga klines hämtade.")
         return
     print(f"✅ Hämtade {len(klines)} klines.")
 
-    lookahead_values = args.lookahead_set if args.lookahead_set else [args.lookahead]
+    if args.lookahead_range:
+        start_la, stop_la, step_la = args.lookahead_range
+        lookahead_values = list(range(start_la, stop_la + 1, max(1, step_la)))
+    else:
+        lookahead_values = args.lookahead_set if args.lookahead_set else [args.lookahead]
 
     def describe(label: str, stats: Dict[str, Any], lookahead: int) -> None:
         if not stats.get("count"):
@@ -196,27 +467,73 @@ def main() -> None:
             print(f"  Efter förlust (>= threshold) MFE medel: {fmt_pct(stats['loss_mfe_mean'])}")
             print(f"  Efter förlust MAE medel: {fmt_pct(stats['loss_mae_mean'])}")
 
+    def csv_path_for(lookahead: int) -> str:
+        if len(lookahead_values) == 1:
+            return args.csv
+        if "{lookahead}" in args.csv:
+            return args.csv.format(lookahead=lookahead)
+        root, ext = os.path.splitext(args.csv)
+        return f"{root}_L{lookahead}{ext or '.csv'}"
+
+    use_fast = NUMPY_AVAILABLE and not args.slow and not args.sketch
+    if not use_fast and not args.slow and not args.sketch:
+        print("⚠️ numpy saknas - använder långsam per-candle-beräkning")
+    if use_fast:
+        lookahead_values = sorted({l for l in lookahead_values if l > 0})
+        sweep = iter_forward_extremes(klines, lookahead_values)
+    stats_by_lookahead: Dict[int, Dict[str, Any]] = {}
+
     for lookahead in lookahead_values:
-        rows = compute_forward_extremes(klines, lookahead)
+        if use_fast:
+            arrays = next(sweep, (None, None))[1]
+            if arrays is None:
+                print(f"Lookahead {lookahead}: inga datapunkter")
+                continue
+            rows = rows_from_arrays(arrays) if args.csv else []
+            down = arrays["down"]
+            mfe, mae = arrays["mfe_pct"], arrays["mae_pct"]
+            stats_all = build_stats_arrays(mfe, mae, args.loss_threshold)
+            stats_down = build_stats_arrays(mfe[down], mae[down], args.loss_threshold)
+            stats_up = build_stats_arrays(mfe[~down], mae[~down], args.loss_threshold)
+        elif args.sketch:
+            rows = iter_forward_rows(klines, lookahead)
+            if args.csv:
+                rows = iter_save_csv(csv_path_for(lookahead), rows)  # skrivs under samma svep
+            grouped = build_stats_streaming(rows, args.loss_threshold)
+            stats_all, stats_down, stats_up = grouped["all"], grouped["down"], grouped["up"]
+        else:
+            rows = compute_forward_extremes(klines, lookahead)
+            stats_all = build_stats(rows, args.loss_threshold)
+            stats_down = build_stats((r for r in rows if r["direction"] == "down"), args.loss_threshold)
+            stats_up = build_stats((r for r in rows if r["direction"] == "up"), args.loss_threshold)
+
         if args.csv:
-            if len(lookahead_values) == 1:
-                csv_path = args.csv
-            elif "{lookahead}" in args.csv:
-                csv_path = args.csv.format(lookahead=lookahead)
-            else:
-                root, ext = os.path.splitext(args.csv)
-                csv_path = f"{root}_L{lookahead}{ext or '.csv'}"
-            save_csv(csv_path, rows)
+            csv_path = csv_path_for(lookahead)
+            if not args.sketch:
+                save_csv(csv_path, rows)
             print(f"💾 Sparade rad-data till {csv_path}")
 
-        stats_all = build_stats(rows, args.loss_threshold)
-        stats_down = build_stats((r for r in rows if r["direction"] == "down"), args.loss_threshold)
-        stats_up = build_stats((r for r in rows if r["direction"] == "up"), args.loss_threshold)
-
+        stats_by_lookahead[lookahead] = stats_all
+        if args.brief:
+            if stats_all.get("count"):
+                print(
+                    f"L={lookahead:<4} n={stats_all['count']:<8} "
+                    f"förlust={fmt_pct(stats_all['loss_hit_ratio'])} "
+                    f"MFE={fmt_pct(stats_all['mfe_mean'])} MAE={fmt_pct(stats_all['mae_mean'])}"
+                )
+            continue
         describe("Totalt", stats_all, lookahead)
         describe("Ned-candles", stats_down, lookahead)
         describe("Upp-candles", stats_up, lookahead)
 
+    if args.pause_map_out:
+        pause_map = build_pause_resume_map(stats_by_lookahead, args.pause_map_stat)
+        directory = os.path.dirname(args.pause_map_out)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.pause_map_out, "w", encoding="utf-8") as wf:
+            json.dump({"pause_resume_map": pause_map}, wf, indent=2)
+        print(f"\n🗺️ pause_resume_map ({args.pause_map_stat}, {len(pause_map)} lookaheads) sparad till {args.pause_map_out}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,380 @@
+"""
+Kline Cache
+===========
+Parallell, återupptagbar nedladdning av Binance-klines med lokal disk-cache.
+
+Koncept:
+1. Tidsintervallet delas upp i fasta chunks om 1000 candles (en förfrågan per chunk)
+2. Chunks som redan finns på disk hoppas över → bara saknade intervall hämtas
+3. Saknade chunks hämtas parallellt inom en request-weight-budget per minut
+4. Varje chunk skrivs atomiskt (temp-fil + rename) → avbruten körning kan återupptas
+
+Chunk-gränserna är alignade mot epoch, så samma candle hamnar alltid i samma fil
+oavsett vilket start/slut man frågar efter. Endast helt stängda chunks sparas;
+pågående chunk hämtas men cachas inte.
+
+Layout:
+    data/klines/<SYMBOL>/<interval>/<chunk_start_ms>.csv
+
+Kör:
+    python kline_cache.py BTCUSDT ETHUSDT --interval 1m --start 2025-01-01T00:00:00Z
+    python kline_cache.py BTCUSDT --base-url http://127.0.0.1:8765   (mot binance_stub.py)
+"""
+
+import argparse
+import csv
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import requests  # python -m pip install requests
+except ImportError as e:
+    raise SystemExit(
+        "requests saknas. Kör:\n    python -m pip install requests\n"
+        "och starta sedan om skriptet."
+    ) from e
+
+BINANCE_REST = "https://api.binance.com"
+DEFAULT_CACHE_DIR = os.path.join("data", "klines")
+
+CHUNK_CANDLES = 1000          # Binance max limit per förfrågan
+KLINES_WEIGHT = 2             # Request-weight för /api/v3/klines (limit ≤ 1000)
+DEFAULT_WEIGHT_PER_MIN = 3000 # Halva Binance-gränsen (6000/min) – lämnar luft åt live-scripten
+MAX_RETRIES = 5               # Nätverks-/serverfel per chunk
+MAX_RATE_LIMIT_WAITS = 30     # 429/418-svar per chunk innan vi ger upp
+
+INTERVAL_MS = {
+    "1s": 1_000,
+    "1m": 60_000,
+    "3m": 180_000,
+    "5m": 300_000,
+    "15m": 900_000,
+    "30m": 1_800_000,
+    "1h": 3_600_000,
+    "2h": 7_200_000,
+    "4h": 14_400_000,
+    "6h": 21_600_000,
+    "8h": 28_800_000,
+    "12h": 43_200_000,
+    "1d": 86_400_000,
+    "3d": 259_200_000,
+    "1w": 604_800_000,
+}
+
+CSV_HEADER = ["open_time", "open", "high", "low", "close", "volume", "close_time"]
+
+
+def interval_to_ms(interval: str) -> int:
+    try:
+        return INTERVAL_MS[interval]
+    except KeyError:
+        raise ValueError(f"Intervall {interval!r} stöds inte av cachen (fast längd krävs)") from None
+
+
+def parse_kline_row(raw: List[Any]) -> Dict[str, Any]:
+    """Råformat (API eller cache-CSV) → samma dict som fetch_klines() returnerar."""
+    return {
+        "open_time": int(raw[0]),
+        "open": float(raw[1]),
+        "high": float(raw[2]),
+        "low": float(raw[3]),
+        "close": float(raw[4]),
+        "volume": float(raw[5]),
+        "close_time": int(raw[6]),
+    }
+
+
+class WeightBudget:
+    """
+    Token bucket för Binance request-weight.
+
+    Fylls på kontinuerligt med weight_per_minute/60 per sekund. Synkas mot
+    servern via X-MBX-USED-WEIGHT-1M och backar vid 429/418 (Retry-After).
+    """
+
+    def __init__(self, weight_per_minute: int = DEFAULT_WEIGHT_PER_MIN):
+        self.capacity = float(weight_per_minute)
+        self.rate = weight_per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, weight: int) -> None:
+        """Blockera tills weight finns tillgänglig i budgeten."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.blocked_until and self.tokens >= weight:
+                    self.tokens -= weight
+                    return
+                wait = max(self.blocked_until - now, (weight - self.tokens) / self.rate)
+            time.sleep(min(max(wait, 0.01), 5.0))
+
+    def observe_used_weight(self, used: Optional[str]) -> None:
+        """Justera ner budgeten om servern rapporterar högre förbrukning än vi tror."""
+        if not used:
+            return
+        try:
+            server_left = self.capacity - float(used)
+        except ValueError:
+            return
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, server_left)
+
+    def back_off(self, seconds: float) -> None:
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = 0.0
+
+
+class KlineCache:
+    """
+    Disk-cache + parallell nedladdare för klines.
+
+    Args:
+        root: Cache-katalog
+        base_url: Binance REST (eller lokal stub)
+        max_workers: Antal parallella förfrågningar
+        weight_per_minute: Request-weight-budget per minut
+    """
+
+    def __init__(
+        self,
+        root: str = DEFAULT_CACHE_DIR,
+        base_url: str = BINANCE_REST,
+        max_workers: int = 8,
+        weight_per_minute: int = DEFAULT_WEIGHT_PER_MIN,
+        verbose: bool = True,
+    ):
+        self.root = root
+        self.base_url = base_url.rstrip("/")
+        self.max_workers = max(1, max_workers)
+        self.budget = WeightBudget(weight_per_minute)
+        self.verbose = verbose
+        self.requests_made = 0
+        self._local = threading.local()
+        self._count_lock = threading.Lock()
+
+    # ----------------------- chunk-geometri -----------------------------------
+    @staticmethod
+    def chunk_span_ms(interval: str) -> int:
+        return CHUNK_CANDLES * interval_to_ms(interval)
+
+    def chunk_starts(self, interval: str, start_ms: int, end_ms: int) -> List[int]:
+        """Alla chunk-starter som täcker [start_ms, end_ms]."""
+        span = self.chunk_span_ms(interval)
+        first = (start_ms // span) * span
+        return list(range(first, end_ms + 1, span))
+
+    def chunk_path(self, symbol: str, interval: str, chunk_start: int) -> str:
+        return os.path.join(self.root, symbol.upper(), interval, f"{chunk_start}.csv")
+
+    def missing_chunks(self, symbol: str, interval: str, start_ms: int, end_ms: int) -> List[int]:
+        return [
+            c for c in self.chunk_starts(interval, start_ms, end_ms)
+            if not os.path.exists(self.chunk_path(symbol, interval, c))
+        ]
+
+    # ----------------------- nedladdning --------------------------------------
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            self._local.session = session
+        return session
+
+    def _fetch_chunk(self, symbol: str, interval: str, chunk_start: int) -> List[List[Any]]:
+        span = self.chunk_span_ms(interval)
+        params = {
+            "symbol": symbol.upper(),
+            "interval": interval,
+            "startTime": chunk_start,
+            "endTime": chunk_start + span - 1,
+            "limit": CHUNK_CANDLES,
+        }
+        delay = 0.5
+        failures = 0
+        rate_limited = 0
+        while failures < MAX_RETRIES and rate_limited < MAX_RATE_LIMIT_WAITS:
+            self.budget.acquire(KLINES_WEIGHT)
+            try:
+                resp = self._session().get(f"{self.base_url}/api/v3/klines", params=params, timeout=10)
+            except requests.exceptions.RequestException:
+                failures += 1
+                if failures == MAX_RETRIES:
+                    raise
+                time.sleep(delay)
+                delay *= 2
+                continue
+            with self._count_lock:
+                self.requests_made += 1
+            if resp.status_code in (418, 429):
+                # Servern bestämmer – vänta Retry-After för alla trådar
+                rate_limited += 1
+                self.budget.back_off(float(resp.headers.get("Retry-After", delay)))
+                continue
+            self.budget.observe_used_weight(resp.headers.get("X-MBX-USED-WEIGHT-1M"))
+            if resp.status_code >= 500:
+                failures += 1
+                time.sleep(delay)
+                delay *= 2
+                continue
+            resp.raise_for_status()
+            return resp.json()
+        raise RuntimeError(f"Gav upp chunk {symbol} {interval} @ {chunk_start} (fel={failures}, 429={rate_limited})")
+
+    def _write_chunk(self, symbol: str, interval: str, chunk_start: int, rows: List[List[Any]]) -> None:
+        path = self.chunk_path(symbol, interval, chunk_start)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", newline="", encoding="utf-8") as wf:
+            writer = csv.writer(wf)
+            writer.writerow(CSV_HEADER)
+            for raw in rows:
+                writer.writerow(raw[:7])
+        os.replace(tmp_path, path)
+
+    def download(self, symbols: Iterable[str], interval: str, start_ms: int, end_ms: int,
+                 now_ms: Optional[int] = None) -> Dict[Tuple[str, int], List[List[Any]]]:
+        """
+        Hämta alla saknade chunks för symbolerna parallellt.
+
+        Returns:
+            Rådata för chunks som hämtades men inte är stängda än (ej cachade),
+            nyckel (symbol, chunk_start).
+        """
+        now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+        span = self.chunk_span_ms(interval)
+        jobs = [
+            (sym.upper(), c)
+            for sym in symbols
+            for c in self.missing_chunks(sym, interval, start_ms, end_ms)
+            if c <= now_ms
+        ]
+        open_chunks: Dict[Tuple[str, int], List[List[Any]]] = {}
+        if not jobs:
+            return open_chunks
+        if self.verbose:
+            print(f"⬇️  Hämtar {len(jobs)} chunks ({interval}) med {self.max_workers} trådar...")
+
+        done = 0
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            futures = {executor.submit(self._fetch_chunk, sym, interval, c): (sym, c) for sym, c in jobs}
+            for fut in as_completed(futures):
+                sym, c = futures[fut]
+                rows = fut.result()
+                if c + span <= now_ms:
+                    self._write_chunk(sym, interval, c, rows)
+                else:
+                    open_chunks[(sym, c)] = rows
+                done += 1
+                if self.verbose and (done % 100 == 0 or done == len(jobs)):
+                    print(f"  {done}/{len(jobs)} chunks klara")
+        except BaseException:
+            # Avbrott: redan skrivna chunks ligger kvar → nästa körning fortsätter där
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        executor.shutdown()
+        return open_chunks
+
+    # ----------------------- läsning ------------------------------------------
+    def _read_chunk(self, symbol: str, interval: str, chunk_start: int) -> List[List[str]]:
+        path = self.chunk_path(symbol, interval, chunk_start)
+        if not os.path.exists(path):
+            return []
+        with open(path, "r", newline="", encoding="utf-8") as rf:
+            reader = csv.reader(rf)
+            next(reader, None)
+            return list(reader)
+
+    def load(self, symbol: str, interval: str, start_ms: int, end_ms: int,
+             open_chunks: Optional[Dict[Tuple[str, int], List[List[Any]]]] = None) -> List[Dict[str, Any]]:
+        """Läs klines med open_time i [start_ms, end_ms] från cachen."""
+        symbol = symbol.upper()
+        open_chunks = open_chunks or {}
+        klines: List[Dict[str, Any]] = []
+        for c in self.chunk_starts(interval, start_ms, end_ms):
+            rows = open_chunks.get((symbol, c)) or self._read_chunk(symbol, interval, c)
+            for raw in rows:
+                open_time = int(raw[0])
+                if start_ms <= open_time <= end_ms:
+                    klines.append(parse_kline_row(raw))
+        return klines
+
+    def get_klines(
+        self,
+        symbol: str,
+        interval: str,
+        max_candles: int,
+        start_time: Optional[int] = None,
+        end_time: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Samma semantik som historical_loss_pause_analysis.fetch_klines(), fast cachad:
+        med start_time → upp till max_candles framåt, annars de senaste max_candles före end_time.
+        """
+        step = interval_to_ms(interval)
+        now_ms = int(time.time() * 1000)
+        end_ms = end_time if end_time is not None else now_ms
+        if start_time is not None:
+            start_ms = start_time
+            end_ms = min(end_ms, start_ms + max_candles * step - 1)
+        else:
+            start_ms = (end_ms // step) * step - (max_candles - 1) * step
+        open_chunks = self.download([symbol], interval, start_ms, end_ms, now_ms=now_ms)
+        klines = self.load(symbol, interval, start_ms, end_ms, open_chunks)
+        if start_time is None:
+            return klines[-max_candles:]
+        return klines[:max_candles]
+
+
+def _to_epoch_ms(dt: Optional[str]) -> Optional[int]:
+    if not dt:
+        return None
+    try:
+        parsed = datetime.fromisoformat(dt.replace("Z", "+00:00"))
+    except ValueError:
+        raise SystemExit(f"Kan inte tolka tidstämpel: {dt}") from None
+    return int(parsed.timestamp() * 1000)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fyll lokal kline-cache från Binance (parallellt, återupptagbart).")
+    parser.add_argument("symbols", nargs="+")
+    parser.add_argument("--interval", default="1m")
+    parser.add_argument("--start", required=True, help="ISO8601 starttid, ex 2025-01-01T00:00:00Z")
+    parser.add_argument("--end", help="ISO8601 sluttid (default: nu)")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--base-url", default=BINANCE_REST)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--weight-per-min", type=int, default=DEFAULT_WEIGHT_PER_MIN)
+    args = parser.parse_args()
+
+    start_ms = _to_epoch_ms(args.start)
+    end_ms = _to_epoch_ms(args.end) or int(time.time() * 1000)
+    cache = KlineCache(args.cache_dir, args.base_url, args.workers, args.weight_per_min)
+
+    t0 = time.perf_counter()
+    try:
+        cache.download(args.symbols, args.interval, start_ms, end_ms)
+    except KeyboardInterrupt:
+        print("\n⏸️ Avbrutet – redan hämtade chunks ligger kvar, kör igen för att fortsätta.")
+        return
+    elapsed = time.perf_counter() - t0
+    print(f"✅ Klart på {elapsed:.1f}s ({cache.requests_made} förfrågningar). Cache: {cache.root}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""
+Latency Stats – latens per steg i live-loopen
+=============================================
+Varje steg (hämtning, scaling, exit, CSV-skrivning, grafritning ...) mäts med
+time.perf_counter_ns() in i ett log-linjärt histogram (8 hinkar per
+tvåpotens → max ~12% relativt fel) för < 1 µs per mätning och fast minne.
+
+Periodiskt skrivs percentiler (p50/p90/p99/max) för senaste intervallet till
+konsolen och som JSON-rader till en metrikfil. Valfritt exponeras kumulativa
+värden i Prometheus textformat på en lokal port (/metrics).
+
+Användning i en loop:
+
+    stats = LatencyStats(metrics_path="logs/latency_metrics.jsonl", report_sec=60)
+    mark = stats.start()
+    price = get_live_price(SYMBOL)
+    mark = stats.lap("fetch", mark)
+    maybe_exit(price)
+    mark = stats.lap("exit", mark)
+    ...
+    stats.maybe_report()
+
+    with stats.measure("csv"):      # för nästlade steg (t.ex. CSV inne i exit)
+        append_csv_row(...)
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional
+
+SUB_BITS = 3
+SUB_BUCKETS = 1 << SUB_BITS           # hinkar per tvåpotens
+BUCKET_COUNT = (64 - SUB_BITS + 1) * SUB_BUCKETS
+REPORT_QUANTILES = (0.5, 0.9, 0.99)
+PROMETHEUS_PREFIX = "trendtrading_stage_latency_seconds"
+
+
+def bucket_index(value_ns: int) -> int:
+    """Log-linjär hink: exakt under 8 ns, sedan 8 hinkar per tvåpotens."""
+    if value_ns < SUB_BUCKETS:
+        return value_ns if value_ns > 0 else 0
+    exp = value_ns.bit_length() - 1
+    sub = (value_ns >> (exp - SUB_BITS)) & (SUB_BUCKETS - 1)
+    return (exp - SUB_BITS + 1) * SUB_BUCKETS + sub
+
+
+def bucket_upper_ns(index: int) -> int:
+    """Största värde (ns) som hamnar i hinken."""
+    if index < SUB_BUCKETS:
+        return index
+    exp = index // SUB_BUCKETS + SUB_BITS - 1
+    sub = index % SUB_BUCKETS
+    return ((SUB_BUCKETS + sub + 1) << (exp - SUB_BITS)) - 1
+
+
+class LatencyHistogram:
+    """Kumulativt histogram + min/max/summa. Intervallvärden fås via snapshot-diff."""
+
+    __slots__ = ("counts", "count", "total_ns", "max_ns", "interval_max_ns")
+
+    def __init__(self):
+        self.counts: List[int] = [0] * BUCKET_COUNT
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self.interval_max_ns = 0
+
+    def record(self, value_ns: int) -> None:
+        self.counts[bucket_index(value_ns)] += 1
+        self.count += 1
+        self.total_ns += value_ns
+        if value_ns > self.interval_max_ns:
+            self.interval_max_ns = value_ns
+            if value_ns > self.max_ns:
+                self.max_ns = value_ns
+
+    @staticmethod
+    def quantile_from(counts: List[int], total: int, q: float, max_ns: int) -> int:
+        """Percentil (ns) ur hinkräkningar; hinkens övre gräns, klippt mot max."""
+        if total <= 0:
+            return 0
+        rank = max(1, int(q * total + 0.999999))
+        seen = 0
+        for idx, c in enumerate(counts):
+            if c:
+                seen += c
+                if seen >= rank:
+                    return min(bucket_upper_ns(idx), max_ns)
+        return max_ns
+
+    def quantile(self, q: float) -> int:
+        return self.quantile_from(self.counts, self.count, q, self.max_ns)
+
+
+class LatencyStats:
+    """
+    Samling histogram per steg med periodisk rapport.
+
+    Args:
+        enabled: False = alla anrop blir nästan gratis no-ops
+        metrics_path: JSON-rader med intervall-percentiler (None = ingen fil)
+        report_sec: Intervall för rapport till konsol/fil (0 = bara vid anrop till report())
+        prometheus_port: >0 = starta /metrics på 127.0.0.1:port
+        print_reports: Skriv intervall-rapport till konsolen
+    """
+
+    def __init__(self, enabled: bool = True, metrics_path: Optional[str] = None,
+                 report_sec: float = 60.0, prometheus_port: int = 0, print_reports: bool = True):
+        self.enabled = enabled
+        self.metrics_path = metrics_path
+        self.report_sec = report_sec
+        self.print_reports = print_reports
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self._snapshots: Dict[str, List[int]] = {}
+        self._snapshot_counts: Dict[str, int] = {}
+        self._snapshot_totals: Dict[str, int] = {}
+        self._last_report = time.monotonic()
+        self._lock = threading.Lock()  # bara mellan rapport och Prometheus-tråden
+        self._httpd: Optional[ThreadingHTTPServer] = None
+        if enabled and metrics_path:
+            directory = os.path.dirname(metrics_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        if enabled and prometheus_port > 0:
+            self.serve_prometheus(prometheus_port)
+
+    # -- mätning (hot path) --------------------------------------------------
+    def start(self) -> int:
+        return time.perf_counter_ns() if self.enabled else 0
+
+    def lap(self, stage: str, mark: int) -> int:
+        """Registrera tiden sedan mark för stage och returnera ny mark."""
+        if not self.enabled:
+            return 0
+        now = time.perf_counter_ns()
+        self.record(stage, now - mark)
+        return now
+
+    def record(self, stage: str, value_ns: int) -> None:
+        hist = self.histograms.get(stage)
+        if hist is None:
+            hist = self.histograms[stage] = LatencyHistogram()
+        hist.record(value_ns)
+
+    @contextmanager
+    def measure(self, stage: str) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        t0 = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter_ns() - t0)
+
+    # -- rapportering --------------------------------------------------------
+    def maybe_report(self) -> None:
+        if self.enabled and self.report_sec > 0 and time.monotonic() - self._last_report >= self.report_sec:
+            self.report()
+
+    def interval_summary(self) -> Dict[str, Dict[str, float]]:
+        """Percentiler (ms) sedan förra rapporten per steg. Nollställer intervallet."""
+        summary = {}
+        with self._lock:
+            for stage, hist in self.histograms.items():
+                prev = self._snapshots.get(stage)
+                counts = hist.counts if prev is None else [c - p for c, p in zip(hist.counts, prev)]
+                count = hist.count - self._snapshot_counts.get(stage, 0)
+                total_ns = hist.total_ns - self._snapshot_totals.get(stage, 0)
+                if count <= 0:
+                    continue
+                max_ns = hist.interval_max_ns
+                row = {"count": count, "mean_ms": total_ns / count / 1e6}
+                for q in REPORT_QUANTILES:
+                    row[f"p{int(q * 100)}_ms"] = LatencyHistogram.quantile_from(counts, count, q, max_ns) / 1e6
+                row["max_ms"] = max_ns / 1e6
+                summary[stage] = row
+                self._snapshots[stage] = list(hist.counts)
+                self._snapshot_counts[stage] = hist.count
+                self._snapshot_totals[stage] = hist.total_ns
+                hist.interval_max_ns = 0
+        return summary
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        now = time.monotonic()
+        interval = now - self._last_report
+        self._last_report = now
+        summary = self.interval_summary()
+        if not summary:
+            return summary
+        if self.print_reports:
+            print(f"⏱️ Latens senaste {interval:.0f}s (ms):  {'steg':<10} {'n':>6} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}")
+            for stage, row in summary.items():
+                print(f"{'':<30}{stage:<10} {row['count']:>6} {row['p50_ms']:>8.2f} {row['p90_ms']:>8.2f} "
+                      f"{row['p99_ms']:>8.2f} {row['max_ms']:>8.2f}")
+        if self.metrics_path:
+            line = {
+                "ts": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "interval_sec": round(interval, 3),
+                "stages": summary,
+            }
+            try:
+                with open(self.metrics_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(line) + "\n")
+            except OSError as e:
+                print(f"⚠️ Kunde inte skriva latensmetrik: {e}")
+        return summary
+
+    # -- Prometheus ----------------------------------------------------------
+    def prometheus_text(self) -> str:
+        """Kumulativa värden som Prometheus summary (kvantiler, _sum, _count)."""
+        lines = [
+            f"# HELP {PROMETHEUS_PREFIX} Latens per steg i live-loopen",
+            f"# TYPE {PROMETHEUS_PREFIX} summary",
+        ]
+        with self._lock:
+            for stage, hist in sorted(self.histograms.items()):
+                for q in REPORT_QUANTILES:
+                    lines.append(f'{PROMETHEUS_PREFIX}{{stage="{stage}",quantile="{q}"}} {hist.quantile(q) / 1e9:.9f}')
+                lines.append(f'{PROMETHEUS_PREFIX}_sum{{stage="{stage}"}} {hist.total_ns / 1e9:.9f}')
+                lines.append(f'{PROMETHEUS_PREFIX}_count{{stage="{stage}"}} {hist.count}')
+        return "\n".join(lines) + "\n"
+
+    def serve_prometheus(self, port: int, host: str = "127.0.0.1") -> None:
+        stats = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, fmt, *args):
+                return
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                body = stats.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        try:
+            self._httpd = ThreadingHTTPServer((host, port), Handler)
+        except OSError as e:
+            print(f"⚠️ Prometheus-port {port} kunde inte öppnas: {e}")
+            return
+        threading.Thread(target=self._httpd.serve_forever, name="latency-prometheus", daemon=True).start()
+        print(f"📡 Latensmetrik (Prometheus): http://{host}:{port}/metrics")
+
+    def close(self) -> None:
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
@@ -0,0 +1,375 @@
+"""
+Live Profiler – profilera den körande paper-tradern utan omstart
+================================================================
+Seghet och minnesläckor syns först efter timmar; att starta om under
+cProfile tappar både tillståndet och felet. Här triggas profilering i den
+körande processen, och resultatet hamnar i loggkatalogen:
+
+    profile [sek] [sample|cprofile]
+        sample    tråd som var sample_ms läser huvudloopens stack
+                  (sys._current_frames) → profile_<ts>.collapsed
+                  (flamegraph.pl / speedscope). Påverkar inte loopen nämnvärt.
+        cprofile  deterministisk cProfile i loop-tråden
+                  → profile_<ts>.pstats + topp-30 som text (.txt)
+    memory [start|stop]
+        tracemalloc-ögonblicksbild → memory_<ts>.txt med topp-allokeringar
+        per rad och skillnad mot förra ögonblicksbilden (minnesläckor).
+        Första "memory" startar spårningen; allokeringar gjorda innan syns
+        inte, så starta tidigt (memory start / profiler_tracemalloc) vid misstanke.
+
+Triggers:
+    kommandofil  <logs>/profile.cmd med en rad ovan; läses och tas bort av
+                 poll() (kollas högst en gång per check_sec, fungerar på Windows)
+    signaler     SIGUSR1 = profile (default_sec, default_mode), SIGUSR2 = memory
+                 (POSIX; signal-hanteraren sätter bara en flagga)
+
+Själva arbetet görs i poll() som anropas en gång per varv i huvudloopen.
+
+    profiler = LiveProfiler("logs")
+    while True:
+        ...
+        profiler.poll()
+
+    python live_profiler.py profile 60 --log-dir logs      # skriv kommandofilen
+    python live_profiler.py memory --pid 12345             # eller skicka signal
+"""
+
+import argparse
+import cProfile
+import io
+import os
+import pstats
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+COMMAND_FILE = "profile.cmd"
+MODES = ("sample", "cprofile")
+DEFAULT_PROFILE_SEC = 30.0
+DEFAULT_SAMPLE_MS = 5.0
+MEMORY_TOP = 30
+PSTATS_TOP = 30
+TRACEMALLOC_FRAMES = 10
+
+PROFILE_SIGNAL = getattr(signal, "SIGUSR1", None)
+MEMORY_SIGNAL = getattr(signal, "SIGUSR2", None)
+
+
+def _output_base(log_dir: str, prefix: str) -> str:
+    """<log_dir>/<prefix>_<UTC-tid>, med löpnummer om flera skrivs samma sekund."""
+    base = os.path.join(log_dir, f"{prefix}_{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}")
+    candidate, n = base, 1
+    while any(name.startswith(os.path.basename(candidate) + ".") for name in os.listdir(log_dir)):
+        n += 1
+        candidate = f"{base}-{n}"
+    return candidate
+
+
+def frame_key(code) -> str:
+    """En stackram i collapsed-format (inga ';' eller mellanslag)."""
+    return f"{code.co_name}@{os.path.basename(code.co_filename)}:{code.co_firstlineno}".replace(" ", "_")
+
+
+def collapse_stack(frame) -> str:
+    """Stack från roten till frame som "a;b;c"."""
+    keys: List[str] = []
+    while frame is not None:
+        keys.append(frame_key(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(keys))
+
+
+def parse_command(text: str) -> Optional[Tuple[str, List[str]]]:
+    """"profile 60 cprofile" → ("profile", ["60", "cprofile"]); tomt/okänt → None."""
+    parts = text.strip().lower().split()
+    if not parts or parts[0] not in ("profile", "memory"):
+        return None
+    return parts[0], parts[1:]
+
+
+class StackSampler:
+    """
+    Samplar en tråds stack i en bakgrundstråd.
+
+    Args:
+        thread_id: Tråden som ska profileras (threading.get_ident())
+        interval_sec: Tid mellan samplingar
+    """
+
+    def __init__(self, thread_id: int, interval_sec: float = DEFAULT_SAMPLE_MS / 1000):
+        self.thread_id = thread_id
+        self.interval_sec = interval_sec
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="live-profiler-sampler", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_sec):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                return  # tråden har avslutats
+            self.stacks[collapse_stack(frame)] += 1
+            self.samples += 1
+            del frame
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def write_collapsed(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def top_leaves(self, n: int = 5) -> List[Tuple[str, int]]:
+        """Funktioner där tråden oftast befann sig (self-tid)."""
+        leaves: Counter = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        return leaves.most_common(n)
+
+
+class LiveProfiler:
+    """
+    Profilering på begäran för en körande loop.
+
+    Args:
+        log_dir: Katalog för kommandofil och utdata
+        enabled: False = poll() gör ingenting
+        default_sec: Längd när ingen tid anges (och för signalen)
+        default_mode: "sample" eller "cprofile"
+        sample_ms: Intervall för sample-läget
+        check_sec: Hur ofta kommandofilen kollas
+        install_signals: Registrera SIGUSR1/SIGUSR2 (bara möjligt i huvudtråden)
+        tracemalloc_at_start: Starta minnesspårning direkt (ser allokeringar från start)
+    """
+
+    def __init__(self, log_dir: str, enabled: bool = True, default_sec: float = DEFAULT_PROFILE_SEC,
+                 default_mode: str = "sample", sample_ms: float = DEFAULT_SAMPLE_MS, check_sec: float = 1.0,
+                 install_signals: bool = True, tracemalloc_at_start: bool = False):
+        self.log_dir = log_dir
+        self.enabled = enabled
+        self.command_path = os.path.join(log_dir, COMMAND_FILE)
+        self.default_sec = default_sec
+        self.default_mode = default_mode if default_mode in MODES else "sample"
+        self.sample_sec = sample_ms / 1000
+        self.check_sec = check_sec
+        self.outputs: List[str] = []
+        self._next_check = 0.0
+        self._pending: List[Tuple[str, List[str]]] = []
+        self._mode: Optional[str] = None
+        self._deadline = 0.0
+        self._started = 0.0
+        self._sampler: Optional[StackSampler] = None
+        self._cprofile: Optional[cProfile.Profile] = None
+        self._last_snapshot: Optional[tracemalloc.Snapshot] = None
+        if not enabled:
+            return
+        if tracemalloc_at_start and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        if install_signals:
+            self._install_signals()
+
+    def _install_signals(self) -> None:
+        if PROFILE_SIGNAL is None or threading.current_thread() is not threading.main_thread():
+            return
+        try:
+            signal.signal(PROFILE_SIGNAL, lambda *_: self._pending.append(("profile", [])))
+            signal.signal(MEMORY_SIGNAL, lambda *_: self._pending.append(("memory", [])))
+        except (ValueError, OSError):
+            return
+        print(f"🔬 Profiler: kill -USR1 {os.getpid()} = profil {self.default_sec:g}s, "
+              f"kill -USR2 {os.getpid()} = minnesbild (eller skriv i {self.command_path})")
+
+    @property
+    def active(self) -> bool:
+        return self._mode is not None
+
+    # -- loop-krok -----------------------------------------------------------
+    def poll(self) -> None:
+        """Anropas en gång per varv i loopen: kör väntande kommandon och avsluta klar profil."""
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + self.check_sec
+            self._read_command_file()
+        while self._pending:
+            command, args = self._pending.pop(0)
+            try:
+                if command == "profile":
+                    self._start_profile(args)
+                else:
+                    self._memory(args)
+            except Exception as e:
+                print(f"⚠️ Profiler: {command} misslyckades: {e}")
+        if self._mode is not None and now >= self._deadline:
+            self.finish_profile()
+
+    def _read_command_file(self) -> None:
+        if not os.path.exists(self.command_path):
+            return
+        taken = self.command_path + ".taken"
+        try:
+            os.replace(self.command_path, taken)  # rader som skrivs under läsningen hamnar i en ny fil
+            with open(taken, "r", encoding="utf-8") as f:
+                text = f.read()
+            os.remove(taken)
+        except OSError:
+            return
+        for line in text.splitlines():
+            parsed = parse_command(line)
+            if parsed is None:
+                if line.strip():
+                    print(f"⚠️ Profiler: okänt kommando '{line.strip()}' (profile [sek] [sample|cprofile] | memory [start|stop])")
+                continue
+            self._pending.append(parsed)
+
+    # -- CPU -----------------------------------------------------------------
+    def _start_profile(self, args: List[str]) -> None:
+        if self._mode is not None:
+            print(f"ℹ️ Profiler: {self._mode}-profil pågår redan")
+            return
+        seconds, mode = self.default_sec, self.default_mode
+        for arg in args:
+            if arg in MODES:
+                mode = arg
+            else:
+                seconds = float(arg)
+        self.start_profile(seconds, mode)
+
+    def start_profile(self, seconds: float, mode: str = "sample") -> None:
+        """Starta profil av anropande tråd i seconds sekunder (avslutas av poll())."""
+        if mode == "cprofile":
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        else:
+            self._sampler = StackSampler(threading.get_ident(), self.sample_sec)
+            self._sampler.start()
+        self._mode = mode
+        self._started = time.monotonic()
+        self._deadline = self._started + seconds
+        print(f"🔬 Profiler: {mode} i {seconds:g}s ...")
+
+    def finish_profile(self) -> Optional[str]:
+        """Avsluta pågående profil och skriv den till log_dir. Returnerar sökvägen."""
+        if self._mode is None:
+            return None
+        os.makedirs(self.log_dir, exist_ok=True)
+        elapsed = time.monotonic() - self._started
+        base = _output_base(self.log_dir, "profile")
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            path = base + ".pstats"
+            self._cprofile.dump_stats(path)
+            text = io.StringIO()
+            pstats.Stats(self._cprofile, stream=text).sort_stats("cumulative").print_stats(PSTATS_TOP)
+            with open(base + ".txt", "w", encoding="utf-8") as f:
+                f.write(text.getvalue())
+            print(f"🔬 Profiler: cProfile {elapsed:.1f}s → {path} (topp {PSTATS_TOP}: {base}.txt)")
+            self._cprofile = None
+        else:
+            sampler = self._sampler
+            sampler.stop()
+            path = base + ".collapsed"
+            sampler.write_collapsed(path)
+            top = ", ".join(f"{name.split('@')[0]} {count / max(sampler.samples, 1) * 100:.0f}%"
+                            for name, count in sampler.top_leaves(3))
+            print(f"🔬 Profiler: {sampler.samples} samplingar på {elapsed:.1f}s → {path} | {top}")
+            self._sampler = None
+        self._mode = None
+        self.outputs.append(path)
+        return path
+
+    # -- minne ---------------------------------------------------------------
+    def _memory(self, args: List[str]) -> None:
+        if args and args[0] == "stop":
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+            self._last_snapshot = None
+            print("🧠 Profiler: tracemalloc stoppad")
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            print("🧠 Profiler: tracemalloc startad – allokeringar före detta syns inte")
+            if args and args[0] == "start":
+                return
+        self.memory_snapshot()
+
+    def memory_snapshot(self) -> Optional[str]:
+        """Topp-allokeringar + diff mot förra ögonblicksbilden → memory_<ts>.txt."""
+        if not tracemalloc.is_tracing():
+            return None
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ))
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"# {datetime.now(timezone.utc).isoformat(timespec='seconds')} pid {os.getpid()}",
+                 f"# spårat nu {current / 1e6:.1f} MB, topp {peak / 1e6:.1f} MB", "",
+                 f"## Topp {MEMORY_TOP} per rad"]
+        lines += [str(stat) for stat in snapshot.statistics("lineno")[:MEMORY_TOP]]
+        if self._last_snapshot is not None:
+            lines += ["", f"## Störst tillväxt sedan förra ögonblicksbilden (topp {MEMORY_TOP})"]
+            lines += [str(stat) for stat in snapshot.compare_to(self._last_snapshot, "lineno")[:MEMORY_TOP]]
+            biggest = snapshot.statistics("traceback")[:1]
+            if biggest:
+                lines += ["", "## Största allokeringen, traceback"]
+                lines += biggest[0].traceback.format()
+        self._last_snapshot = snapshot
+
+        os.makedirs(self.log_dir, exist_ok=True)
+        path = _output_base(self.log_dir, "memory") + ".txt"
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        print(f"🧠 Profiler: {current / 1e6:.1f} MB spårat (topp {peak / 1e6:.1f} MB) → {path}")
+        self.outputs.append(path)
+        return path
+
+    def close(self) -> None:
+        """Skriv ut en pågående profil (t.ex. vid Ctrl+C)."""
+        if self._mode is not None:
+            self.finish_profile()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Trigga profilering i en körande paper-trader.")
+    parser.add_argument("command", choices=["profile", "memory"])
+    parser.add_argument("args", nargs="*", help="profile: [sek] [sample|cprofile]; memory: [start|stop]")
+    parser.add_argument("--log-dir", default="logs", help="Traderns loggkatalog (där profile.cmd läses)")
+    parser.add_argument("--pid", type=int, help="Skicka signal till processen istället för kommandofil (POSIX)")
+    args = parser.parse_args()
+
+    if args.pid:
+        sig = PROFILE_SIGNAL if args.command == "profile" else MEMORY_SIGNAL
+        if sig is None:
+            raise SystemExit("❌ Signaler saknas på den här plattformen – använd kommandofilen (utan --pid)")
+        if args.args:
+            print("ℹ️ Argument ignoreras med --pid (signalen använder traderns default)")
+        os.kill(args.pid, sig)
+        print(f"📨 {signal.Signals(sig).name} → pid {args.pid}")
+        return
+    line = " ".join([args.command] + args.args)
+    if parse_command(line) is None:
+        raise SystemExit(f"❌ Ogiltigt kommando: {line}")
+    os.makedirs(args.log_dir, exist_ok=True)
+    path = os.path.join(args.log_dir, COMMAND_FILE)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(line + "\n")
+    print(f"📨 '{line}' → {path} (plockas upp inom någon sekund)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,398 @@
+"""
+Local Order Book – lokal orderbok från en snapshot + diff-depth-streamen
+========================================================================
+"Markov breakout live polling.py" hämtade get_order_book(limit=5) via REST
+varje poll bara för att läsa bästa bid/ask. Här hålls boken lokalt enligt
+Binance procedur för spot:
+
+    1. Öppna <symbol>@depth@100ms och buffra händelser
+    2. Hämta en snapshot (/api/v3/depth, limit=1000) → lastUpdateId
+       (live i en egen tråd, högst en per sekund och med backoff vid fel)
+    3. Släng händelser med u <= lastUpdateId
+    4. Första händelsen som används måste ha U <= lastUpdateId+1 <= u
+    5. Därefter måste varje händelses U vara föregående u + 1, annars har
+       något tappats → ny snapshot (resync)
+    6. Antal "0" tar bort en prisnivå
+
+    LocalOrderBook  → nivåer i dict + sorterade prislistor; best bid/ask och
+                      mid är O(1), top(n) kopierar bara n nivåer
+    OrderBookSync   → steg 1–5 (buffring, gap-detektering, resync)
+    OrderBookFeed   → websocket-tråd som driver OrderBookSync live, kan spela
+                      in snapshot + diffs till JSONL
+    DepthReplay     → lokal ersättare: spelar upp en sådan JSONL-inspelning
+                      genom samma OrderBookSync (ingen nyckel/nätverk)
+
+Kör (spela upp en inspelning och visa boken):
+    python local_order_book.py recordings/BTCUSDT_depth.jsonl --top 5
+"""
+
+import argparse
+import bisect
+import json
+import threading
+import time
+from collections import deque
+from decimal import Decimal
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import websocket  # python -m pip install websocket-client
+    WEBSOCKET_AVAILABLE = True
+except ImportError:
+    WEBSOCKET_AVAILABLE = False
+
+SNAPSHOT_LIMIT = 1000
+SNAPSHOT_MIN_INTERVAL_SEC = 1.0
+SNAPSHOT_MAX_BACKOFF_SEC = 60.0
+MAX_BUFFERED_EVENTS = 2000      # ~200 s av @100ms-händelser
+DEPTH_STREAM_URL = "wss://stream.binance.com:9443/ws/{symbol}@depth@100ms"
+DEPTH_STREAM_URL_TESTNET = "wss://stream.testnet.binance.vision/ws/{symbol}@depth@100ms"
+ZERO = Decimal("0")
+
+Level = Tuple[Decimal, Decimal]
+
+
+class LocalOrderBook:
+    """Prisnivåer för en symbol. Priser hålls sorterade stigande på båda sidor."""
+
+    def __init__(self, symbol: str = "BTCUSDT"):
+        self.symbol = symbol
+        self.bids: Dict[Decimal, Decimal] = {}
+        self.asks: Dict[Decimal, Decimal] = {}
+        self._bid_prices: List[Decimal] = []   # stigande, bästa sist
+        self._ask_prices: List[Decimal] = []   # stigande, bästa först
+        self.last_update_id = 0
+        self.updated_at = 0.0
+
+    # -- skrivning ----------------------------------------------------------
+    def load_snapshot(self, snapshot: Dict[str, Any]) -> None:
+        self.bids = {Decimal(p): Decimal(q) for p, q in snapshot["bids"] if Decimal(q) != ZERO}
+        self.asks = {Decimal(p): Decimal(q) for p, q in snapshot["asks"] if Decimal(q) != ZERO}
+        self._bid_prices = sorted(self.bids)
+        self._ask_prices = sorted(self.asks)
+        self.last_update_id = int(snapshot["lastUpdateId"])
+        self.updated_at = time.time()
+
+    def apply_levels(self, bids: List[List[str]], asks: List[List[str]]) -> None:
+        for p, q in bids:
+            self._set(self.bids, self._bid_prices, Decimal(p), Decimal(q))
+        for p, q in asks:
+            self._set(self.asks, self._ask_prices, Decimal(p), Decimal(q))
+        self.updated_at = time.time()
+
+    @staticmethod
+    def _set(levels: Dict[Decimal, Decimal], prices: List[Decimal], price: Decimal, qty: Decimal) -> None:
+        if qty == ZERO:
+            if levels.pop(price, None) is not None:
+                del prices[bisect.bisect_left(prices, price)]
+            return
+        if price not in levels:
+            bisect.insort(prices, price)
+        levels[price] = qty
+
+    def clear(self) -> None:
+        self.bids.clear()
+        self.asks.clear()
+        self._bid_prices.clear()
+        self._ask_prices.clear()
+        self.last_update_id = 0
+
+    # -- läsning ------------------------------------------------------------
+    def best_bid(self) -> Optional[Level]:
+        if not self._bid_prices:
+            return None
+        p = self._bid_prices[-1]
+        return p, self.bids[p]
+
+    def best_ask(self) -> Optional[Level]:
+        if not self._ask_prices:
+            return None
+        p = self._ask_prices[0]
+        return p, self.asks[p]
+
+    def mid(self) -> Optional[Decimal]:
+        if not self._bid_prices or not self._ask_prices:
+            return None
+        return (self._bid_prices[-1] + self._ask_prices[0]) / 2
+
+    def top(self, n: int = 5) -> Tuple[List[Level], List[Level]]:
+        """(bids bäst först, asks bäst först), n nivåer per sida."""
+        bid_prices = self._bid_prices[-n:][::-1] if n > 0 else []
+        ask_prices = self._ask_prices[:n]
+        return ([(p, self.bids[p]) for p in bid_prices],
+                [(p, self.asks[p]) for p in ask_prices])
+
+    def depth_qty(self, side: str, n: int = 5) -> Decimal:
+        """Summerad kvantitet på de n bästa nivåerna (BUY → asks, SELL → bids)."""
+        bids, asks = self.top(n)
+        return sum((q for _, q in (asks if side == "BUY" else bids)), ZERO)
+
+    def crossed(self) -> bool:
+        return bool(self._bid_prices and self._ask_prices and self._bid_prices[-1] >= self._ask_prices[0])
+
+
+class OrderBookSync:
+    """
+    Binance-proceduren för att hålla en LocalOrderBook i synk.
+
+    Args:
+        book: Boken som ska uppdateras
+        fetch_snapshot: Returnerar en /api/v3/depth-snapshot (anropas vid start och resync)
+        background: Hämta snapshots i en egen tråd utanför låset (live). False =
+                    direkt i on_event (DepthReplay – deterministiskt)
+        min_interval_sec: Minsta tid mellan två snapshot-försök (background)
+        max_backoff_sec: Tak för exponentiell backoff efter misslyckade försök
+        max_buffer: Max buffrade händelser medan boken är osynkad (äldsta släpps;
+                    saknas de när snapshoten kommer blir det ett gap → ny snapshot)
+    """
+
+    def __init__(self, book: LocalOrderBook, fetch_snapshot: Callable[[], Dict[str, Any]],
+                 background: bool = False, min_interval_sec: float = SNAPSHOT_MIN_INTERVAL_SEC,
+                 max_backoff_sec: float = SNAPSHOT_MAX_BACKOFF_SEC, max_buffer: int = MAX_BUFFERED_EVENTS):
+        self.book = book
+        self.fetch_snapshot = fetch_snapshot
+        self.background = background
+        self.min_interval_sec = min_interval_sec
+        self.max_backoff_sec = max_backoff_sec
+        self.synced = False
+        self._first = True
+        self._buffer: Deque[Dict[str, Any]] = deque(maxlen=max_buffer)
+        self.stats = {"events": 0, "applied": 0, "stale": 0, "gaps": 0, "snapshots": 0,
+                      "snapshot_errors": 0, "dropped": 0}
+        self._lock = threading.Lock()
+        self._fetching = False
+        self._failures = 0
+        self._next_attempt = 0.0
+
+    def on_event(self, event: Dict[str, Any]) -> None:
+        """En depthUpdate-händelse (U = första, u = sista update-id)."""
+        with self._lock:
+            self.stats["events"] += 1
+            if self.synced and self._apply(event):
+                return
+            if self.synced:
+                self.synced = False  # gap → buffra från och med denna händelse
+                self._buffer.clear()
+            if len(self._buffer) == self._buffer.maxlen:
+                self.stats["dropped"] += 1
+            self._buffer.append(event)
+            if not self.background:
+                self._install(self.fetch_snapshot())
+                return
+            now = time.monotonic()
+            if self._fetching or now < self._next_attempt:
+                return
+            self._fetching = True
+            self._next_attempt = now + self.min_interval_sec
+        threading.Thread(target=self._fetch_worker, name="depth-snapshot", daemon=True).start()
+
+    def _fetch_worker(self) -> None:
+        """REST-snapshot utan lås (websocket-callback och best_bid_ask blockeras inte)."""
+        try:
+            snapshot = self.fetch_snapshot()
+        except Exception as err:
+            with self._lock:
+                self._fetching = False
+                self._failures += 1
+                self.stats["snapshot_errors"] += 1
+                backoff = min(self.max_backoff_sec, self.min_interval_sec * 2 ** self._failures)
+                self._next_attempt = time.monotonic() + backoff
+            print(f"⚠️ Orderbok {self.book.symbol}: snapshot misslyckades ({err}) – nytt försök om {backoff:.1f}s")
+            return
+        with self._lock:
+            self._fetching = False
+            self._install(snapshot)
+            if self.synced:
+                self._failures = 0
+
+    def _install(self, snapshot: Dict[str, Any]) -> None:
+        """Ladda snapshoten och applicera buffrade händelser (anropas med låset)."""
+        self.stats["snapshots"] += 1
+        self.book.clear()
+        self.book.load_snapshot(snapshot)
+        self._first = True
+        while self._buffer:
+            if not self._apply(self._buffer[0]):
+                # Snapshot äldre än händelserna → behåll dem, nästa händelse hämtar en ny
+                self.synced = False
+                return
+            self._buffer.popleft()
+        self.synced = True
+
+    def reset(self) -> None:
+        """Efter återanslutning: det som missats går inte att veta → osynkad, tom buffert."""
+        with self._lock:
+            self.synced = False
+            self._buffer.clear()
+
+    def _apply(self, event: Dict[str, Any]) -> bool:
+        """False = gap (händelser har tappats och boken måste synkas om)."""
+        first_id, last_id = int(event["U"]), int(event["u"])
+        expected = self.book.last_update_id + 1
+        if last_id < expected:
+            self.stats["stale"] += 1
+            return True
+        ok = first_id <= expected if self._first else first_id == expected
+        if not ok:
+            self.stats["gaps"] += 1
+            print(f"⚠️ Orderbok {self.book.symbol}: gap (väntade {expected}, fick U={first_id}) – resync")
+            return False
+        self.book.apply_levels(event.get("b", []), event.get("a", []))
+        self.book.last_update_id = last_id
+        self._first = False
+        self.stats["applied"] += 1
+        return True
+
+    def best_bid_ask(self) -> Optional[Tuple[Decimal, Decimal]]:
+        """(bid, ask) om boken är synkad och inte korsad, annars None."""
+        with self._lock:
+            if not self.synced:
+                return None
+            bid, ask = self.book.best_bid(), self.book.best_ask()
+            if bid is None or ask is None or bid[0] >= ask[0]:
+                return None
+            return bid[0], ask[0]
+
+
+class OrderBookFeed:
+    """
+    Live: diff-depth-websocket → OrderBookSync, snapshot via python-binance.
+
+    Args:
+        client: python-binance Client (get_order_book)
+        symbol: T.ex. BTCUSDT
+        testnet: Spot-testnätets stream
+        record_path: Spela in snapshots + diffs som JSONL (för DepthReplay)
+        max_age_sec: best_bid_ask() ger None om boken inte uppdaterats så länge
+    """
+
+    def __init__(self, client: Any, symbol: str, testnet: bool = True,
+                 record_path: Optional[str] = None, max_age_sec: float = 5.0):
+        if not WEBSOCKET_AVAILABLE:
+            raise SystemExit(
+                "websocket-client saknas. Kör:\n    python -m pip install websocket-client\n"
+                "och starta sedan om skriptet."
+            )
+        self.client = client
+        self.symbol = symbol
+        self.url = (DEPTH_STREAM_URL_TESTNET if testnet else DEPTH_STREAM_URL).format(symbol=symbol.lower())
+        self.max_age_sec = max_age_sec
+        self.book = LocalOrderBook(symbol)
+        self.sync = OrderBookSync(self.book, self._fetch_snapshot, background=True)
+        self._record = open(record_path, "a", encoding="utf-8") if record_path else None
+        self._record_lock = threading.Lock()  # snapshots skrivs från hämtningstråden
+        self._ws = None
+        self._stop = threading.Event()
+
+    def _fetch_snapshot(self) -> Dict[str, Any]:
+        snapshot = self.client.get_order_book(symbol=self.symbol, limit=SNAPSHOT_LIMIT)
+        self._write({"type": "snapshot", **snapshot})
+        return snapshot
+
+    def _write(self, obj: Dict[str, Any]) -> None:
+        if self._record is not None:
+            line = json.dumps(obj, separators=(",", ":")) + "\n"
+            with self._record_lock:
+                self._record.write(line)
+
+    def _on_message(self, _ws, message: str) -> None:
+        try:
+            event = json.loads(message)
+            if event.get("e") != "depthUpdate":
+                return
+            self._write({"type": "diff", **event})
+            self.sync.on_event(event)
+        except Exception as err:
+            print("⚠️ Orderbok-fel:", err)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self._ws = websocket.WebSocketApp(self.url, on_message=self._on_message,
+                                                  on_error=lambda _ws, err: print("⚠️ Depth WS-fel:", err))
+                self._ws.run_forever(ping_interval=20, ping_timeout=10)
+            except Exception as err:
+                print("⚠️ Depth-stream:", err)
+            # Efter avbrott går det inte att veta vad som missats
+            self.sync.reset()
+            if not self._stop.is_set():
+                time.sleep(3)
+
+    def start(self) -> "OrderBookFeed":
+        threading.Thread(target=self._run, name="depth-stream", daemon=True).start()
+        return self
+
+    def best_bid_ask(self) -> Optional[Tuple[Decimal, Decimal]]:
+        if time.time() - self.book.updated_at > self.max_age_sec:
+            return None
+        return self.sync.best_bid_ask()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._ws is not None:
+            self._ws.close()
+        with self._record_lock:
+            if self._record is not None:
+                self._record.close()
+                self._record = None
+
+
+class DepthReplay:
+    """
+    Spela upp en JSONL-inspelning från OrderBookFeed genom OrderBookSync.
+    Varje snapshot-begäran besvaras med nästa inspelade snapshot.
+    """
+
+    def __init__(self, path: str, symbol: str = "BTCUSDT"):
+        self.path = path
+        self.book = LocalOrderBook(symbol)
+        self.sync = OrderBookSync(self.book, self._next_snapshot)
+        self._snapshots: List[Dict[str, Any]] = []
+        self._diffs: List[Dict[str, Any]] = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                obj = json.loads(line)
+                (self._snapshots if obj.pop("type") == "snapshot" else self._diffs).append(obj)
+
+    def _next_snapshot(self) -> Dict[str, Any]:
+        if not self._snapshots:
+            raise RuntimeError("Inspelningen har inga fler snapshots")
+        return self._snapshots.pop(0)
+
+    def events(self) -> Iterator[Dict[str, Any]]:
+        """Applicera diffs en i taget och ge varje händelse efter att den hanterats."""
+        for event in self._diffs:
+            self.sync.on_event(event)
+            yield event
+
+    def run(self) -> LocalOrderBook:
+        for _ in self.events():
+            pass
+        return self.book
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Spela upp en inspelad diff-depth-ström till en lokal orderbok.")
+    parser.add_argument("path", help="JSONL från OrderBookFeed(record_path=...)")
+    parser.add_argument("--symbol", default="BTCUSDT")
+    parser.add_argument("--top", type=int, default=5)
+    args = parser.parse_args()
+
+    replay = DepthReplay(args.path, args.symbol)
+    t0 = time.perf_counter()
+    book = replay.run()
+    elapsed = time.perf_counter() - t0
+    s = replay.sync.stats
+    print(f"📚 {s['events']} diffs på {elapsed*1000:.0f} ms: {s['applied']} använda, {s['stale']} gamla, "
+          f"{s['gaps']} gap, {s['snapshots']} snapshots | lastUpdateId={book.last_update_id}")
+    bids, asks = book.top(args.top)
+    for (bp, bq), (ap, aq) in zip(bids, asks):
+        print(f"   {bp:>12} x {bq:<12} | {ap:>12} x {aq}")
+    print(f"   mid={book.mid()}")
+
+
+if __name__ == "__main__":
+    main()
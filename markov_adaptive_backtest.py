@@ -306,13 +306,24 @@ def load_historical_data(filename: str = "data/btc_1m_sample.json") -> List[Dict
         return data
 
 # ----------------------- Backtest Strategy -----------------------------------
-def run_backtest():
+def run_backtest(data: Optional[List[Dict]] = None, plot: bool = True) -> Optional[Dict]:
+    """
+    Kör backtesten.
+
+    Args:
+        data: Candles (timestamp/close ...). None = läs från load_historical_data()
+        plot: False = hoppa över grafen (t.ex. i benchmarks.py)
+
+    Returns:
+        Sammanfattning (ticks, trades, final_total, total_return_pct) eller None utan data
+    """
     # Load data
-    data = load_historical_data()
+    if data is None:
+        data = load_historical_data()
     
     if not data:
         print("❌ No data to backtest")
-        return
+        return None
     
     # Initialize
     paper = PaperAccount(INITIAL_USDT, INITIAL_BTC)
@@ -513,6 +524,16 @@ def run_backtest():
             reversion_win_rate = (len([t for t in reversion_trades if t['pnl_pct'] > 0]) / len(reversion_trades)) * 100
             print(f"  MEAN_REVERSION mode: {len(reversion_trades)} trades, {reversion_win_rate:.1f}% win rate")
     
+    summary = {
+        "ticks": len(data),
+        "trades": len(paper.trades),
+        "mode_switches": len(mode_manager.mode_changes),
+        "final_total": final_total,
+        "total_return_pct": total_return,
+    }
+    if not plot:
+        return summary
+
     # Plot results
     fig, (ax1, ax2, ax3) = plt.subplots(3, 1, figsize=(14, 10), sharex=True)
     
@@ -545,6 +566,7 @@ def run_backtest():
     plt.savefig('backtest_results.png', dpi=150)
     print("\n📊 Results saved to: backtest_results.png")
     plt.show()
+    return summary
 
 # ----------------------- Main ------------------------------------------------
 if __name__ == "__main__":
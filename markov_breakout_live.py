@@ -5,13 +5,19 @@ import time
 import threading
 from decimal import Decimal, ROUND_DOWN
 from datetime import datetime
-from collections import defaultdict
+from typing import Optional
 
 import websocket
 
 from binance.client import Client
 from binance.exceptions import BinanceAPIException, BinanceRequestException
 
+from balance_cache import BalanceCache, UserDataStream
+from markov_model import MarkovCountStore
+from order_executor import OrderExecutor, OrderIntent
+from tick_conflator import TickConflator
+from tick_recorder import TickRecorder
+
 
 # === Ladda config (tål UTF-8 BOM) ===
 ROOT = os.path.dirname(__file__)
@@ -28,6 +34,11 @@ TESTNET = cfg.get("testnet", True)
 TP_PCT = Decimal(str(cfg.get("tp_pct", 0.0010)))              # 0.10% take profit
 TAKER_FEE_PCT = Decimal(str(cfg.get("taker_fee_pct", 0.0004))) # ungefärlig taker-fee
 ORDER_QTY = Decimal(str(cfg.get("order_qty", 0.001)))         # kvantitet per affär
+BALANCE_REFRESH_SEC = float(cfg.get("balance_refresh_sec", 60))  # saldon via REST i bakgrunden
+USER_DATA_STREAM = bool(cfg.get("user_data_stream", True))      # saldon i realtid via user-data-stream
+TICK_RECORD_ENABLED = bool(cfg.get("tick_record_enabled", False))  # spela in bookTicker till recordings/
+TICK_CONFLATE_SEC = float(cfg.get("tick_conflate_sec", 0.05))    # strategin högst en gång per intervall
+TICK_STATS_SEC = float(cfg.get("tick_stats_sec", 60))            # skriv ut mottagna/släppta ticks
 
 # Loggar
 LOG_DIR = os.path.join(ROOT, "logs")
@@ -89,53 +100,14 @@ def log_order(row: list):
         w.writerow(row)
 
 
-def load_markov_counts() -> dict:
-    counts = defaultdict(int)
-    if os.path.exists(MARKOV_CSV):
-        with open(MARKOV_CSV, "r", encoding="utf-8") as fp:
-            r = csv.reader(fp)
-            _ = next(r, None)
-            for row in r:
-                a, b, c = row
-                counts[(a, b)] = int(c)
-    return counts
-
-
-def save_markov_counts(counts: dict):
-    with open(MARKOV_CSV, "w", newline="", encoding="utf-8") as fp:
-        w = csv.writer(fp)
-        w.writerow(["from_state", "to_state", "count"])
-        for (a, b), c in sorted(counts.items()):
-            w.writerow([a, b, c])
-
-
-def stationary_distribution(counts: dict) -> dict:
-    states = ["LW", "LB", "SW", "SB"]
-    P = {s: {t: 0.0 for t in states} for s in states}
-    for s in states:
-        row_sum = sum(counts.get((s, t), 0) for t in states)
-        if row_sum == 0:
-            for t in states:
-                P[s][t] = 1.0 / len(states)
-        else:
-            for t in states:
-                P[s][t] = counts.get((s, t), 0) / row_sum
-    pi = {s: 1.0 / len(states) for s in states}
-    for _ in range(100):
-        new = {t: 0.0 for t in states}
-        for s in states:
-            for t in states:
-                new[t] += pi[s] * P[s][t]
-        pi = new
-    return pi
-
-
 # === Strategi ===
 class Strategy:
     def __init__(self, client: Client, symbol: str):
         self.client = client
         self.symbol = symbol
         self.filters = exchange_filters(client, symbol)
+        self.base_asset = symbol.replace("USDT", "")
+        self.balances = BalanceCache(client, refresh_sec=BALANCE_REFRESH_SEC).start()
 
         self.level = last_price(client, symbol)  # L := senaste pris vid start
         self.position = None                     # None | "LONG" | "SHORT" (SHORT i spot = simulerad)
@@ -143,7 +115,13 @@ class Strategy:
         self.entry_qty = Decimal("0")
 
         self.prev_state = None                   # "LW"/"LB"/"SW"/"SB"
-        self.counts = load_markov_counts()
+        self.markov = MarkovCountStore(MARKOV_CSV)  # append-only logg + periodisk snapshot
+
+        # Ordrar läggs i egen tråd; on_tick köar bara (se order_executor.py)
+        self._lock = threading.Lock()
+        self.conflator: Optional[TickConflator] = None  # sätts i main(); extremvärden nollas vid entry
+        self.executor = OrderExecutor(self._place_order, on_fill=self._on_fill,
+                                      on_error=self._on_order_error).start()
 
         print(f"🔧 Startnivå L={self.level} för {symbol}")
 
@@ -156,11 +134,41 @@ class Strategy:
         return q
 
     def _free_quote(self, asset="USDT") -> Decimal:
-        acct = self.client.get_account()
-        for b in acct["balances"]:
-            if b["asset"] == asset:
-                return Decimal(b["free"])
-        return Decimal("0")
+        return self.balances.free(asset)  # minnesuppslag, se balance_cache.py
+
+    def _place_order(self, intent: OrderIntent) -> dict:
+        """Market-order (körs i executorns tråd) som håller saldocachen i synk."""
+        try:
+            if intent.side == "BUY":
+                resp = self.client.order_market_buy(symbol=self.symbol, quantity=float(intent.qty),
+                                                    newClientOrderId=intent.client_order_id)
+            else:
+                resp = self.client.order_market_sell(symbol=self.symbol, quantity=float(intent.qty),
+                                                     newClientOrderId=intent.client_order_id)
+        except Exception:
+            self.balances.invalidate()
+            resp = self._lookup_filled(intent)  # timeout ≠ ingen order: fråga Binance
+            if resp is None:
+                raise
+            print(f"♻️ {intent.tag}: svaret gick förlorat men ordern är fylld – stämmer av")
+            return resp
+        self.balances.apply_order(resp, self.base_asset, "USDT")
+        return resp
+
+    def _lookup_filled(self, intent: OrderIntent):
+        """Ordern via newClientOrderId om den faktiskt fylldes, annars None."""
+        try:
+            order = self.client.get_order(symbol=self.symbol, origClientOrderId=intent.client_order_id)
+        except Exception:
+            return None
+        if order.get("status") != "FILLED":
+            return None
+        executed = Decimal(str(order["executedQty"]))
+        if executed > 0:
+            # get_order saknar fills → ett snittpris från cummulativeQuoteQty
+            avg = Decimal(str(order["cummulativeQuoteQty"])) / executed
+            order = dict(order, fills=[{"price": str(avg), "qty": str(executed)}])
+        return order
 
     def enter_long(self, px: Decimal):
         q = self._legal_qty(ORDER_QTY, px)
@@ -168,66 +176,67 @@ class Strategy:
         if self._free_quote() < need:
             print(f"⛔ Otillräckligt USDT ({need:.2f} krävs). Skip LONG.")
             return False
-
-        resp = self.client.order_market_buy(symbol=self.symbol, quantity=float(q))
-        avg_px = avg_fill_price(resp) or px
-        self.position = "LONG"
-        self.entry_price = avg_px
-        self.entry_qty = Decimal(str(resp.get("executedQty", q)))
-        self.level = avg_px
-        log_order([datetime.utcnow().isoformat(timespec="seconds")+"Z", self.symbol, "BUY",
-                   f"{self.entry_qty:.8f}", f"{avg_px:.8f}", f"{(self.entry_qty*avg_px):.8f}", resp["orderId"], "ENTER_LONG"])
-        print(f"✅ ENTER LONG @ {avg_px} qty={self.entry_qty}")
-        return True
+        return self.executor.submit(OrderIntent("BUY", q, "ENTER_LONG", px))
 
     def enter_short(self, px: Decimal):
         # Spot kan inte gå "äkta" kort. Försöker sälja om bas-saldo finns (simulerad short).
-        acct = self.client.get_account()
-        base_asset = self.symbol.replace("USDT", "")
-        base_free = Decimal(next((b["free"] for b in acct["balances"] if b["asset"] == base_asset), "0"))
+        base_free = self.balances.free(self.base_asset)
         if base_free <= Decimal("0"):
             print("ℹ️ Inget bas-saldo – hoppar över SHORT i spot. (Futures rekommenderas för short.)")
             return False
 
         q = self._legal_qty(min(base_free, ORDER_QTY), px)
-        resp = self.client.order_market_sell(symbol=self.symbol, quantity=float(q))
-        avg_px = avg_fill_price(resp) or px
-        self.position = "SHORT"
-        self.entry_price = avg_px
-        self.entry_qty = Decimal(str(resp.get("executedQty", q)))
-        self.level = avg_px
-        log_order([datetime.utcnow().isoformat(timespec="seconds")+"Z", self.symbol, "SELL",
-                   f"{self.entry_qty:.8f}", f"{avg_px:.8f}", f"{(self.entry_qty*avg_px):.8f}", resp["orderId"], "ENTER_SHORT"])
-        print(f"✅ ENTER SHORT @ {avg_px} qty={self.entry_qty}")
-        return True
+        return self.executor.submit(OrderIntent("SELL", q, "ENTER_SHORT", px))
 
     def exit_position(self, px: Decimal, reason: str):
         if not self.position:
             return
-
+        side = "SELL" if self.position == "LONG" else "BUY"
+        self.executor.submit(OrderIntent(side, self.entry_qty, f"EXIT_{reason}", px))
+
+    # --- fyllnader (anropas från executorns tråd) ---
+    def _on_fill(self, intent: OrderIntent, resp: dict):
+        with self._lock:
+            if intent.tag.startswith("ENTER_"):
+                self._entry_filled(intent, resp)
+            else:
+                self._exit_filled(intent, resp)
+
+    def _on_order_error(self, intent: OrderIntent, err: Exception):
+        print(f"❌ Order {intent.tag} ({intent.side} {intent.qty}) misslyckades: {err}")
+
+    def _entry_filled(self, intent: OrderIntent, resp: dict):
+        avg_px = avg_fill_price(resp) or intent.ref_price
+        self.position = "LONG" if intent.side == "BUY" else "SHORT"
+        self.entry_price = avg_px
+        self.entry_qty = Decimal(str(resp.get("executedQty", intent.qty)))
+        self.level = avg_px
+        if self.conflator is not None:
+            self.conflator.reset_extremes()  # TP/BE bara på quotes efter fyllnaden
+        log_order([datetime.utcnow().isoformat(timespec="seconds")+"Z", self.symbol, intent.side,
+                   f"{self.entry_qty:.8f}", f"{avg_px:.8f}", f"{(self.entry_qty*avg_px):.8f}", resp["orderId"], intent.tag])
+        print(f"✅ {intent.tag.replace('_', ' ')} @ {avg_px} qty={self.entry_qty} "
+              f"(ack {(intent.acked - intent.sent)*1000:.0f} ms)")
+
+    def _exit_filled(self, intent: OrderIntent, resp: dict):
+        avg_px = avg_fill_price(resp) or intent.ref_price
+        reason = intent.tag[len("EXIT_"):]
         if self.position == "LONG":
-            resp = self.client.order_market_sell(symbol=self.symbol, quantity=float(self.entry_qty))
-            avg_px = avg_fill_price(resp) or px
             pnl_pct = (avg_px / self.entry_price - 1) - (2 * TAKER_FEE_PCT)
             state = "LW" if pnl_pct > 0 else "LB"
-            side = "SELL"
         else:
-            resp = self.client.order_market_buy(symbol=self.symbol, quantity=float(self.entry_qty))
-            avg_px = avg_fill_price(resp) or px
             pnl_pct = (1 - (avg_px / self.entry_price)) - (2 * TAKER_FEE_PCT)
             state = "SW" if pnl_pct > 0 else "SB"
-            side = "BUY"
 
-        log_order([datetime.utcnow().isoformat(timespec="seconds")+"Z", self.symbol, side,
-                   f"{self.entry_qty:.8f}", f"{avg_px:.8f}", f"{(self.entry_qty*avg_px):.8f}", resp["orderId"], f"EXIT_{reason}"])
+        log_order([datetime.utcnow().isoformat(timespec="seconds")+"Z", self.symbol, intent.side,
+                   f"{self.entry_qty:.8f}", f"{avg_px:.8f}", f"{(self.entry_qty*avg_px):.8f}", resp["orderId"], intent.tag])
 
         print(f"🔚 EXIT {self.position} @ {avg_px} (entry {self.entry_price})  ≈ PnL {pnl_pct*100:.3f}%  [{reason}]")
 
         if self.prev_state:
-            self.counts[(self.prev_state, state)] += 1
+            self.markov.record(self.prev_state, state)
         self.prev_state = state
-        save_markov_counts(self.counts)
-        pi = stationary_distribution(self.counts)
+        pi = self.markov.counts.stationary()  # exakt lösning, cachad tills räknarna ändras
         print(f"🧮 Stationär ~ {{ {', '.join([f'{k}:{round(v,3)}' for k,v in pi.items()])} }}")
 
         self.level = avg_px  # ny nivå = utgångspris
@@ -235,33 +244,41 @@ class Strategy:
         self.entry_price = None
         self.entry_qty = Decimal("0")
 
-    def on_tick(self, best_bid: Decimal, best_ask: Decimal):
+    def on_tick(self, best_bid: Decimal, best_ask: Decimal,
+                mid_high: Decimal = None, mid_low: Decimal = None):
+        """mid_high/mid_low = högsta/lägsta mid sedan förra anropet (tick_conflator.py)."""
+        # Inga nya beslut medan en order väntar på fyllnad (annars dubbelorder)
+        if self.executor.busy:
+            return
         mid = (best_bid + best_ask) / 2
-
-        if not self.position:
-            if mid > self.level:
-                self.enter_long(mid)
-            elif mid < self.level:
-                self.enter_short(mid)
-        else:
-            if self.position == "LONG":
-                tp = self.entry_price * (1 + TP_PCT)
-                be = self.entry_price
-                if mid >= tp:
-                    self.exit_position(mid, "TP")
-                elif mid <= be:
-                    self.exit_position(mid, "BE")
-            elif self.position == "SHORT":
-                tp = self.entry_price * (1 - TP_PCT)
-                be = self.entry_price
-                if mid <= tp:
-                    self.exit_position(mid, "TP")
-                elif mid >= be:
-                    self.exit_position(mid, "BE")
+        hi = mid if mid_high is None else mid_high
+        lo = mid if mid_low is None else mid_low
+
+        with self._lock:
+            if not self.position:
+                if mid > self.level:
+                    self.enter_long(mid)
+                elif mid < self.level:
+                    self.enter_short(mid)
+            else:
+                if self.position == "LONG":
+                    tp = self.entry_price * (1 + TP_PCT)
+                    be = self.entry_price
+                    if hi >= tp:
+                        self.exit_position(mid, "TP")
+                    elif lo <= be:
+                        self.exit_position(mid, "BE")
+                elif self.position == "SHORT":
+                    tp = self.entry_price * (1 - TP_PCT)
+                    be = self.entry_price
+                    if lo <= tp:
+                        self.exit_position(mid, "TP")
+                    elif hi >= be:
+                        self.exit_position(mid, "BE")
 
 
 # === WS-loop ===
-def start_ws_loop(strat: Strategy, symbol: str, testnet: bool = True):
+def start_ws_loop(conflator: TickConflator, symbol: str, testnet: bool = True):
     ws_url = (
         f"wss://stream.binancefuture.com/ws/{symbol.lower()}@bookTicker"
         if testnet
@@ -273,9 +290,7 @@ def start_ws_loop(strat: Strategy, symbol: str, testnet: bool = True):
 
     def on_message(_ws, message):
         try:
-            data = json.loads(message)
-            if "b" in data and "a" in data:
-                strat.on_tick(Decimal(data["b"]), Decimal(data["a"]))
+            conflator.on_message(message)  # avkodning, inspelning och strategi (sammanslaget)
         except Exception as err:
             print("⚠️ on_message-fel:", err)
 
@@ -306,15 +321,40 @@ def main():
     print(" Startar Binance Testnet live-strategi...")
     client = Client(API_KEY, API_SECRET, testnet=TESTNET)
     strat = Strategy(client, SYMBOL)
-
-    t = threading.Thread(target=start_ws_loop, args=(strat, SYMBOL, TESTNET), daemon=True)
+    user_stream = UserDataStream(client, strat.balances, testnet=TESTNET).start() if USER_DATA_STREAM else None
+    recorder = None
+    if TICK_RECORD_ENABLED:
+        recorder = TickRecorder(
+            directory=os.path.join(ROOT, cfg.get("tick_record_dir", "recordings")),
+            symbol=SYMBOL,
+            price_decimals=int(cfg.get("tick_record_decimals", 2)),
+        ).start()
+        print(f"📼 Tick-inspelning aktiv → {recorder.directory}")
+
+    conflator = TickConflator(strat.on_tick, interval_sec=TICK_CONFLATE_SEC, recorder=recorder).start()
+    strat.conflator = conflator
+    t = threading.Thread(target=start_ws_loop, args=(conflator, SYMBOL, TESTNET), daemon=True)
     t.start()
 
     try:
+        next_stats = time.time() + TICK_STATS_SEC
         while True:
             time.sleep(1)
+            if TICK_STATS_SEC > 0 and time.time() >= next_stats:
+                print(conflator.stats_line())
+                next_stats = time.time() + TICK_STATS_SEC
     except KeyboardInterrupt:
         print("\n🛑 Avslutar…")
+    finally:
+        conflator.stop()
+        print(conflator.stats_line())
+        strat.executor.stop()  # låt en order i luften bli klar innan loggar stängs
+        strat.markov.close()
+        strat.balances.stop()
+        if user_stream is not None:
+            user_stream.stop()
+        if recorder is not None:
+            recorder.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,504 @@
+"""
+Markov Model – arraybaserade övergångsräknare, exakt stationär fördelning
+=========================================================================
+Delas av live-skripten (markov_breakout_live.py, Markov breakout live polling.py)
+och paper-skriptens MarkovState.
+
+    TransitionCounts  → 4×4-räknare i en platt array('q') + antal per tillstånd.
+                        Stationär fördelning löses exakt (linjärt system 4×4)
+                        och cachas tills räknarna ändras.
+    MarkovCountStore  → persistens: varje övergång läggs till i en append-only
+                        logg (en kort rad), och snapshot-CSV:n (markov.csv)
+                        skrivs om atomiskt bara var compact_every:e övergång.
+    OutcomeSequenceModel → ordning-k-modell: P(nästa utfall | de k senaste).
+                        Alla ordningar 0..k räknas i en platt array, historiken
+                        hålls som ett rullande bas-4-tal → O(k) per exit och
+                        uppslag utan allokering (cachas tills nästa exit).
+    MarkovState       → paper-skriptens tillstånd (counts/trans/last_states
+                        + ordning-k-modellen för entry-grinden).
+
+Ordning-k-modellen kan tränas i bulk från trade_metrics.csv (kolumnen state):
+
+    python markov_model.py logs/trade_metrics.csv --order 3
+
+Snapshot-CSV:n har samma format som tidigare (from_state,to_state,count) plus
+en rad "__log_seq__,,N" som anger hur många loggrader som redan ingår. Vid
+start läses snapshot + loggrader med högre sekvensnummer → en krasch mellan
+snapshot och loggtrunkering ger aldrig dubbelräkning.
+"""
+
+import argparse
+import csv
+import os
+from array import array
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+STATES = ("LW", "LB", "SW", "SB")
+N_STATES = len(STATES)
+STATE_INDEX = {s: i for i, s in enumerate(STATES)}
+SEQ_ROW = "__log_seq__"
+DEFAULT_COMPACT_EVERY = 200
+SINGULAR_EPS = 1e-12
+MAX_ORDER = 6
+WIN_LOSS = {"LONG": (STATE_INDEX["LW"], STATE_INDEX["LB"]),
+            "SHORT": (STATE_INDEX["SW"], STATE_INDEX["SB"])}
+
+
+# ----------------------- Stationär fördelning --------------------------------
+def power_iteration(P: List[List[float]], iterations: int = 100) -> List[float]:
+    """Gamla metoden (start i likfördelning). Används bara när systemet är singulärt."""
+    n = len(P)
+    pi = [1.0 / n] * n
+    for _ in range(iterations):
+        new = [0.0] * n
+        for s in range(n):
+            ps = pi[s]
+            row = P[s]
+            for t in range(n):
+                new[t] += ps * row[t]
+        pi = new
+    return pi
+
+
+def solve_stationary(P: List[List[float]]) -> Optional[List[float]]:
+    """
+    Exakt π med π·P = π och Σπ = 1 (Gauss-elimination med pivotering).
+    None om lösningen inte är entydig (flera slutna klasser).
+    """
+    n = len(P)
+    # (Pᵀ - I)·π = 0, sista ekvationen ersätts med Σπ = 1
+    A = [[P[j][i] - (1.0 if i == j else 0.0) for j in range(n)] + [0.0] for i in range(n - 1)]
+    A.append([1.0] * n + [1.0])
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(A[r][col]))
+        if abs(A[pivot][col]) < SINGULAR_EPS:
+            return None
+        A[col], A[pivot] = A[pivot], A[col]
+        inv = 1.0 / A[col][col]
+        for r in range(n):
+            if r != col and A[r][col] != 0.0:
+                f = A[r][col] * inv
+                row_r, row_c = A[r], A[col]
+                for c in range(col, n + 1):
+                    row_r[c] -= f * row_c[c]
+    return [max(0.0, A[i][n] / A[i][i]) for i in range(n)]
+
+
+# ----------------------- Räknare ---------------------------------------------
+class TransitionCounts:
+    """Övergångar i platt array (index from*4 + to) och antal observationer per tillstånd."""
+
+    __slots__ = ("trans", "state_counts", "version", "_pi", "_pi_version")
+
+    def __init__(self):
+        self.trans = array("q", [0] * (N_STATES * N_STATES))
+        self.state_counts = array("q", [0] * N_STATES)
+        self.version = 0
+        self._pi: Optional[Dict[str, float]] = None
+        self._pi_version = -1
+
+    def add_transition(self, from_state: str, to_state: str, n: int = 1) -> None:
+        self.trans[STATE_INDEX[from_state] * N_STATES + STATE_INDEX[to_state]] += n
+        self.version += 1
+
+    def add_state(self, state: str, n: int = 1) -> None:
+        self.state_counts[STATE_INDEX[state]] += n
+        self.version += 1
+
+    def count(self, from_state: str, to_state: str) -> int:
+        return self.trans[STATE_INDEX[from_state] * N_STATES + STATE_INDEX[to_state]]
+
+    def pairs(self) -> Iterator[Tuple[str, str, int]]:
+        """(from, to, count) för alla nollskilda övergångar i sorterad ordning."""
+        for a, b in sorted((a, b) for a in STATES for b in STATES):
+            c = self.count(a, b)
+            if c:
+                yield a, b, c
+
+    def transition_matrix(self, empty_row_uniform: bool = False) -> List[List[float]]:
+        """Radnormerad matris; rader utan data blir 0 (eller likfördelning)."""
+        mat = []
+        for i in range(N_STATES):
+            row = self.trans[i * N_STATES:(i + 1) * N_STATES]
+            row_sum = sum(row)
+            if row_sum == 0:
+                fill = 1.0 / N_STATES if empty_row_uniform else 0.0
+                mat.append([fill] * N_STATES)
+            else:
+                mat.append([c / row_sum for c in row])
+        return mat
+
+    def stationary(self) -> Dict[str, float]:
+        """Stationär fördelning (tomma rader = likfördelning). Räknas om bara när räknarna ändrats."""
+        if self._pi_version != self.version:
+            P = self.transition_matrix(empty_row_uniform=True)
+            pi = solve_stationary(P) or power_iteration(P)
+            self._pi = dict(zip(STATES, pi))
+            self._pi_version = self.version
+        return dict(self._pi)
+
+
+# ----------------------- Persistens ------------------------------------------
+class MarkovCountStore:
+    """
+    Övergångsräknare som överlever omstarter.
+
+    Args:
+        snapshot_path: markov.csv (from_state,to_state,count)
+        compact_every: Skriv om snapshot och töm loggen efter så här många övergångar
+    """
+
+    def __init__(self, snapshot_path: str, compact_every: int = DEFAULT_COMPACT_EVERY):
+        self.snapshot_path = snapshot_path
+        self.log_path = os.path.splitext(snapshot_path)[0] + ".log"
+        self.compact_every = compact_every
+        self.counts = TransitionCounts()
+        self.seq = 0               # senaste sekvensnummer (snapshot + logg)
+        self._pending = 0          # loggrader sedan senaste kompaktering
+        self._log = None
+        self.load()
+
+    def load(self) -> None:
+        snapshot_seq = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r", encoding="utf-8", newline="") as fp:
+                reader = csv.reader(fp)
+                next(reader, None)
+                for row in reader:
+                    if len(row) != 3:
+                        continue
+                    a, b, c = row
+                    if a == SEQ_ROW:
+                        snapshot_seq = int(c)
+                    elif a in STATE_INDEX and b in STATE_INDEX:
+                        self.counts.add_transition(a, b, int(c))
+        self.seq = snapshot_seq
+        if os.path.exists(self.log_path):
+            with open(self.log_path, "r", encoding="utf-8") as fp:
+                for line in fp:
+                    parts = line.strip().split(",")
+                    if len(parts) != 3 or parts[1] not in STATE_INDEX or parts[2] not in STATE_INDEX:
+                        continue  # t.ex. halv rad efter krasch
+                    seq = int(parts[0])
+                    if seq > snapshot_seq:
+                        self.counts.add_transition(parts[1], parts[2])
+                        self.seq = max(self.seq, seq)
+                        self._pending += 1
+
+    def record(self, from_state: str, to_state: str) -> None:
+        """Räkna en övergång och lägg till en rad i loggen (ingen omskrivning)."""
+        self.counts.add_transition(from_state, to_state)
+        self.seq += 1
+        if self._log is None:
+            os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+            self._log = open(self.log_path, "a", encoding="utf-8")
+        self._log.write(f"{self.seq},{from_state},{to_state}\n")
+        self._log.flush()
+        self._pending += 1
+        if self.compact_every > 0 and self._pending >= self.compact_every:
+            self.compact()
+
+    def compact(self) -> None:
+        """Skriv snapshot atomiskt (temp + rename) och töm loggen."""
+        tmp_path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", newline="", encoding="utf-8") as fp:
+            w = csv.writer(fp)
+            w.writerow(["from_state", "to_state", "count"])
+            for a, b, c in self.counts.pairs():
+                w.writerow([a, b, c])
+            w.writerow([SEQ_ROW, "", self.seq])
+        os.replace(tmp_path, self.snapshot_path)
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+        # Snapshot innehåller nu allt → loggen kan tömmas (gamla rader ignoreras ändå via seq)
+        open(self.log_path, "w", encoding="utf-8").close()
+        self._pending = 0
+
+    def close(self) -> None:
+        if self._pending:
+            self.compact()
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+
+# ----------------------- Ordning k -------------------------------------------
+def outcome_state(state_tag: str, side: str, pnl: float) -> Optional[str]:
+    """
+    Exit-tagg → utfall för ordning-k-modellen. LW/LB/SW/SB behålls; övriga
+    exits (MAX_LOSS, MAX_TIME, MODE_SWITCH) räknas som vinst/förlust på sin sida
+    efter PnL:ens tecken, annars skulle modellen bara se de lyckade exitarna.
+    """
+    if state_tag in STATE_INDEX:
+        return state_tag
+    if side not in WIN_LOSS:
+        return None
+    return ("L" if side == "LONG" else "S") + ("W" if pnl > 0 else "B")
+
+
+class OutcomeSequenceModel:
+    """
+    Räknare för nästa utfall givet de k senaste (k ≤ MAX_ORDER).
+
+    Ordning j har 4^j kontexter × 4 utfall och ligger på offset[j] i samma
+    platt array('q') (k=6 → 21 844 räknare, ~170 kB). Kontexten är de senaste
+    utfallen som bas-4-tal med senaste utfallet som lägsta siffra, så ordning
+    j:s kontext är bara ctx % 4^j.
+
+    Args:
+        order: Antal tidigare utfall att betinga på (0 = bara frekvenser)
+    """
+
+    __slots__ = ("order", "counts", "ctx", "hist_len", "version",
+                 "_offsets", "_mods", "_cache")
+
+    def __init__(self, order: int = 2):
+        if not 0 <= order <= MAX_ORDER:
+            raise ValueError(f"order måste vara 0..{MAX_ORDER}, fick {order}")
+        self.order = order
+        self._mods = [N_STATES ** j for j in range(order + 1)]
+        self._offsets = []
+        size = 0
+        for m in self._mods:
+            self._offsets.append(size)
+            size += m * N_STATES
+        self.counts = array("q", bytes(8 * size))
+        self.ctx = 0          # senaste utfallen (bas 4)
+        self.hist_len = 0     # antal kända utfall i ctx (max order)
+        self.version = 0
+        self._cache: Dict[Tuple[str, int], Tuple[Optional[float], int, int]] = {}
+
+    def update(self, state: str) -> None:
+        """Räkna ett nytt utfall i alla ordningar som historiken räcker till."""
+        s = STATE_INDEX.get(state)
+        if s is None:
+            return  # t.ex. MODE_SWITCH
+        counts, ctx = self.counts, self.ctx
+        for j in range(self.hist_len + 1):
+            counts[self._offsets[j] + (ctx % self._mods[j]) * N_STATES + s] += 1
+        self.ctx = (ctx * N_STATES + s) % self._mods[self.order]
+        if self.hist_len < self.order:
+            self.hist_len += 1
+        self.version += 1
+        self._cache.clear()
+
+    def fit(self, states: Iterable[str]) -> int:
+        """Bulk-träning i tidsordning. Returnerar antal räknade utfall."""
+        before = self.total()
+        for state in states:
+            self.update(state)
+        return self.total() - before
+
+    def fit_from_trade_metrics(self, paths: Union[str, Sequence[str]]) -> int:
+        """Träna från en eller flera trade_metrics.csv (state/side/entry/exit, äldst först)."""
+        if isinstance(paths, str):
+            paths = [paths]
+        n = 0
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            with open(path, "r", encoding="utf-8", newline="") as fp:
+                n += self.fit(_trade_metrics_outcomes(csv.DictReader(fp)))
+        return n
+
+    def total(self) -> int:
+        return sum(self.counts[:N_STATES])
+
+    def _context(self, history: Optional[Sequence[str]]) -> Tuple[int, int]:
+        if history is None:
+            return self.ctx, self.hist_len
+        ctx = 0
+        known = [STATE_INDEX[h] for h in history if h in STATE_INDEX][-self.order:] if self.order else []
+        for s in known:
+            ctx = ctx * N_STATES + s
+        return ctx, len(known)
+
+    def row(self, order: int, history: Optional[Sequence[str]] = None) -> List[int]:
+        """Räknare för nästa utfall (LW, LB, SW, SB) givet de senaste `order` utfallen."""
+        ctx, hist_len = self._context(history)
+        if order > hist_len:
+            raise ValueError(f"historiken har bara {hist_len} utfall")
+        base = self._offsets[order] + (ctx % self._mods[order]) * N_STATES
+        return list(self.counts[base:base + N_STATES])
+
+    def probabilities(self, history: Optional[Sequence[str]] = None,
+                      min_samples: int = 1) -> Tuple[Dict[str, float], int, int]:
+        """
+        (P(nästa utfall), använd ordning, antal observationer). Backar till
+        kortare historik tills kontexten har minst min_samples observationer.
+        """
+        ctx, hist_len = self._context(history)
+        counts = self.counts
+        n = 0
+        for j in range(hist_len, -1, -1):
+            base = self._offsets[j] + (ctx % self._mods[j]) * N_STATES
+            row = counts[base:base + N_STATES]
+            n = sum(row)
+            if n >= min_samples and n > 0:
+                return {s: c / n for s, c in zip(STATES, row)}, j, n
+        return {s: 0.0 for s in STATES}, 0, n
+
+    def win_probability(self, side: str, min_samples: int = 1) -> Tuple[Optional[float], int, int]:
+        """
+        (P(vinst | sida, nuvarande historik), ordning, antal) där bara utfall på
+        samma sida räknas (LONG: LW/(LW+LB)). None om ingen ordning har
+        min_samples observationer. Cachas tills nästa update().
+        """
+        key = (side, min_samples)
+        hit = self._cache.get(key)
+        if hit is not None:
+            return hit
+        win, loss = WIN_LOSS[side]
+        counts, ctx = self.counts, self.ctx
+        result: Tuple[Optional[float], int, int] = (None, 0, 0)
+        for j in range(self.hist_len, -1, -1):
+            base = self._offsets[j] + (ctx % self._mods[j]) * N_STATES
+            w = counts[base + win]
+            n = w + counts[base + loss]
+            if n >= min_samples and n > 0:
+                result = (w / n, j, n)
+                break
+        self._cache[key] = result
+        return result
+
+    def history(self) -> List[str]:
+        """De senaste utfallen (äldst först) som kontexten består av."""
+        out = []
+        ctx = self.ctx
+        for _ in range(self.hist_len):
+            out.append(STATES[ctx % N_STATES])
+            ctx //= N_STATES
+        return out[::-1]
+
+    def to_dict(self) -> Dict[str, object]:
+        """Glesa räknare som [index, antal]-par (checkpoint-vänligt)."""
+        return {
+            "order": self.order,
+            "ctx": self.ctx,
+            "hist_len": self.hist_len,
+            "counts": [[i, c] for i, c in enumerate(self.counts) if c],
+        }
+
+    def load_dict(self, data: Dict[str, object]) -> bool:
+        """False (och oförändrad modell) om datat gäller en annan ordning."""
+        if int(data.get("order", -1)) != self.order:
+            return False
+        counts = array("q", bytes(8 * len(self.counts)))
+        for i, c in data.get("counts", []):
+            counts[int(i)] = int(c)
+        self.counts = counts
+        self.ctx = int(data.get("ctx", 0))
+        self.hist_len = int(data.get("hist_len", 0))
+        self.version += 1
+        self._cache.clear()
+        return True
+
+
+def _trade_metrics_outcomes(rows: Iterable[Dict[str, str]]) -> Iterator[str]:
+    for row in rows:
+        side = row.get("side", "")
+        try:
+            move = float(row.get("exit_price") or 0) - float(row.get("entry_price") or 0)
+        except ValueError:
+            continue
+        state = outcome_state(row.get("state", ""), side, move if side == "LONG" else -move)
+        if state is not None:
+            yield state
+
+
+# ----------------------- Paper-skriptens tillstånd ---------------------------
+class MarkovState:
+    """
+    Markov-tillstånd för paper-skripten: antal per utfall, övergångar och de
+    senaste utfallen (för loss-paus/riktningsbias), plus en ordning-k-modell
+    (outcomes) för entry-grinden.
+    """
+
+    STATES = STATES
+
+    def __init__(self, history_len: int = 2, order: int = 2):
+        self.model = TransitionCounts()
+        self.outcomes = OutcomeSequenceModel(order)
+        self.prev_state: Optional[str] = None
+        self.last_states: deque = deque(maxlen=max(2, history_len))
+
+    def on_state(self, state: str, outcome: Optional[str] = None):
+        """outcome = utfallet för ordning-k-modellen (se outcome_state), default state."""
+        self.outcomes.update(outcome or state)
+        if state not in STATE_INDEX:
+            return
+        self.model.add_state(state)
+        if self.prev_state is not None:
+            self.model.add_transition(self.prev_state, state)
+        self.prev_state = state
+        self.last_states.append(state)
+
+    @property
+    def counts(self) -> Dict[str, int]:
+        return dict(zip(STATES, self.model.state_counts))
+
+    @property
+    def trans(self) -> Dict[str, Dict[str, int]]:
+        return {a: {b: self.model.count(a, b) for b in STATES} for a in STATES}
+
+    def empirical_stationary(self) -> Dict[str, float]:
+        total = sum(self.model.state_counts)
+        if total == 0:
+            return {s: 0.0 for s in STATES}
+        return {s: float(c) / float(total) for s, c in zip(STATES, self.model.state_counts)}
+
+    def transition_matrix(self) -> List[List[float]]:
+        return self.model.transition_matrix()
+
+    def stationary(self) -> Dict[str, float]:
+        return self.model.stationary()
+
+    def to_dict(self) -> Dict[str, object]:
+        """Samma form som checkpointen har sparat sedan tidigare."""
+        return {
+            "counts": self.counts,
+            "trans": self.trans,
+            "prev_state": self.prev_state,
+            "last_states": list(self.last_states),
+            "outcomes": self.outcomes.to_dict(),
+        }
+
+    def load_dict(self, data: Dict[str, object]) -> None:
+        self.model = TransitionCounts()
+        for s, c in data.get("counts", {}).items():
+            if s in STATE_INDEX and c:
+                self.model.add_state(s, int(c))
+        for a, row in data.get("trans", {}).items():
+            for b, c in row.items():
+                if a in STATE_INDEX and b in STATE_INDEX and c:
+                    self.model.add_transition(a, b, int(c))
+        self.prev_state = data.get("prev_state")
+        self.last_states.clear()
+        self.last_states.extend(data.get("last_states", []))
+        if "outcomes" in data:
+            self.outcomes.load_dict(data["outcomes"])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Träna ordning-k-modellen från trade_metrics.csv och visa P(nästa utfall).")
+    parser.add_argument("paths", nargs="+", help="trade_metrics.csv (äldst först)")
+    parser.add_argument("--order", type=int, default=2, help=f"Ordning k (0..{MAX_ORDER})")
+    parser.add_argument("--min-samples", type=int, default=10)
+    args = parser.parse_args()
+
+    model = OutcomeSequenceModel(args.order)
+    n = model.fit_from_trade_metrics(args.paths)
+    print(f"📊 {n} utfall, ordning {model.order}, senaste historik {' '.join(model.history()) or '-'}")
+    probs, used, samples = model.probabilities(min_samples=args.min_samples)
+    print("   Nästa: " + "  ".join(f"{s}={p:.3f}" for s, p in probs.items())
+          + f"  (ordning {used}, n={samples})")
+    for side in WIN_LOSS:
+        p, used, samples = model.win_probability(side, args.min_samples)
+        shown = f"{p:.3f}" if p is not None else "-"
+        print(f"   P(vinst | {side:5s}) = {shown}  (ordning {used}, n={samples})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,369 @@
+"""
+Monte Carlo Risk – fördelningar istället för punktskattningar
+=============================================================
+PerformanceTracker ger max drawdown för EN väg (den som råkade inträffa).
+Här dras trade-sekvensen om (bootstrap, eller block-bootstrap som behåller
+korta serier av vinster/förluster) till 100k+ vägar och riskmåtten räknas
+som fördelningar:
+
+    max drawdown      USD och % av toppen, per väg
+    time-to-recover   längsta tid under en tidigare topp (antal trades, ≈ timmar
+                      via snittavståndet mellan trades i loggen)
+    risk of ruin      andel vägar där kapitalet någon gång faller under
+                      ruin-nivån (--ruin-pct av startkapitalet förlorat)
+    equity-kurvor     percentiler (p5..p95) per steg, som CSV
+
+Med dynamic_position_sizing simuleras samma regler som live-skriptets
+update_position_size_on_win/loss (position_size_levels, size_step_losses,
+size_reset_on_win) – vägberoende, så trades stegas igenom i tur och ordning
+men varje steg är en NumPy-operation över alla vägar i batchen. Utan sizing
+är allt cumsum/accumulate över hela batchen.
+
+Vägarna körs i batchar (minnet ~ batch × trades), var batch med en egen seed
+ur SeedSequence → resultatet beror inte på antal --workers (processpool).
+
+Indata:
+    trade_metrics.csv   (side, entry_price, exit_price, state) → PnL i full
+                        storlek = ±(exit − entry) × order_qty − avgifter
+    ledger-CSV          kolumn pnl_usd (t.ex. orders_paper.csv, EXIT-rader)
+
+    python monte_carlo_risk.py logs/trade_metrics.csv --paths 100000
+    python monte_carlo_risk.py logs/trade_metrics.csv --block 20 --workers 4 --curves-out data/mc_curves.csv
+"""
+
+import argparse
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+from csv_tail import parse_utc_ts
+
+DEFAULT_PATHS = 100_000
+DEFAULT_BATCH_ELEMENTS = 2_000_000  # vägar × trades per batch (~16 MB float64 per matris)
+CURVE_POINTS = 101
+CURVE_PERCENTILES = (5, 25, 50, 75, 95)
+REPORT_PERCENTILES = (50, 90, 95, 99)
+WIN_STATES = ("LW", "SW")
+LOSS_STATES = ("LB", "SB")
+
+_WORKER_DATA: Dict[str, Any] = {}
+
+
+# ----------------------- indata ----------------------------------------------
+def load_trades(path: str, order_qty: float = 0.01, fee_pct: float = 0.0) -> Dict[str, Any]:
+    """
+    {"pnl": [...], "outcome": [+1 vinst, -1 förlust, 0 övrigt], "hours_per_trade": float|None,
+     "sized": bool} ur trade_metrics.csv eller en ledger med pnl_usd. En ledger har redan
+    sizing inräknad (sized=True) och delexits som egna rader. fee_pct (taker, andel)
+    dras för både entry och exit; för ledger-rader approximeras entry med exitpriset.
+    """
+    pnl: List[float] = []
+    outcome: List[int] = []
+    first_ts = last_ts = None
+    with open(path, "r", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        cols = reader.fieldnames or []
+        ledger = "pnl_usd" in cols and "exit_price" not in cols
+        for row in reader:
+            try:
+                state = row.get("state", "")
+                if ledger:
+                    if row.get("side") not in ("EXIT", None) or not row.get("pnl_usd"):
+                        continue
+                    value = float(row["pnl_usd"]) - 2 * float(row["qty"]) * float(row["price"]) * fee_pct
+                    ts = row.get("ts")
+                else:
+                    entry, exit_ = float(row["entry_price"]), float(row["exit_price"])
+                    move = exit_ - entry if row["side"] == "LONG" else entry - exit_
+                    value = (move - (entry + exit_) * fee_pct) * order_qty
+                    ts = row.get("exit_ts")
+            except (KeyError, ValueError):
+                continue
+            pnl.append(value)
+            if state in WIN_STATES:
+                outcome.append(1)
+            elif state in LOSS_STATES:
+                outcome.append(-1)
+            else:
+                outcome.append(0)
+            if ts:
+                try:
+                    stamp = parse_utc_ts(ts)
+                except ValueError:
+                    continue
+                first_ts = first_ts or stamp
+                last_ts = stamp
+    hours = None
+    if first_ts and last_ts and len(pnl) > 1:
+        hours = (last_ts - first_ts).total_seconds() / 3600 / (len(pnl) - 1)
+    return {"pnl": pnl, "outcome": outcome, "hours_per_trade": hours, "sized": ledger}
+
+
+def sizing_from_config(cfg: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Live-skriptets dynamic sizing-parametrar (None om avstängt)."""
+    if not cfg.get("dynamic_position_sizing", False):
+        return None
+    return {
+        "levels": [float(x) for x in cfg.get("position_size_levels", [1.0, 0.5, 0.25])],
+        "step_losses": int(cfg.get("size_step_losses", 2)),
+        "reset_on_win": bool(cfg.get("size_reset_on_win", True)),
+    }
+
+
+# ----------------------- simulering ------------------------------------------
+def resample_indices(rng: "np.random.Generator", n: int, paths: int, length: int, block: int) -> "np.ndarray":
+    """
+    (length, paths) index i trade-serien – tiden längs axel 0 så att varje steg
+    är en sammanhängande rad över vägarna. block > 1 = cirkulär block-bootstrap.
+    """
+    if block <= 1:
+        return rng.integers(0, n, size=(length, paths), dtype=np.int32)
+    blocks = -(-length // block)
+    starts = rng.integers(0, n, size=(blocks, 1, paths), dtype=np.int32)
+    idx = (starts + np.arange(block, dtype=np.int32)[:, None]) % n
+    return idx.reshape(blocks * block, paths)[:length]
+
+
+def sizing_table(sizing: Dict[str, Any]) -> "Tuple[np.ndarray, np.ndarray]":
+    """
+    Live-skriptets sizing-regler som tillståndsmaskin: tillstånd = (nivå, förluster
+    i rad), utfall -1/0/+1 → (övergångstabell [tillstånd, utfall+1], multiplikator
+    per tillstånd). På sista nivån kan förlustserien inte flytta nivån längre, så
+    räknaren mättas där och tillstånden blir ändliga.
+    """
+    levels = [float(x) for x in sizing["levels"]]
+    top = len(levels) - 1
+    step_losses = max(1, int(sizing["step_losses"]))
+    reset_on_win = sizing["reset_on_win"]
+
+    def state(level: int, consec: int) -> int:
+        return level * step_losses + min(consec, step_losses - 1)
+
+    table = np.zeros((len(levels) * step_losses, 3), dtype=np.int32)
+    mult = np.zeros(len(levels) * step_losses, dtype=np.float64)
+    for level in range(len(levels)):
+        for consec in range(step_losses):
+            here = state(level, consec)
+            mult[here] = levels[level]
+            # Förlust (update_position_size_on_loss)
+            if consec + 1 >= step_losses and level < top:
+                table[here, 0] = state(level + 1, 0)
+            else:
+                table[here, 0] = state(level, consec + 1)
+            table[here, 1] = here  # MAX_LOSS/MAX_TIME m.fl. rör inte sizing
+            # Vinst (update_position_size_on_win) – nollar bara om nivån > 0
+            table[here, 2] = state(0, 0) if reset_on_win and level > 0 else here
+    return table, mult
+
+
+def apply_sizing(pnl: "np.ndarray", outcome: "np.ndarray", sizing: Dict[str, Any]) -> "np.ndarray":
+    """Skala (length, paths) PnL i full storlek med sizing-nivån som gällde vid varje trade."""
+    table, mult = sizing_table(sizing)
+    state = np.zeros(pnl.shape[1], dtype=np.int32)
+    column = outcome.astype(np.int32) + 1
+    for t in range(pnl.shape[0]):
+        pnl[t] *= mult[state]
+        state = table[state, column[t]]
+    return pnl
+
+
+def simulate_batch(pnl: "np.ndarray", outcome: "np.ndarray", paths: int, length: int, seed: Sequence[int],
+                   start_capital: float, ruin_level: float, block: int = 1,
+                   sizing: Optional[Dict[str, Any]] = None) -> Dict[str, "np.ndarray"]:
+    """En batch vägar → per-väg-mått + equity vid CURVE_POINTS jämnt fördelade steg."""
+    rng = np.random.default_rng(np.random.SeedSequence(list(seed)))
+    idx = resample_indices(rng, len(pnl), paths, length, block)
+    equity = pnl[idx]
+    if sizing is not None:
+        apply_sizing(equity, outcome[idx], sizing)
+    del idx
+    np.cumsum(equity, axis=0, out=equity)
+    equity += start_capital
+
+    peak = np.maximum.accumulate(equity, axis=0)
+    np.maximum(peak, start_capital, out=peak)
+    drawdown = peak - equity
+    dd_at = drawdown.argmax(axis=0)
+    cols = np.arange(paths)
+    max_dd = drawdown[dd_at, cols]
+    max_dd_pct = max_dd / peak[dd_at, cols] * 100
+    del drawdown
+
+    # Underwater-längd: steg sedan senaste nya topp (start räknas som topp)
+    step_no = np.arange(1, length + 1, dtype=np.int32)[:, None]
+    last_peak = np.where(equity >= peak, step_no, np.int32(0))
+    del peak
+    np.maximum.accumulate(last_peak, axis=0, out=last_peak)
+    underwater = (step_no - last_peak).max(axis=0)
+    del last_peak
+
+    curve_at = np.linspace(0, length - 1, CURVE_POINTS).round().astype(np.int64)
+    return {
+        "max_dd": max_dd,
+        "max_dd_pct": max_dd_pct,
+        "underwater": underwater,
+        "ruined": equity.min(axis=0) <= ruin_level,
+        "final": equity[-1] - start_capital,
+        "curves": equity[curve_at].T.astype(np.float32),
+    }
+
+
+def _init_worker(pnl, outcome, settings):
+    _WORKER_DATA["pnl"] = np.asarray(pnl, dtype=np.float64)
+    _WORKER_DATA["outcome"] = np.asarray(outcome, dtype=np.int8)
+    _WORKER_DATA["settings"] = settings
+
+
+def _run_batch(job):
+    paths, seed = job
+    s = _WORKER_DATA["settings"]
+    return simulate_batch(_WORKER_DATA["pnl"], _WORKER_DATA["outcome"], paths, s["length"], seed,
+                          s["start_capital"], s["ruin_level"], s["block"], s["sizing"])
+
+
+def run_monte_carlo(pnl: Sequence[float], outcome: Sequence[int], paths: int = DEFAULT_PATHS,
+                    length: Optional[int] = None, start_capital: float = 10000.0, ruin_pct: float = 0.5,
+                    block: int = 1, sizing: Optional[Dict[str, Any]] = None, seed: int = 42,
+                    workers: int = 1, batch_elements: int = DEFAULT_BATCH_ELEMENTS) -> Dict[str, "np.ndarray"]:
+    """
+    Simulera paths vägar à length trades (default lika många som i serien).
+    Batchar om ~batch_elements värden; workers > 1 kör batcharna i en processpool.
+    """
+    if not NUMPY_AVAILABLE:
+        raise RuntimeError("numpy krävs för monte_carlo_risk")
+    if not pnl:
+        raise ValueError("Inga trades att sampla")
+    length = length or len(pnl)
+    batch = max(1, min(paths, batch_elements // length))
+    sizes = [batch] * (paths // batch) + ([paths % batch] if paths % batch else [])
+    seeds = [(seed, i) for i in range(len(sizes))]
+    settings = {"length": length, "start_capital": start_capital,
+                "ruin_level": start_capital * (1 - ruin_pct), "block": block, "sizing": sizing}
+    jobs = list(zip(sizes, seeds))
+    if workers <= 1 or len(jobs) == 1:
+        _init_worker(pnl, outcome, settings)
+        parts = [_run_batch(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(list(pnl), list(outcome), settings)) as pool:
+            parts = list(pool.map(_run_batch, jobs))
+    return {key: np.concatenate([p[key] for p in parts]) for key in parts[0]}
+
+
+# ----------------------- rapport ---------------------------------------------
+def summarize(result: Dict[str, "np.ndarray"], hours_per_trade: Optional[float] = None) -> Dict[str, Any]:
+    def pct(values) -> Dict[str, float]:
+        return {f"p{p}": float(v) for p, v in zip(REPORT_PERCENTILES, np.percentile(values, REPORT_PERCENTILES))}
+
+    summary: Dict[str, Any] = {
+        "paths": int(result["final"].size),
+        "max_drawdown_usd": pct(result["max_dd"]),
+        "max_drawdown_pct": pct(result["max_dd_pct"]),
+        "underwater_trades": pct(result["underwater"]),
+        "final_pnl_usd": pct(result["final"]),
+        "prob_loss": float((result["final"] < 0).mean()),
+        "risk_of_ruin": float(result["ruined"].mean()),
+    }
+    if hours_per_trade:
+        summary["underwater_hours"] = {k: v * hours_per_trade for k, v in summary["underwater_trades"].items()}
+    return summary
+
+
+def percentile_curves(result: Dict[str, "np.ndarray"], length: int) -> List[Dict[str, float]]:
+    steps = np.linspace(0, length - 1, CURVE_POINTS).round().astype(np.int64) + 1
+    levels = np.percentile(result["curves"], CURVE_PERCENTILES, axis=0)
+    return [
+        {"trade": int(step), **{f"p{p}": round(float(levels[i, j]), 4) for i, p in enumerate(CURVE_PERCENTILES)}}
+        for j, step in enumerate(steps)
+    ]
+
+
+def print_summary(summary: Dict[str, Any]) -> None:
+    head = f"{'Mått':<24}" + "".join(f"{'p' + str(p):>12}" for p in REPORT_PERCENTILES)
+    print(head)
+    print("-" * len(head))
+    rows = [("Max drawdown $", "max_drawdown_usd", "{:>12.2f}"), ("Max drawdown %", "max_drawdown_pct", "{:>12.3f}"),
+            ("Under vatten (trades)", "underwater_trades", "{:>12.0f}"), ("Under vatten (h)", "underwater_hours", "{:>12.1f}"),
+            ("Slut-PnL $", "final_pnl_usd", "{:>12.2f}")]
+    for label, key, fmt in rows:
+        if key in summary:
+            print(f"{label:<24}" + "".join(fmt.format(summary[key][f"p{p}"]) for p in REPORT_PERCENTILES))
+    print(f"\nP(förlust vid slutet): {summary['prob_loss']*100:.2f}%   Risk of ruin: {summary['risk_of_ruin']*100:.3f}%")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Monte Carlo-fördelningar för drawdown, återhämtning och risk of ruin.")
+    parser.add_argument("trades", help="trade_metrics.csv eller ledger-CSV med pnl_usd")
+    parser.add_argument("--config", default="config.json", help="order_qty, paper_usdt, taker_fee_pct och dynamic sizing")
+    parser.add_argument("--fee-pct", type=float, help="Taker-avgift som andel (default taker_fee_pct ur configen, 0 = brutto)")
+    parser.add_argument("--paths", type=int, default=DEFAULT_PATHS)
+    parser.add_argument("--length", type=int, help="Trades per väg (default: lika många som i loggen)")
+    parser.add_argument("--block", type=int, default=1, help="Blocklängd för block-bootstrap (1 = vanlig bootstrap)")
+    parser.add_argument("--ruin-pct", type=float, default=0.5, help="Ruin = så stor andel av startkapitalet förlorad")
+    parser.add_argument("--no-sizing", action="store_true", help="Ignorera dynamic_position_sizing i configen")
+    parser.add_argument("--workers", type=int, default=1, help="Processer (batcharna fördelas över dem)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--curves-out", help="Percentil-equitykurvor som CSV")
+    parser.add_argument("--out", help="Sammanfattning som JSON")
+    args = parser.parse_args()
+
+    if not NUMPY_AVAILABLE:
+        raise SystemExit("❌ numpy saknas – pip install numpy")
+    cfg: Dict[str, Any] = {}
+    if os.path.exists(args.config):
+        with open(args.config, "r", encoding="utf-8-sig") as f:
+            cfg = json.load(f)
+    fee_pct = args.fee_pct if args.fee_pct is not None else float(cfg.get("taker_fee_pct", 0.0004))
+    data = load_trades(args.trades, order_qty=float(cfg.get("order_qty", 0.01)), fee_pct=fee_pct)
+    if not data["pnl"]:
+        raise SystemExit(f"❌ Inga trades i {args.trades}")
+    sizing = None if args.no_sizing or data["sized"] else sizing_from_config(cfg)
+    if data["sized"] and sizing_from_config(cfg):
+        print("ℹ️ Ledger-PnL har redan sizing inräknad – dynamic sizing simuleras inte")
+    start_capital = float(cfg.get("paper_usdt", 10000))
+    length = args.length or len(data["pnl"])
+
+    print(f"🎲 {args.paths} vägar × {length} trades ur {len(data['pnl'])} trades "
+          f"({'block ' + str(args.block) if args.block > 1 else 'bootstrap'}, "
+          f"avgift {fee_pct*100:.3f}%, sizing {'på ' + str(sizing['levels']) if sizing else 'av'}, "
+          f"{args.workers} process(er))")
+    t0 = time.perf_counter()
+    result = run_monte_carlo(data["pnl"], data["outcome"], paths=args.paths, length=length,
+                             start_capital=start_capital, ruin_pct=args.ruin_pct, block=args.block,
+                             sizing=sizing, seed=args.seed, workers=args.workers)
+    elapsed = time.perf_counter() - t0
+    print(f"⏱️ {elapsed:.2f} s ({args.paths * length / elapsed / 1e6:.1f} M trade-steg/s)\n")
+
+    summary = summarize(result, data["hours_per_trade"])
+    print_summary(summary)
+
+    if args.curves_out:
+        curves = percentile_curves(result, length)
+        directory = os.path.dirname(args.curves_out)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.curves_out, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=list(curves[0].keys()))
+            writer.writeheader()
+            writer.writerows(curves)
+        print(f"💾 Equity-percentiler: {args.curves_out}")
+    if args.out:
+        summary.update({"trades": len(data["pnl"]), "length": length, "block": args.block,
+                        "sizing": sizing, "start_capital": start_capital, "ruin_pct": args.ruin_pct,
+                        "fee_pct": fee_pct, "seed": args.seed})
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        print(f"💾 Sammanfattning: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
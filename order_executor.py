@@ -0,0 +1,151 @@
+"""
+Order Executor – ordrar i egen tråd, frikopplade från tick-hanteringen
+=====================================================================
+markov_breakout_live.py lade tidigare market-ordrar direkt i websocketens
+on_message-callback. Under REST-rundresan (50–300 ms) stod all inläsning av
+bookTicker still och nästa beslut fattades på gamla priser.
+
+Nu lägger strategin bara en OrderIntent i kön och returnerar direkt:
+
+    executor = OrderExecutor(place_order, on_fill=..., on_error=...).start()
+    if not executor.busy:
+        executor.submit(OrderIntent("BUY", qty, "ENTER_LONG", ref_price))
+
+    place_order(intent) → Binance-svar   (körs i arbetartråden)
+    on_fill(intent, resp)                (arbetartråden, efter svaret)
+    on_error(intent, err)                (arbetartråden, vid undantag)
+
+Högst en order är i luften åt gången: submit() avvisar nya intents medan en
+order väntar på fyllnad, så samma signal på nästa tick ger ingen dubbelorder.
+Efter ett fel är executorn upptagen i error_backoff_sec så att ett ihållande
+fel (t.ex. otillräckligt saldo) inte ger en ny order per tick.
+
+Varje intent får ett eget newClientOrderId så att en order kan spåras i
+Binance (executionReport/allOrders) även om svaret aldrig kom fram.
+"""
+
+import itertools
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Any, Callable, Dict, Optional
+
+DEFAULT_ERROR_BACKOFF_SEC = 1.0
+_order_seq = itertools.count(1)
+
+
+@dataclass
+class OrderIntent:
+    """En order som strategin vill lägga."""
+    side: str                  # BUY / SELL
+    qty: Decimal
+    tag: str                   # ENTER_LONG, EXIT_TP ...
+    ref_price: Decimal         # mid när beslutet togs
+    client_order_id: str = ""
+    created: float = field(default_factory=time.monotonic)
+    sent: float = 0.0
+    acked: float = 0.0
+
+    def __post_init__(self):
+        if not self.client_order_id:
+            self.client_order_id = f"mb{int(time.time() * 1000)}_{next(_order_seq)}"
+
+
+class OrderExecutor:
+    """
+    Arbetartråd med kö och spårning av order i luften.
+
+    Args:
+        place_order: Lägger ordern och returnerar svaret (blockerande REST-anrop)
+        on_fill: Anropas med (intent, svar) när ordern är fylld
+        on_error: Anropas med (intent, undantag) om place_order kastar
+        error_backoff_sec: Hur länge nya intents avvisas efter ett fel
+    """
+
+    def __init__(self, place_order: Callable[[OrderIntent], Dict[str, Any]],
+                 on_fill: Callable[[OrderIntent, Dict[str, Any]], None],
+                 on_error: Optional[Callable[[OrderIntent, Exception], None]] = None,
+                 error_backoff_sec: float = DEFAULT_ERROR_BACKOFF_SEC):
+        self.place_order = place_order
+        self.on_fill = on_fill
+        self.on_error = on_error
+        self.error_backoff_sec = error_backoff_sec
+        self.in_flight: Optional[OrderIntent] = None
+        self.stats = {"submitted": 0, "filled": 0, "failed": 0, "rejected": 0}
+        self.last_ack_ms = 0.0
+        self._blocked_until = 0.0
+        self._queue: "queue.Queue[Optional[OrderIntent]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def busy(self) -> bool:
+        """True om en order är i luften eller executorn backar efter ett fel."""
+        return self.in_flight is not None or time.monotonic() < self._blocked_until
+
+    def submit(self, intent: OrderIntent) -> bool:
+        """Köa en order. False (och ingen order) om en annan redan väntar."""
+        with self._lock:
+            if self.busy:
+                self.stats["rejected"] += 1
+                return False
+            self.in_flight = intent
+            self._idle.clear()
+            self.stats["submitted"] += 1
+        self._queue.put(intent)
+        return True
+
+    def start(self) -> "OrderExecutor":
+        self._thread = threading.Thread(target=self._run, name="order-executor", daemon=True)
+        self._thread.start()
+        return self
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """Vänta tills ingen order är i luften (t.ex. vid avslut)."""
+        return self._idle.wait(timeout)
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Låt pågående order bli klar och stoppa tråden."""
+        self.wait_idle(timeout)
+        self._queue.put(None)
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        while True:
+            intent = self._queue.get()
+            if intent is None:
+                return
+            intent.sent = time.monotonic()
+            try:
+                resp = self.place_order(intent)
+            except Exception as err:
+                intent.acked = time.monotonic()
+                self.stats["failed"] += 1
+                self._blocked_until = intent.acked + self.error_backoff_sec
+                self._finish(intent, None, err)
+                continue
+            intent.acked = time.monotonic()
+            self.last_ack_ms = (intent.acked - intent.sent) * 1000.0
+            self.stats["filled"] += 1
+            self._finish(intent, resp, None)
+
+    def _finish(self, intent: OrderIntent, resp: Optional[Dict[str, Any]], err: Optional[Exception]) -> None:
+        try:
+            if err is None:
+                self.on_fill(intent, resp)
+            elif self.on_error is not None:
+                self.on_error(intent, err)
+            else:
+                print(f"⚠️ Order {intent.tag} misslyckades: {err}")
+        except Exception as cb_err:
+            print(f"⚠️ Fel i order-callback ({intent.tag}): {cb_err}")
+        finally:
+            with self._lock:
+                self.in_flight = None
+                self._idle.set()
@@ -0,0 +1,427 @@
+"""
+Paper Fan-out – flera strategivarianter på ett och samma prisflöde
+==================================================================
+Breakout-, smart-, reversion-, long only- och adaptive-skripten pollar var
+för sig Binance och har egna PaperBroker/Position/MarkovState. Fem skript
+betyder fem gånger HTTP-trafiken, fem graffönster och fem gånger parsningen –
+och en A/B-jämförelse haltar eftersom varje skript ser lite olika priser.
+
+Här hämtas priset EN gång per poll och delas ut till alla varianter:
+
+    PriceSource  → live (ett REST-anrop per poll) eller replay av en tickfil
+                   (replay.py, samma sampling som --replay i poll-läge)
+    Variant      → ett live-skript laddat som egen modulinstans i egen tråd:
+                   egna globaler (paper, pos, mk ...), egen config, egen
+                   loggkatalog och console.log. get_live_price() läser
+                   variantens kö istället för Binance.
+    Scoreboard   → saldo, position, exits och PnL per variant sida vid sida
+
+Alla varianter får exakt samma följd av (tid, pris); en variant som hinner
+efter buffras i sin kö och kön syns på scoreboarden. Skripten känner igen
+fan-out via attached_variant() vid import och hoppar då över egen sleep,
+graf (Agg, ingen ritning) och egen CLI-tolkning.
+
+Kör:
+    python paper_fanout.py                                     # alla fem, config.json
+    python paper_fanout.py --variant base="Markov adaptive live paper.py" \\
+                           --variant tight="Markov adaptive live paper.py",config_tight.json
+    python paper_fanout.py --replay data/ticks_2025-11-10.csv  # deterministiskt, så fort CPU:n hinner
+
+Loggar: logs/fanout/<variant>/ (orders_paper.csv, console.log ...) och
+logs/fanout/scoreboard.csv.
+"""
+
+import argparse
+import csv
+import importlib.util
+import io
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+from replay import ReplayClock, ReplayFinished, ReplaySession
+
+try:
+    import requests  # python -m pip install requests
+    REQUESTS_AVAILABLE = True
+    NETWORK_ERRORS: Tuple[type, ...] = (requests.exceptions.RequestException,)
+except ImportError:
+    REQUESTS_AVAILABLE = False
+    NETWORK_ERRORS = ()
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+BINANCE_PUBLIC = "https://api.binance.com"
+DEFAULT_SCRIPTS = {
+    "breakout": "Markov breakout live paper.py",
+    "smart": "Markov breakout live paper smart.py",
+    "reversion": "Markov reversion live paper.py",
+    "long_only": "Markov breakout live paper long only.py",
+    "adaptive": "Markov adaptive live paper.py",
+}
+DEFAULT_QUEUE_TICKS = 2000       # så långt får en variant ligga efter innan flödet väntar
+LATENCY_SAMPLES = 4096           # senaste publish → get_price-latenserna per variant
+DEFAULT_SCOREBOARD_SEC = 10.0
+
+_local = threading.local()
+
+
+class FeedClosed(KeyboardInterrupt):
+    """
+    Flödet är slut eller stoppat. Ärver KeyboardInterrupt så att variantens
+    huvudloop avslutas via samma väg som Ctrl+C (sessionssummering, loggar).
+    """
+
+
+def attached_variant() -> Optional["Variant"]:
+    """Varianten som importerar skriptet (None när skriptet körs fristående)."""
+    return getattr(_local, "variant", None)
+
+
+# ----------------------- Variant ---------------------------------------------
+class Variant:
+    """
+    Ett live-skript som egen modulinstans, matad från fan-out-flödet.
+
+    Args:
+        name: Kort namn (katalog under logs/fanout/ och rad på scoreboarden)
+        script: Sökväg till live-skriptet
+        config_path: Variantens config.json
+        log_dir: Variantens loggkatalog
+        symbol: Flödets symbol (skriptets base_symbol måste vara samma)
+        replay: True när flödet är en tickfil (skripten stänger av checkpoint m.m.;
+                warm start är alltid av under fan-out)
+        queue_ticks: Max antal ticks i kön innan flödet väntar på varianten
+    """
+
+    def __init__(self, name: str, script: str, config_path: str, log_dir: str, symbol: str,
+                 replay: bool = False, queue_ticks: int = DEFAULT_QUEUE_TICKS):
+        self.name = name
+        self.script = script
+        self.config_path = config_path
+        self.log_dir = log_dir
+        self.symbol = symbol
+        self.replay = replay
+        self.clock = ReplayClock(0.0, advance_on_sleep=False)  # tiden följer flödets ticks
+        self.module: Any = None
+        self.error: Optional[BaseException] = None
+        self.feed_closed = False  # skriptet har läst flödets slutmarkering
+        self.ticks = 0
+        self.first_ns = self.last_ns = 0  # monotonic_ns för första/senaste lästa tick
+        self.latencies: "deque[int]" = deque(maxlen=LATENCY_SAMPLES)
+        self.last_price: Optional[Decimal] = None
+        self.start_equity: Optional[Decimal] = None
+        self.done = threading.Event()
+        self._queue: "queue.Queue[Optional[Tuple[float, Decimal, Optional[int]]]]" = queue.Queue(maxsize=queue_ticks)
+        self._console: Optional[io.TextIOBase] = None
+        self._thread: Optional[threading.Thread] = None
+
+    # -- skriptets sida (variantens tråd) ------------------------------------
+    def get_price(self, symbol: str) -> Decimal:
+        """Nästa tick ur kön. Ersätter get_live_price() i skriptet."""
+        if symbol != self.symbol:
+            raise SystemExit(f"Variant {self.name} handlar {symbol} men flödet är {self.symbol}")
+        item = self._queue.get()
+        if item is None:
+            self.feed_closed = True
+            raise FeedClosed()
+        ts, price, sent_ns = item
+        self.clock.advance_to(ts)
+        now_ns = time.monotonic_ns()
+        if sent_ns is not None:
+            self.latencies.append(now_ns - sent_ns)
+        if not self.ticks:
+            self.first_ns = now_ns
+        self.last_ns = now_ns
+        self.ticks += 1
+        self.last_price = price
+        if self.start_equity is None:
+            # Första ticken hämtas vid import när paper redan finns → PnL-basen
+            self.start_equity = self._balances()[2]
+        return price
+
+    def _balances(self) -> Tuple[Optional[Decimal], Optional[Decimal], Optional[Decimal]]:
+        """(USDT, bas, värde i USDT) ur skriptets paper-konto."""
+        paper = getattr(self.module, "paper", None)
+        if paper is None or self.last_price is None:
+            return None, None, None
+        balances = dict(paper.balances)
+        base_asset = self.symbol[:-4] if self.symbol.endswith("USDT") else self.symbol[:3]
+        usdt = balances.get("USDT", Decimal("0"))
+        base = balances.get(base_asset, Decimal("0"))
+        return usdt, base, usdt + base * self.last_price
+
+    def _run(self) -> None:
+        _local.variant = self
+        os.makedirs(self.log_dir, exist_ok=True)
+        self._console = open(os.path.join(self.log_dir, "console.log"), "w", encoding="utf-8", buffering=1)
+        try:
+            spec = importlib.util.spec_from_file_location(f"fanout_{self.name}", self.script)
+            module = importlib.util.module_from_spec(spec)
+            self.module = module
+            spec.loader.exec_module(module)  # startpris hämtas redan här (första ticken)
+            module.main()
+            if not self.feed_closed:
+                # main() fångar sina egna fel och returnerar – det är inget normalt slut
+                raise RuntimeError(f"main() avslutades före flödet ({self.backlog} ticks kvar i kön)")
+        except FeedClosed:
+            pass  # flödet tog slut under import – inget att summera
+        except BaseException as err:
+            self.error = err
+            print(f"❌ Variant {self.name} avbröts: {err!r}")
+        finally:
+            self.done.set()
+            self._console.close()
+
+    # -- flödets sida (huvudtråden) ------------------------------------------
+    def start(self) -> "Variant":
+        self._thread = threading.Thread(target=self._run, name=f"variant-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def publish(self, ts: float, price: Decimal, sent_ns: Optional[int] = None) -> None:
+        """
+        Lägg en tick i kön (väntar om varianten ligger queue_ticks efter).
+        sent_ns: monotonic_ns när ticken skickades – latensen mäts när skriptet läser den.
+        """
+        while not self.done.is_set():
+            try:
+                self._queue.put((ts, price, sent_ns), timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def close(self) -> None:
+        while not self.done.is_set():
+            try:
+                self._queue.put(None, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    @property
+    def backlog(self) -> int:
+        return self._queue.qsize()
+
+    # -- scoreboard ----------------------------------------------------------
+    def score(self) -> Dict[str, Any]:
+        """Variantens läge just nu (läses utan lås – bara för visning)."""
+        paper = getattr(self.module, "paper", None)
+        pos = getattr(self.module, "pos", None)
+        row: Dict[str, Any] = {"variant": self.name, "ticks": self.ticks, "backlog": self.backlog,
+                               "side": getattr(pos, "side", "-"), "exits": getattr(paper, "exits", None),
+                               "usdt": None, "base": None, "equity": None, "pnl": None, "pnl_pct": None,
+                               "status": "fel" if self.error else ("klar" if self.done.is_set() else "kör")}
+        usdt, base, equity = self._balances()
+        if equity is None or self.start_equity is None:
+            return row
+        pnl = equity - self.start_equity
+        row.update(usdt=usdt, base=base, equity=equity, pnl=pnl,
+                   pnl_pct=(pnl / self.start_equity * 100) if self.start_equity else Decimal("0"))
+        return row
+
+
+# ----------------------- stdout per variant ----------------------------------
+class VariantStdout:
+    """Utskrifter från en varianttråd går till dess console.log, resten till terminalen."""
+
+    def __init__(self, terminal):
+        self.terminal = terminal
+
+    def write(self, text: str) -> int:
+        variant = getattr(_local, "variant", None)
+        if variant is not None and variant._console is not None and not variant._console.closed:
+            return variant._console.write(text)
+        return self.terminal.write(text)
+
+    def flush(self) -> None:
+        variant = getattr(_local, "variant", None)
+        if variant is not None and variant._console is not None and not variant._console.closed:
+            variant._console.flush()
+        else:
+            self.terminal.flush()
+
+    def __getattr__(self, name: str):
+        return getattr(self.terminal, name)
+
+
+# ----------------------- Prisflöde -------------------------------------------
+class PriceSource:
+    """
+    Ett pris per poll: live via Binance REST, eller ur en tickfil med virtuell klocka.
+
+    Args:
+        symbol: T.ex. BTCUSDT
+        poll_sec: Samplingsintervall (live: väntetid mellan anrop, replay: virtuell tid)
+        replay_path: Tickfil (se replay.py) – None = live
+    """
+
+    def __init__(self, symbol: str, poll_sec: float, replay_path: Optional[str] = None):
+        self.symbol = symbol
+        self.poll_sec = poll_sec
+        self.replay: Optional[ReplaySession] = ReplaySession(replay_path, "poll") if replay_path else None
+        if self.replay is None and not REQUESTS_AVAILABLE:
+            raise SystemExit(
+                "requests saknas. Kör:\n    python -m pip install requests\n"
+                "och starta sedan om skriptet."
+            )
+        self.fetches = 0
+        self._next = 0.0
+
+    def next_tick(self) -> Tuple[float, Decimal]:
+        """(tid, pris) för nästa poll. ReplayFinished när tickfilen är slut."""
+        self.fetches += 1
+        if self.replay is not None:
+            if self.fetches > 1:
+                self.replay.clock.sleep(self.poll_sec)
+            return self.replay.clock.time(), self.replay.get_price(self.symbol)
+        wait = self._next - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        self._next = time.monotonic() + self.poll_sec
+        r = requests.get(f"{BINANCE_PUBLIC}/api/v3/ticker/price", params={"symbol": self.symbol}, timeout=5)
+        r.raise_for_status()
+        return time.time(), Decimal(r.json()["price"])
+
+
+# ----------------------- Scoreboard ------------------------------------------
+def _fmt(value: Any, spec: str) -> str:
+    return "-" if value is None else format(value, spec)
+
+
+def format_scoreboard(rows: List[Dict[str, Any]], price: Optional[Decimal], top: Optional[int] = None) -> str:
+    """Tabell sorterad på PnL (bäst först); top begränsar antalet rader."""
+    lines = [f"🏁 Scoreboard  pris={_fmt(price, '.2f')}  {datetime.now().strftime('%H:%M:%S')}",
+             f"   {'variant':<12}{'pos':>6}{'exits':>7}{'USDT':>12}{'bas':>12}{'värde':>12}{'PnL':>10}{'PnL%':>9}{'ticks':>8}{'kö':>6}  status"]
+    ranked = sorted(rows, key=lambda r: r["pnl"] if r["pnl"] is not None else Decimal("-1e30"), reverse=True)
+    if top is not None and len(ranked) > top:
+        hidden = len(ranked) - top
+        ranked = ranked[:top]
+    else:
+        hidden = 0
+    for r in ranked:
+        lines.append(f"   {r['variant']:<12}{r['side']:>6}{_fmt(r['exits'], 'd'):>7}{_fmt(r['usdt'], '.2f'):>12}"
+                     f"{_fmt(r['base'], '.6f'):>12}{_fmt(r['equity'], '.2f'):>12}{_fmt(r['pnl'], '+.2f'):>10}"
+                     f"{_fmt(r['pnl_pct'], '+.3f'):>9}{r['ticks']:>8}{r['backlog']:>6}  {r['status']}")
+    if hidden:
+        lines.append(f"   ... {hidden} varianter till")
+    return "\n".join(lines)
+
+
+def append_scoreboard_csv(path: str, rows: List[Dict[str, Any]]) -> None:
+    new_file = not os.path.exists(path)
+    with open(path, "a", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        if new_file:
+            w.writerow(["ts", "variant", "ticks", "side", "exits", "usdt", "base", "equity", "pnl_usdt", "pnl_pct", "status"])
+        ts = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        for r in rows:
+            w.writerow([ts, r["variant"], r["ticks"], r["side"], "" if r["exits"] is None else r["exits"],
+                        *("" if r[k] is None else f"{r[k]}" for k in ("usdt", "base", "equity", "pnl")),
+                        "" if r["pnl_pct"] is None else f"{r['pnl_pct']:.4f}", r["status"]])
+
+
+# ----------------------- CLI -------------------------------------------------
+def parse_variant(spec: str) -> Tuple[str, str, Optional[str]]:
+    """"namn=skript.py[,config.json]" → (namn, skript, config)."""
+    name, sep, rest = spec.partition("=")
+    if not sep or not name or not rest:
+        raise argparse.ArgumentTypeError(f"Ogiltig variant: {spec!r} (namn=skript.py[,config.json])")
+    script, _, config = rest.partition(",")
+    return name.strip(), script.strip(), config.strip() or None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Kör flera paper-varianter på ett delat prisflöde.")
+    parser.add_argument("--variant", action="append", type=parse_variant, default=[], metavar="NAMN=SKRIPT[,CONFIG]",
+                        help="Variant att köra (kan upprepas). Default: alla fem paper-skripten med config.json")
+    parser.add_argument("--config", default=os.path.join(ROOT, "config.json"), help="Config för flödet och default för varianterna")
+    parser.add_argument("--replay", metavar="TICKFIL", help="Mata varianterna från en tickfil istället för Binance")
+    parser.add_argument("--poll-sec", type=float, help="Samplingsintervall (default poll_sec i config)")
+    parser.add_argument("--log-dir", default=os.path.join(ROOT, "logs", "fanout"))
+    parser.add_argument("--scoreboard-sec", type=float, default=DEFAULT_SCOREBOARD_SEC)
+    args = parser.parse_args()
+
+    with open(args.config, "r", encoding="utf-8-sig") as f:
+        cfg = json.load(f)
+    symbol = cfg.get("base_symbol", "BTCUSDT")
+    poll_sec = args.poll_sec if args.poll_sec is not None else float(cfg.get("poll_sec", 0.5))
+    specs = args.variant or [(name, script, None) for name, script in DEFAULT_SCRIPTS.items()]
+    if len({name for name, _, _ in specs}) != len(specs):
+        raise SystemExit("Variantnamnen måste vara unika")
+
+    # Ett enda prisflöde, inga graffönster, utskrifter per variant till console.log
+    import matplotlib
+    matplotlib.use("Agg")
+    source = PriceSource(symbol, poll_sec, args.replay)
+    os.makedirs(args.log_dir, exist_ok=True)
+    scoreboard_csv = os.path.join(args.log_dir, "scoreboard.csv")
+    terminal = sys.stdout
+    sys.stdout = VariantStdout(terminal)
+
+    variants = [
+        Variant(name, os.path.join(ROOT, script), os.path.abspath(config or args.config),
+                os.path.join(args.log_dir, name), symbol, replay=source.replay is not None)
+        for name, script, config in specs
+    ]
+    mode = f"replay {source.replay.describe()}" if source.replay else f"live, poll {poll_sec}s"
+    print(f"🔀 Fan-out {symbol} ({mode}) → {len(variants)} varianter: {', '.join(v.name for v in variants)}")
+    print(f"📁 Loggar: {args.log_dir}/<variant>/")
+    for v in variants:
+        v.start()
+
+    wall_start = time.perf_counter()
+    next_board = time.monotonic() + args.scoreboard_sec
+    price: Optional[Decimal] = None
+    try:
+        while not all(v.done.is_set() for v in variants):
+            try:
+                ts, price = source.next_tick()
+            except ReplayFinished:
+                break
+            except NETWORK_ERRORS as ex:
+                print(f"⚠️ Nätverksfel vid prishämtning: {ex}")
+                time.sleep(2.0)
+                continue
+            for v in variants:
+                v.publish(ts, price)
+            if time.monotonic() >= next_board:
+                next_board = time.monotonic() + args.scoreboard_sec
+                rows = [v.score() for v in variants]
+                print(format_scoreboard(rows, price))
+                append_scoreboard_csv(scoreboard_csv, rows)
+    except KeyboardInterrupt:
+        print("\n🛑 Avslutar varianterna...")
+    finally:
+        for v in variants:
+            v.close()
+        for v in variants:
+            v.join(timeout=60)
+        rows = [v.score() for v in variants]
+        print(format_scoreboard(rows, price))
+        append_scoreboard_csv(scoreboard_csv, rows)
+        wall = time.perf_counter() - wall_start
+        print(f"📡 {source.fetches} prishämtningar delade av {len(variants)} varianter på {wall:.1f}s")
+        if source.replay:
+            print(source.replay.speed_report())
+        for v in variants:
+            if v.error is not None:
+                print(f"❌ {v.name}: {v.error!r} (se {os.path.join(v.log_dir, 'console.log')})")
+        sys.stdout = terminal
+
+
+if __name__ == "__main__":
+    # Kör via modulnamnet: skripten importerar paper_fanout och måste se samma
+    # trådlokala variant som huvudprogrammet (inte en separat __main__-kopia)
+    import paper_fanout
+    paper_fanout.main()
@@ -0,0 +1,322 @@
+"""
+Paper Farm – hundratals config-varianter över alla kärnor
+=========================================================
+paper_fanout.py kör varianterna som trådar i en process. Farmen skalar ut:
+
+    matare (huvudprocessen)  → hämtar priset EN gång per poll (live/replay,
+                               samma PriceSource som fan-out) och skriver
+                               det till en PriceRing i delat minne
+    arbetare × N (processer) → läser ringen (ingen egen nätverks-I/O) och
+                               matar sin batch av Variant-instanser
+    aggregering              → arbetarna skickar scoreboard-rader via en
+                               multiprocessing.Queue; huvudprocessen visar
+                               topplistan och skriver farm_results.csv
+
+Varianterna är configs för adaptive-skriptet (eller --script) byggda ur en
+bas-config plus överskrivningar, antingen som rutnät eller som en lista:
+
+    python paper_farm.py --grid tp_pct=0.001,0.0015,0.002 --grid loss_pause_cnt=2,3,4
+    python paper_farm.py --spec farm.json --workers 8 --replay data/ticks_2025-11-10.csv
+
+    farm.json: {"grid": {"tp_pct": [0.001, 0.002]},
+                "variants": {"wide": {"tp_pct": 0.004, "poll_sec": 1.0}}}
+
+Loggar: logs/farm/<variant>/ (config.json utan API-nycklar, orders_paper.csv,
+console.log ...), logs/farm/farm_results.csv och farm_workers.csv med
+ticks/s och fan-out-latens (skriven i ringen → läst av variantens skript)
+per arbetare, båda räknade på tickar som varianterna faktiskt bearbetat.
+Vid replay ligger mataren upp till en ring och en variantkö före, så
+latensen där är kölängd; ringens egen latens mäts i benchmarks.py
+(ring_latency_w{N}).
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import multiprocessing as mp
+import os
+import queue
+import sys
+import time
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+from paper_fanout import (DEFAULT_SCRIPTS, PriceSource, Variant, VariantStdout, NETWORK_ERRORS,
+                          format_scoreboard)
+from price_ring import DEFAULT_CAPACITY, MAX_READERS, PriceRing
+from replay import ReplayFinished
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SCRIPT = DEFAULT_SCRIPTS["adaptive"]
+DEFAULT_SCOREBOARD_SEC = 10.0
+DEFAULT_TOP = 10
+SECRET_KEYS = ("api_key", "api_secret")
+
+
+# ----------------------- Configs ---------------------------------------------
+def parse_value(text: str) -> Any:
+    """"0.001" → 0.001, "true" → True, annat → strängen."""
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def expand_variants(grid: Dict[str, List[Any]], listed: Dict[str, Dict[str, Any]]) -> List[Tuple[str, Dict[str, Any]]]:
+    """Rutnätets kartesiska produkt (c000, c001 ...) följt av namngivna varianter."""
+    variants: List[Tuple[str, Dict[str, Any]]] = []
+    if grid:
+        keys = list(grid)
+        for i, values in enumerate(itertools.product(*(grid[k] for k in keys))):
+            variants.append((f"c{i:03d}", dict(zip(keys, values))))
+    variants.extend((name, dict(overrides)) for name, overrides in listed.items())
+    return variants or [("base", {})]
+
+
+def write_variant_config(base_cfg: Dict[str, Any], overrides: Dict[str, Any], log_dir: str) -> str:
+    """Bas-config + överskrivningar till <log_dir>/config.json. API-nycklarna följer inte med."""
+    cfg = {k: v for k, v in base_cfg.items() if k not in SECRET_KEYS}
+    cfg.update(overrides)
+    os.makedirs(log_dir, exist_ok=True)
+    path = os.path.join(log_dir, "config.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(cfg, f, indent=2)
+    return path
+
+
+def format_params(overrides: Dict[str, Any]) -> str:
+    return ", ".join(f"{k}={v}" for k, v in overrides.items()) or "(bas)"
+
+
+# ----------------------- Arbetare --------------------------------------------
+def _percentile_us(samples: List[int], pct: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))] / 1000.0
+
+
+def run_worker(ring_name: str, index: int, specs: List[Tuple[str, str, str, str]], symbol: str,
+               replay: bool, results: "mp.Queue", report_sec: float) -> None:
+    """
+    En arbetarprocess: läs ringen och dela ut varje tick till sina varianter.
+    specs: (namn, skript, config, loggkatalog) per variant.
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    sys.stdout = VariantStdout(sys.stdout)
+    reader = PriceRing.attach(ring_name).reader(index)
+    variants = [Variant(name, script, config, log_dir, symbol, replay=replay)
+                for name, script, config, log_dir in specs]
+    for v in variants:
+        v.start()
+    next_report = time.monotonic() + report_sec
+
+    def stats() -> Dict[str, Any]:
+        # Räknat på när skripten läst tickarna (get_price), inte när de lades i köerna:
+        # ticks = lästa av alla felfria varianter, latens = skriven i ringen → läst
+        measured = [v for v in variants if v.error is None and v.ticks]
+        ticks = min((v.ticks for v in measured), default=0)
+        span = (max(v.last_ns for v in measured) - min(v.first_ns for v in measured)) / 1e9 if measured else 0.0
+        samples = [ns for v in measured for ns in list(v.latencies)]
+        return {"worker": index, "variants": len(variants), "ticks": ticks,
+                "ticks_per_sec": ticks / span if span > 0 else 0.0,
+                "lost": reader.stats["lost"], "latency_p50_us": _percentile_us(samples, 0.50),
+                "latency_p99_us": _percentile_us(samples, 0.99),
+                "latency_max_us": max(samples) / 1000.0 if samples else None}
+
+    try:
+        while not all(v.done.is_set() for v in variants):
+            tick = reader.next(timeout=0.5)
+            if tick is not None:
+                ts, price, written_ns = tick
+                for v in variants:
+                    v.publish(ts, price, sent_ns=written_ns)
+            elif reader.finished:
+                break
+            if time.monotonic() >= next_report:
+                next_report = time.monotonic() + report_sec
+                results.put(("score", index, [v.score() for v in variants], stats()))
+    except KeyboardInterrupt:
+        pass  # Ctrl+C når hela processgruppen – avsluta varianterna nedan
+    finally:
+        reader.detach()  # matningen ska inte vänta på oss medan varianterna avslutas
+        for v in variants:
+            v.close()
+        for v in variants:
+            v.join(timeout=60)
+        errors = {v.name: repr(v.error) for v in variants if v.error is not None}
+        results.put(("done", index, [v.score() for v in variants], dict(stats(), errors=errors)))
+
+
+# ----------------------- Resultat --------------------------------------------
+def write_results(path: str, rows: List[Dict[str, Any]], params: Dict[str, Dict[str, Any]]) -> None:
+    keys = sorted({k for p in params.values() for k in p})
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["variant", *keys, "ticks", "side", "exits", "equity", "pnl_usdt", "pnl_pct", "status"])
+        for r in sorted(rows, key=lambda r: r["pnl"] if r["pnl"] is not None else Decimal("-1e30"), reverse=True):
+            p = params.get(r["variant"], {})
+            w.writerow([r["variant"], *(p.get(k, "") for k in keys), r["ticks"], r["side"],
+                        "" if r["exits"] is None else r["exits"],
+                        *("" if r[k] is None else f"{r[k]}" for k in ("equity", "pnl")),
+                        "" if r["pnl_pct"] is None else f"{r['pnl_pct']:.4f}", r["status"]])
+
+
+def write_worker_stats(path: str, stats: List[Dict[str, Any]]) -> None:
+    cols = ["worker", "variants", "ticks", "ticks_per_sec", "lost", "latency_p50_us", "latency_p99_us", "latency_max_us"]
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(cols)
+        for s in sorted(stats, key=lambda s: s["worker"]):
+            w.writerow(["" if s.get(c) is None else s[c] for c in cols])
+
+
+def print_worker_stats(stats: List[Dict[str, Any]]) -> None:
+    for s in sorted(stats, key=lambda s: s["worker"]):
+        p50 = "-" if s["latency_p50_us"] is None else f"{s['latency_p50_us']:.0f}"
+        p99 = "-" if s["latency_p99_us"] is None else f"{s['latency_p99_us']:.0f}"
+        print(f"   arbetare {s['worker']}: {s['variants']} varianter, {s['ticks']} ticks "
+              f"({s['ticks_per_sec']:,.0f}/s), tappade {s['lost']}, fan-out p50={p50} µs p99={p99} µs")
+
+
+# ----------------------- Matare / CLI ----------------------------------------
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Kör många config-varianter i flera processer på ett delat prisflöde.")
+    parser.add_argument("--script", default=DEFAULT_SCRIPT, help="Skript som varianterna kör (default adaptive)")
+    parser.add_argument("--config", default=os.path.join(ROOT, "config.json"), help="Bas-config (flöde + varianter)")
+    parser.add_argument("--grid", action="append", default=[], metavar="NYCKEL=V1,V2,...",
+                        help="Config-nyckel och värden att svepa (kan upprepas → kartesisk produkt)")
+    parser.add_argument("--spec", help='JSON med {"grid": {...}, "variants": {namn: {...}}}')
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--replay", metavar="TICKFIL", help="Mata farmen från en tickfil istället för Binance")
+    parser.add_argument("--poll-sec", type=float, help="Samplingsintervall (default poll_sec i config)")
+    parser.add_argument("--capacity", type=int, default=DEFAULT_CAPACITY, help="Ticks i ringbufferten")
+    parser.add_argument("--log-dir", default=os.path.join(ROOT, "logs", "farm"))
+    parser.add_argument("--scoreboard-sec", type=float, default=DEFAULT_SCOREBOARD_SEC)
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP, help="Rader i topplistan")
+    args = parser.parse_args()
+
+    with open(args.config, "r", encoding="utf-8-sig") as f:
+        base_cfg = json.load(f)
+    grid: Dict[str, List[Any]] = {}
+    listed: Dict[str, Dict[str, Any]] = {}
+    if args.spec:
+        with open(args.spec, "r", encoding="utf-8-sig") as f:
+            spec = json.load(f)
+        grid.update(spec.get("grid", {}))
+        listed.update(spec.get("variants", {}))
+    for item in args.grid:
+        key, sep, values = item.partition("=")
+        if not sep or not values:
+            raise SystemExit(f"Ogiltigt --grid: {item!r} (nyckel=v1,v2,...)")
+        grid[key.strip()] = [parse_value(v.strip()) for v in values.split(",")]
+    configs = expand_variants(grid, listed)
+
+    symbol = base_cfg.get("base_symbol", "BTCUSDT")
+    poll_sec = args.poll_sec if args.poll_sec is not None else float(base_cfg.get("poll_sec", 0.5))
+    workers = max(1, min(args.workers, len(configs), MAX_READERS))
+    script = os.path.join(ROOT, args.script)
+    params = {name: overrides for name, overrides in configs}
+    specs = []
+    for name, overrides in configs:
+        log_dir = os.path.join(args.log_dir, name)
+        specs.append((name, script, write_variant_config(base_cfg, overrides, log_dir), log_dir))
+    batches = [specs[i::workers] for i in range(workers)]
+
+    source = PriceSource(symbol, poll_sec, args.replay)
+    replay = source.replay is not None
+    ring = PriceRing.create(capacity=args.capacity, readers=workers)
+    results: "mp.Queue" = mp.Queue()
+    procs = [mp.Process(target=run_worker, name=f"farm-worker-{i}",
+                        args=(ring.name, i, batch, symbol, replay, results, args.scoreboard_sec))
+             for i, batch in enumerate(batches)]
+    mode = f"replay {source.replay.describe()}" if replay else f"live, poll {poll_sec}s"
+    print(f"🚜 Farm {symbol} ({mode}): {len(configs)} varianter av {os.path.basename(script)} på {workers} arbetare")
+    print(f"📁 Loggar: {args.log_dir}/<variant>/")
+    for p in procs:
+        p.start()
+
+    latest: Dict[str, Dict[str, Any]] = {}
+    worker_stats: Dict[int, Dict[str, Any]] = {}
+    finished: set = set()
+
+    def drain(timeout: Optional[float] = None) -> None:
+        """Ta hand om arbetarnas meddelanden; timeout = vänta på det första."""
+        while True:
+            try:
+                kind, index, rows, stats = results.get(timeout=timeout) if timeout else results.get_nowait()
+            except queue.Empty:
+                return
+            timeout = None
+            for r in rows:
+                latest[r["variant"]] = r
+            worker_stats[index] = stats
+            if kind == "done":
+                finished.add(index)
+                ring.drop_reader(index)
+
+    def drop_dead_workers() -> None:
+        for i, p in enumerate(procs):
+            if p.exitcode is not None and i not in finished:
+                print(f"❌ Arbetare {i} avslutades oväntat (exitcode {p.exitcode})")
+                finished.add(i)
+                ring.drop_reader(i)
+
+    wall_start = time.perf_counter()
+    next_board = time.monotonic() + args.scoreboard_sec
+    price: Optional[Decimal] = None
+    try:
+        while len(finished) < workers:
+            try:
+                ts, price = source.next_tick()
+            except ReplayFinished:
+                break
+            except NETWORK_ERRORS as ex:
+                print(f"⚠️ Nätverksfel vid prishämtning: {ex}")
+                time.sleep(2.0)
+                continue
+            if replay:
+                # Mottryck: den långsammaste arbetaren ska inte köras över
+                while not ring.wait_for_readers(timeout=0.5):
+                    drain()
+                    drop_dead_workers()
+            ring.write(ts, price)
+            drain()
+            if time.monotonic() >= next_board:
+                next_board = time.monotonic() + args.scoreboard_sec
+                drop_dead_workers()
+                print(format_scoreboard(list(latest.values()), price, top=args.top))
+    except KeyboardInterrupt:
+        print("\n🛑 Avslutar farmen...")
+    finally:
+        ring.close_feed()
+        while len(finished) < workers:
+            drain(timeout=1.0)
+            drop_dead_workers()
+        for p in procs:
+            p.join(timeout=10)
+        ring.close()
+
+        rows = list(latest.values())
+        print(format_scoreboard(rows, price, top=args.top))
+        ranked = sorted(rows, key=lambda r: r["pnl"] if r["pnl"] is not None else Decimal("-1e30"), reverse=True)
+        for r in ranked[:args.top]:
+            print(f"   {r['variant']}: {format_params(params.get(r['variant'], {}))}")
+        os.makedirs(args.log_dir, exist_ok=True)
+        write_results(os.path.join(args.log_dir, "farm_results.csv"), rows, params)
+        write_worker_stats(os.path.join(args.log_dir, "farm_workers.csv"), list(worker_stats.values()))
+        wall = time.perf_counter() - wall_start
+        print(f"📡 {source.fetches} prishämtningar delade av {len(configs)} varianter i {workers} processer på {wall:.1f}s")
+        print_worker_stats(list(worker_stats.values()))
+        if source.replay:
+            print(source.replay.speed_report())
+        for s in worker_stats.values():
+            for name, err in (s.get("errors") or {}).items():
+                print(f"❌ {name}: {err} (se {os.path.join(args.log_dir, name, 'console.log')})")
+        print(f"💾 Resultat: {os.path.join(args.log_dir, 'farm_results.csv')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""
+Performance Tracker – löpande strategi-metrics i O(1) per trade
+===============================================================
+Delas av "Strategy optimizer.py" (backtest/grid search) och paper-skriptens
+do_exit(). Tidigare räknade calculate_metrics() om allt ur hela trades-listan
+och equity-kurvan vid varje anrop; nu uppdaterar add_trade() ackumulatorer
+och calculate_metrics() läser bara av dem:
+
+    antal/wins/losses   räknare per sida och utfall
+    brutto vinst/förlust summor → avg_win, avg_loss, profit factor
+    Sharpe              Welford (löpande medel + M2) över trade-returns
+    drawdown            löpande topp och största fall från toppen (USD)
+    streaks             nuvarande + längsta vinst-/förlustsvit
+    duration            summa → medel
+
+keep_history=False sparar inte trades/equity-kurvan alls (live: konstant
+minne); to_dict()/load_dict() gör trackern checkpoint-vänlig.
+
+    tracker = PerformanceTracker(10000, keep_history=False)
+    tracker.add_trade(trade)
+    metrics = tracker.calculate_metrics()    # O(1)
+"""
+
+import math
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+SHARPE_ANNUALIZATION = 252 ** 0.5
+
+
+@dataclass
+class TradeResult:
+    """Resultat från en enskild trade"""
+    entry_time: str
+    exit_time: str
+    side: str  # "LONG" / "SHORT"
+    entry_price: Decimal
+    exit_price: Decimal
+    qty: Decimal
+    pnl_pct: float
+    pnl_usd: float
+    exit_reason: str  # "TP" / "BE" / "SL" / "TRAILING"
+    duration_sec: float
+
+@dataclass
+class StrategyMetrics:
+    """Prestanda-metrics för en strategi-konfiguration"""
+    # Parametrar som testades
+    params: Dict[str, Any]
+
+    # Resultat
+    total_trades: int
+    long_trades: int
+    short_trades: int
+
+    wins: int
+    losses: int
+    win_rate: float
+
+    total_pnl_usd: float
+    total_pnl_pct: float
+    avg_win: float
+    avg_loss: float
+
+    largest_win: float
+    largest_loss: float
+
+    max_drawdown_pct: float
+    max_drawdown_usd: float
+
+    sharpe_ratio: float
+    profit_factor: float
+
+    avg_trade_duration_sec: float
+
+    start_capital: float
+    end_capital: float
+    roi_pct: float
+
+    longest_win_streak: int = 0
+    longest_loss_streak: int = 0
+
+    # Avbruten i förtid av optimizerns pruning (metrics gäller då bara fram till pruned_at)
+    pruned: bool = False
+    pruned_at: float = 1.0  # andel av datat som hann köras
+    prune_reason: str = ""
+
+class PerformanceTracker:
+    """
+    Spårar prestanda under backtest/live trading.
+
+    Args:
+        start_capital: Kapital före första traden
+        keep_history: Spara trades och equity-kurvan (behövs inte för metrics)
+    """
+
+    def __init__(self, start_capital: float, keep_history: bool = True):
+        self.start_capital = start_capital
+        self.current_capital = start_capital
+        self.peak_capital = start_capital
+        self.keep_history = keep_history
+
+        self.trades: List[TradeResult] = []
+        self.equity_curve: List[float] = [start_capital]
+
+        self.total_trades = 0
+        self.long_trades = 0
+        self.short_trades = 0
+        self.wins = 0
+        self.gross_win = 0.0
+        self.gross_loss = 0.0  # summa av pnl_usd <= 0 (negativ eller 0)
+        self.total_pnl_usd = 0.0
+        self.largest_win = -math.inf
+        self.largest_loss = math.inf
+        self.max_drawdown_usd = 0.0
+        self.duration_sum = 0.0
+        # Welford över pnl_pct
+        self.return_mean = 0.0
+        self.return_m2 = 0.0
+        # Streaks (>0 = vinster i rad, <0 = förluster i rad)
+        self.streak = 0
+        self.longest_win_streak = 0
+        self.longest_loss_streak = 0
+
+    def add_trade(self, trade: TradeResult):
+        """Lägg till en trade och uppdatera metrics"""
+        if self.keep_history:
+            self.trades.append(trade)
+        pnl = trade.pnl_usd
+
+        # Uppdatera kapital
+        self.current_capital += pnl
+        if self.keep_history:
+            self.equity_curve.append(self.current_capital)
+
+        # Uppdatera peak och drawdown
+        if self.current_capital > self.peak_capital:
+            self.peak_capital = self.current_capital
+        drawdown = self.peak_capital - self.current_capital
+        if drawdown > self.max_drawdown_usd:
+            self.max_drawdown_usd = drawdown
+
+        self.total_trades += 1
+        if trade.side == "LONG":
+            self.long_trades += 1
+        elif trade.side == "SHORT":
+            self.short_trades += 1
+        self.total_pnl_usd += pnl
+        self.duration_sum += trade.duration_sec
+        self.largest_win = max(self.largest_win, pnl)
+        self.largest_loss = min(self.largest_loss, pnl)
+
+        if pnl > 0:
+            self.wins += 1
+            self.gross_win += pnl
+            self.streak = self.streak + 1 if self.streak > 0 else 1
+            self.longest_win_streak = max(self.longest_win_streak, self.streak)
+        else:
+            self.gross_loss += pnl
+            self.streak = self.streak - 1 if self.streak < 0 else -1
+            self.longest_loss_streak = max(self.longest_loss_streak, -self.streak)
+
+        delta = trade.pnl_pct - self.return_mean
+        self.return_mean += delta / self.total_trades
+        self.return_m2 += delta * (trade.pnl_pct - self.return_mean)
+
+    @property
+    def losses(self) -> int:
+        return self.total_trades - self.wins
+
+    @property
+    def sharpe_ratio(self) -> float:
+        """Sharpe (förenklad – trade returns, sample-std, ×√252)"""
+        if self.total_trades < 2:
+            return 0.0
+        std_return = math.sqrt(self.return_m2 / (self.total_trades - 1))
+        return (self.return_mean / std_return * SHARPE_ANNUALIZATION) if std_return > 0 else 0.0
+
+    @property
+    def profit_factor(self) -> float:
+        total_losses = abs(self.gross_loss)
+        return self.gross_win / total_losses if total_losses > 0 else float('inf')
+
+    def calculate_metrics(self, params: Optional[Dict[str, Any]] = None) -> StrategyMetrics:
+        """Alla performance metrics ur ackumulatorerna (O(1))"""
+        params = params if params is not None else {}
+        n = self.total_trades
+        if not n:
+            return StrategyMetrics(
+                params=params,
+                total_trades=0, long_trades=0, short_trades=0,
+                wins=0, losses=0, win_rate=0.0,
+                total_pnl_usd=0.0, total_pnl_pct=0.0,
+                avg_win=0.0, avg_loss=0.0,
+                largest_win=0.0, largest_loss=0.0,
+                max_drawdown_pct=0.0, max_drawdown_usd=0.0,
+                sharpe_ratio=0.0, profit_factor=0.0,
+                avg_trade_duration_sec=0.0,
+                start_capital=self.start_capital,
+                end_capital=self.current_capital,
+                roi_pct=0.0
+            )
+
+        losses = self.losses
+        roi_pct = ((self.current_capital - self.start_capital) / self.start_capital) * 100
+        return StrategyMetrics(
+            params=params,
+            total_trades=n,
+            long_trades=self.long_trades,
+            short_trades=self.short_trades,
+            wins=self.wins,
+            losses=losses,
+            win_rate=self.wins / n,
+            total_pnl_usd=self.total_pnl_usd,
+            total_pnl_pct=(self.current_capital / self.start_capital - 1) * 100,
+            avg_win=self.gross_win / self.wins if self.wins else 0.0,
+            avg_loss=self.gross_loss / losses if losses else 0.0,
+            largest_win=self.largest_win,
+            largest_loss=self.largest_loss,
+            # Relativt den högsta toppen hittills (som den gamla omräkningen)
+            max_drawdown_pct=(self.max_drawdown_usd / self.peak_capital * 100) if self.peak_capital > 0 else 0.0,
+            max_drawdown_usd=self.max_drawdown_usd,
+            sharpe_ratio=self.sharpe_ratio,
+            profit_factor=self.profit_factor,
+            avg_trade_duration_sec=self.duration_sum / n,
+            start_capital=self.start_capital,
+            end_capital=self.current_capital,
+            roi_pct=roi_pct,
+            longest_win_streak=self.longest_win_streak,
+            longest_loss_streak=self.longest_loss_streak,
+        )
+
+    # ----------------------- checkpoint ---------------------------------------
+    _INT_FIELDS = ("total_trades", "long_trades", "short_trades", "wins",
+                   "streak", "longest_win_streak", "longest_loss_streak")
+    _FLOAT_FIELDS = ("start_capital", "current_capital", "peak_capital", "gross_win", "gross_loss",
+                     "total_pnl_usd", "largest_win", "largest_loss", "max_drawdown_usd",
+                     "duration_sum", "return_mean", "return_m2")
+    _STATE_FIELDS = _INT_FIELDS + _FLOAT_FIELDS
+
+    def to_dict(self) -> Dict[str, object]:
+        """Ackumulatorerna (inte historiken) – räcker för att fortsätta efter --resume"""
+        data = {name: getattr(self, name) for name in self._STATE_FIELDS}
+        if not self.total_trades:
+            data["largest_win"] = data["largest_loss"] = None  # ±inf är inte giltig JSON
+        return data
+
+    def load_dict(self, data: Dict[str, object]) -> None:
+        for name in self._INT_FIELDS:
+            if data.get(name) is not None:
+                setattr(self, name, int(data[name]))
+        for name in self._FLOAT_FIELDS:
+            if data.get(name) is not None:
+                setattr(self, name, float(data[name]))
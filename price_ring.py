@@ -0,0 +1,240 @@
+"""
+Price Ring – tickflöde i delat minne mellan processer
+=====================================================
+paper_fanout.py kör varianter som trådar i en process; GIL:en sätter taket
+vid några tiotal adaptive-varianter. För en farm med hundratals configs över
+alla kärnor skriver en matarprocess varje tick EN gång till en ringbuffert i
+multiprocessing.shared_memory, och varje arbetarprocess läser den utan egen
+nätverks-I/O (se paper_farm.py).
+
+Layout (int64-ord):
+
+    header   magic, kapacitet, seq (antal skrivna ticks), stängd,
+             läsarposition × MAX_READERS (-1 = ingen läsare)
+    slot i   ts (float64), koefficient, exponent, skriven_ns (monotonic)
+
+Priset lagras som (koefficient, exponent) → exakt samma Decimal som matades
+in (95003.64 förblir 95003.64, ingen float-avrundning).
+
+Protokoll (en skrivare, många läsare):
+    skrivare  fyll slot[seq % kapacitet], öka sedan seq
+    läsare    läs slot[pos % kapacitet] om pos < seq, kontrollera efteråt att
+              skrivaren inte hunnit börja skriva över slotten (annars
+              överkörd: hoppa fram och räkna tappade ticks), spara pos
+    mottryck  lag() = seq - långsammaste läsarens pos. Vid replay väntar
+              mataren tills lag() < kapacitet - 1; live väntar den aldrig
+              (en läsare som inte hänger med tappar ticks istället)
+
+    ring = PriceRing.create(capacity=65536, readers=4)
+    ring.write(ts, price)                      # matarprocessen
+    reader = PriceRing.attach(ring.name).reader(0)
+    tick = reader.next(timeout=1.0)            # (ts, pris, skriven_ns) eller None
+"""
+
+import time
+from decimal import Decimal
+from multiprocessing import shared_memory
+from typing import Dict, Optional, Tuple
+
+MAGIC = 0x50524E47  # "PRNG"
+MAX_READERS = 64
+DEFAULT_CAPACITY = 1 << 16
+DEFAULT_SPIN_SLEEP_SEC = 0.0002
+_MAGIC, _CAPACITY, _SEQ, _CLOSED = 0, 1, 2, 3
+_READERS = 4
+_HEADER_WORDS = _READERS + MAX_READERS
+_SLOT_WORDS = 4
+_TS, _COEF, _EXP, _WRITTEN = 0, 1, 2, 3
+
+
+def encode_price(price: Decimal) -> Tuple[int, int]:
+    """Decimal → (koefficient, exponent) utan avrundning."""
+    sign, digits, exponent = price.as_tuple()
+    coef = int("".join(map(str, digits))) if digits else 0
+    return (-coef if sign else coef), int(exponent)
+
+
+def decode_price(coef: int, exponent: int) -> Decimal:
+    return Decimal(coef).scaleb(exponent)
+
+
+class PriceRing:
+    """
+    Ringbuffert av (ts, pris) i delat minne. Skapas av matarprocessen med
+    create() och öppnas av arbetarna med attach(name).
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool):
+        self.shm = shm
+        self.owner = owner
+        self.name = shm.name
+        self._q = shm.buf.cast("q")
+        self._d = shm.buf.cast("d")
+        if self._q[_MAGIC] != MAGIC:
+            raise ValueError(f"{shm.name} är ingen PriceRing")
+        self.capacity = int(self._q[_CAPACITY])
+
+    @classmethod
+    def create(cls, capacity: int = DEFAULT_CAPACITY, readers: int = 0,
+               name: Optional[str] = None) -> "PriceRing":
+        """Ny ring. readers läsarplatser (0..readers-1) registreras direkt så
+        att matningen kan börja innan arbetarna hunnit starta."""
+        if not 0 <= readers <= MAX_READERS:
+            raise ValueError(f"readers måste vara 0..{MAX_READERS}")
+        size = (_HEADER_WORDS + capacity * _SLOT_WORDS) * 8
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        q = shm.buf.cast("q")
+        q[_CAPACITY] = capacity
+        q[_SEQ] = 0
+        q[_CLOSED] = 0
+        for i in range(MAX_READERS):
+            q[_READERS + i] = 0 if i < readers else -1
+        q[_MAGIC] = MAGIC
+        q.release()
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name: str) -> "PriceRing":
+        """Öppna en befintlig ring (arbetarprocesser startade med multiprocessing)."""
+        return cls(shared_memory.SharedMemory(name=name, create=False), owner=False)
+
+    # ----------------------- skrivare -----------------------------------------
+    @property
+    def seq(self) -> int:
+        return int(self._q[_SEQ])
+
+    def write(self, ts: float, price: Decimal) -> int:
+        """Skriv en tick (väntar aldrig – se lag()/wait_for_readers()). Returnerar dess seq."""
+        seq = self._q[_SEQ]
+        base = _HEADER_WORDS + (seq % self.capacity) * _SLOT_WORDS
+        coef, exponent = encode_price(price)
+        self._d[base + _TS] = ts
+        self._q[base + _COEF] = coef
+        self._q[base + _EXP] = exponent
+        self._q[base + _WRITTEN] = time.monotonic_ns()
+        self._q[_SEQ] = seq + 1  # publicera sist
+        return seq
+
+    def lag(self) -> int:
+        """Ticks som den långsammaste registrerade läsaren ligger efter (0 utan läsare)."""
+        seq = self._q[_SEQ]
+        positions = [p for p in self._q[_READERS:_READERS + MAX_READERS] if p >= 0]
+        return seq - min(positions) if positions else 0
+
+    def wait_for_readers(self, max_lag: Optional[int] = None, timeout: Optional[float] = None,
+                         spin_sleep: float = DEFAULT_SPIN_SLEEP_SEC) -> bool:
+        """
+        Mottryck vid replay: vänta tills lag() < max_lag. Default kapaciteten - 1:
+        efter nästa write ligger den långsammaste läsaren fortfarande inom ett varv.
+        False vid timeout.
+        """
+        limit = self.capacity - 1 if max_lag is None else max_lag
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.lag() >= limit:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(spin_sleep)
+        return True
+
+    def drop_reader(self, index: int) -> None:
+        """Avregistrera en läsare (t.ex. en arbetare som dött) så att den inte håller tillbaka matningen."""
+        self._q[_READERS + index] = -1
+
+    def close_feed(self) -> None:
+        """Inga fler ticks: läsarna får None när de läst ikapp."""
+        self._q[_CLOSED] = 1
+
+    @property
+    def closed(self) -> bool:
+        return bool(self._q[_CLOSED])
+
+    # ----------------------- läsare -------------------------------------------
+    def reader(self, index: int, from_start: bool = True) -> "RingReader":
+        return RingReader(self, index, from_start)
+
+    def close(self) -> None:
+        """Släpp mappningen; skaparen tar även bort segmentet."""
+        self._q.release()
+        self._d.release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class RingReader:
+    """
+    En läsares position i ringen (läsarplats index i headern).
+
+    Args:
+        ring: Öppnad PriceRing
+        index: Läsarplats 0..MAX_READERS-1 (unik per process)
+        from_start: Börja från seq 0 (default, alla läsare ser samma följd)
+                    eller från nuvarande seq (bara nya ticks)
+    """
+
+    def __init__(self, ring: PriceRing, index: int, from_start: bool = True):
+        if not 0 <= index < MAX_READERS:
+            raise ValueError(f"Läsarindex måste vara 0..{MAX_READERS - 1}")
+        self.ring = ring
+        self.index = index
+        self._q = ring._q
+        self._d = ring._d
+        self._slot = _READERS + index
+        self.pos = 0 if from_start else ring.seq
+        self._q[self._slot] = self.pos
+        self.stats: Dict[str, int] = {"read": 0, "lost": 0, "waits": 0}
+
+    def poll(self) -> Optional[Tuple[float, Decimal, int]]:
+        """Nästa tick om en finns, annars None (väntar inte)."""
+        q = self._q
+        capacity = self.ring.capacity
+        while True:
+            seq = q[_SEQ]
+            if self.pos >= seq:
+                return None
+            if seq - self.pos >= capacity:
+                # Överkörd: äldsta slot som säkert är orörd är seq - kapacitet + 1
+                skip_to = seq - capacity + 1
+                self.stats["lost"] += skip_to - self.pos
+                self.pos = skip_to
+            base = _HEADER_WORDS + (self.pos % capacity) * _SLOT_WORDS
+            ts = self._d[base + _TS]
+            coef = q[base + _COEF]
+            exponent = q[base + _EXP]
+            written = q[base + _WRITTEN]
+            # Har skrivaren hunnit börja på samma slot ett varv senare?
+            if q[_SEQ] - self.pos >= capacity:
+                continue
+            self.pos += 1
+            q[self._slot] = self.pos
+            self.stats["read"] += 1
+            return ts, decode_price(coef, exponent), written
+
+    @property
+    def finished(self) -> bool:
+        """Matningen är stängd och allt är läst."""
+        return self.ring.closed and self.pos >= self.ring.seq
+
+    def next(self, timeout: Optional[float] = None,
+             spin_sleep: float = DEFAULT_SPIN_SLEEP_SEC) -> Optional[Tuple[float, Decimal, int]]:
+        """
+        Nästa tick; väntar tills den finns. None när matningen är stängd och
+        allt är läst, eller vid timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            tick = self.poll()
+            if tick is not None:
+                return tick
+            if self.finished:
+                return None
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            self.stats["waits"] += 1
+            time.sleep(spin_sleep)
+
+    def detach(self) -> None:
+        """Släpp läsarplatsen (matningen väntar inte längre på oss) och mappningen."""
+        self.ring.drop_reader(self.index)
+        self._q = self._d = None
+        self.ring.close()
@@ -0,0 +1,198 @@
+"""
+Replay – deterministisk körning av live-skripten mot inspelade ticks
+====================================================================
+Live-skripten läser tid via en injicerbar klocka istället för time.time():
+
+    SystemClock  → riktig tid (live/paper)
+    ReplayClock  → virtuell tid; sleep() flyttar bara klockan framåt
+
+Med ReplaySession matas en inspelad tickfil genom exakt samma kodväg som live
+(get_live_price → maybe_exit/maybe_enter → do_exit ...) så snabbt CPU:n hinner.
+Samma tickfil + samma config ger bit-identiska loggar mellan körningar.
+
+Tickfiler:
+    .ttk-inspelning från tick_recorder.py (fil eller katalog), eller
+    CSV med header där första kolumnen är tid i ms (ts/timestamp/open_time) och
+    priset ligger i kolumnen price/last/close (annars andra kolumnen).
+
+Lägen:
+    poll  → som live: varje prisanrop ger senaste tick <= klockan, och loopens
+            sleep() avgör samplingen (default, motsvarar riktig polling)
+    tick  → varje prisanrop ger nästa tick och klockan hoppar till dess tid
+
+Kör:
+    python "Markov adaptive live paper.py" --replay data/ticks_2025-11-10.csv
+"""
+
+import argparse
+import bisect
+import csv
+import os
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import List, Optional, Tuple
+
+from tick_recorder import FILE_EXT, load_last_prices
+
+TS_COLUMNS = ("ts", "timestamp", "open_time", "receive_ts", "time")
+PRICE_COLUMNS = ("price", "last", "close")
+REPLAY_MODES = ("poll", "tick")
+
+
+class ReplayFinished(Exception):
+    """Tickfilen är slut – live-loopen avslutas som vid Ctrl+C."""
+
+
+# ----------------------- Klockor ---------------------------------------------
+class SystemClock:
+    """Riktig tid. Samma gränssnitt som ReplayClock."""
+
+    def time(self) -> float:
+        return time.time()
+
+    def sleep(self, seconds: float) -> None:
+        time.sleep(seconds)
+
+    def now_utc(self) -> datetime:
+        return datetime.now(timezone.utc)
+
+
+class ReplayClock:
+    """
+    Virtuell klocka för replay.
+
+    sleep() väntar inte utan flyttar bara tiden framåt, så en veckas data kan
+    köras på minuter. Tiden är en ren float-summa → deterministisk mellan körningar.
+    Med advance_on_sleep=False styrs tiden enbart av advance_to() (tick-läge).
+    """
+
+    def __init__(self, start: float, advance_on_sleep: bool = True):
+        self._now = float(start)
+        self.advance_on_sleep = advance_on_sleep
+
+    def time(self) -> float:
+        return self._now
+
+    def sleep(self, seconds: float) -> None:
+        if self.advance_on_sleep and seconds > 0:
+            self._now += seconds
+
+    def advance_to(self, t: float) -> None:
+        if t > self._now:
+            self._now = t
+
+    def now_utc(self) -> datetime:
+        return datetime.fromtimestamp(self._now, tz=timezone.utc)
+
+
+# ----------------------- Tickfiler -------------------------------------------
+def load_ticks_csv(path: str) -> Tuple[List[int], List[Decimal]]:
+    """Läs (ts_ms, pris) från CSV. Priset behålls som Decimal exakt som i filen."""
+    timestamps: List[int] = []
+    prices: List[Decimal] = []
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return timestamps, prices
+        cols = [c.strip().lower() for c in header]
+        ts_idx = next((cols.index(c) for c in TS_COLUMNS if c in cols), 0)
+        price_idx = next((cols.index(c) for c in PRICE_COLUMNS if c in cols), 1)
+        for row in reader:
+            if len(row) <= max(ts_idx, price_idx) or not row[price_idx]:
+                continue
+            price = Decimal(row[price_idx])
+            if price <= 0:
+                continue
+            timestamps.append(int(float(row[ts_idx])))
+            prices.append(price)
+    return timestamps, prices
+
+
+def load_ticks(path: str) -> Tuple[List[int], List[Decimal]]:
+    """Läs en tickfil (ts i ms stigande, pris som Decimal)."""
+    if os.path.isdir(path) or path.endswith(FILE_EXT):
+        timestamps, prices = load_last_prices(path)
+    else:
+        timestamps, prices = load_ticks_csv(path)
+    if any(b < a for a, b in zip(timestamps, timestamps[1:])):
+        order = sorted(range(len(timestamps)), key=timestamps.__getitem__)
+        timestamps = [timestamps[i] for i in order]
+        prices = [prices[i] for i in order]
+    return timestamps, prices
+
+
+class TickFeed:
+    """Inspelade ticks som prisskälla för en ReplayClock."""
+
+    def __init__(self, timestamps: List[int], prices: List[Decimal], clock: ReplayClock, mode: str = "poll"):
+        if mode not in REPLAY_MODES:
+            raise ValueError(f"Okänt replay-läge: {mode}")
+        self.ts_sec = [t / 1000.0 for t in timestamps]
+        self.prices = prices
+        self.clock = clock
+        self.mode = mode
+        self.index = -1  # senast levererade tick
+        self.calls = 0
+
+    def __len__(self) -> int:
+        return len(self.prices)
+
+    def next_price(self) -> Decimal:
+        self.calls += 1
+        if self.mode == "tick":
+            self.index += 1
+            if self.index >= len(self.prices):
+                raise ReplayFinished()
+            self.clock.advance_to(self.ts_sec[self.index])
+            return self.prices[self.index]
+
+        now = self.clock.time()
+        if now > self.ts_sec[-1]:
+            raise ReplayFinished()
+        idx = bisect.bisect_right(self.ts_sec, now, lo=max(0, self.index)) - 1
+        self.index = max(idx, 0)
+        return self.prices[self.index]
+
+
+class ReplaySession:
+    """Knyter ihop tickfil, virtuell klocka och prisfunktion för ett live-skript."""
+
+    def __init__(self, path: str, mode: str = "poll"):
+        timestamps, prices = load_ticks(path)
+        if not prices:
+            raise SystemExit(f"Replay: inga ticks i {path}")
+        self.path = path
+        self.clock = ReplayClock(timestamps[0] / 1000.0, advance_on_sleep=(mode == "poll"))
+        self.feed = TickFeed(timestamps, prices, self.clock, mode)
+        self.started_wall = time.perf_counter()
+
+    def get_price(self, symbol: str) -> Decimal:
+        return self.feed.next_price()
+
+    def describe(self) -> str:
+        span_h = (self.feed.ts_sec[-1] - self.feed.ts_sec[0]) / 3600.0
+        return f"{len(self.feed)} ticks ({span_h:.1f} h) från {os.path.basename(self.path)}, läge={self.feed.mode}"
+
+    def speed_report(self) -> str:
+        wall = time.perf_counter() - self.started_wall
+        simulated = self.clock.time() - self.feed.ts_sec[0]
+        ratio = simulated / wall if wall > 0 else 0.0
+        return f"⏩ Replay: {simulated/3600:.2f} h marknadsdata på {wall:.1f}s ({ratio:,.0f}x realtid, {self.feed.calls} prisanrop)"
+
+
+# ----------------------- CLI-hjälp för live-skripten -------------------------
+def parse_replay_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """
+    Flaggor som live-skripten läser redan vid import (innan startpriset hämtas).
+    Okända argument ignoreras så att skripten kan ha egna flaggor.
+    """
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--replay", metavar="TICKFIL", help="Kör mot inspelade ticks istället för Binance")
+    parser.add_argument("--replay-mode", choices=REPLAY_MODES, default="poll")
+    parser.add_argument("--log-dir", help="Katalog för loggar (default logs/, vid replay logs/replay/ – replay rensar bara där)")
+    parser.add_argument("--config", help="Alternativ config.json (t.ex. för att validera en ändring i replay)")
+    parser.add_argument("--resume", action="store_true", help="Återställ motorns tillstånd från senaste checkpoint (checkpoint.py)")
+    args, _ = parser.parse_known_args(argv)
+    return args
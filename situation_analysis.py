@@ -19,15 +19,25 @@ Output:
 - Konsolrapport med rekommendationer
 - CSV med annoterade trades
 - Förslag på filter-parametrar för config.json
+
+Alla grupperingar (timme, veckodag, state, duration, sida och korsningarna
+timme × sida och state × duration) byggs i ETT svep av SituationAggregator:
+varje trade uppdaterar summor i sina grupper, medel räknas ur summorna.
+Loggen strömmas i chunkar (iter_trade_chunks) och den annoterade CSV:n skrivs
+medan den läses, så minnet beror på antalet grupper – inte antalet trades.
+
+    python situation_analysis.py
+    python situation_analysis.py --metrics logs/replay/trade_metrics.csv --chunk-size 50000
 """
 
+import argparse
 import csv
 import json
 import os
 from collections import defaultdict
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 import statistics
 
@@ -65,158 +75,246 @@ class ScenarioStats:
     avg_mae_pct: float
 
 
-def load_trade_metrics(csv_path: str) -> List[TradeRecord]:
-    """Ladda och parsa trade_metrics.csv"""
-    trades = []
+def parse_trade_row(row: Dict[str, str]) -> TradeRecord:
+    """En rad ur trade_metrics.csv → TradeRecord (KeyError/ValueError vid trasig rad)"""
+    # Fix timestamp format (remove double +00:00 if present)
+    ts_str = row["exit_ts"].replace("Z", "")
+    if ts_str.count("+00:00") > 1:
+        ts_str = ts_str.replace("+00:00", "", 1)  # Remove first occurrence
+    if not ts_str.endswith("+00:00") and not ts_str.endswith("Z"):
+        ts_str += "+00:00"
+    ts = datetime.fromisoformat(ts_str)
+    state = row["state"]
+    side = row["side"]
+    entry_price = float(row["entry_price"])
+    exit_price = float(row["exit_price"])
     
+    # Beräkna PnL%
+    if side == "LONG":
+        pnl_pct = (exit_price - entry_price) / entry_price
+    else:  # SHORT
+        pnl_pct = (entry_price - exit_price) / entry_price
+    
+    return TradeRecord(
+        timestamp=ts,
+        state=state,
+        side=side,
+        entry_price=entry_price,
+        exit_price=exit_price,
+        duration_sec=float(row["duration_sec"]),
+        mfe_pct=float(row["mfe_pct"]),
+        mae_pct=float(row["mae_pct"]),
+        hour_utc=ts.hour,
+        day_of_week=ts.weekday(),
+        is_win=state in ["LW", "SW"],  # Bestäm win/loss
+        pnl_pct=pnl_pct,
+    )
+
+
+def iter_trade_chunks(csv_path: str, chunk_size: int = 20_000) -> Iterator[List[TradeRecord]]:
+    """Strömma trade_metrics.csv som listor om högst chunk_size trades"""
     if not os.path.exists(csv_path):
         print(f"⚠️ Hittade inte {csv_path}")
-        return trades
+        return
     
+    chunk: List[TradeRecord] = []
     with open(csv_path, "r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
+        for row in csv.DictReader(f):
             try:
-                # Fix timestamp format (remove double +00:00 if present)
-                ts_str = row["exit_ts"].replace("Z", "")
-                if ts_str.count("+00:00") > 1:
-                    ts_str = ts_str.replace("+00:00", "", 1)  # Remove first occurrence
-                if not ts_str.endswith("+00:00") and not ts_str.endswith("Z"):
-                    ts_str += "+00:00"
-                ts = datetime.fromisoformat(ts_str)
-                state = row["state"]
-                side = row["side"]
-                entry_price = float(row["entry_price"])
-                exit_price = float(row["exit_price"])
-                duration = float(row["duration_sec"])
-                mfe_pct = float(row["mfe_pct"])
-                mae_pct = float(row["mae_pct"])
-                
-                # Bestäm win/loss
-                is_win = state in ["LW", "SW"]
-                
-                # Beräkna PnL%
-                if side == "LONG":
-                    pnl_pct = (exit_price - entry_price) / entry_price
-                else:  # SHORT
-                    pnl_pct = (entry_price - exit_price) / entry_price
-                
-                trade = TradeRecord(
-                    timestamp=ts,
-                    state=state,
-                    side=side,
-                    entry_price=entry_price,
-                    exit_price=exit_price,
-                    duration_sec=duration,
-                    mfe_pct=mfe_pct,
-                    mae_pct=mae_pct,
-                    hour_utc=ts.hour,
-                    day_of_week=ts.weekday(),
-                    is_win=is_win,
-                    pnl_pct=pnl_pct,
-                )
-                trades.append(trade)
-            except (KeyError, ValueError) as e:
+                chunk.append(parse_trade_row(row))
+            except (KeyError, ValueError, ZeroDivisionError) as e:
                 print(f"⚠️ Kunde inte parsa rad: {e}")
                 continue
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def load_trade_metrics(csv_path: str) -> List[TradeRecord]:
+    """Ladda och parsa trade_metrics.csv"""
+    return [t for chunk in iter_trade_chunks(csv_path) for t in chunk]
+
+
+@dataclass
+class ScenarioAggregate:
+    """Löpande summor för en grupp (medel räknas först i to_stats)"""
+    trade_count: int = 0
+    win_count: int = 0
+    pnl_sum: float = 0.0
+    duration_sum: float = 0.0
+    mfe_sum: float = 0.0
+    mae_sum: float = 0.0
+    
+    def add(self, t: TradeRecord) -> None:
+        self.trade_count += 1
+        self.win_count += t.is_win
+        self.pnl_sum += t.pnl_pct
+        self.duration_sum += t.duration_sec
+        self.mfe_sum += t.mfe_pct
+        self.mae_sum += t.mae_pct
     
-    return trades
+    def merge(self, other: "ScenarioAggregate") -> None:
+        self.trade_count += other.trade_count
+        self.win_count += other.win_count
+        self.pnl_sum += other.pnl_sum
+        self.duration_sum += other.duration_sum
+        self.mfe_sum += other.mfe_sum
+        self.mae_sum += other.mae_sum
+    
+    def to_stats(self, scenario_name: str) -> ScenarioStats:
+        n = self.trade_count
+        return ScenarioStats(
+            scenario_name=scenario_name,
+            trade_count=n,
+            win_count=self.win_count,
+            loss_count=n - self.win_count,
+            win_rate=self.win_count / n,
+            avg_pnl_pct=self.pnl_sum / n,
+            avg_duration_sec=self.duration_sum / n,
+            avg_mfe_pct=self.mfe_sum / n,
+            avg_mae_pct=self.mae_sum / n,
+        )
 
 
-def calculate_scenario_stats(trades: List[TradeRecord], 
-                            filter_func, 
-                            scenario_name: str) -> Optional[ScenarioStats]:
-    """Beräkna statistik för trades som matchar ett filter"""
-    filtered = [t for t in trades if filter_func(t)]
+DAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+STATES = ["LW", "LB", "SW", "SB"]
+SIDES = ["LONG", "SHORT"]
+DURATION_BUCKETS = [
+    (0, 30, "0-30s (Very Quick)"),
+    (30, 60, "30-60s (Quick)"),
+    (60, 180, "1-3min (Medium)"),
+    (180, 600, "3-10min (Long)"),
+    (600, float('inf'), ">10min (Very Long)"),
+]
+
+
+def duration_bucket(duration_sec: float) -> Optional[int]:
+    for i, (min_dur, max_dur, _) in enumerate(DURATION_BUCKETS):
+        if min_dur <= duration_sec < max_dur:
+            return i
+    return None
+
+
+# Dimension → (nyckel för en trade (None = hoppa över), alla nycklar i rapportordning, namn)
+DIMENSIONS: Dict[str, Tuple[Callable[[TradeRecord], object], List[object], Callable[[object], str]]] = {
+    "hour": (lambda t: t.hour_utc, list(range(24)), lambda h: f"Hour {h:02d}:00 UTC"),
+    "day": (lambda t: t.day_of_week, list(range(7)), lambda d: DAY_NAMES[d]),
+    "state": (lambda t: t.state if t.state in STATES else None, STATES, lambda s: f"State: {s}"),
+    "duration": (lambda t: duration_bucket(t.duration_sec), list(range(len(DURATION_BUCKETS))),
+                 lambda i: DURATION_BUCKETS[i][2]),
+    "side": (lambda t: t.side if t.side in SIDES else None, SIDES, lambda s: s),
+}
+DEFAULT_GROUPINGS: List[Tuple[str, ...]] = [
+    ("hour",), ("day",), ("state",), ("duration",), ("side",),
+    ("hour", "side"), ("state", "duration"),
+]
+
+
+class SituationAggregator:
+    """
+    Alla grupperingar i ett svep. En gruppering är en tupel av dimensioner;
+    ("hour", "side") ger en grupp per (timme, sida).
     
-    if not filtered:
-        return None
+    Args:
+        groupings: Vilka grupperingar som byggs (default DEFAULT_GROUPINGS)
+    """
     
-    win_count = sum(1 for t in filtered if t.is_win)
-    loss_count = len(filtered) - win_count
-    win_rate = win_count / len(filtered) if filtered else 0.0
+    def __init__(self, groupings: Optional[List[Tuple[str, ...]]] = None):
+        self.groupings = [tuple(g) for g in (groupings or DEFAULT_GROUPINGS)]
+        for grouping in self.groupings:
+            unknown = [d for d in grouping if d not in DIMENSIONS]
+            if unknown:
+                raise ValueError(f"Okänd dimension: {unknown}")
+        self.total = ScenarioAggregate()
+        self.groups: Dict[Tuple[str, ...], Dict[tuple, ScenarioAggregate]] = {
+            g: defaultdict(ScenarioAggregate) for g in self.groupings
+        }
+        self.first_ts: Optional[datetime] = None
+        self.last_ts: Optional[datetime] = None
+        self._dims = sorted({d for g in self.groupings for d in g})
     
-    avg_pnl = statistics.mean(t.pnl_pct for t in filtered) if filtered else 0.0
-    avg_duration = statistics.mean(t.duration_sec for t in filtered) if filtered else 0.0
-    avg_mfe = statistics.mean(t.mfe_pct for t in filtered) if filtered else 0.0
-    avg_mae = statistics.mean(t.mae_pct for t in filtered) if filtered else 0.0
+    def add(self, t: TradeRecord) -> None:
+        self.total.add(t)
+        if self.first_ts is None:
+            self.first_ts = t.timestamp
+        self.last_ts = t.timestamp
+        keys = {d: DIMENSIONS[d][0](t) for d in self._dims}
+        for grouping, groups in self.groups.items():
+            key = tuple(keys[d] for d in grouping)
+            if None not in key:
+                groups[key].add(t)
     
-    return ScenarioStats(
-        scenario_name=scenario_name,
-        trade_count=len(filtered),
-        win_count=win_count,
-        loss_count=loss_count,
-        win_rate=win_rate,
-        avg_pnl_pct=avg_pnl,
-        avg_duration_sec=avg_duration,
-        avg_mfe_pct=avg_mfe,
-        avg_mae_pct=avg_mae,
-    )
+    def add_many(self, trades: Iterable[TradeRecord]) -> "SituationAggregator":
+        for t in trades:
+            self.add(t)
+        return self
+    
+    def merge(self, other: "SituationAggregator") -> "SituationAggregator":
+        """Slå ihop med en annan aggregator (t.ex. en annan logg eller chunk)"""
+        self.total.merge(other.total)
+        for grouping, groups in other.groups.items():
+            mine = self.groups.setdefault(grouping, defaultdict(ScenarioAggregate))
+            for key, agg in groups.items():
+                mine[key].merge(agg)
+        if other.first_ts is not None and (self.first_ts is None or other.first_ts < self.first_ts):
+            self.first_ts = other.first_ts
+        if other.last_ts is not None and (self.last_ts is None or other.last_ts > self.last_ts):
+            self.last_ts = other.last_ts
+        return self
+    
+    def scenarios(self, *grouping: str) -> List[ScenarioStats]:
+        """ScenarioStats för en gruppering, i dimensionernas ordning (tomma grupper utelämnas)"""
+        groups = self.groups[tuple(grouping)]
+        keys: List[tuple] = [()]
+        for d in grouping:
+            keys = [k + (v,) for k in keys for v in DIMENSIONS[d][1]]
+        results = []
+        for key in keys:
+            agg = groups.get(key)
+            if agg is not None and agg.trade_count:
+                name = " | ".join(DIMENSIONS[d][2](v) for d, v in zip(grouping, key))
+                results.append(agg.to_stats(name))
+        return results
+
+
+TradeSource = Union[SituationAggregator, List[TradeRecord]]
 
 
-def analyze_by_hour(trades: List[TradeRecord]) -> List[ScenarioStats]:
+def _aggregated(source: TradeSource) -> SituationAggregator:
+    return source if isinstance(source, SituationAggregator) else SituationAggregator().add_many(source)
+
+
+def calculate_scenario_stats(trades: List[TradeRecord], 
+                            filter_func, 
+                            scenario_name: str) -> Optional[ScenarioStats]:
+    """Beräkna statistik för trades som matchar ett filter (ett eget svep – för ad hoc-filter)"""
+    agg = ScenarioAggregate()
+    for t in trades:
+        if filter_func(t):
+            agg.add(t)
+    return agg.to_stats(scenario_name) if agg.trade_count else None
+
+
+def analyze_by_hour(trades: TradeSource) -> List[ScenarioStats]:
     """Analysera win-rate per timme på dygnet"""
-    results = []
-    for hour in range(24):
-        stats = calculate_scenario_stats(
-            trades,
-            lambda t: t.hour_utc == hour,
-            f"Hour {hour:02d}:00 UTC"
-        )
-        if stats:
-            results.append(stats)
-    return results
+    return _aggregated(trades).scenarios("hour")
 
 
-def analyze_by_day_of_week(trades: List[TradeRecord]) -> List[ScenarioStats]:
+def analyze_by_day_of_week(trades: TradeSource) -> List[ScenarioStats]:
     """Analysera win-rate per veckodag"""
-    day_names = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-    results = []
-    for day in range(7):
-        stats = calculate_scenario_stats(
-            trades,
-            lambda t: t.day_of_week == day,
-            day_names[day]
-        )
-        if stats:
-            results.append(stats)
-    return results
+    return _aggregated(trades).scenarios("day")
 
 
-def analyze_by_state(trades: List[TradeRecord]) -> List[ScenarioStats]:
+def analyze_by_state(trades: TradeSource) -> List[ScenarioStats]:
     """Analysera win-rate per Markov-state"""
-    states = ["LW", "LB", "SW", "SB"]
-    results = []
-    for state in states:
-        stats = calculate_scenario_stats(
-            trades,
-            lambda t: t.state == state,
-            f"State: {state}"
-        )
-        if stats:
-            results.append(stats)
-    return results
+    return _aggregated(trades).scenarios("state")
 
 
-def analyze_by_duration(trades: List[TradeRecord]) -> List[ScenarioStats]:
+def analyze_by_duration(trades: TradeSource) -> List[ScenarioStats]:
     """Analysera win-rate per trade-duration"""
-    buckets = [
-        (0, 30, "0-30s (Very Quick)"),
-        (30, 60, "30-60s (Quick)"),
-        (60, 180, "1-3min (Medium)"),
-        (180, 600, "3-10min (Long)"),
-        (600, float('inf'), ">10min (Very Long)"),
-    ]
-    results = []
-    for min_dur, max_dur, name in buckets:
-        stats = calculate_scenario_stats(
-            trades,
-            lambda t: min_dur <= t.duration_sec < max_dur,
-            name
-        )
-        if stats:
-            results.append(stats)
-    return results
+    return _aggregated(trades).scenarios("duration")
 
 
 def print_scenario_report(scenarios: List[ScenarioStats], title: str):
@@ -232,12 +330,13 @@ def print_scenario_report(scenarios: List[ScenarioStats], title: str):
               f"{s.win_rate*100:>6.1f}% {s.avg_pnl_pct*100:>9.3f}% {s.avg_duration_sec:>9.1f}s")
 
 
-def generate_recommendations(trades: List[TradeRecord]) -> Dict[str, any]:
+def generate_recommendations(trades: TradeSource) -> Dict[str, any]:
     """Generera rekommendationer baserat på analys"""
     recommendations = {}
+    agg = _aggregated(trades)
     
     # Analysera timmar
-    hourly = analyze_by_hour(trades)
+    hourly = analyze_by_hour(agg)
     if hourly:
         best_hours = [h for h in hourly if h.win_rate > 0.55 and h.trade_count >= 5]
         worst_hours = [h for h in hourly if h.win_rate < 0.45 and h.trade_count >= 5]
@@ -251,7 +350,7 @@ def generate_recommendations(trades: List[TradeRecord]) -> Dict[str, any]:
             recommendations["avoid_hours"] = worst_hour_ranges
     
     # Analysera duration
-    duration = analyze_by_duration(trades)
+    duration = analyze_by_duration(agg)
     if duration:
         quick_trades = [d for d in duration if "Quick" in d.scenario_name or "Very Quick" in d.scenario_name]
         if quick_trades:
@@ -260,7 +359,7 @@ def generate_recommendations(trades: List[TradeRecord]) -> Dict[str, any]:
                 recommendations["suggestion"] = "Snabba trades (<60s) har låg win-rate - överväg att öka MIN_MOVE_PCT eller COOLDOWN_SEC"
     
     # Analysera states
-    states = analyze_by_state(trades)
+    states = analyze_by_state(agg)
     if states:
         loss_states = [s for s in states if "LB" in s.scenario_name or "SB" in s.scenario_name]
         if loss_states:
@@ -274,64 +373,97 @@ def generate_recommendations(trades: List[TradeRecord]) -> Dict[str, any]:
     return recommendations
 
 
+ANNOTATED_HEADER = [
+    "timestamp", "state", "side", "entry_price", "exit_price",
+    "duration_sec", "mfe_pct", "mae_pct", "hour_utc", "day_of_week",
+    "is_win", "pnl_pct"
+]
+
+
+def annotated_row(t: TradeRecord) -> list:
+    return [
+        t.timestamp.isoformat(),
+        t.state,
+        t.side,
+        t.entry_price,
+        t.exit_price,
+        t.duration_sec,
+        t.mfe_pct,
+        t.mae_pct,
+        t.hour_utc,
+        t.day_of_week,
+        1 if t.is_win else 0,
+        t.pnl_pct,
+    ]
+
+
 def save_annotated_trades(trades: List[TradeRecord], output_path: str):
     """Spara annoterade trades till CSV"""
     with open(output_path, "w", newline="", encoding="utf-8") as f:
         writer = csv.writer(f)
-        writer.writerow([
-            "timestamp", "state", "side", "entry_price", "exit_price",
-            "duration_sec", "mfe_pct", "mae_pct", "hour_utc", "day_of_week",
-            "is_win", "pnl_pct"
-        ])
-        for t in trades:
-            writer.writerow([
-                t.timestamp.isoformat(),
-                t.state,
-                t.side,
-                t.entry_price,
-                t.exit_price,
-                t.duration_sec,
-                t.mfe_pct,
-                t.mae_pct,
-                t.hour_utc,
-                t.day_of_week,
-                1 if t.is_win else 0,
-                t.pnl_pct,
-            ])
+        writer.writerow(ANNOTATED_HEADER)
+        writer.writerows(annotated_row(t) for t in trades)
     print(f"✅ Annoterade trades sparade till: {output_path}")
 
 
+def aggregate_trade_metrics(csv_path: str, chunk_size: int = 20_000,
+                            annotated_path: Optional[str] = None) -> SituationAggregator:
+    """
+    Ett svep över loggen i chunkar: bygg alla grupperingar och skriv (valfritt)
+    den annoterade CSV:n under tiden. Ingen chunk sparas efter att den räknats in.
+    """
+    agg = SituationAggregator()
+    out = open(annotated_path, "w", newline="", encoding="utf-8") if annotated_path else None
+    try:
+        writer = csv.writer(out) if out else None
+        if writer:
+            writer.writerow(ANNOTATED_HEADER)
+        for chunk in iter_trade_chunks(csv_path, chunk_size):
+            agg.add_many(chunk)
+            if writer:
+                writer.writerows(annotated_row(t) for t in chunk)
+    finally:
+        if out:
+            out.close()
+    return agg
+
+
 def main():
+    parser = argparse.ArgumentParser(description="Win-rate och PnL per marknadssituation ur trade_metrics.csv.")
+    parser.add_argument("--metrics", default=os.path.join("logs", "trade_metrics.csv"))
+    parser.add_argument("--out", default=os.path.join("data", "annotated_trades.csv"), help="Annoterade trades (CSV)")
+    parser.add_argument("--chunk-size", type=int, default=20_000, help="Trades per chunk vid inläsning")
+    args = parser.parse_args()
+
     print("🔍 Situation Analysis - Trading Pattern Recognition")
     print("="*80)
     
-    # Ladda data
-    metrics_path = os.path.join("logs", "trade_metrics.csv")
-    trades = load_trade_metrics(metrics_path)
+    # Ladda data (ett svep, annoterad CSV skrivs samtidigt)
+    metrics_path = args.metrics
+    output_path = args.out
+    out_dir = os.path.dirname(output_path)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    agg = aggregate_trade_metrics(metrics_path, args.chunk_size, annotated_path=output_path)
     
-    if not trades:
+    if not agg.total.trade_count:
         print("❌ Inga trades hittades. Kör live-scriptet först för att samla data.")
         return
     
-    print(f"📊 Laddade {len(trades)} trades från {metrics_path}")
-    print(f"   Tidsperiod: {trades[0].timestamp.date()} till {trades[-1].timestamp.date()}")
-    
-    # Kör analyser
-    print("\n🔬 Kör analyser...")
-    
-    hourly_stats = analyze_by_hour(trades)
-    daily_stats = analyze_by_day_of_week(trades)
-    state_stats = analyze_by_state(trades)
-    duration_stats = analyze_by_duration(trades)
+    print(f"📊 Laddade {agg.total.trade_count} trades från {metrics_path}")
+    print(f"   Tidsperiod: {agg.first_ts.date()} till {agg.last_ts.date()}")
     
     # Skriv ut rapporter
-    print_scenario_report(hourly_stats, "WIN-RATE PER TIMME (UTC)")
-    print_scenario_report(daily_stats, "WIN-RATE PER VECKODAG")
-    print_scenario_report(state_stats, "WIN-RATE PER MARKOV-STATE")
-    print_scenario_report(duration_stats, "WIN-RATE PER TRADE-DURATION")
+    print_scenario_report(agg.scenarios("hour"), "WIN-RATE PER TIMME (UTC)")
+    print_scenario_report(agg.scenarios("day"), "WIN-RATE PER VECKODAG")
+    print_scenario_report(agg.scenarios("state"), "WIN-RATE PER MARKOV-STATE")
+    print_scenario_report(agg.scenarios("duration"), "WIN-RATE PER TRADE-DURATION")
+    print_scenario_report(agg.scenarios("side"), "WIN-RATE PER SIDA")
+    print_scenario_report(agg.scenarios("hour", "side"), "WIN-RATE PER TIMME × SIDA")
+    print_scenario_report(agg.scenarios("state", "duration"), "WIN-RATE PER STATE × DURATION")
     
     # Generera rekommendationer
-    recommendations = generate_recommendations(trades)
+    recommendations = generate_recommendations(agg)
     
     print(f"\n{'='*80}")
     print(f"{'REKOMMENDATIONER':^80}")
@@ -353,10 +485,10 @@ def main():
         print(f"⚠️  {recommendations['warning']}")
     
     # Beräkna overall stats
-    total_trades = len(trades)
-    total_wins = sum(1 for t in trades if t.is_win)
+    total_trades = agg.total.trade_count
+    total_wins = agg.total.win_count
     overall_win_rate = total_wins / total_trades if total_trades > 0 else 0
-    overall_pnl = sum(t.pnl_pct for t in trades)
+    overall_pnl = agg.total.pnl_sum
     
     print(f"\n{'='*80}")
     print(f"{'SAMMANFATTNING':^80}")
@@ -366,11 +498,7 @@ def main():
     print(f"Losses: {total_trades - total_wins} ({(1-overall_win_rate)*100:.1f}%)")
     print(f"Total PnL: {overall_pnl*100:.3f}%")
     print(f"Avg PnL per trade: {(overall_pnl/total_trades)*100:.3f}%" if total_trades > 0 else "N/A")
-    
-    # Spara annoterade trades
-    output_path = os.path.join("data", "annotated_trades.csv")
-    os.makedirs("data", exist_ok=True)
-    save_annotated_trades(trades, output_path)
+    print(f"✅ Annoterade trades sparade till: {output_path}")
     
     print(f"\n{'='*80}")
     print("✅ Analys klar!")
@@ -0,0 +1,200 @@
+"""
+Tester för balance_cache.py mot binance_stub.StubAccountClient (inga nycklar/nätverk).
+
+    python -m pytest -q test_balance_cache.py
+"""
+
+import json
+import time
+from decimal import Decimal
+
+import balance_cache
+from balance_cache import BalanceCache, UserDataStream
+from binance_stub import StubAccountClient
+
+
+class RacingClient(StubAccountClient):
+    """get_account() som låter en order fyllas efter att snapshoten lästs men innan den returneras."""
+
+    def __init__(self, **kwargs):
+        super().__init__(event_delay_sec=None, **kwargs)
+        self.fill_during_refresh = False
+
+    def get_account(self):
+        acct = super().get_account()
+        if self.fill_during_refresh:
+            self.fill_during_refresh = False
+            self.order_market_buy(symbol=self.symbol, quantity=0.01)  # event → cache.apply_event
+        return acct
+
+
+def test_refresh_does_not_overwrite_newer_event():
+    client = RacingClient(balances={"USDT": "10000", "BTC": "0"}, fee_pct="0")
+    cache = BalanceCache(client, refresh_sec=0)
+    client.subscribe(cache.apply_event)
+    cache.refresh()
+    assert cache.free("USDT") == Decimal("10000")
+
+    client.fill_during_refresh = True
+    cache.refresh()
+
+    assert cache.free("USDT") == Decimal("9050")      # händelsens saldo, inte snapshotens
+    assert cache.free("BTC") == Decimal("0.01")
+    assert cache.as_of_ms == client.orders["stub1"]["transactTime"]
+    assert cache.stats["stale_refreshes"] == 1
+
+
+def test_refresh_never_moves_as_of_backwards():
+    client = StubAccountClient(balances={"USDT": "10000", "BTC": "0"}, fee_pct="0", event_delay_sec=None)
+    cache = BalanceCache(client, refresh_sec=0)
+    client.subscribe(cache.apply_event)
+    cache.refresh()
+    client.order_market_buy(symbol=client.symbol, quantity=0.01)
+    event_ms = cache.as_of_ms
+
+    cache.refresh()  # stubbens updateTime = senaste händelsen → samma tid, tillämpas
+    assert cache.as_of_ms == event_ms
+    assert cache.free("USDT") == Decimal("9050")
+    assert cache.stats["stale_refreshes"] == 0
+
+
+def test_apply_order_counts_fill_and_commission():
+    client = StubAccountClient(balances={"USDT": "10000", "BTC": "0"}, fee_pct="0.001", event_delay_sec=None)
+    cache = BalanceCache(client, refresh_sec=0)  # ingen stream: bara orderns svar räknas in
+    cache.refresh()
+
+    buy = client.order_market_buy(symbol=client.symbol, quantity=0.01)
+    cache.apply_order(buy, "BTC", "USDT")
+    assert cache.free("USDT") == Decimal("9050")
+    assert cache.free("BTC") == Decimal("0.00999")      # avgiften dras i BTC vid köp
+    assert cache.as_of_ms == buy["transactTime"]
+
+    sell = client.order_market_sell(symbol=client.symbol, quantity=0.005)
+    cache.apply_order(sell, "BTC", "USDT")
+    assert cache.free("BTC") == Decimal("0.00499")
+    assert cache.free("USDT") == Decimal("9050") + Decimal("475") - Decimal("0.475")  # avgift i USDT vid sälj
+    assert cache.free("USDT") == client.balances["USDT"]
+    assert cache.stats["fills"] == 2
+    assert client.calls["get_account"] == 1
+
+
+def test_apply_order_skipped_when_stream_already_delivered():
+    client = StubAccountClient(balances={"USDT": "10000", "BTC": "0"}, fee_pct="0.001", event_delay_sec=None)
+    cache = BalanceCache(client, refresh_sec=0)
+    client.subscribe(cache.apply_event)
+    cache.refresh()
+
+    resp = client.order_market_buy(symbol=client.symbol, quantity=0.01)  # händelsen kommer före svaret
+    cache.apply_order(resp, "BTC", "USDT")
+
+    assert cache.stats["skipped_fills"] == 1
+    assert cache.stats["fills"] == 0
+    assert cache.free("BTC") == Decimal("0.00999")      # inte dubbelräknad
+    assert cache.free("USDT") == Decimal("9050")
+
+
+def test_apply_order_without_fill_data_invalidates():
+    client = StubAccountClient(event_delay_sec=None)
+    cache = BalanceCache(client, refresh_sec=0)
+    cache.refresh()
+    cache.apply_order({"status": "EXPIRED"}, "BTC", "USDT")
+    assert not cache.valid
+    cache.free("USDT")
+    assert client.calls["get_account"] == 2
+
+
+def test_invalidate_forces_refresh_on_next_free():
+    client = StubAccountClient(balances={"USDT": "10000", "BTC": "0"}, event_delay_sec=None)
+    cache = BalanceCache(client, refresh_sec=0)
+    cache.free("USDT")
+    cache.free("BTC")
+    assert client.calls["get_account"] == 1             # bara första läsningen går till REST
+
+    client.balances["USDT"] = Decimal("12345")           # t.ex. insättning som streamen missat
+    cache.invalidate()
+    assert cache.free("USDT") == Decimal("12345")
+    assert client.calls["get_account"] == 2
+    cache.free("USDT")
+    assert client.calls["get_account"] == 2
+
+
+def test_apply_event_ordering():
+    client = StubAccountClient(balances={"USDT": "1000", "BTC": "0"}, event_delay_sec=None)
+    cache = BalanceCache(client, refresh_sec=0)
+    cache.refresh()
+    t = cache.as_of_ms
+
+    position = {"e": "outboundAccountPosition", "E": t + 10, "u": t + 10,
+                "B": [{"a": "USDT", "f": "900", "l": "100"}]}
+    cache.apply_event(position)
+    assert (cache.free("USDT"), cache.locked("USDT")) == (Decimal("900"), Decimal("100"))
+
+    # Insättning som redan ingår i positionen (T <= u) räknas inte igen
+    cache.apply_event({"e": "balanceUpdate", "a": "USDT", "d": "50", "T": t + 10})
+    assert cache.free("USDT") == Decimal("900")
+    # Nyare insättning läggs på fritt saldo
+    cache.apply_event({"e": "balanceUpdate", "a": "USDT", "d": "50", "T": t + 20})
+    assert cache.free("USDT") == Decimal("950")
+
+    # Försenad position från före den senaste skriver inte över
+    cache.apply_event({"e": "outboundAccountPosition", "E": t + 5, "u": t + 5,
+                       "B": [{"a": "USDT", "f": "1", "l": "0"}]})
+    assert cache.free("USDT") == Decimal("950")
+    # Nyare position är absolut och ersätter saldot
+    cache.apply_event({"e": "outboundAccountPosition", "E": t + 30, "u": t + 30,
+                       "B": [{"a": "USDT", "f": "700", "l": "0"}]})
+    assert cache.free("USDT") == Decimal("700")
+    assert cache.as_of_ms == t + 30
+
+    cache.apply_event({"e": "executionReport", "s": "BTCUSDT"})  # okänd typ → ignoreras
+    assert cache.stats["events"] == 3
+
+
+class FakeWebSocketApp:
+    """websocket.WebSocketApp som levererar förinspelade meddelanden och sedan kopplar ner."""
+
+    sessions = []
+
+    def __init__(self, url, on_open=None, on_message=None, on_error=None):
+        self.url = url
+        self.on_message = on_message
+        self.closed = False
+
+    def run_forever(self, **kwargs):
+        for message in FakeWebSocketApp.sessions.pop(0):
+            if callable(message):
+                message()
+            else:
+                self.on_message(self, message)
+
+    def close(self):
+        self.closed = True
+
+
+def test_user_data_stream_reconnects_and_invalidates(monkeypatch):
+    client = StubAccountClient(balances={"USDT": "1000", "BTC": "0"}, event_delay_sec=None)
+    cache = BalanceCache(client, refresh_sec=0)
+    cache.refresh()
+    seen = []
+
+    monkeypatch.setattr(balance_cache, "WEBSOCKET_AVAILABLE", True)
+    monkeypatch.setattr(balance_cache, "websocket", type("ws", (), {"WebSocketApp": FakeWebSocketApp}), raising=False)
+    monkeypatch.setattr(time, "sleep", lambda sec: None)
+    stream = UserDataStream(client, cache, on_event=seen.append)
+
+    event_ms = client._now_ms()  # stubbens klocka → REST-snapshoten efteråt är inte äldre
+    event = {"e": "outboundAccountPosition", "E": event_ms, "u": event_ms,
+             "B": [{"a": "USDT", "f": "800", "l": "0"}]}
+    FakeWebSocketApp.sessions = [
+        [json.dumps(event), "inte json"],   # första anslutningen: en händelse, ett trasigt meddelande, avbrott
+        [stream.stop],                      # andra anslutningen: avsluta
+    ]
+    stream._run()
+
+    assert client.calls["stream_get_listen_key"] == 2  # ny listenKey vid återanslutning
+    assert seen == [event]
+    assert cache.stats["events"] == 1
+    assert not cache.valid                               # händelser kan ha missats under avbrottet
+    assert cache.free("USDT") == Decimal("1000")         # → läses om via REST (stubbens saldo)
+    assert client.calls["get_account"] == 2
+    assert client.calls["stream_close"] == 1
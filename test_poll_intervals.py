@@ -2,9 +2,20 @@
 """
 Test different poll intervals for the adaptive strategy.
 Analyzes performance with various tick frequencies (1s, 2s, 5s, 10s, 30s).
+
+Default mode resamples all intervals in a single pass over the data, keeps a
+rolling sum for the L average and simulates the intervals in parallel. Use
+--sweep for a fine grid (0.25 s .. 60 s) and --legacy for the original
+per-interval implementation (reference).
 """
 
-import json
+import argparse
+import heapq
+import os
+import sys
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from decimal import Decimal
 from pathlib import Path
 from datetime import datetime, timezone
@@ -12,35 +23,35 @@ from datetime import datetime, timezone
 # Load historical data
 DATA_FILE = Path("data") / "klines_analysis.csv"
 
-if not DATA_FILE.exists():
-    print(f"Error: Data file not found: {DATA_FILE}")
-    print("Please ensure historical data exists in data/klines_analysis.csv")
-    exit(1)
-
-# Parse CSV data
-prices = []
-timestamps = []
-
-with open(DATA_FILE, 'r') as f:
-    lines = f.readlines()[1:]  # Skip header
-    for line in lines:
-        parts = line.strip().split(',')
-        if len(parts) >= 2:
-            ts = int(parts[0])
-            price = float(parts[1])  # Close price (index 1)
-            if price > 0:  # Only include valid prices
-                timestamps.append(ts)
-                prices.append(price)
-
-print(f"✅ Loaded {len(prices)} price points from {DATA_FILE}")
-print(f"📅 Period: {datetime.fromtimestamp(timestamps[0]/1000)} to {datetime.fromtimestamp(timestamps[-1]/1000)}")
-print(f"💵 Price range: ${min(prices):.0f} - ${max(prices):.0f}")
-print()
+
+def load_prices(path):
+    """Read (timestamps, prices) from the analysis CSV (ts ms, close, ...)."""
+    prices = []
+    timestamps = []
+    with open(path, 'r') as f:
+        next(f, None)  # Skip header
+        for line in f:
+            parts = line.strip().split(',')
+            if len(parts) >= 2:
+                ts = int(parts[0])
+                price = float(parts[1])  # Close price (index 1)
+                if price > 0:  # Only include valid prices
+                    timestamps.append(ts)
+                    prices.append(price)
+    return prices, timestamps
+
 
 # Test configurations
 POLL_INTERVALS = [1, 2, 5, 10, 30]  # seconds
 INITIAL_CAPITAL = 10000  # USDT
 
+# Fine sweep: 0.25 s .. 60 s
+SWEEP_START = 0.25
+SWEEP_STOP = 60.0
+SWEEP_STEP = 0.25
+
+L_WINDOW = 30
+
 def simulate_strategy(poll_sec, prices, timestamps):
     """
     Simplified simulation of adaptive strategy with given poll interval.
@@ -223,88 +234,336 @@ def simulate_strategy(poll_sec, prices, timestamps):
         'trades_per_day': trades_per_day
     }
 
-# Run tests
-print("=" * 80)
-print("🧪 TESTING DIFFERENT POLL INTERVALS")
-print("=" * 80)
-print()
 
-results = []
+def sweep_intervals(start=SWEEP_START, stop=SWEEP_STOP, step=SWEEP_STEP):
+    """Poll intervals start..stop (inclusive), rounded to whole milliseconds."""
+    count = int(round((stop - start) / step)) + 1
+    return sorted({round(start + i * step, 3) for i in range(count)})
+
+
+def resample_all(timestamps, poll_secs):
+    """
+    Sample indices for every poll interval in ONE pass over the data.
+
+    Same rule as simulate_strategy(): a tick is taken when at least poll_sec
+    has passed since the previous sample (the first tick only sets the clock).
+    A heap keyed on the next due time means each tick only touches the
+    intervals that actually sample it.
+
+    Returns: {poll_sec: array of indices into timestamps/prices}
+    """
+    samples = {poll: array('l') for poll in poll_secs}
+    if not timestamps:
+        return samples
+    start = timestamps[0]
+    heap = [(start + round(poll * 1000), round(poll * 1000), poll) for poll in poll_secs]
+    heapq.heapify(heap)
+    for i, ts in enumerate(timestamps):
+        while heap and heap[0][0] <= ts:
+            _, step_ms, poll = heap[0]
+            samples[poll].append(i)
+            heapq.heapreplace(heap, (ts + step_ms, step_ms, poll))
+    return samples
+
+
+def simulate_sampled(poll_sec, prices_d, timestamps, indices, verbose=True):
+    """
+    Same simulation as simulate_strategy(), on precomputed sample indices.
+
+    prices_d: prices as Decimal (converted once for all intervals).
+    L is kept as a rolling Decimal sum over the last L_WINDOW samples; Decimal
+    addition/subtraction of prices is exact, so L matches sum(window)/len(window).
+    """
+    if verbose:
+        print(f"  Poll {poll_sec:g}s: {len(indices)} ticks (from {len(prices_d)} original)")
+
+    # Config
+    POSITION_SIZE = Decimal("0.05")  # BTC
+    TAKE_PROFIT_PCT = Decimal("0.007")  # 0.7%
+    MAX_LOSS_PCT = Decimal("0.01")  # 1.0%
+    FEE_PCT = Decimal("0.001")  # 0.1% taker fee
+    MARGIN_PCT = Decimal("0.5")  # 2x leverage
+    window_len = Decimal(L_WINDOW)
 
-for poll_sec in POLL_INTERVALS:
-    print(f"Testing poll_sec = {poll_sec}s...")
-    result = simulate_strategy(poll_sec, prices, timestamps)
-    results.append(result)
+    position = None
+    balance_usdt = Decimal(str(INITIAL_CAPITAL))
+    trades = []
+    window = deque()
+    rolling_sum = Decimal("0")
+
+    for idx in indices:
+        ts = timestamps[idx]
+        price_d = prices_d[idx]
+        window.append(price_d)
+        rolling_sum += price_d
+        if len(window) > L_WINDOW:
+            rolling_sum -= window.popleft()
+        elif len(window) < L_WINDOW:
+            continue
+
+        L = rolling_sum / window_len
+
+        if position:
+            entry_price = position['entry']
+            side = position['side']
+            if side == 'LONG':
+                pnl_pct = (price_d - entry_price) / entry_price
+                crossed_l = price_d <= L
+            else:  # SHORT
+                pnl_pct = (entry_price - price_d) / entry_price
+                crossed_l = price_d >= L
+
+            if pnl_pct >= TAKE_PROFIT_PCT:
+                reason = 'TP'
+            elif pnl_pct <= -MAX_LOSS_PCT:
+                reason = 'SL'
+            elif crossed_l:
+                reason = 'L_CROSS'
+            else:
+                reason = None
+
+            if reason:
+                qty = position['qty']
+                entry_value = entry_price * qty
+                exit_value = price_d * qty
+                entry_fee = entry_value * FEE_PCT
+                exit_fee = exit_value * FEE_PCT
+                if side == 'LONG':
+                    pnl = exit_value - entry_value - entry_fee - exit_fee
+                else:
+                    pnl = entry_value - exit_value - entry_fee - exit_fee
+
+                trades.append({
+                    'side': side,
+                    'entry': float(entry_price),
+                    'exit': float(price_d),
+                    'pnl_pct': float(pnl_pct * 100),
+                    'pnl_usdt': float(pnl),
+                    'reason': reason,
+                    'hold_time': (ts - position['entry_time']) / 1000
+                })
+                balance_usdt += pnl
+                position = None
+
+        if not position:
+            if price_d > L:
+                entry_value = price_d * POSITION_SIZE
+                entry_fee = entry_value * FEE_PCT
+                if balance_usdt >= (entry_value + entry_fee):
+                    balance_usdt -= (entry_value + entry_fee)
+                    position = {'side': 'LONG', 'entry': price_d, 'entry_time': ts, 'qty': POSITION_SIZE}
+            elif price_d < L:
+                if balance_usdt >= price_d * POSITION_SIZE * MARGIN_PCT:
+                    position = {'side': 'SHORT', 'entry': price_d, 'entry_time': ts, 'qty': POSITION_SIZE}
+
+    first_ts = timestamps[indices[0]] if len(indices) else 0
+    last_ts = timestamps[indices[-1]] if len(indices) else 0
+    return summarize_trades(poll_sec, trades, balance_usdt, first_ts, last_ts)
+
+
+def summarize_trades(poll_sec, trades, balance_usdt, first_ts, last_ts):
+    """Result dict in the same format as simulate_strategy()."""
+    if not trades:
+        return {
+            'poll_sec': poll_sec,
+            'total_trades': 0,
+            'wins': 0,
+            'losses': 0,
+            'win_rate': 0,
+            'total_pnl': 0,
+            'final_balance': float(balance_usdt),
+            'avg_hold_time': 0,
+            'trades_per_day': 0
+        }
+    wins = sum(1 for t in trades if t['pnl_usdt'] > 0)
+    losses = sum(1 for t in trades if t['pnl_usdt'] < 0)
+    duration_days = (last_ts - first_ts) / (1000 * 86400)
+    return {
+        'poll_sec': poll_sec,
+        'total_trades': len(trades),
+        'wins': wins,
+        'losses': losses,
+        'win_rate': wins / len(trades) * 100,
+        'total_pnl': sum(t['pnl_usdt'] for t in trades),
+        'final_balance': float(balance_usdt),
+        'avg_hold_time': sum(t['hold_time'] for t in trades) / len(trades),
+        'trades_per_day': len(trades) / duration_days if duration_days > 0 else 0
+    }
+
+
+# Worker state: data is sent once per process, not once per interval
+_WORKER_DATA = {}
+
+
+def _init_worker(prices, timestamps):
+    _WORKER_DATA['timestamps'] = timestamps
+    _WORKER_DATA['prices_d'] = [Decimal(str(p)) for p in prices]
+
+
+def _simulate_batch(poll_secs):
+    """Resample one batch of intervals in a single pass and simulate each."""
+    timestamps = _WORKER_DATA['timestamps']
+    prices_d = _WORKER_DATA['prices_d']
+    samples = resample_all(timestamps, poll_secs)
+    return [simulate_sampled(poll, prices_d, timestamps, samples[poll], verbose=False) for poll in poll_secs]
+
+
+def run_all(prices, timestamps, poll_secs, workers=None, verbose=True):
+    """
+    Simulate all poll intervals. workers=1 runs in-process; otherwise the
+    intervals are split into interleaved batches over a process pool (so each
+    batch mixes short and long intervals and the load stays even).
+    """
+    poll_secs = list(poll_secs)
+    workers = workers or os.cpu_count() or 1
+    workers = max(1, min(workers, len(poll_secs)))
+    if workers == 1:
+        prices_d = [Decimal(str(p)) for p in prices]
+        samples = resample_all(timestamps, poll_secs)
+        return [simulate_sampled(poll, prices_d, timestamps, samples[poll], verbose) for poll in poll_secs]
+
+    batches = [poll_secs[i::workers] for i in range(workers)]
+    by_poll = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(prices, timestamps)) as pool:
+        for batch_results in pool.map(_simulate_batch, batches):
+            for r in batch_results:
+                by_poll[r['poll_sec']] = r
+                if verbose:
+                    print(f"  Poll {r['poll_sec']:g}s: {r['total_trades']} trades")
+    return [by_poll[poll] for poll in poll_secs]
+
+
+def print_report(results):
+    # Display results
+    print("=" * 80)
+    print("📊 RESULTS SUMMARY")
+    print("=" * 80)
     print()
 
-# Display results
-print("=" * 80)
-print("📊 RESULTS SUMMARY")
-print("=" * 80)
-print()
-
-print(f"{'Poll':<6} {'Trades':<8} {'Wins':<6} {'Loss':<6} {'WinRate':<8} {'PnL':<10} {'Balance':<10} {'AvgHold':<10} {'Trades/Day':<12}")
-print("-" * 80)
-
-for r in results:
-    print(f"{r['poll_sec']}s    "
-          f"{r['total_trades']:<8} "
-          f"{r['wins']:<6} "
-          f"{r['losses']:<6} "
-          f"{r['win_rate']:<7.1f}% "
-          f"${r['total_pnl']:<9.2f} "
-          f"${r['final_balance']:<9.2f} "
-          f"{r['avg_hold_time']/60:<9.1f}m "
-          f"{r['trades_per_day']:<11.1f}")
-
-print()
-
-# Find best configuration
-best = max(results, key=lambda x: x['total_pnl'])
-print(f"🏆 BEST PERFORMANCE: poll_sec = {best['poll_sec']}s")
-print(f"   Total P&L: ${best['total_pnl']:.2f}")
-print(f"   Win Rate: {best['win_rate']:.1f}%")
-print(f"   Avg Hold: {best['avg_hold_time']/60:.1f} minutes")
-print(f"   Trades/Day: {best['trades_per_day']:.1f}")
-print()
-
-# Recommendations
-print("=" * 80)
-print("💡 RECOMMENDATIONS")
-print("=" * 80)
-print()
-
-if best['poll_sec'] <= 2:
-    print("⚠️  WARNING: Very short poll interval detected!")
-    print("   - High frequency trading creates many small trades")
-    print("   - In real trading, this increases:")
-    print("     • Slippage costs")
-    print("     • Network latency issues")
-    print("     • API rate limits")
-    print("   - Consider using 5s or higher for live trading")
+    print(f"{'Poll':<6} {'Trades':<8} {'Wins':<6} {'Loss':<6} {'WinRate':<8} {'PnL':<10} {'Balance':<10} {'AvgHold':<10} {'Trades/Day':<12}")
+    print("-" * 80)
+
+    for r in results:
+        print(f"{format(r['poll_sec'], 'g') + 's':<6} "
+              f"{r['total_trades']:<8} "
+              f"{r['wins']:<6} "
+              f"{r['losses']:<6} "
+              f"{r['win_rate']:<7.1f}% "
+              f"${r['total_pnl']:<9.2f} "
+              f"${r['final_balance']:<9.2f} "
+              f"{r['avg_hold_time']/60:<9.1f}m "
+              f"{r['trades_per_day']:<11.1f}")
+
+    print()
+
+    # Find best configuration
+    best = max(results, key=lambda x: x['total_pnl'])
+    print(f"🏆 BEST PERFORMANCE: poll_sec = {best['poll_sec']}s")
+    print(f"   Total P&L: ${best['total_pnl']:.2f}")
+    print(f"   Win Rate: {best['win_rate']:.1f}%")
+    print(f"   Avg Hold: {best['avg_hold_time']/60:.1f} minutes")
+    print(f"   Trades/Day: {best['trades_per_day']:.1f}")
     print()
 
-if best['trades_per_day'] > 100:
-    print("⚠️  WARNING: Very high trading frequency!")
-    print(f"   - {best['trades_per_day']:.0f} trades/day may not be sustainable")
-    print("   - Real-world considerations:")
-    print("     • Binance has rate limits")
-    print("     • Higher slippage on frequent trades")
-    print("     • Psychological fatigue from monitoring")
+    # Recommendations
+    print("=" * 80)
+    print("💡 RECOMMENDATIONS")
+    print("=" * 80)
     print()
 
-print("✅ OPTIMAL CONFIGURATION:")
-# Find good balance between profit and practicality
-practical = [r for r in results if r['poll_sec'] >= 5 and r['trades_per_day'] < 50]
-if practical:
-    recommended = max(practical, key=lambda x: x['total_pnl'])
-    print(f"   poll_sec: {recommended['poll_sec']}s")
-    print(f"   Expected P&L: ${recommended['total_pnl']:.2f}")
-    print(f"   Win Rate: {recommended['win_rate']:.1f}%")
-    print(f"   Trades/Day: {recommended['trades_per_day']:.1f}")
-else:
-    print(f"   poll_sec: {best['poll_sec']}s (best profit)")
-    print("   Note: Consider practical limitations for live trading")
-
-print()
-print("=" * 80)
+    if best['poll_sec'] <= 2:
+        print("⚠️  WARNING: Very short poll interval detected!")
+        print("   - High frequency trading creates many small trades")
+        print("   - In real trading, this increases:")
+        print("     • Slippage costs")
+        print("     • Network latency issues")
+        print("     • API rate limits")
+        print("   - Consider using 5s or higher for live trading")
+        print()
+
+    if best['trades_per_day'] > 100:
+        print("⚠️  WARNING: Very high trading frequency!")
+        print(f"   - {best['trades_per_day']:.0f} trades/day may not be sustainable")
+        print("   - Real-world considerations:")
+        print("     • Binance has rate limits")
+        print("     • Higher slippage on frequent trades")
+        print("     • Psychological fatigue from monitoring")
+        print()
+
+    print("✅ OPTIMAL CONFIGURATION:")
+    # Find good balance between profit and practicality
+    practical = [r for r in results if r['poll_sec'] >= 5 and r['trades_per_day'] < 50]
+    if practical:
+        recommended = max(practical, key=lambda x: x['total_pnl'])
+        print(f"   poll_sec: {recommended['poll_sec']}s")
+        print(f"   Expected P&L: ${recommended['total_pnl']:.2f}")
+        print(f"   Win Rate: {recommended['win_rate']:.1f}%")
+        print(f"   Trades/Day: {recommended['trades_per_day']:.1f}")
+    else:
+        print(f"   poll_sec: {best['poll_sec']}s (best profit)")
+        print("   Note: Consider practical limitations for live trading")
+
+    print()
+    print("=" * 80)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test poll intervals for the adaptive strategy.")
+    parser.add_argument("--data", default=str(DATA_FILE), help="CSV with ts(ms),close,...")
+    parser.add_argument("--intervals", type=float, nargs="+", help=f"Poll intervals in seconds (default {POLL_INTERVALS})")
+    parser.add_argument("--sweep", action="store_true",
+                        help=f"Fine sweep {SWEEP_START}s..{SWEEP_STOP}s in steps of {SWEEP_STEP}s")
+    parser.add_argument("--sweep-range", type=float, nargs=3, metavar=("START", "STOP", "STEP"),
+                        help="Custom sweep range in seconds")
+    parser.add_argument("--workers", type=int, default=None, help="Processes (default: all CPUs, 1 = in-process)")
+    parser.add_argument("--legacy", action="store_true", help="Original per-interval resampling (reference)")
+    args = parser.parse_args()
+
+    data_file = Path(args.data)
+    if not data_file.exists():
+        print(f"Error: Data file not found: {data_file}")
+        print("Please ensure historical data exists in data/klines_analysis.csv")
+        sys.exit(1)
+
+    prices, timestamps = load_prices(data_file)
+    if not prices:
+        print(f"Error: No valid prices in {data_file}")
+        sys.exit(1)
+
+    print(f"✅ Loaded {len(prices)} price points from {data_file}")
+    print(f"📅 Period: {datetime.fromtimestamp(timestamps[0]/1000)} to {datetime.fromtimestamp(timestamps[-1]/1000)}")
+    print(f"💵 Price range: ${min(prices):.0f} - ${max(prices):.0f}")
+    print()
+
+    if args.sweep_range:
+        poll_secs = sweep_intervals(*args.sweep_range)
+    elif args.sweep:
+        poll_secs = sweep_intervals()
+    elif args.intervals:
+        poll_secs = [int(p) if float(p).is_integer() else p for p in args.intervals]
+    else:
+        poll_secs = POLL_INTERVALS
+
+    # Run tests
+    print("=" * 80)
+    print("🧪 TESTING DIFFERENT POLL INTERVALS")
+    print("=" * 80)
+    print()
+
+    if args.legacy:
+        results = []
+        for poll_sec in poll_secs:
+            print(f"Testing poll_sec = {poll_sec}s...")
+            results.append(simulate_strategy(poll_sec, prices, timestamps))
+            print()
+    else:
+        print(f"Testing {len(poll_secs)} intervals ({poll_secs[0]:g}s .. {poll_secs[-1]:g}s)...")
+        results = run_all(prices, timestamps, poll_secs, workers=args.workers, verbose=len(poll_secs) <= 20)
+        print()
+
+    print_report(results)
+
+
+if __name__ == "__main__":
+    main()
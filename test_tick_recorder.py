@@ -0,0 +1,68 @@
+"""
+Tester för tick_recorder.py: ogiltiga ticks och skrivfel får inte stoppa inspelningen.
+
+    python -m pytest -q test_tick_recorder.py
+"""
+
+import time
+from decimal import Decimal
+
+import pytest
+
+from tick_recorder import TickRecorder, iter_blocks, recording_files
+
+T0 = 1_762_732_800_000  # 2025-11-10 00:00 UTC
+
+
+def recorded_last(directory):
+    return [p for path in recording_files(str(directory)) for block in iter_blocks(path) for p in block["last"]]
+
+
+def test_bad_ticks_are_dropped_and_the_rest_written(tmp_path):
+    rec = TickRecorder(directory=str(tmp_path))
+    rec.record(T0, last=Decimal("95000.10"))
+    rec.record(T0 + 1, last=float("nan"))
+    rec.record(None, last=Decimal("95000.20"))
+    rec.record(T0 + 3, last=Decimal("95000.30"))
+    rec.flush()
+    rec.close()
+
+    assert rec.recorded == 2
+    assert rec.dropped == 2
+    assert recorded_last(tmp_path) == [95000.10, 95000.30]
+
+
+def test_background_thread_survives_bad_tick(tmp_path):
+    rec = TickRecorder(directory=str(tmp_path), flush_sec=0.01).start()
+    try:
+        rec.record(T0, last=float("inf"))
+        time.sleep(0.1)
+        rec.record(T0 + 1, last="95000.50")
+        deadline = time.monotonic() + 2.0
+        while rec.recorded < 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert rec._thread.is_alive()
+    finally:
+        rec.close()
+    assert rec.dropped == 1
+    assert recorded_last(tmp_path) == [95000.50]
+
+
+def test_write_error_keeps_ticks_for_next_flush(tmp_path, monkeypatch):
+    rec = TickRecorder(directory=str(tmp_path))
+    rec.record(T0, last=Decimal("95000.10"))
+    rec.record(T0 + 1, last=Decimal("95000.20"))
+
+    def disk_full(ts_ms):
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(rec, "_ensure_file", disk_full)
+    with pytest.raises(OSError):
+        rec.flush()
+    assert rec.recorded == 0
+    monkeypatch.undo()
+
+    rec.record(T0 + 2, last=Decimal("95000.30"))
+    rec.close()
+    assert rec.recorded == 3
+    assert recorded_last(tmp_path) == [95000.10, 95000.20, 95000.30]
@@ -0,0 +1,214 @@
+"""
+Tick Conflator – slå ihop bookTicker-skurar innan strategin körs
+================================================================
+BTCUSDT@bookTicker skickar i skurar tusentals meddelanden per sekund. Tidigare
+gjorde on_message json.loads + två Decimal + hela strategin för varje
+meddelande, och Python-callbacken halkade efter (besluten togs på gamla priser).
+
+Här görs så lite som möjligt per meddelande:
+
+    1. decode_book_ticker()  → b/a/E plockas ut som strängar med str.find
+                               (json.loads bara om formatet avviker)
+    2. oförändrad quote       → släpps direkt (strängjämförelse, ingen Decimal)
+    3. ändrad quote           → sparas som senaste + intervallets högsta/lägsta mid
+    4. strategin              → körs högst en gång per interval_sec med senaste
+                               quote och intervallets extremvärden (mid_high/mid_low),
+                               så att ett TP/BE som bara nuddades mellan två
+                               utvärderingar ändå syns
+
+Första ändringen efter ett lugnt intervall utvärderas direkt i WS-tråden
+(ingen extra fördröjning vid breakout); resten av skuren utvärderas av en
+bakgrundstråd när intervallet löpt ut.
+
+    conflator = TickConflator(strat.on_tick, interval_sec=0.05).start()
+    ws on_message: conflator.on_message(message)
+"""
+
+import json
+import threading
+import time
+from decimal import Decimal
+from typing import Any, Callable, Dict, Optional, Tuple
+
+DEFAULT_INTERVAL_SEC = 0.05
+
+
+def _field(message: str, key: str) -> Optional[str]:
+    """Strängvärdet för "key":"..." eller None."""
+    i = message.find(key)
+    if i < 0:
+        return None
+    i += len(key)
+    j = message.find('"', i)
+    return message[i:j] if j > i else None
+
+
+def _int_field(message: str, key: str) -> Optional[int]:
+    i = message.find(key)
+    if i < 0:
+        return None
+    i += len(key)
+    j = i
+    n = len(message)
+    while j < n and message[j].isdigit():
+        j += 1
+    return int(message[i:j]) if j > i else None
+
+
+def decode_book_ticker(message: str) -> Optional[Tuple[str, str, Optional[int]]]:
+    """
+    (bid, ask, exch_ts_ms) som strängar/int ur ett bookTicker-meddelande.
+    None om meddelandet inte är en quote (t.ex. svar på subscribe).
+    """
+    bid = _field(message, '"b":"')
+    ask = _field(message, '"a":"')
+    if bid is not None and ask is not None:
+        exch_ts = _int_field(message, '"E":')
+        if exch_ts is None:
+            exch_ts = _int_field(message, '"T":')
+        return bid, ask, exch_ts
+    # Reservväg: annan formatering/whitespace eller kombinerad stream ({"stream":..,"data":{..}})
+    try:
+        data = json.loads(message)
+    except ValueError:
+        return None
+    if isinstance(data, dict) and isinstance(data.get("data"), dict):
+        data = data["data"]
+    if not isinstance(data, dict) or "b" not in data or "a" not in data:
+        return None
+    return str(data["b"]), str(data["a"]), data.get("E") or data.get("T")
+
+
+class TickConflator:
+    """
+    Senaste quote per mikrointervall till strategin.
+
+    Args:
+        on_tick: strategi-callback (bid, ask, mid_high=..., mid_low=...)
+        interval_sec: Minsta tid mellan två utvärderingar (0 = varje ändrad quote)
+        recorder: Valfri TickRecorder – får varje ändrad quote (strängar, ingen Decimal)
+    """
+
+    def __init__(self, on_tick: Callable[..., Any], interval_sec: float = DEFAULT_INTERVAL_SEC,
+                 recorder: Any = None):
+        self.on_tick = on_tick
+        self.interval_sec = interval_sec
+        self.recorder = recorder
+        self.stats: Dict[str, int] = {
+            "received": 0,     # alla meddelanden
+            "unchanged": 0,    # samma bid/ask som förra → släppta
+            "conflated": 0,    # ändrade men ersatta av en nyare inom intervallet
+            "evaluated": 0,    # strategianrop
+            "fallback": 0,     # avkodade via json.loads
+            "ignored": 0,      # inte en quote
+        }
+        self._bid = self._ask = ""
+        self._hi_str: Optional[Tuple[str, str]] = None
+        self._lo_str: Optional[Tuple[str, str]] = None
+        self._hi = float("-inf")
+        self._lo = float("inf")
+        self._pending = False
+        self._next_eval = 0.0
+        self._lock = threading.Lock()
+        self._eval_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # -- WS-tråden -----------------------------------------------------------
+    def on_message(self, message: str) -> None:
+        stats = self.stats
+        stats["received"] += 1
+        # Snabbväg: bara b/a, ingen tidsstämpel om inget spelas in
+        i = message.find('"b":"')
+        j = message.find('"a":"')
+        if i >= 0 and j >= 0:
+            bid = message[i + 5:message.find('"', i + 5)]
+            ask = message[j + 5:message.find('"', j + 5)]
+            exch_ts = None
+            if self.recorder is not None:
+                exch_ts = _int_field(message, '"E":')
+                if exch_ts is None:
+                    exch_ts = _int_field(message, '"T":')
+        else:
+            quote = decode_book_ticker(message)
+            if quote is None:
+                stats["ignored"] += 1
+                return
+            stats["fallback"] += 1
+            bid, ask, exch_ts = quote
+        # Endast WS-tråden skriver _bid/_ask → jämförelsen behöver inget lås
+        if bid == self._bid and ask == self._ask:
+            stats["unchanged"] += 1
+            return
+        mid2 = float(bid) + float(ask)  # 2·mid räcker för att jämföra
+        with self._lock:
+            self._bid, self._ask = bid, ask
+            if mid2 > self._hi:
+                self._hi, self._hi_str = mid2, (bid, ask)
+            if mid2 < self._lo:
+                self._lo, self._lo_str = mid2, (bid, ask)
+            if self._pending:
+                stats["conflated"] += 1
+            self._pending = True
+        if self.recorder is not None:
+            self.recorder.record(int(time.time() * 1000), bid=bid, ask=ask, exch_ts_ms=exch_ts)
+        if time.monotonic() >= self._next_eval:
+            self._evaluate()
+
+    # -- utvärdering ---------------------------------------------------------
+    def _evaluate(self) -> None:
+        if not self._eval_lock.acquire(blocking=False):
+            return  # den andra tråden utvärderar redan; vår quote ligger kvar som pending
+        try:
+            with self._lock:
+                if not self._pending:
+                    return
+                bid, ask = self._bid, self._ask
+                hi, lo = self._hi_str, self._lo_str
+                self._pending = False
+                self._hi, self._lo = float("-inf"), float("inf")
+                self._hi_str = self._lo_str = None
+                self._next_eval = time.monotonic() + self.interval_sec
+            self.stats["evaluated"] += 1
+            self.on_tick(Decimal(bid), Decimal(ask),
+                         mid_high=(Decimal(hi[0]) + Decimal(hi[1])) / 2,
+                         mid_low=(Decimal(lo[0]) + Decimal(lo[1])) / 2)
+        except Exception as err:
+            print("⚠️ Strategifel:", err)
+        finally:
+            self._eval_lock.release()
+
+    def reset_extremes(self) -> None:
+        """
+        Glöm intervallets högsta/lägsta (och ej utvärderad quote). Anropas när en
+        position öppnas: quotes från före fyllnaden får inte trigga TP/BE mot entry.
+        """
+        with self._lock:
+            self._pending = False
+            self._hi, self._lo = float("-inf"), float("inf")
+            self._hi_str = self._lo_str = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_sec):
+            if self._pending and time.monotonic() >= self._next_eval:
+                self._evaluate()
+
+    def start(self) -> "TickConflator":
+        """Starta tråden som utvärderar skurens sista quote när intervallet löpt ut."""
+        if self.interval_sec > 0:
+            self._thread = threading.Thread(target=self._run, name="tick-conflator", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats_line(self) -> str:
+        s = self.stats
+        dropped = s["unchanged"] + s["conflated"]
+        pct = dropped / s["received"] * 100 if s["received"] else 0.0
+        return (f"📉 Ticks: {s['received']} mottagna, {s['evaluated']} utvärderade, "
+                f"{dropped} släppta ({pct:.1f}%: {s['unchanged']} oförändrade, {s['conflated']} sammanslagna)")
@@ -0,0 +1,456 @@
+"""
+Tick Recorder – kompakt binär tick-logg
+=======================================
+Sparar varje tick som live-loopen ser (mottagningstid, börstid om den finns,
+bid, ask, last) i ett kompakt binärformat. Inspelningarna är grunddata för
+replay (replay.py) och poll-intervallstudier.
+
+Kostnad i live-loopen: record() lägger bara en tuple i en kö (~1 µs). Kodning
+och skrivning sker i en bakgrundstråd som tömmer kön var flush_sec sekund.
+
+Filformat (.ttk)
+----------------
+    Filhuvud:  MAGIC (8 byte) | uint16 längd | JSON-metadata (symbol, price_decimals, ...)
+    Block:     b"TB" | uint32 antal ticks | uint32 payload-längd | payload
+
+Payload per tick (alla tal zigzag-varint, delta mot föregående värde i samma block):
+    flags                  bit0=exch_ts, bit1=bid, bit2=ask, bit3=last
+    Δ recv_ts_ms
+    Δ exch_ts_ms           (om bit0)
+    Δ bid/ask/last         (om respektive bit, i heltals-ticks om 10^-price_decimals)
+
+Varje block börjar om från 0 så att block kan läsas oberoende av varandra (och en
+avbruten skrivning förstör bara sista blocket). Priser lagras som heltal → exakt
+tillbaka till Decimal vid läsning.
+
+Läs:
+    for block in iter_blocks("recordings/BTCUSDT_20251110_000000.ttk"):
+        block["recv_ts"], block["last"] ...   # array('q') / array('d')
+
+    python tick_recorder.py recordings/BTCUSDT_20251110_000000.ttk   # sammanfattning
+    python tick_recorder.py recordings/ --csv ticks.csv              # exportera för replay
+"""
+
+import argparse
+import json
+import os
+import struct
+import threading
+from array import array
+from collections import deque
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+MAGIC = b"TTICK01\n"
+BLOCK_MAGIC = b"TB"
+BLOCK_HEADER = struct.Struct("<2sII")
+FILE_EXT = ".ttk"
+
+FLAG_EXCH_TS = 1
+FLAG_BID = 2
+FLAG_ASK = 4
+FLAG_LAST = 8
+PRICE_FIELDS = (("bid", FLAG_BID), ("ask", FLAG_ASK), ("last", FLAG_LAST))
+
+DEFAULT_RECORD_DIR = "recordings"
+DEFAULT_PRICE_DECIMALS = 2
+DEFAULT_FLUSH_SEC = 1.0
+DEFAULT_MAX_FILE_BYTES = 64 * 1024 * 1024
+BAD_TICK_ERRORS = (ValueError, TypeError, ArithmeticError)  # encode_block på NaN/inf/None m.m.
+
+
+# ----------------------- Varint-kodning --------------------------------------
+def _put_varint(out: bytearray, value: int) -> None:
+    """Zigzag + LEB128 (små deltan, positiva som negativa, blir 1–2 byte)."""
+    v = (value << 1) ^ (value >> 63) if value < 0 else value << 1
+    while v >= 0x80:
+        out.append((v & 0x7F) | 0x80)
+        v >>= 7
+    out.append(v)
+
+
+def _get_varint(buf: bytes, pos: int) -> Tuple[int, int]:
+    shift = 0
+    result = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7F) << shift
+        if b < 0x80:
+            break
+        shift += 7
+    return (result >> 1) ^ -(result & 1), pos
+
+
+def encode_block(ticks: List[tuple], scale: int) -> bytes:
+    """
+    Koda en lista ticks (recv_ts_ms, exch_ts_ms|None, bid, ask, last) till ett block.
+    Priser kan vara Decimal, float, str eller None.
+    """
+    payload = bytearray()
+    prev = [0, 0, 0, 0, 0]  # recv, exch, bid, ask, last
+    for recv_ts, exch_ts, *prices in ticks:
+        flags = 0
+        values = []
+        if exch_ts is not None:
+            flags |= FLAG_EXCH_TS
+        for (_, flag), price in zip(PRICE_FIELDS, prices):
+            if price is None:
+                values.append(None)
+                continue
+            flags |= flag
+            if isinstance(price, Decimal):
+                values.append(int((price * scale).to_integral_value()))
+            else:
+                values.append(int(round(float(price) * scale)))
+        _put_varint(payload, flags)
+        _put_varint(payload, recv_ts - prev[0])
+        prev[0] = recv_ts
+        if exch_ts is not None:
+            _put_varint(payload, exch_ts - prev[1])
+            prev[1] = exch_ts
+        for i, v in enumerate(values, start=2):
+            if v is not None:
+                _put_varint(payload, v - prev[i])
+                prev[i] = v
+    return BLOCK_HEADER.pack(BLOCK_MAGIC, len(ticks), len(payload)) + bytes(payload)
+
+
+def decode_block(payload: bytes, count: int, price_decimals: int) -> Dict[str, array]:
+    """Payload → kolumn-arrayer. Saknade priser blir NaN, saknad börstid 0."""
+    scale = 10.0 ** price_decimals
+    nan = float("nan")
+    cols = {
+        "recv_ts": array("q"),
+        "exch_ts": array("q"),
+        "bid": array("d"),
+        "ask": array("d"),
+        "last": array("d"),
+    }
+    prev = [0, 0, 0, 0, 0]
+    pos = 0
+    for _ in range(count):
+        flags, pos = _get_varint(payload, pos)
+        delta, pos = _get_varint(payload, pos)
+        prev[0] += delta
+        cols["recv_ts"].append(prev[0])
+        if flags & FLAG_EXCH_TS:
+            delta, pos = _get_varint(payload, pos)
+            prev[1] += delta
+            cols["exch_ts"].append(prev[1])
+        else:
+            cols["exch_ts"].append(0)
+        for i, (name, flag) in enumerate(PRICE_FIELDS, start=2):
+            if flags & flag:
+                delta, pos = _get_varint(payload, pos)
+                prev[i] += delta
+                cols[name].append(prev[i] / scale)
+            else:
+                cols[name].append(nan)
+    return cols
+
+
+# ----------------------- Inspelare -------------------------------------------
+class TickRecorder:
+    """
+    Bakgrundsinspelare för live-ticks.
+
+    Args:
+        directory: Katalog för .ttk-filer
+        symbol: Symbol (del av filnamnet och metadata)
+        price_decimals: Prisupplösning (2 → 0.01 USDT per tick)
+        flush_sec: Hur ofta bakgrundstråden skriver ett block
+        max_file_bytes: Rotera när filen blir större än så här (roterar även vid ny UTC-dag)
+    """
+
+    def __init__(self, directory: str = DEFAULT_RECORD_DIR, symbol: str = "BTCUSDT",
+                 price_decimals: int = DEFAULT_PRICE_DECIMALS, flush_sec: float = DEFAULT_FLUSH_SEC,
+                 max_file_bytes: int = DEFAULT_MAX_FILE_BYTES):
+        self.directory = directory
+        self.symbol = symbol
+        self.price_decimals = int(price_decimals)
+        self.scale = 10 ** self.price_decimals
+        self.flush_sec = flush_sec
+        self.max_file_bytes = max_file_bytes
+        self.recorded = 0
+        self.dropped = 0  # ticks som inte gick att koda (ogiltigt pris/tid)
+        self.bytes_written = 0
+        self.path: Optional[str] = None
+        self._queue: deque = deque()
+        self._file = None
+        self._file_day: Optional[str] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        os.makedirs(directory, exist_ok=True)
+
+    # -- hot path ------------------------------------------------------------
+    def record(self, recv_ts_ms: int, last: Any = None, bid: Any = None, ask: Any = None,
+               exch_ts_ms: Optional[int] = None) -> None:
+        """Lägg en tick i kön (trådsäkert, ingen I/O)."""
+        self._queue.append((recv_ts_ms, exch_ts_ms, bid, ask, last))
+
+    # -- bakgrund ------------------------------------------------------------
+    def start(self) -> "TickRecorder":
+        self._thread = threading.Thread(target=self._run, name="tick-recorder", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self) -> None:
+        """Stoppa tråden, skriv kvarvarande ticks och stäng filen."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> "TickRecorder":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _run(self) -> None:
+        # Tråden får inte dö: då växer kön resten av sessionen utan att något skrivs
+        while not self._stop.wait(self.flush_sec):
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"⚠️ Tick-inspelning: skrivfel {e} (försöker igen)")
+            except Exception as e:
+                print(f"⚠️ Tick-inspelning: oväntat fel {e!r}")
+
+    def flush(self) -> None:
+        """
+        Koda och skriv allt som ligger i kön som ett block. Ticks som inte går att
+        koda hoppas över; vid skrivfel läggs ticksen tillbaka först i kön.
+        """
+        ticks = []
+        queue = self._queue
+        while queue:
+            ticks.append(queue.popleft())
+        if not ticks:
+            return
+        try:
+            block = encode_block(ticks, self.scale)
+        except BAD_TICK_ERRORS:
+            ticks = self._drop_bad_ticks(ticks)
+            if not ticks:
+                return
+            block = encode_block(ticks, self.scale)
+        try:
+            self._ensure_file(ticks[0][0])
+            self._file.write(block)
+            self._file.flush()
+        except OSError:
+            queue.extendleft(reversed(ticks))
+            self._abandon_file()
+            raise
+        self.recorded += len(ticks)
+        self.bytes_written += len(block)
+
+    def _drop_bad_ticks(self, ticks: List[tuple]) -> List[tuple]:
+        good = []
+        for tick in ticks:
+            try:
+                encode_block([tick], self.scale)
+            except BAD_TICK_ERRORS as e:
+                self.dropped += 1
+                print(f"⚠️ Tick-inspelning: hoppar över ogiltig tick {tick!r}: {e!r}")
+            else:
+                good.append(tick)
+        return good
+
+    def _abandon_file(self) -> None:
+        """Efter skrivfel: nästa block i en ny fil (ett halvskrivet block avslutar läsningen av den gamla)."""
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+
+    def _ensure_file(self, ts_ms: int) -> None:
+        day = datetime.fromtimestamp(ts_ms / 1000.0, tz=timezone.utc).strftime("%Y%m%d")
+        if self._file is not None:
+            if day == self._file_day and self._file.tell() < self.max_file_bytes:
+                return
+            self._file.close()
+        stamp = datetime.fromtimestamp(ts_ms / 1000.0, tz=timezone.utc).strftime("%Y%m%d_%H%M%S")
+        path = os.path.join(self.directory, f"{self.symbol}_{stamp}{FILE_EXT}")
+        n = 1
+        while os.path.exists(path):
+            path = os.path.join(self.directory, f"{self.symbol}_{stamp}_{n}{FILE_EXT}")
+            n += 1
+        meta = json.dumps({
+            "symbol": self.symbol,
+            "price_decimals": self.price_decimals,
+            "created_ms": ts_ms,
+        }).encode("utf-8")
+        self._file = open(path, "wb")
+        self._file.write(MAGIC + struct.pack("<H", len(meta)) + meta)
+        self._file_day = day
+        self.path = path
+
+
+# ----------------------- Läsning ---------------------------------------------
+def read_header(f) -> Dict[str, Any]:
+    magic = f.read(len(MAGIC))
+    if magic != MAGIC:
+        raise ValueError("Inte en tick-inspelning (fel magic)")
+    (length,) = struct.unpack("<H", f.read(2))
+    return json.loads(f.read(length).decode("utf-8"))
+
+
+def _block_start_ts(payload: bytes) -> int:
+    """recv_ts för blockets första tick (första deltat räknas från 0)."""
+    _, pos = _get_varint(payload, 0)
+    ts, _ = _get_varint(payload, pos)
+    return ts
+
+
+def iter_blocks(path: str, since_ms: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Läs en .ttk-fil block för block. Varje block är en dict med arrayer
+    (recv_ts, exch_ts, bid, ask, last) plus "meta".
+    Ett trasigt/ofullständigt sista block (t.ex. efter krasch) hoppas över.
+
+    Med since_ms avkodas bara block som kan innehålla ticks >= since_ms
+    (blockens starttid läses ur de första byten, resten hoppas över).
+    """
+    with open(path, "rb") as f:
+        meta = read_header(f)
+        decimals = int(meta.get("price_decimals", DEFAULT_PRICE_DECIMALS))
+        pending = None  # senaste block som startar före since_ms
+        while True:
+            head = f.read(BLOCK_HEADER.size)
+            if len(head) < BLOCK_HEADER.size:
+                break
+            magic, count, length = BLOCK_HEADER.unpack(head)
+            payload = f.read(length)
+            if magic != BLOCK_MAGIC or len(payload) < length:
+                break
+            if since_ms is not None and count:
+                if _block_start_ts(payload) < since_ms:
+                    pending = (payload, count)
+                    continue
+                if pending is not None:
+                    block = decode_block(pending[0], pending[1], decimals)
+                    block["meta"] = meta
+                    pending = None
+                    yield block
+            block = decode_block(payload, count, decimals)
+            block["meta"] = meta
+            yield block
+        if pending is not None:
+            block = decode_block(pending[0], pending[1], decimals)
+            block["meta"] = meta
+            yield block
+
+
+def recording_files(path: str) -> List[str]:
+    """En fil eller alla .ttk-filer i en katalog (sorterade = tidsordning)."""
+    if os.path.isdir(path):
+        return sorted(os.path.join(path, n) for n in os.listdir(path) if n.endswith(FILE_EXT))
+    return [path]
+
+
+def load_last_prices(path: str, since_ms: Optional[int] = None) -> Tuple[List[int], List[Decimal]]:
+    """
+    (recv_ts_ms, last som Decimal) från en fil eller katalog – samma form som
+    replay.load_ticks(). Ticks utan last använder mid (bid+ask)/2.
+    Med since_ms hoppas äldre ticks (och filer) över.
+
+    Priserna är heltal/10^decimals i filen; repr() av float-värdet ger därför
+    exakt samma decimalsträng tillbaka.
+    """
+    timestamps: List[int] = []
+    prices: List[Decimal] = []
+    files = recording_files(path)
+    if since_ms is not None:
+        files = files_since(files, since_ms)
+    for file_path in files:
+        for block in iter_blocks(file_path, since_ms):
+            decimals = int(block["meta"].get("price_decimals", DEFAULT_PRICE_DECIMALS))
+            quantum = Decimal(1).scaleb(-decimals)
+            for ts, last, bid, ask in zip(block["recv_ts"], block["last"], block["bid"], block["ask"]):
+                if since_ms is not None and ts < since_ms:
+                    continue
+                if last == last:  # inte NaN
+                    price = Decimal(repr(last)).quantize(quantum)
+                elif bid == bid and ask == ask:
+                    price = ((Decimal(repr(bid)) + Decimal(repr(ask))) / 2).quantize(quantum)
+                else:
+                    continue
+                timestamps.append(ts)
+                prices.append(price)
+    return timestamps, prices
+
+
+def files_since(files: List[str], since_ms: int) -> List[str]:
+    """Filer som kan innehålla ticks >= since_ms (filer är sorterade i tidsordning)."""
+    keep = []
+    for file_path in reversed(files):
+        keep.append(file_path)
+        try:
+            with open(file_path, "rb") as f:
+                created_ms = int(read_header(f).get("created_ms", 0))
+        except (OSError, ValueError):
+            continue
+        if created_ms <= since_ms:
+            break  # äldre filer slutar innan denna startade
+    keep.reverse()
+    return keep
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Sammanfatta/exportera tick-inspelningar (.ttk).")
+    parser.add_argument("path", help=".ttk-fil eller katalog")
+    parser.add_argument("--csv", help="Exportera recv_ts,exch_ts,bid,ask,last till CSV (läsbar av replay.py)")
+    args = parser.parse_args()
+
+    total = 0
+    first_ts = last_ts = None
+    size = 0
+    out = open(args.csv, "w", encoding="utf-8", newline="") if args.csv else None
+    try:
+        if out:
+            out.write("receive_ts,exch_ts,bid,ask,last\n")
+        for file_path in recording_files(args.path):
+            size += os.path.getsize(file_path)
+            for block in iter_blocks(file_path):
+                decimals = int(block["meta"].get("price_decimals", DEFAULT_PRICE_DECIMALS))
+                n = len(block["recv_ts"])
+                if not n:
+                    continue
+                total += n
+                first_ts = block["recv_ts"][0] if first_ts is None else first_ts
+                last_ts = block["recv_ts"][-1]
+                if out:
+                    fmt = f"{{:.{decimals}f}}"
+                    for row in zip(block["recv_ts"], block["exch_ts"], block["bid"], block["ask"], block["last"]):
+                        ts, ex, bid, ask, last = row
+                        out.write(",".join([
+                            str(ts), str(ex) if ex else "",
+                            fmt.format(bid) if bid == bid else "",
+                            fmt.format(ask) if ask == ask else "",
+                            fmt.format(last) if last == last else "",
+                        ]) + "\n")
+    finally:
+        if out:
+            out.close()
+
+    if not total:
+        print("Inga ticks hittades.")
+        return
+    span_h = (last_ts - first_ts) / 3_600_000
+    print(f"📼 {total} ticks över {span_h:.2f} h, {size/1024:.1f} KiB ({size/total:.2f} byte/tick)")
+    if args.csv:
+        print(f"💾 Exporterade till {args.csv}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Warm Start – förfyll indikator- och grafbuffertar vid uppstart
+==============================================================
+Efter varje omstart behöver TrendDetector 50 ticks innan den ger poäng och
+maybe_enter() väntar på 20 ticks i START_MODE – med 0.5 s loop är det minuter
+av dödtid. Här hämtas de senaste minuternas priser och samplas om till loopens
+takt, så att buffertarna är fyllda inom en sekund efter start.
+
+Källor (första som ger tillräckligt färsk data vinner):
+    recording → senaste tick-inspelningen (tick_recorder.py), om sista ticken
+                är högst max_gap_sec gammal
+    klines    → en enda förfrågan mot /api/v3/klines med 1s-candles (close)
+
+Samplingen är "senaste pris <= tidpunkt" på ett jämnt rutnät som slutar nu,
+d.v.s. samma värden som live-loopen hade sett om den hade kört.
+
+Kör (visa vad som skulle användas):
+    python warm_start.py BTCUSDT --step 0.5 --count 800
+"""
+
+import argparse
+import bisect
+import os
+import time
+from decimal import Decimal
+from typing import List, Optional, Tuple
+
+from tick_recorder import FILE_EXT, files_since, load_last_prices
+
+try:
+    import requests  # python -m pip install requests
+except ImportError as e:
+    raise SystemExit(
+        "requests saknas. Kör:\n    python -m pip install requests\n"
+        "och starta sedan om skriptet."
+    ) from e
+
+BINANCE_REST = "https://api.binance.com"
+WARM_START_SOURCES = ("auto", "recording", "klines")
+KLINES_MAX_LIMIT = 1000
+DEFAULT_MAX_GAP_SEC = 30.0
+
+
+def resample_hold(timestamps_ms: List[int], prices: List[Decimal], end_ms: int,
+                  step_sec: float, count: int) -> List[Decimal]:
+    """
+    Senaste pris <= t för t = end - (count-1)*step ... end.
+    Rutnätspunkter före första ticken utelämnas.
+    """
+    if not prices:
+        return []
+    step_ms = step_sec * 1000.0
+    out: List[Decimal] = []
+    for k in range(count - 1, -1, -1):
+        t = end_ms - k * step_ms
+        idx = bisect.bisect_right(timestamps_ms, t) - 1
+        if idx >= 0:
+            out.append(prices[idx])
+    return out
+
+
+def seed_from_recording(directory: str, symbol: str, now_ms: int, step_sec: float, count: int,
+                        max_gap_sec: float = DEFAULT_MAX_GAP_SEC) -> List[Decimal]:
+    """Priser ur lokala .ttk-inspelningar för symbol (tom lista om de är för gamla)."""
+    if not os.path.isdir(directory):
+        return []
+    files = sorted(
+        os.path.join(directory, n) for n in os.listdir(directory)
+        if n.startswith(f"{symbol}_") and n.endswith(FILE_EXT)
+    )
+    if not files:
+        return []
+    since_ms = int(now_ms - count * step_sec * 1000.0)
+    timestamps: List[int] = []
+    prices: List[Decimal] = []
+    for file_path in files_since(files, since_ms):
+        ts, px = load_last_prices(file_path, since_ms=since_ms)
+        timestamps.extend(ts)
+        prices.extend(px)
+    if not timestamps or now_ms - timestamps[-1] > max_gap_sec * 1000.0:
+        return []
+    if any(b < a for a, b in zip(timestamps, timestamps[1:])):
+        order = sorted(range(len(timestamps)), key=timestamps.__getitem__)
+        timestamps = [timestamps[i] for i in order]
+        prices = [prices[i] for i in order]
+    return resample_hold(timestamps, prices, now_ms, step_sec, count)
+
+
+def seed_from_klines(symbol: str, now_ms: int, step_sec: float, count: int,
+                     base_url: str = BINANCE_REST, timeout: float = 5.0) -> List[Decimal]:
+    """Priser ur en förfrågan med 1s-klines (close vid candle-slut)."""
+    limit = min(KLINES_MAX_LIMIT, int(count * step_sec) + 2)
+    r = requests.get(f"{base_url}/api/v3/klines",
+                     params={"symbol": symbol, "interval": "1s", "limit": limit},
+                     timeout=timeout)
+    r.raise_for_status()
+    rows = r.json()
+    # Close gäller från candlens sista millisekund
+    timestamps = [int(row[6]) for row in rows]
+    prices = [Decimal(row[4]) for row in rows]
+    return resample_hold(timestamps, prices, now_ms, step_sec, count)
+
+
+def load_seed_prices(symbol: str, step_sec: float, count: int, source: str = "auto",
+                     record_dir: Optional[str] = None, now_ms: Optional[int] = None,
+                     max_gap_sec: float = DEFAULT_MAX_GAP_SEC,
+                     base_url: str = BINANCE_REST) -> Tuple[List[Decimal], str]:
+    """
+    (priser äldst→nyast, källa). Tom lista och källa "" om ingen källa gav data;
+    nätverksfel ger då en kallstart istället för ett avbrott.
+    """
+    if source not in WARM_START_SOURCES:
+        raise ValueError(f"Okänd warm start-källa: {source}")
+    now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+    if source in ("auto", "recording") and record_dir:
+        prices = seed_from_recording(record_dir, symbol, now_ms, step_sec, count, max_gap_sec)
+        if prices:
+            return prices, "recording"
+    if source in ("auto", "klines"):
+        try:
+            prices = seed_from_klines(symbol, now_ms, step_sec, count, base_url)
+        except (requests.exceptions.RequestException, ValueError, IndexError) as e:
+            print(f"⚠️ Warm start: klines kunde inte hämtas ({e})")
+            prices = []
+        if prices:
+            return prices, "klines"
+    return [], ""
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Visa warm start-data för live-skriptet.")
+    parser.add_argument("symbol", nargs="?", default="BTCUSDT")
+    parser.add_argument("--step", type=float, default=0.5, help="Loopens takt i sekunder (graph_update_sec)")
+    parser.add_argument("--count", type=int, default=800, help="Antal punkter (grafens max_points)")
+    parser.add_argument("--source", choices=WARM_START_SOURCES, default="auto")
+    parser.add_argument("--record-dir", default="recordings")
+    parser.add_argument("--base-url", default=BINANCE_REST, help="T.ex. http://127.0.0.1:8765 (binance_stub.py)")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    prices, source = load_seed_prices(args.symbol.upper(), args.step, args.count, args.source,
+                                      record_dir=args.record_dir, base_url=args.base_url)
+    elapsed = time.perf_counter() - t0
+    if not prices:
+        print("Ingen warm start-data hittades.")
+        return
+    print(f"🔥 {len(prices)} priser från {source} på {elapsed*1000:.0f} ms: "
+          f"{prices[0]} → {prices[-1]} (min {min(prices)}, max {max(prices)})")
+
+
+if __name__ == "__main__":
+    main()